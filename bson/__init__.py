@@ -15,13 +15,17 @@
 """BSON (Binary JSON) encoding and decoding.
 """
 
+import array
 import calendar
 import collections
 import datetime
 import itertools
+import mmap
+import os
 import re
 import struct
 import sys
+import time
 import uuid
 
 from codecs import (utf_8_decode as _utf_8_decode,
@@ -31,7 +35,8 @@ from bson.binary import (Binary, OLD_UUID_SUBTYPE,
                          JAVA_LEGACY, CSHARP_LEGACY,
                          UUIDLegacy)
 from bson.code import Code
-from bson.codec_options import CodecOptions, DEFAULT_CODEC_OPTIONS
+from bson.codec_options import (CodecOptions, DEFAULT_CODEC_OPTIONS,
+                                 _compiled_codec, _raw_document_class)
 from bson.dbref import DBRef
 from bson.errors import (InvalidBSON,
                          InvalidDocument,
@@ -87,6 +92,7 @@ BSONMAX = b"\x7F" # Max key
 
 _UNPACK_FLOAT = struct.Struct("<d").unpack
 _UNPACK_INT = struct.Struct("<i").unpack
+_UNPACK_INT_FROM = struct.Struct("<i").unpack_from
 _UNPACK_LENGTH_SUBTYPE = struct.Struct("<iB").unpack
 _UNPACK_LONG = struct.Struct("<q").unpack
 _UNPACK_TIMESTAMP = struct.Struct("<II").unpack
@@ -104,6 +110,50 @@ def _get_c_string(data, position):
     return _utf_8_decode(data[position:end], None, True)[0], end + 1
 
 
+# The most field names a decode call keeps for CodecOptions.intern_keys.
+_KEY_CACHE_SIZE = 1024
+
+
+class _KeyCacheOptions(CodecOptions):
+    """The CodecOptions of one decode call with intern_keys set, holding
+    the field names decoded by the call, by their encoded bytes.
+    """
+
+    def __new__(cls, opts):
+        self = tuple.__new__(cls, opts)
+        self.key_cache = {}
+        return self
+
+
+def _decoding_options(opts):
+    """Get the options to decode with in one call, with a new cache of
+    field names if opts.intern_keys is set."""
+    if opts.intern_keys:
+        return _KeyCacheOptions(opts)
+    return opts
+
+
+def _get_key(data, position, opts):
+    """Decode a BSON element name, reusing the string decoded for it
+    earlier in the same call if opts.intern_keys is set."""
+    if not opts.intern_keys:
+        return _get_c_string(data, position)
+    cache = getattr(opts, "key_cache", None)
+    if cache is None:
+        return _get_c_string(data, position)
+    end = data.index(b"\x00", position)
+    encoded = data[position:end]
+    try:
+        return cache[encoded], end + 1
+    except KeyError:
+        pass
+    name = _utf_8_decode(encoded, None, True)[0]
+    if len(cache) >= _KEY_CACHE_SIZE:
+        cache.clear()
+    cache[encoded] = name
+    return name, end + 1
+
+
 def _get_float(data, position, dummy0, dummy1):
     """Decode a BSON double to python float."""
     end = position + 8
@@ -130,6 +180,10 @@ def _get_object(data, position, obj_end, opts):
         raise InvalidBSON("bad eoo")
     if end >= obj_end:
         raise InvalidBSON("invalid object length")
+    if _raw_document_class(opts.document_class):
+        return (opts.document_class(data[position:end + 1], opts),
+                position + obj_size)
+
     obj = _elements_to_dict(data, position + 4, end, opts)
 
     position += obj_size
@@ -143,8 +197,10 @@ def _get_array(data, position, obj_end, opts):
     """Decode a BSON array to python list."""
     size = _UNPACK_INT(data[position:position + 4])[0]
     end = position + size - 1
-    if data[end:end + 1] != b"\x00":
+    if size < 5 or data[end:end + 1] != b"\x00":
         raise InvalidBSON("bad eoo")
+    if end >= obj_end:
+        raise InvalidBSON("invalid object length")
     position += 4
     end -= 1
     result = []
@@ -153,12 +209,15 @@ def _get_array(data, position, obj_end, opts):
     append = result.append
     index = data.index
     getter = _ELEMENT_GETTER
+    registry = opts.type_registry
 
     while position < end:
         element_type = data[position:position + 1]
         # Just skip the keys.
         position = index(b'\x00', position) + 1
         value, position = getter[element_type](data, position, obj_end, opts)
+        if registry is not None:
+            value = _decode_custom_type(value, registry)
         append(value)
     return result, position + 1
 
@@ -291,13 +350,23 @@ _ELEMENT_GETTER = {
     BSONMAX: lambda w, x, y, z: (MaxKey(), x)}
 
 
+def _decode_custom_type(value, registry):
+    """Convert a decoded value with its type's decoder, if any."""
+    decoder = registry._decoder(type(value))
+    if decoder is None:
+        return value
+    return decoder(value)
+
+
 def _element_to_dict(data, position, obj_end, opts):
     """Decode a single key, value pair."""
     element_type = data[position:position + 1]
     position += 1
-    element_name, position = _get_c_string(data, position)
+    element_name, position = _get_key(data, position, opts)
     value, position = _ELEMENT_GETTER[element_type](data,
                                                     position, obj_end, opts)
+    if opts.type_registry is not None:
+        value = _decode_custom_type(value, opts.type_registry)
     return element_name, value, position
 
 
@@ -313,6 +382,7 @@ def _elements_to_dict(data, position, obj_end, opts):
 
 def _bson_to_dict(data, opts):
     """Decode a BSON string to document_class."""
+    data = _buffer_to_bytes(data)
     try:
         obj_size = _UNPACK_INT(data[:4])[0]
     except struct.error as exc:
@@ -322,7 +392,11 @@ def _bson_to_dict(data, opts):
     if data[obj_size - 1:obj_size] != b"\x00":
         raise InvalidBSON("bad eoo")
     try:
-        return _elements_to_dict(data, 4, obj_size - 1, opts)
+        if (_raw_document_class(opts.document_class) or
+                _compiled_codec(opts.document_class)):
+            return opts.document_class(data, opts)
+        return _elements_to_dict(data, 4, obj_size - 1,
+                                 _decoding_options(opts))
     except InvalidBSON:
         raise
     except Exception:
@@ -333,6 +407,222 @@ if _USE_C:
     _bson_to_dict = _cbson._bson_to_dict
 
 
+# The size of each fixed length element type.
+_ELEMENT_SIZE = {
+    BSONNUM: 8,
+    BSONUND: 0,
+    BSONOID: 12,
+    BSONBOO: 1,
+    BSONDAT: 8,
+    BSONNUL: 0,
+    BSONINT: 4,
+    BSONTIM: 8,
+    BSONLON: 8,
+    BSONMIN: 0,
+    BSONMAX: 0}
+
+
+# The smallest valid length prefix of each variable length element type.
+_MIN_VALUE_LENGTH = {
+    BSONSTR: 1,
+    BSONCOD: 1,
+    BSONSYM: 1,
+    BSONOBJ: 5,
+    BSONARR: 5,
+    BSONCWS: 14,
+    BSONBIN: 0,
+    BSONREF: 1}
+
+# The bytes before each variable length value not counted by its length.
+_VALUE_LENGTH_OFFSET = {
+    BSONSTR: 4,
+    BSONCOD: 4,
+    BSONSYM: 4,
+    BSONOBJ: 0,
+    BSONARR: 0,
+    BSONCWS: 0,
+    BSONBIN: 5,
+    BSONREF: 16}
+
+
+def _skip_value(data, position, element_type, obj_end):
+    """Return the position after the value of an element, without
+    decoding it.
+
+    Raises InvalidBSON if the value's length is invalid or the value
+    runs past `obj_end`, the end of the enclosing document.
+    """
+    if element_type in _ELEMENT_SIZE:
+        value_end = position + _ELEMENT_SIZE[element_type]
+    elif element_type in _MIN_VALUE_LENGTH:
+        length = _UNPACK_INT(data[position:position + 4])[0]
+        if length < _MIN_VALUE_LENGTH[element_type]:
+            raise InvalidBSON("invalid length for element type %r" %
+                              (element_type,))
+        value_end = position + _VALUE_LENGTH_OFFSET[element_type] + length
+    elif element_type == BSONRGX:
+        value_end = data.index(b"\x00", position) + 1
+        value_end = data.index(b"\x00", value_end) + 1
+    else:
+        raise InvalidBSON("no decoder for element type %r" % (element_type,))
+    if value_end > obj_end:
+        raise InvalidBSON("invalid object length")
+    return value_end
+
+
+def _raw_bson_index(data):
+    """Return a (name, position) pair for each element of a BSON document.
+
+    Only the names are decoded; `position` is the offset of the element's
+    type byte in `data`, for :func:`_raw_element_value`.
+    """
+    try:
+        obj_size = _UNPACK_INT(data[:4])[0]
+        if obj_size != len(data) or data[obj_size - 1:obj_size] != b"\x00":
+            raise InvalidBSON("invalid object size")
+        end = obj_size - 1
+        index = []
+        position = 4
+        while position < end:
+            element_type = data[position:position + 1]
+            name, value_position = _get_c_string(data, position + 1)
+            index.append((name, position))
+            position = _skip_value(data, value_position, element_type, end)
+        if position != end:
+            raise InvalidBSON("invalid object length")
+        return index
+    except InvalidBSON:
+        raise
+    except Exception:
+        # Change exception type to InvalidBSON but preserve traceback.
+        _, exc_value, exc_tb = sys.exc_info()
+        reraise(InvalidBSON, exc_value, exc_tb)
+if _USE_C:
+    _raw_bson_index = _cbson._raw_bson_index
+
+
+def _fields_tree(fields):
+    """Turn an iterable of dotted field names into a tree of dicts.
+
+    Each dict maps a field name to True, to select the whole field, or to
+    the dict of names to select from within it. For example
+    ``['a', 'b.c', 'b.d']`` becomes ``{'a': True, 'b': {'c': True,
+    'd': True}}``.
+    """
+    if isinstance(fields, string_type):
+        raise TypeError("fields must be a list of field names, not a string")
+    tree = {}
+    for field in fields:
+        if not isinstance(field, string_type):
+            raise TypeError("fields must be a list of field names, "
+                            "not %r" % (field,))
+        if not isinstance(field, text_type):
+            field = field.decode("utf-8")
+        node = tree
+        names = field.split(".")
+        for name in names[:-1]:
+            child = node.get(name)
+            if child is True:
+                # The whole parent field is already selected.
+                break
+            if child is None:
+                child = node[name] = {}
+            node = child
+        else:
+            node[names[-1]] = True
+    return tree
+
+
+def _get_object_fields(data, position, obj_end, opts, tree):
+    """Decode the fields selected by `tree` from a BSON subdocument."""
+    obj_size = _UNPACK_INT(data[position:position + 4])[0]
+    end = position + obj_size - 1
+    if data[end:position + obj_size] != b"\x00":
+        raise InvalidBSON("bad eoo")
+    if end >= obj_end:
+        raise InvalidBSON("invalid object length")
+    obj = _elements_to_dict_fields(data, position + 4, end, opts, tree)
+    return obj, position + obj_size
+
+
+def _get_array_fields(data, position, obj_end, opts, tree):
+    """Decode the fields selected by `tree` from each subdocument of a BSON
+    array. Other array elements are skipped.
+    """
+    size = _UNPACK_INT(data[position:position + 4])[0]
+    end = position + size - 1
+    if size < 5 or data[end:end + 1] != b"\x00":
+        raise InvalidBSON("bad eoo")
+    if end >= obj_end:
+        raise InvalidBSON("invalid object length")
+    position += 4
+    result = []
+    while position < end:
+        element_type = data[position:position + 1]
+        position = data.index(b"\x00", position + 1) + 1
+        if element_type == BSONOBJ:
+            value, position = _get_object_fields(data, position, obj_end,
+                                                 opts, tree)
+            result.append(value)
+        else:
+            position = _skip_value(data, position, element_type, end)
+    if position != end:
+        raise InvalidBSON("invalid object length")
+    return result, position + 1
+
+
+def _elements_to_dict_fields(data, position, obj_end, opts, tree):
+    """Decode the fields selected by `tree` from a BSON document, skipping
+    the others without decoding them.
+    """
+    result = opts.document_class()
+    end = obj_end - 1
+    while position < end:
+        element_type = data[position:position + 1]
+        name, position = _get_key(data, position + 1, opts)
+        selected = tree.get(name)
+        if selected is True:
+            value, position = _ELEMENT_GETTER[element_type](
+                data, position, obj_end, opts)
+            if opts.type_registry is not None:
+                value = _decode_custom_type(value, opts.type_registry)
+        elif selected is not None and element_type == BSONOBJ:
+            value, position = _get_object_fields(
+                data, position, obj_end, opts, selected)
+        elif selected is not None and element_type == BSONARR:
+            value, position = _get_array_fields(
+                data, position, obj_end, opts, selected)
+        else:
+            position = _skip_value(data, position, element_type, obj_end)
+            continue
+        result[name] = value
+    if position != obj_end:
+        raise InvalidBSON("invalid object length")
+    return result
+
+
+def _raw_element_value(data, position, opts):
+    """Decode the value of the element whose type byte is at `position`
+    in the BSON document `data`.
+    """
+    try:
+        element_type = data[position:position + 1]
+        position = data.index(b"\x00", position + 1) + 1
+        value = _ELEMENT_GETTER[element_type](data, position,
+                                              len(data) - 1, opts)[0]
+        if opts.type_registry is not None:
+            value = _decode_custom_type(value, opts.type_registry)
+        return value
+    except InvalidBSON:
+        raise
+    except Exception:
+        # Change exception type to InvalidBSON but preserve traceback.
+        _, exc_value, exc_tb = sys.exc_info()
+        reraise(InvalidBSON, exc_value, exc_tb)
+if _USE_C:
+    _raw_element_value = _cbson._raw_element_value
+
+
 _PACK_FLOAT = struct.Struct("<d").pack
 _PACK_INT = struct.Struct("<i").pack
 _PACK_LENGTH_SUBTYPE = struct.Struct("<iB").pack
@@ -429,6 +719,11 @@ def _encode_mapping(name, value, check_keys, opts):
     return b"\x03" + name + _PACK_INT(len(data) + 5) + data + b"\x00"
 
 
+def _encode_raw_document(name, value, dummy0, dummy1):
+    """Encode a bson.raw_bson.RawBSONDocument, reusing its bytes."""
+    return b"\x03" + name + value.raw
+
+
 def _encode_dbref(name, value, check_keys, opts):
     """Encode bson.dbref.DBRef."""
     buf = bytearray(b"\x03" + name + b"\x00\x00\x00\x00")
@@ -588,6 +883,104 @@ def _encode_maxkey(name, dummy0, dummy1, dummy2):
     return b"\x7F" + name
 
 
+def _pack_bool(value):
+    return value and b"\x01" or b"\x00"
+
+
+def _pack_int64(value):
+    try:
+        return _PACK_LONG(value)
+    except struct.error:
+        raise OverflowError("BSON can only handle up to 8-byte ints")
+
+
+# The kinds of the items of numeric buffers, by struct format code.
+_BUFFER_KINDS = {
+    "?": "bool",
+    "b": "int", "h": "int", "i": "int", "l": "int", "q": "int",
+    "B": "uint", "H": "uint", "I": "uint", "L": "uint", "Q": "uint",
+    "f": "float", "d": "float",
+}
+
+# The kinds of NumPy dtypes that are encoded as numbers: booleans, signed
+# and unsigned integers, and floats.
+_NUMERIC_DTYPE_KINDS = frozenset(["b", "i", "u", "f"])
+
+# The standard size struct format code, BSON type and packing function of
+# the items of numeric buffers, by their kind and size.
+_BUFFER_ITEMS = {
+    ("bool", 1): ("?", BSONBOO, _pack_bool),
+    ("int", 1): ("b", BSONINT, _PACK_INT),
+    ("int", 2): ("h", BSONINT, _PACK_INT),
+    ("int", 4): ("i", BSONINT, _PACK_INT),
+    ("int", 8): ("q", BSONLON, _pack_int64),
+    ("uint", 1): ("B", BSONINT, _PACK_INT),
+    ("uint", 2): ("H", BSONINT, _PACK_INT),
+    ("uint", 4): ("I", BSONLON, _pack_int64),
+    ("uint", 8): ("Q", BSONLON, _pack_int64),
+    ("float", 4): ("f", BSONNUM, _PACK_FLOAT),
+    ("float", 8): ("d", BSONNUM, _PACK_FLOAT),
+}
+
+
+def _numeric_buffer(value):
+    """Get the BSON type, packing function and items of a NumPy scalar or
+    one dimensional array, or of another object supporting the buffer
+    protocol with numeric items, and whether it is an array.
+
+    Returns None if `value` isn't such an object. Buffers of bytes are
+    only numeric for NumPy types, other byte strings aren't numbers, and
+    NumPy values are only numeric if their dtype is: datetime64 and
+    timedelta64 scalars export their items as bytes.
+    """
+    dtype = getattr(value, "dtype", None)
+    if (dtype is not None and
+            getattr(dtype, "kind", None) not in _NUMERIC_DTYPE_KINDS):
+        return None
+    try:
+        view = memoryview(value)
+    except (TypeError, ValueError):
+        return None
+    fmt = view.format
+    order = "="
+    if fmt[:1] in ("@", "=", "<", ">", "!"):
+        if fmt[0] != "@":
+            order = fmt[0]
+        fmt = fmt[1:]
+    if view.ndim > 1 or fmt not in _BUFFER_KINDS:
+        return None
+    if fmt in ("b", "B") and type(value).__module__ != "numpy":
+        return None
+    try:
+        code, type_byte, pack = _BUFFER_ITEMS[(_BUFFER_KINDS[fmt],
+                                               view.itemsize)]
+    except KeyError:
+        return None
+    count = view.shape[0] if view.ndim else 1
+    try:
+        data = view.tobytes()
+    except ValueError:
+        # Python 2's memoryview can't copy a strided buffer, NumPy can.
+        data = value.tobytes()
+    items = struct.unpack(order + str(count) + code, data)
+    return type_byte, pack, items, view.ndim == 1
+
+
+def _encode_numeric_buffer(name, value, dummy0, dummy1):
+    """Encode a NumPy scalar or array, or another numeric buffer."""
+    numeric = _numeric_buffer(value)
+    if numeric is None:
+        raise InvalidDocument("cannot convert value of type %s to bson" %
+                              type(value))
+    type_byte, pack, items, is_array = numeric
+    if not is_array:
+        return type_byte + name + pack(items[0])
+    lname = gen_list_name()
+    data = b"".join([type_byte + next(lname) + pack(item)
+                     for item in items])
+    return b"\x04" + name + _PACK_INT(len(data) + 5) + data + b"\x00"
+
+
 # Each encoder function's signature is:
 #   - name: utf-8 bytes
 #   - value: a Python data type, e.g. a Python int for _encode_int
@@ -631,6 +1024,7 @@ _MARKERS = {
     17: _encode_timestamp,
     18: _encode_long,
     100: _encode_dbref,
+    101: _encode_raw_document,
     127: _encode_maxkey,
     255: _encode_minkey,
 }
@@ -639,9 +1033,18 @@ if not PY3:
     _ENCODERS[long] = _encode_long
 
 
-def _name_value_to_bson(name, value, check_keys, opts):
+def _name_value_to_bson(name, value, check_keys, opts,
+                        in_custom_call=False):
     """Encode a single name, value pair."""
 
+    # Values with an encoder in the type registry are converted first. The
+    # converted value is encoded as is.
+    if not in_custom_call and opts.type_registry is not None:
+        encoder = opts.type_registry._encoder(type(value))
+        if encoder is not None:
+            return _name_value_to_bson(name, encoder(value), check_keys,
+                                       opts, True)
+
     # First see if the type is already cached. KeyError will only ever
     # happen once per subtype.
     try:
@@ -668,12 +1071,17 @@ def _name_value_to_bson(name, value, check_keys, opts):
             _ENCODERS[type(value)] = func
             return func(name, value, check_keys, opts)
 
+    # Last, NumPy scalars and arrays, without importing NumPy.
+    if _numeric_buffer(value) is not None:
+        _ENCODERS[type(value)] = _encode_numeric_buffer
+        return _encode_numeric_buffer(name, value, check_keys, opts)
+
     raise InvalidDocument("cannot convert value of type %s to bson" %
                           type(value))
 
 
-def _element_to_bson(key, value, check_keys, opts):
-    """Encode a single key, value pair."""
+def _key_to_name(key, check_keys):
+    """Check a document key and make it an element name."""
     if not isinstance(key, string_type):
         raise InvalidDocument("documents must have only string keys, "
                               "key was %r" % (key,))
@@ -683,12 +1091,23 @@ def _element_to_bson(key, value, check_keys, opts):
         if "." in key:
             raise InvalidDocument("key %r must not contain '.'" % (key,))
 
-    name = _make_name(key)
+    return _make_name(key)
+
+
+def _element_to_bson(key, value, check_keys, opts):
+    """Encode a single key, value pair."""
+    name = _key_to_name(key, check_keys)
     return _name_value_to_bson(name, value, check_keys, opts)
 
 
 def _dict_to_bson(doc, check_keys, opts, top_level=True):
     """Encode a document to BSON."""
+    if _raw_document_class(doc):
+        return doc.raw
+    if top_level and _compiled_codec(opts.document_class):
+        encoded = opts.document_class._encode(doc)
+        if encoded is not None:
+            return encoded
     try:
         elements = []
         if top_level and "_id" in doc:
@@ -711,18 +1130,192 @@ _CODEC_OPTIONS_TYPE_ERROR = TypeError(
     "codec_options must be an instance of CodecOptions")
 
 
-def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS):
+def _buffer_to_bytes(data):
+    """Return `data`, an object supporting the buffer protocol, as bytes."""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, bytearray):
+        return bytes(data)
+    view = _buffer_view(data)
+    if isinstance(view, memoryview):
+        return view.tobytes()
+    return view[:]
+
+
+def _buffer_view(data):
+    """Return `data`, an object supporting the buffer protocol, as an object
+    that can be sliced without copying the rest of it.
+    """
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, text_type):
+        raise TypeError("BSON data must be bytes or an object supporting "
+                        "the buffer protocol, not %r" % (type(data),))
+    try:
+        return memoryview(data)
+    except TypeError:
+        if PY3:
+            raise
+        # Objects like mmap only support the old buffer protocol in
+        # Python 2. Slicing a buffer copies just the slice.
+        return buffer(data)
+
+
+def _encode_into(document, buf, offset, check_keys, opts):
+    """Encode `document` at `offset` in `buf` and return the number of
+    bytes written.
+    """
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    encoded = _dict_to_bson(document, check_keys, opts)
+    end = offset + len(encoded)
+    if isinstance(buf, bytearray):
+        if offset > len(buf):
+            raise ValueError("offset is past the end of the buffer")
+    elif end > len(buf):
+        raise ValueError("buffer is too small")
+    buf[offset:end] = encoded
+    return len(encoded)
+if _USE_C:
+    _encode_into = _cbson._encode_into
+
+
+def encode_into(document, buf, offset=0, check_keys=False,
+                codec_options=DEFAULT_CODEC_OPTIONS):
+    """Encode a document into an existing buffer.
+
+    Works like :meth:`BSON.encode`, but writes the encoded document to
+    `buf` starting at `offset` instead of returning a new :class:`BSON`
+    instance, and returns the number of bytes written. If `buf` is a
+    :class:`bytearray` it is grown as needed, so documents can be appended
+    to it with ``encode_into(doc, buf, len(buf))``. Otherwise `buf` must be
+    a writable object supporting the buffer protocol, like
+    :class:`mmap.mmap`, with room for the document, or
+    :class:`ValueError` is raised.
+
+    :Parameters:
+      - `document`: mapping type representing a document
+      - `buf`: a :class:`bytearray` or other writable buffer
+      - `offset` (optional): where to write the document in `buf`
+      - `check_keys` (optional): check if keys start with '$' or
+        contain '.', raising :class:`~bson.errors.InvalidDocument` in
+        either case
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+
+    .. versionadded:: 3.0
+    """
+    if not isinstance(codec_options, CodecOptions):
+        raise _CODEC_OPTIONS_TYPE_ERROR
+
+    return _encode_into(document, buf, offset, check_keys, codec_options)
+
+
+# The encoded size of the values of fixed size types.
+_VALUE_SIZE = {
+    bool: 1,
+    datetime.datetime: 8,
+    float: 8,
+    type(None): 0,
+    MaxKey: 0,
+    MinKey: 0,
+    ObjectId: 12,
+    Timestamp: 8,
+}
+
+
+def _encoded_value_size(value, check_keys, opts):
+    """Get the encoded size of an element's value, without encoding it."""
+    if opts.type_registry is not None:
+        encoder = opts.type_registry._encoder(type(value))
+        if encoder is not None:
+            value = encoder(value)
+    value_type = type(value)
+    try:
+        return _VALUE_SIZE[value_type]
+    except KeyError:
+        pass
+    if value_type is text_type:
+        return len(_utf_8_encode(value)[0]) + 5
+    if value_type is dict or value_type is SON:
+        return _encoded_size(value, check_keys, opts, False)
+    if value_type is list or value_type is tuple:
+        size = 5
+        for index, item in enumerate(value):
+            size += (len(str(index)) + 2 +
+                     _encoded_value_size(item, check_keys, opts))
+        return size
+    # Other types are sized by encoding them, without a name.
+    return len(_name_value_to_bson(b"\x00", value, check_keys, opts,
+                                   True)) - 2
+
+
+def _encoded_size(doc, check_keys, opts, top_level=True):
+    """Get the size of a document encoded to BSON, without encoding it."""
+    if type(doc) is not dict and type(doc) is not SON:
+        # RawBSONDocuments, documents of a CompiledCodec and other mappings
+        # are sized by encoding them.
+        return len(_dict_to_bson(doc, check_keys, opts, top_level))
+    size = 5
+    for key, value in iteritems(doc):
+        size += (len(_key_to_name(key, check_keys)) + 1 +
+                 _encoded_value_size(value, check_keys, opts))
+    return size
+if _USE_C:
+    _encoded_size = _cbson._encoded_size
+
+
+def encoded_size(document, check_keys=False,
+                 codec_options=DEFAULT_CODEC_OPTIONS):
+    """Get the size of a document encoded to BSON, without encoding it.
+
+    Returns the same size as ``len(BSON.encode(document, check_keys,
+    codec_options))`` and raises the same errors, but walks the document
+    summing the sizes of its elements instead of encoding it, so no
+    output is allocated for the common types. Useful for planning how to
+    split documents into batches before encoding them.
+
+    :Parameters:
+      - `document`: mapping type representing a document
+      - `check_keys` (optional): check if keys start with '$' or
+        contain '.', raising :class:`~bson.errors.InvalidDocument` in
+        either case
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+
+    .. versionadded:: 3.0
+    """
+    if not isinstance(codec_options, CodecOptions):
+        raise _CODEC_OPTIONS_TYPE_ERROR
+
+    return _encoded_size(document, check_keys, codec_options)
+
+
+def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS, fields=None):
     """Decode BSON data to multiple documents.
 
     `data` must be a string of concatenated, valid, BSON-encoded
-    documents.
+    documents, or an object supporting the buffer protocol (e.g.
+    :class:`bytearray` or :class:`memoryview`) that holds them.
+
+    If `fields` is given only those fields are decoded, the others are
+    skipped without creating Python objects for them. Fields of embedded
+    documents are selected with dot notation, e.g. ``'address.city'``,
+    which also selects the field from each document in an array.
+    `fields` is ignored when decoding to
+    :class:`~bson.raw_bson.RawBSONDocument`.
 
     :Parameters:
       - `data`: BSON data
       - `codec_options` (optional): An instance of
         :class:`~bson.codec_options.CodecOptions`.
+      - `fields` (optional): A list of the field names to decode.
 
     .. versionchanged:: 3.0
+       `data` may be any object supporting the buffer protocol.
+
+       Added the `fields` parameter.
+
        Removed `compile_re` option: PyMongo now always represents BSON regular
        expressions as :class:`~bson.regex.Regex` objects. Use
        :meth:`~bson.regex.Regex.try_compile` to attempt to convert from a
@@ -743,9 +1336,16 @@ def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS):
     if not isinstance(codec_options, CodecOptions):
         raise _CODEC_OPTIONS_TYPE_ERROR
 
+    data = _buffer_to_bytes(data)
     docs = []
     position = 0
     end = len(data) - 1
+    # A CompiledCodec decodes whole documents, like RawBSONDocument.
+    use_raw = (_raw_document_class(codec_options.document_class) or
+               _compiled_codec(codec_options.document_class))
+    if fields is not None:
+        tree = _fields_tree(fields)
+    opts = _decoding_options(codec_options)
     try:
         while position < end:
             obj_size = _UNPACK_INT(data[position:position + 4])[0]
@@ -754,10 +1354,21 @@ def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS):
             obj_end = position + obj_size - 1
             if data[obj_end:position + obj_size] != b"\x00":
                 raise InvalidBSON("bad eoo")
-            docs.append(_elements_to_dict(data,
-                                          position + 4,
-                                          obj_end,
-                                          codec_options))
+            if use_raw:
+                docs.append(
+                    codec_options.document_class(
+                        data[position:obj_end + 1], codec_options))
+            elif fields is not None:
+                docs.append(_elements_to_dict_fields(data,
+                                                     position + 4,
+                                                     obj_end,
+                                                     opts,
+                                                     tree))
+            else:
+                docs.append(_elements_to_dict(data,
+                                              position + 4,
+                                              obj_end,
+                                              opts))
             position += obj_size
         return docs
     except InvalidBSON:
@@ -772,6 +1383,426 @@ if _USE_C:
     decode_all = _cbson.decode_all
 
 
+# The column types of decode_columns, in the order of the type codes used by
+# _decode_columns, and the width of their values in bytes.
+_COLUMN_TYPES = ('int32', 'int64', 'double', 'bool', 'datetime64', 'objectid')
+_COLUMN_WIDTHS = (4, 8, 8, 1, 8, 12)
+# The struct format codes of the typed buffers each column type accepts,
+# buffers of bytes are accepted for any column type.
+_COLUMN_FORMATS = (("i", "l"), ("q", "l"), ("d",), ("?",), ("q", "l"),
+                   ("12s",))
+
+
+def _column_int64_from_int32(data, position):
+    return _PACK_LONG(_UNPACK_INT(data[position:position + 4])[0])
+
+
+def _column_double_from_int32(data, position):
+    return _PACK_FLOAT(_UNPACK_INT(data[position:position + 4])[0])
+
+
+def _column_double_from_int64(data, position):
+    return _PACK_FLOAT(_UNPACK_LONG(data[position:position + 8])[0])
+
+
+def _column_bool(data, position):
+    if data[position:position + 1] == b"\x00":
+        return b"\x00"
+    return b"\x01"
+
+
+def _column_copy(width):
+    def copy(data, position):
+        return data[position:position + width]
+    return copy
+
+
+# For each column type, map the BSON types it accepts to a function
+# returning the column value of an element, as little-endian bytes.
+_COLUMN_READERS = (
+    {BSONINT: _column_copy(4)},
+    {BSONINT: _column_int64_from_int32,
+     BSONLON: _column_copy(8)},
+    {BSONNUM: _column_copy(8),
+     BSONINT: _column_double_from_int32,
+     BSONLON: _column_double_from_int64},
+    {BSONBOO: _column_bool},
+    {BSONDAT: _column_copy(8)},
+    {BSONOID: _column_copy(12)})
+
+
+def _decode_columns(data, specs):
+    """Append a row for each BSON document in `data` to the columns in
+    `specs`, a list of (encoded field name, column type code, values, mask)
+    tuples.
+    """
+    data = _buffer_to_bytes(data)
+    columns = dict((spec[0], spec) for spec in specs)
+    values = dict((name, []) for name in columns)
+    masks = dict((name, []) for name in columns)
+    position = 0
+    end = len(data) - 1
+    try:
+        while position < end:
+            obj_size = _UNPACK_INT(data[position:position + 4])[0]
+            if len(data) - position < obj_size:
+                raise InvalidBSON("invalid object size")
+            obj_end = position + obj_size - 1
+            if data[obj_end:position + obj_size] != b"\x00":
+                raise InvalidBSON("bad eoo")
+            row = {}
+            element = position + 4
+            while element < obj_end:
+                element_type = data[element:element + 1]
+                name_end = data.index(b"\x00", element + 1)
+                name = data[element + 1:name_end]
+                element = name_end + 1
+                if name in columns and name not in row:
+                    reader = _COLUMN_READERS[columns[name][1]].get(
+                        element_type)
+                    if reader is not None:
+                        row[name] = reader(data, element)
+                element = _skip_value(data, element, element_type,
+                                      obj_end)
+            if element != obj_end:
+                raise InvalidBSON("invalid object length")
+            for name, (_, type_code, _, _) in iteritems(columns):
+                value = row.get(name)
+                if value is None:
+                    values[name].append(b"\x00" * _COLUMN_WIDTHS[type_code])
+                    masks[name].append(b"\x00")
+                else:
+                    values[name].append(value)
+                    masks[name].append(b"\x01")
+            position += obj_size
+    except InvalidBSON:
+        raise
+    except Exception:
+        # Change exception type to InvalidBSON but preserve traceback.
+        _, exc_value, exc_tb = sys.exc_info()
+        reraise(InvalidBSON, exc_value, exc_tb)
+    for name, (_, _, column_values, column_mask) in iteritems(columns):
+        column_values += b"".join(values[name])
+        column_mask += b"".join(masks[name])
+if _USE_C:
+    _decode_columns = _cbson._decode_columns
+
+
+def decode_columns(data, schema, columns=None):
+    """Decode BSON data to typed columns, without creating a document for
+    each row.
+
+    `data` must be a string of concatenated, valid, BSON-encoded
+    documents, or an object supporting the buffer protocol that holds
+    them. `schema` maps the name of each top-level field to decode to its
+    column type:
+
+    ============== ============================ ==================
+    Column type    BSON types                   NumPy dtype
+    ============== ============================ ==================
+    ``int32``      int32                        ``'<i4'``
+    ``int64``      int32, int64                 ``'<i8'``
+    ``double``     double, int32, int64         ``'<f8'``
+    ``bool``       boolean                      ``'?'``
+    ``datetime64`` datetime                     ``'<M8[ms]'``
+    ``objectid``   ObjectId                     ``'S12'``
+    ============== ============================ ==================
+
+    Returns a dict mapping each field name to a ``(values, mask)`` pair of
+    :class:`bytearray`. `values` holds one fixed width, little-endian value
+    for each document and `mask` one byte, 1 if the document has a value
+    of an accepted type for the field and 0 if it doesn't, in which case
+    the value is zeroed. Both support the buffer protocol, so NumPy can
+    use them without copying::
+
+      >>> values, mask = bson.decode_columns(data, {'x': 'int64'})['x']
+      >>> x = numpy.ma.masked_array(numpy.frombuffer(values, '<i8'),
+      ...                           ~numpy.frombuffer(mask, '?'))
+
+    To decode a stream of BSON data pass the result of a previous call as
+    `columns`, the rows from `data` are appended to it.
+
+    :Parameters:
+      - `data`: BSON data
+      - `schema`: A mapping of field names to column types.
+      - `columns` (optional): A dict returned by a previous call with the
+        same `schema`, to append to.
+
+    .. versionadded:: 3.0
+    """
+    if not isinstance(schema, collections.Mapping):
+        raise TypeError("schema must be a mapping of field names to "
+                        "column types")
+    if columns is None:
+        columns = dict((name, (bytearray(), bytearray())) for name in schema)
+    elif (not isinstance(columns, dict) or
+            sorted(columns) != sorted(schema)):
+        raise ValueError("columns must be the result of decode_columns "
+                         "with the same schema")
+    specs = []
+    for name, column_type in iteritems(schema):
+        if not isinstance(name, string_type):
+            raise TypeError("field names must be strings, not %r"
+                            % (name,))
+        if column_type not in _COLUMN_TYPES:
+            raise ValueError("unknown column type %r, must be one of %s"
+                             % (column_type, ", ".join(_COLUMN_TYPES)))
+        if isinstance(name, text_type):
+            encoded_name = _utf_8_encode(name)[0]
+        else:
+            encoded_name = name
+        values, mask = columns[name]
+        specs.append((encoded_name, _COLUMN_TYPES.index(column_type),
+                      values, mask))
+    _decode_columns(data, specs)
+    return columns
+
+
+# The BSON type of the elements encoded from each column type.
+_COLUMN_BSON_TYPES = (BSONINT, BSONLON, BSONNUM, BSONBOO, BSONDAT, BSONOID)
+
+
+def _object_ids(count):
+    """Generate `count` new ObjectIds, as a bytearray of 12 byte ids."""
+    prefix, inc = ObjectId._reserve_inc(count)
+    head = struct.pack(">i", int(time.time())) + prefix
+    return bytearray(b"".join(
+        head + struct.pack(">i", (inc + i) % 0xFFFFFF)[1:4]
+        for i in range(count)))
+if _USE_C:
+    _object_ids = _cbson._object_ids
+
+
+def _generate_object_ids(cls, count):
+    """Generate a list of `count` new instances of `cls`, ObjectId or a
+    subclass of it.
+    """
+    ids = bytes(_object_ids(count))
+    return [cls(ids[i:i + 12]) for i in range(0, 12 * count, 12)]
+if _USE_C:
+    _generate_object_ids = _cbson._generate_object_ids
+
+
+def _infer_column_type(view):
+    """Get the column type of the values in a memoryview from its format,
+    or None.
+    """
+    fmt = view.format.lstrip("<=@")
+    if fmt in ("i", "l", "q"):
+        if view.itemsize == 4:
+            return "int32"
+        elif view.itemsize == 8:
+            return "int64"
+    elif fmt == "d":
+        return "double"
+    elif fmt == "?":
+        return "bool"
+    return None
+
+
+def _buffer_length(obj, name):
+    """Get a memoryview of a one dimensional buffer and its length in
+    bytes.
+    """
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        raise TypeError("column %r must support the buffer protocol"
+                        % (name,))
+    if view.ndim != 1:
+        raise ValueError("column %r must be one dimensional" % (name,))
+    return view, len(view) * view.itemsize
+
+
+def _column_specs(columns, schema=None, check_keys=True):
+    """Check the columns to encode to BSON documents, one per row.
+
+    `columns` maps field names to objects supporting the buffer protocol,
+    or to ``(values, mask)`` pairs like the results of
+    :func:`decode_columns`. `schema` optionally maps field names to column
+    types, which are otherwise inferred from the format of each buffer.
+    A typed buffer must hold little-endian values of its column type, a
+    buffer of bytes can hold any.
+
+    Returns a list of (encoded field name, column type code, values, mask)
+    tuples, the number of rows, and the values of the ``_id`` column. An
+    ``_id`` column of new ObjectIds is added if `columns` has none.
+    """
+    if not isinstance(columns, collections.Mapping) or not columns:
+        raise TypeError("columns must be a non-empty mapping of field "
+                        "names to arrays")
+    if schema is None:
+        schema = {}
+    elif not isinstance(schema, collections.Mapping):
+        raise TypeError("schema must be a mapping of field names to "
+                        "column types")
+    specs = []
+    rows = None
+    ids = None
+    for name, column in iteritems(columns):
+        if not isinstance(name, string_type):
+            raise TypeError("field names must be strings, not %r" % (name,))
+        if isinstance(column, tuple):
+            values, mask = column
+        else:
+            values, mask = column, None
+
+        view, length = _buffer_length(values, name)
+        column_type = schema.get(name)
+        if column_type is None:
+            column_type = _infer_column_type(view)
+            if column_type is None:
+                raise TypeError("can't encode column %r of format %r, "
+                                "give its column type in schema"
+                                % (name, view.format))
+        elif column_type not in _COLUMN_TYPES:
+            raise ValueError("unknown column type %r, must be one of %s"
+                             % (column_type, ", ".join(_COLUMN_TYPES)))
+        type_code = _COLUMN_TYPES.index(column_type)
+        width = _COLUMN_WIDTHS[type_code]
+        if view.itemsize > 1:
+            # Values are copied as they are, so a typed buffer must hold
+            # little-endian values of the column type.
+            if view.format[:1] in (">", "!"):
+                raise ValueError("column %r must be in little-endian byte "
+                                 "order" % (name,))
+            if (view.itemsize != width or view.format.lstrip("<=@")
+                    not in _COLUMN_FORMATS[type_code]):
+                raise ValueError("column %r does not hold %s values"
+                                 % (name, column_type))
+        if length % width:
+            raise ValueError("column %r does not hold %s values"
+                             % (name, column_type))
+        del view
+        if rows is None:
+            rows = length // width
+        elif rows != length // width:
+            raise ValueError("all columns must have the same length")
+        if mask is not None:
+            mask_view, mask_length = _buffer_length(mask, name)
+            del mask_view
+            if mask_length != rows:
+                raise ValueError("the mask of column %r must have one byte "
+                                 "per value" % (name,))
+
+        if isinstance(name, text_type):
+            encoded_name = _utf_8_encode(name)[0]
+        else:
+            encoded_name = name
+        if b"\x00" in encoded_name:
+            raise InvalidDocument("key %r must not contain null character"
+                                  % (name,))
+        if check_keys:
+            if name.startswith("$"):
+                raise InvalidDocument("key %r must not start with '$'"
+                                      % (name,))
+            if "." in name:
+                raise InvalidDocument("key %r must not contain '.'"
+                                      % (name,))
+
+        if name == "_id":
+            specs.insert(0, (encoded_name, type_code, values, mask))
+            ids = values
+        else:
+            specs.append((encoded_name, type_code, values, mask))
+    if not rows:
+        raise ValueError("columns must not be empty")
+    if ids is None:
+        ids = _object_ids(rows)
+        specs.insert(0, (b"_id", _COLUMN_TYPES.index("objectid"), ids, None))
+    return specs, rows, ids
+
+
+def _encode_column_rows(specs, rows):
+    """Generate the BSON document of each row of the columns in `specs`,
+    as returned by :func:`_column_specs`.
+    """
+    columns = []
+    for name, type_code, values, mask in specs:
+        if mask is not None:
+            mask = _buffer_to_bytes(mask)
+        columns.append((_COLUMN_BSON_TYPES[type_code] + name + b"\x00",
+                        _COLUMN_WIDTHS[type_code],
+                        _COLUMN_TYPES[type_code] == "bool",
+                        _buffer_to_bytes(values), mask))
+    for row in range(rows):
+        elements = []
+        for prefix, width, is_bool, values, mask in columns:
+            if mask is not None and mask[row:row + 1] == b"\x00":
+                continue
+            value = values[row * width:(row + 1) * width]
+            if is_bool and value != b"\x00":
+                value = b"\x01"
+            elements.append(prefix)
+            elements.append(value)
+        data = b"".join(elements)
+        yield _PACK_INT(len(data) + 5) + data + b"\x00"
+
+
+try:
+    array.array("q")
+    _OFFSET_TYPECODE = "q"
+except ValueError:
+    # Python 2 and Python 3.2 have no "q" typecode.
+    _OFFSET_TYPECODE = "l"
+
+
+def _document_offsets(data):
+    """Check the lengths and terminators of the BSON documents in `data`
+    and return an array of their (offset, length) pairs.
+    """
+    data = _buffer_view(data)
+    offsets = []
+    position = 0
+    end = len(data)
+    while position < end:
+        if end - position < 5:
+            raise InvalidBSON("not enough data for a BSON document")
+        obj_size = _UNPACK_INT_FROM(data, position)[0]
+        if obj_size < 5:
+            raise InvalidBSON("invalid message size")
+        if obj_size > end - position:
+            raise InvalidBSON("objsize too large")
+        if data[position + obj_size - 1:position + obj_size] != b"\x00":
+            raise InvalidBSON("bad eoo")
+        offsets.append(position)
+        offsets.append(obj_size)
+        position += obj_size
+    return array.array(_OFFSET_TYPECODE, offsets)
+
+
+if _USE_C and array.array(_OFFSET_TYPECODE).itemsize == 8:
+    def _document_offsets(data):
+        # The extension packs the pairs as native 64-bit integers.
+        return array.array(_OFFSET_TYPECODE, _cbson._document_offsets(data))
+
+
+def document_offsets(data):
+    """Find the boundaries of concatenated BSON documents without
+    decoding them.
+
+    Checks the length prefix and terminating null byte of each document
+    in `data` and returns an :class:`array.array` of 64-bit integers
+    holding the offset and length of each document in turn, so document
+    ``i`` is ``data[offsets[2 * i]:offsets[2 * i] + offsets[2 * i + 1]]``.
+    No object is created per document, which makes this a fast way to
+    count the documents in a buffer, to split it between worker processes,
+    or to slice raw documents out of it to insert them again.
+
+    Raises :class:`~bson.errors.InvalidBSON` if a length or terminator is
+    invalid. The elements of the documents are not validated.
+
+    `data` must be a string of concatenated, BSON-encoded documents, or
+    an object supporting the buffer protocol that holds them.
+
+    :Parameters:
+      - `data`: BSON data
+
+    .. versionadded:: 3.0
+    """
+    return _document_offsets(data)
+
+
 def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
     """Decode BSON data to multiple documents as a generator.
 
@@ -779,7 +1810,9 @@ def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
     time.
 
     `data` must be a string of concatenated, valid, BSON-encoded
-    documents.
+    documents, or an object supporting the buffer protocol (e.g.
+    :class:`bytearray`, :class:`memoryview` or :class:`mmap.mmap`) that
+    holds them. Documents are decoded in place, without copying `data`.
 
     :Parameters:
       - `data`: BSON data
@@ -787,6 +1820,8 @@ def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
         :class:`~bson.codec_options.CodecOptions`.
 
     .. versionchanged:: 3.0
+       `data` may be any object supporting the buffer protocol.
+
        Replaced `as_class`, `tz_aware`, and `uuid_subtype` options with
        `codec_options`.
 
@@ -795,10 +1830,14 @@ def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
     if not isinstance(codec_options, CodecOptions):
         raise _CODEC_OPTIONS_TYPE_ERROR
 
+    data = _buffer_view(data)
     position = 0
     end = len(data) - 1
     while position < end:
-        obj_size = _UNPACK_INT(data[position:position + 4])[0]
+        try:
+            obj_size = _UNPACK_INT_FROM(data, position)[0]
+        except struct.error as exc:
+            raise InvalidBSON(str(exc))
         elements = data[position:position + obj_size]
         position += obj_size
 
@@ -834,18 +1873,107 @@ def decode_file_iter(file_obj, codec_options=DEFAULT_CODEC_OPTIONS):
         yield _bson_to_dict(elements, codec_options)
 
 
+def decode_file_mmap(path, codec_options=DEFAULT_CODEC_OPTIONS):
+    """Decode the bson data in a file to multiple documents as a generator,
+    through a read-only memory map of the file.
+
+    Works like :func:`decode_file_iter`, but instead of reading the file
+    each document is decoded straight from the mapping, so even a
+    multi-gigabyte file, like a collection dumped by mongodump, is never
+    read into memory.
+
+    :Parameters:
+      - `path`: The path of a file containing BSON data.
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+
+    .. versionadded:: 3.0
+    """
+    if not isinstance(codec_options, CodecOptions):
+        raise _CODEC_OPTIONS_TYPE_ERROR
+
+    with open(path, "rb") as file_obj:
+        if not os.fstat(file_obj.fileno()).st_size:
+            # An empty file can't be mapped.
+            return
+        mapping = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+    docs = decode_iter(mapping, codec_options)
+    try:
+        for doc in docs:
+            yield doc
+    finally:
+        docs.close()
+        try:
+            mapping.close()
+        except BufferError:
+            # A view of the mapping is still referenced, e.g. by a
+            # traceback. The mapping is closed when it is collected.
+            pass
+
+
+# How much of a file _raw_file_iter reads at a time.
+_RAW_FILE_CHUNK_SIZE = 1024 * 1024
+
+
+def _raw_file_iter(file_obj, chunk_size=_RAW_FILE_CHUNK_SIZE):
+    """Read concatenated BSON documents from a file, yielding the bytes of
+    each one without decoding it.
+
+    The file is read `chunk_size` bytes at a time, only the length prefix
+    and terminating null byte of each document are checked. The rest of a
+    document that doesn't fit in the chunk is read in one call.
+    """
+    data = b""
+    position = 0
+    while True:
+        if len(data) - position < 4:
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                break
+            # Only the start of a length prefix is carried over.
+            data = data[position:] + chunk
+            position = 0
+            continue
+        obj_size = _UNPACK_INT_FROM(data, position)[0]
+        if obj_size < 5:
+            raise InvalidBSON("invalid object size")
+        obj_end = position + obj_size
+        if obj_end <= len(data):
+            document = data[position:obj_end]
+            position = obj_end
+        else:
+            document = data[position:] + file_obj.read(obj_end - len(data))
+            if len(document) != obj_size:
+                raise InvalidBSON("cut off in middle of object")
+            data = b""
+            position = 0
+        if document[-1:] != b"\x00":
+            raise InvalidBSON("bad eoo")
+        yield document
+    if position < len(data):
+        raise InvalidBSON("cut off in middle of object")
+
+
 def is_valid(bson):
     """Check that the given string represents valid :class:`BSON` data.
 
     Raises :class:`TypeError` if `bson` is not an instance of
-    :class:`str` (:class:`bytes` in python 3). Returns ``True``
-    if `bson` is valid :class:`BSON`, ``False`` otherwise.
+    :class:`str` (:class:`bytes` in python 3) or another object supporting
+    the buffer protocol. Returns ``True`` if `bson` is valid :class:`BSON`,
+    ``False`` otherwise.
 
     :Parameters:
       - `bson`: the data to be validated
+
+    .. versionchanged:: 3.0
+       `bson` may be any object supporting the buffer protocol.
     """
     if not isinstance(bson, bytes):
-        raise TypeError("BSON data must be an instance of a subclass of bytes")
+        try:
+            bson = _buffer_view(bson)
+        except TypeError:
+            raise TypeError("BSON data must be an instance of a subclass of "
+                            "bytes or support the buffer protocol")
 
     try:
         _bson_to_dict(bson, DEFAULT_CODEC_OPTIONS)
@@ -22,6 +22,7 @@
 
 #include "Python.h"
 #include "datetime.h"
+#include <time.h>
 
 #include "buffer.h"
 #include "time64.h"
@@ -110,22 +111,141 @@ _downcast_and_check(Py_ssize_t size, int extra) {
     return (int)size + extra;
 }
 
+/* The _type_marker of bson.raw_bson.RawBSONDocument. */
+#define RAW_BSON_DOCUMENT_MARKER 101
+
+/* The _type_marker of bson.compiled_codec.CompiledCodec. */
+#define COMPILED_CODEC_MARKER 102
+
+/* Get the _type_marker of an object, or 0 if it has none.
+ *
+ * Returns -1 on error. */
+static long _type_marker(PyObject* object) {
+    PyObject* type_marker;
+    long type = 0;
+
+    if (!PyObject_HasAttrString(object, "_type_marker")) {
+        return 0;
+    }
+    type_marker = PyObject_GetAttrString(object, "_type_marker");
+    if (type_marker == NULL) {
+        return -1;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (PyLong_CheckExact(type_marker)) {
+        type = PyLong_AsLong(type_marker);
+#else
+    if (PyInt_CheckExact(type_marker)) {
+        type = PyInt_AsLong(type_marker);
+#endif
+        if (type == -1 && PyErr_Occurred()) {
+            Py_DECREF(type_marker);
+            return -1;
+        }
+    }
+    Py_DECREF(type_marker);
+    return type;
+}
+
+/* Set the type registry fields of a codec_options_t* from a
+ * CodecOptions.type_registry. type_encoders is the registry's cache of
+ * encoders by type, left NULL if the registry has no encoders, and
+ * type_decoders its decoders, left NULL if it has none.
+ *
+ * Returns 0 on failure. */
+static int _load_type_registry(PyObject* type_registry,
+                               codec_options_t* options) {
+    PyObject* encoders;
+    PyObject* decoders;
+
+    options->type_registry = NULL;
+    options->type_encoders = NULL;
+    options->type_decoders = NULL;
+    if (type_registry == Py_None) {
+        return 1;
+    }
+    encoders = PyObject_GetAttrString(type_registry,
+                                      "_TypeRegistry__encoder_cache");
+    if (!encoders) {
+        return 0;
+    }
+    decoders = PyObject_GetAttrString(type_registry,
+                                      "_TypeRegistry__decoders");
+    if (!decoders) {
+        Py_DECREF(encoders);
+        return 0;
+    }
+    if (!PyDict_Check(decoders) ||
+        !(encoders == Py_None || PyDict_Check(encoders))) {
+        PyErr_SetString(PyExc_TypeError, "invalid type_registry");
+        Py_DECREF(encoders);
+        Py_DECREF(decoders);
+        return 0;
+    }
+    if (encoders == Py_None) {
+        Py_DECREF(encoders);
+    } else {
+        options->type_encoders = encoders;
+    }
+    if (PyDict_Size(decoders)) {
+        options->type_decoders = decoders;
+    } else {
+        Py_DECREF(decoders);
+    }
+    Py_INCREF(type_registry);
+    options->type_registry = type_registry;
+    return 1;
+}
+
+/* A cache of decoded field names for CodecOptions.intern_keys, so that
+ * the documents decoded by one call share one string object per name and
+ * repeated names skip the UTF-8 decode. Each call's codec_options_t owns
+ * its cache, which is freed with them. It is direct mapped on a hash of
+ * the encoded name, bounding it to KEY_CACHE_SIZE names of at most
+ * KEY_CACHE_MAX_LENGTH bytes. */
+#define KEY_CACHE_SIZE 1024
+#define KEY_CACHE_MAX_LENGTH 64
+
+struct key_cache_entry {
+    PyObject* name;
+    size_t length;
+    char encoded[KEY_CACHE_MAX_LENGTH];
+};
+
 /* Fill out a codec_options_t* from a CodecOptions object. Use with the "O&"
  * format spec in PyArg_ParseTuple.
  *
- * Return 1 on success. options->document_class is a new reference.
+ * Return 1 on success. options->document_class and options->options_obj
+ * are new references.
  * Return 0 on failure.
  */
 int convert_codec_options(PyObject* options_obj, void* p) {
     codec_options_t* options = (codec_options_t*)p;
-    if (!PyArg_ParseTuple(options_obj, "Obb",
+    long type_marker;
+    PyObject* type_registry;
+    options->key_cache = NULL;
+    if (!PyArg_ParseTuple(options_obj, "ObbbO",
                           &options->document_class,
                           &options->tz_aware,
-                          &options->uuid_rep)) {
+                          &options->uuid_rep,
+                          &options->intern_keys,
+                          &type_registry)) {
+        return 0;
+    }
+
+    type_marker = _type_marker(options->document_class);
+    if (type_marker < 0) {
+        return 0;
+    }
+    options->is_raw_bson = (type_marker == RAW_BSON_DOCUMENT_MARKER);
+    options->is_compiled = (type_marker == COMPILED_CODEC_MARKER);
+    if (!_load_type_registry(type_registry, options)) {
         return 0;
     }
 
     Py_INCREF(options->document_class);
+    Py_INCREF(options_obj);
+    options->options_obj = options_obj;
     return 1;
 }
 
@@ -137,10 +257,30 @@ void default_codec_options(codec_options_t* options) {
     // TODO: set to "1". PYTHON-526, setting tz_aware=True by default.
     options->tz_aware = 0;
     options->uuid_rep = PYTHON_LEGACY;
+    options->options_obj = NULL;
+    options->is_raw_bson = 0;
+    options->is_compiled = 0;
+    options->intern_keys = 0;
+    options->type_registry = NULL;
+    options->type_encoders = NULL;
+    options->type_decoders = NULL;
+    options->key_cache = NULL;
 }
 
 void destroy_codec_options(codec_options_t* options) {
     Py_CLEAR(options->document_class);
+    Py_CLEAR(options->options_obj);
+    Py_CLEAR(options->type_registry);
+    Py_CLEAR(options->type_encoders);
+    Py_CLEAR(options->type_decoders);
+    if (options->key_cache) {
+        int i;
+        for (i = 0; i < KEY_CACHE_SIZE; i++) {
+            Py_XDECREF(options->key_cache[i].name);
+        }
+        PyMem_Free(options->key_cache);
+        options->key_cache = NULL;
+    }
 }
 
 static PyObject* elements_to_dict(PyObject* self, const char* string,
@@ -401,15 +541,56 @@ static int _load_python_objects(PyObject* module) {
     return 0;
 }
 
+/* Convert `value` with the encoder for its type in the type registry.
+ * The encoder is looked up in the registry's cache, and resolved by the
+ * registry the first time a type is seen.
+ *
+ * Returns a new reference to the converted value, or to `value` if its
+ * type has no encoder, or NULL on failure. */
+static PyObject* _encode_custom_type(PyObject* value,
+                                     const codec_options_t* options) {
+    PyObject* value_type = (PyObject*)Py_TYPE(value);
+    PyObject* converted;
+    /* Borrowed reference. */
+    PyObject* encoder = PyDict_GetItem(options->type_encoders, value_type);
+
+    if (encoder) {
+        Py_INCREF(encoder);
+    } else {
+        encoder = PyObject_CallMethod(options->type_registry, "_encoder",
+                                      "(O)", value_type);
+        if (!encoder) {
+            return NULL;
+        }
+    }
+    if (encoder == Py_None) {
+        Py_DECREF(encoder);
+        Py_INCREF(value);
+        return value;
+    }
+    converted = PyObject_CallFunctionObjArgs(encoder, value, NULL);
+    Py_DECREF(encoder);
+    return converted;
+}
+
 static int write_element_to_buffer(PyObject* self, buffer_t buffer,
                                    int type_byte, PyObject* value,
                                    unsigned char check_keys,
                                    const codec_options_t* options) {
     int result;
+    PyObject* converted = NULL;
     if(Py_EnterRecursiveCall(" while encoding an object to BSON "))
         return 0;
+    if (options->type_encoders) {
+        if (!(converted = _encode_custom_type(value, options))) {
+            Py_LeaveRecursiveCall();
+            return 0;
+        }
+        value = converted;
+    }
     result = _write_element_to_buffer(self, buffer, type_byte,
                                       value, check_keys, options);
+    Py_XDECREF(converted);
     Py_LeaveRecursiveCall();
     return result;
 }
@@ -585,6 +766,249 @@ static int _write_regex_to_buffer(
     return 1;
 }
 
+/* Is `value` an instance of a type from the numpy package? */
+static int _is_numpy(PyObject* value) {
+    int result = 0;
+    PyObject* module = PyObject_GetAttrString((PyObject*)Py_TYPE(value),
+                                              "__module__");
+    if (!module) {
+        PyErr_Clear();
+        return 0;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (PyUnicode_Check(module)) {
+        result = (PyUnicode_CompareWithASCIIString(module, "numpy") == 0);
+    }
+#else
+    if (PyString_Check(module)) {
+        result = (strcmp(PyString_AS_STRING(module), "numpy") == 0);
+    }
+#endif
+    Py_DECREF(module);
+    return result;
+}
+
+/* Does `value` have a NumPy dtype whose items aren't booleans, integers
+ * or floats? datetime64 and timedelta64 scalars export their items as
+ * bytes, which would otherwise be written as an array of small ints. */
+static int _has_non_numeric_dtype(PyObject* value) {
+    int result = 1;
+    PyObject* dtype;
+    PyObject* kind;
+
+    if (!PyObject_HasAttrString(value, "dtype")) {
+        return 0;
+    }
+    dtype = PyObject_GetAttrString(value, "dtype");
+    if (!dtype) {
+        PyErr_Clear();
+        return 1;
+    }
+    kind = PyObject_GetAttrString(dtype, "kind");
+    Py_DECREF(dtype);
+    if (!kind) {
+        PyErr_Clear();
+        return 1;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (PyUnicode_Check(kind)) {
+        result = !(PyUnicode_CompareWithASCIIString(kind, "b") == 0 ||
+                   PyUnicode_CompareWithASCIIString(kind, "i") == 0 ||
+                   PyUnicode_CompareWithASCIIString(kind, "u") == 0 ||
+                   PyUnicode_CompareWithASCIIString(kind, "f") == 0);
+    }
+#else
+    if (PyString_Check(kind) && PyString_GET_SIZE(kind) == 1) {
+        result = !strchr("biuf", PyString_AS_STRING(kind)[0]);
+    }
+#endif
+    Py_DECREF(kind);
+    return result;
+}
+
+/* Get the BSON type of the items of a numeric buffer from their struct
+ * format code and size, or 0 if they aren't supported. */
+static char _numeric_bson_type(char code, Py_ssize_t itemsize) {
+    switch (code) {
+    case '?':
+        return itemsize == 1 ? 0x08 : 0;
+    case 'f':
+        return itemsize == 4 ? 0x01 : 0;
+    case 'd':
+        return itemsize == 8 ? 0x01 : 0;
+    case 'b':
+    case 'h':
+    case 'i':
+    case 'l':
+    case 'q':
+        if (itemsize == 1 || itemsize == 2 || itemsize == 4) {
+            return 0x10;
+        }
+        return itemsize == 8 ? 0x12 : 0;
+    case 'B':
+    case 'H':
+    case 'I':
+    case 'L':
+    case 'Q':
+        if (itemsize == 1 || itemsize == 2) {
+            return 0x10;
+        }
+        return (itemsize == 4 || itemsize == 8) ? 0x12 : 0;
+    }
+    return 0;
+}
+
+/* Write the numeric buffer item at `data` as a value of `bson_type`,
+ * reversing its bytes first if `swap` is set.
+ *
+ * Returns 0 on failure. */
+static int _write_numeric_item(buffer_t buffer, const char* data,
+                               char code, Py_ssize_t itemsize, int swap,
+                               char bson_type) {
+    unsigned char item[8];
+    Py_ssize_t i;
+
+    for (i = 0; i < itemsize; i++) {
+        item[i] = data[swap ? itemsize - 1 - i : i];
+    }
+    if (bson_type == 0x08) {
+        const char c = item[0] ? 0x01 : 0x00;
+        return buffer_write_bytes(buffer, &c, 1);
+    } else if (bson_type == 0x01) {
+        double d;
+        if (itemsize == 4) {
+            float f;
+            memcpy(&f, item, 4);
+            d = f;
+        } else {
+            memcpy(&d, item, 8);
+        }
+        return buffer_write_bytes(buffer, (const char*)&d, 8);
+    } else {
+        long long value;
+        int is_signed = (code == 'b' || code == 'h' || code == 'i' ||
+                         code == 'l' || code == 'q');
+        if (itemsize == 1) {
+            value = is_signed ? (long long)*(signed char*)item
+                              : (long long)item[0];
+        } else if (itemsize == 2) {
+            unsigned short u;
+            short n;
+            memcpy(&u, item, 2);
+            memcpy(&n, item, 2);
+            value = is_signed ? (long long)n : (long long)u;
+        } else if (itemsize == 4) {
+            unsigned int u;
+            int n;
+            memcpy(&u, item, 4);
+            memcpy(&n, item, 4);
+            value = is_signed ? (long long)n : (long long)u;
+        } else {
+            unsigned long long u;
+            memcpy(&u, item, 8);
+            if (!is_signed && u > (unsigned long long)LLONG_MAX) {
+                PyErr_SetString(PyExc_OverflowError,
+                                "MongoDB can only handle up to 8-byte ints");
+                return 0;
+            }
+            memcpy(&value, item, 8);
+        }
+        if (bson_type == 0x10) {
+            const int int_value = (int)value;
+            return buffer_write_bytes(buffer, (const char*)&int_value, 4);
+        }
+        return buffer_write_bytes(buffer, (const char*)&value, 8);
+    }
+}
+
+/* Write a NumPy scalar or one dimensional array, or another object
+ * supporting the buffer protocol with numeric items, as a BSON int32,
+ * int64, double or boolean, or an array of them. Buffers of bytes are
+ * only written for NumPy types, other byte strings aren't numbers, and
+ * NumPy values are only written if their dtype is numeric.
+ *
+ * Returns 1 if the value was written, 0 if it isn't a numeric buffer and
+ * -1 on failure. */
+static int _write_numeric_buffer(buffer_t buffer, int type_byte,
+                                 PyObject* value) {
+    Py_buffer view;
+    const char* format;
+    const int one = 1;
+    const int little_endian = *(const char*)&one;
+    char order = '=';
+    char code;
+    char bson_type;
+    int swap;
+    int result = -1;
+
+    if (!PyObject_CheckBuffer(value) || _has_non_numeric_dtype(value)) {
+        return 0;
+    }
+    if (PyObject_GetBuffer(value, &view, PyBUF_RECORDS_RO) == -1) {
+        PyErr_Clear();
+        return 0;
+    }
+    format = view.format ? view.format : "B";
+    if (*format && strchr("@=<>!", *format)) {
+        if (*format != '@') {
+            order = *format;
+        }
+        format++;
+    }
+    code = format[0];
+    if (!code || format[1] || view.ndim > 1 ||
+        !(bson_type = _numeric_bson_type(code, view.itemsize)) ||
+        ((code == 'b' || code == 'B') && !_is_numpy(value))) {
+        PyBuffer_Release(&view);
+        return 0;
+    }
+    swap = ((order == '<' && !little_endian) ||
+            ((order == '>' || order == '!') && little_endian));
+
+    if (view.ndim == 0) {
+        *(buffer_get_buffer(buffer) + type_byte) = bson_type;
+        if (_write_numeric_item(buffer, (const char*)view.buf, code,
+                                view.itemsize, swap, bson_type)) {
+            result = 1;
+        }
+    } else {
+        Py_ssize_t items = view.shape[0];
+        Py_ssize_t stride = view.strides ? view.strides[0] : view.itemsize;
+        Py_ssize_t i;
+        int length_location;
+        int length;
+        char zero = 0;
+
+        *(buffer_get_buffer(buffer) + type_byte) = 0x04;
+        length_location = buffer_save_space(buffer, 4);
+        if (length_location == -1) {
+            PyErr_NoMemory();
+            goto done;
+        }
+        for (i = 0; i < items; i++) {
+            char name[16];
+            INT2STRING(name, (int)i);
+            if (!buffer_write_bytes(buffer, &bson_type, 1) ||
+                !buffer_write_bytes(buffer, name, (int)strlen(name) + 1) ||
+                !_write_numeric_item(buffer,
+                                     (const char*)view.buf + i * stride,
+                                     code, view.itemsize, swap, bson_type)) {
+                goto done;
+            }
+        }
+        if (!buffer_write_bytes(buffer, &zero, 1)) {
+            goto done;
+        }
+        length = buffer_get_position(buffer) - length_location;
+        memcpy(buffer_get_buffer(buffer) + length_location, &length, 4);
+        result = 1;
+    }
+
+done:
+    PyBuffer_Release(&view);
+    return result;
+}
+
 /* TODO our platform better be little-endian w/ 4-byte ints! */
 /* Write a single value to the buffer (also write its type_byte, for which
  * space has already been reserved.
@@ -598,6 +1022,7 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
     PyObject* type_marker = NULL;
     PyObject* mapping_type;
     PyObject* uuid_type;
+    int written;
 
     /*
      * Don't use PyObject_IsInstance for our custom types. It causes
@@ -829,6 +1254,15 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
                 *(buffer_get_buffer(buffer) + type_byte) = 0x12;
                 return 1;
             }
+        case RAW_BSON_DOCUMENT_MARKER:
+            {
+                /* RawBSONDocument, written as is by write_dict. */
+                if (!write_dict(self, buffer, value, 0, options, 0)) {
+                    return 0;
+                }
+                *(buffer_get_buffer(buffer) + type_byte) = 0x03;
+                return 1;
+            }
         case 100:
             {
                 /* DBRef */
@@ -1153,6 +1587,13 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
     }
     Py_XDECREF(mapping_type);
     Py_XDECREF(uuid_type);
+
+    /* NumPy scalars and arrays, without importing NumPy. */
+    written = _write_numeric_buffer(buffer, type_byte, value);
+    if (written) {
+        return written == 1;
+    }
+
     /* We can't determine value's type. Fail. */
     _set_cannot_encode(value);
     return 0;
@@ -1232,39 +1673,38 @@ int write_pair(PyObject* self, buffer_t buffer, const char* name, int name_lengt
     return 1;
 }
 
-int decode_and_write_pair(PyObject* self, buffer_t buffer,
-                          PyObject* key, PyObject* value,
-                          unsigned char check_keys,
-                          const codec_options_t* options,
-                          unsigned char top_level) {
+/* Encode a document key to UTF-8, checking that it is a string without
+ * NULL bytes.
+ *
+ * Returns a new reference to the encoded key and sets `data` and `size`,
+ * which includes the trailing NULL byte, or returns NULL on failure. */
+static PyObject* _encode_key(PyObject* key, const char** data, int* size) {
     PyObject* encoded;
-    const char* data;
-    int size;
     if (PyUnicode_Check(key)) {
         encoded = PyUnicode_AsUTF8String(key);
         if (!encoded) {
-            return 0;
+            return NULL;
         }
 #if PY_MAJOR_VERSION >= 3
-        if (!(data = PyBytes_AS_STRING(encoded))) {
+        if (!(*data = PyBytes_AS_STRING(encoded))) {
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         }
-        if ((size = _downcast_and_check(PyBytes_GET_SIZE(encoded), 1)) == -1) {
+        if ((*size = _downcast_and_check(PyBytes_GET_SIZE(encoded), 1)) == -1) {
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         }
 #else
-        if (!(data = PyString_AS_STRING(encoded))) {
+        if (!(*data = PyString_AS_STRING(encoded))) {
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         }
-        if ((size = _downcast_and_check(PyString_GET_SIZE(encoded), 1)) == -1) {
+        if ((*size = _downcast_and_check(PyString_GET_SIZE(encoded), 1)) == -1) {
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         }
 #endif
-        if (strlen(data) != (size_t)(size - 1)) {
+        if (strlen(*data) != (size_t)(*size - 1)) {
             PyObject* InvalidDocument = _error("InvalidDocument");
             if (InvalidDocument) {
                 PyErr_SetString(InvalidDocument,
@@ -1272,7 +1712,7 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
                 Py_DECREF(InvalidDocument);
             }
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         }
 #if PY_MAJOR_VERSION < 3
     } else if (PyString_Check(key)) {
@@ -1280,15 +1720,15 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
         encoded = key;
         Py_INCREF(encoded);
 
-        if (!(data = PyString_AS_STRING(encoded))) {
+        if (!(*data = PyString_AS_STRING(encoded))) {
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         }
-        if ((size = _downcast_and_check(PyString_GET_SIZE(encoded), 1)) == -1) {
+        if ((*size = _downcast_and_check(PyString_GET_SIZE(encoded), 1)) == -1) {
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         }
-        status = check_string((const unsigned char*)data, size - 1, 1, 1);
+        status = check_string((const unsigned char*)*data, *size - 1, 1, 1);
 
         if (status == NOT_UTF_8) {
             PyObject* InvalidStringData = _error("InvalidStringData");
@@ -1298,7 +1738,7 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
                 Py_DECREF(InvalidStringData);
             }
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         } else if (status == HAS_NULL) {
             PyObject* InvalidDocument = _error("InvalidDocument");
             if (InvalidDocument) {
@@ -1307,7 +1747,7 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
                 Py_DECREF(InvalidDocument);
             }
             Py_DECREF(encoded);
-            return 0;
+            return NULL;
         }
 #endif
     } else {
@@ -1344,6 +1784,20 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
             }
             Py_DECREF(InvalidDocument);
         }
+        return NULL;
+    }
+    return encoded;
+}
+
+int decode_and_write_pair(PyObject* self, buffer_t buffer,
+                          PyObject* key, PyObject* value,
+                          unsigned char check_keys,
+                          const codec_options_t* options,
+                          unsigned char top_level) {
+    PyObject* encoded;
+    const char* data;
+    int size;
+    if (!(encoded = _encode_key(key, &data, &size))) {
         return 0;
     }
 
@@ -1358,6 +1812,82 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
     return 1;
 }
 
+/* Write the bytes of a RawBSONDocument.
+ *
+ * returns 0 on failure */
+static int write_raw_document(buffer_t buffer, PyObject* raw_document) {
+    PyObject* raw;
+    char* data;
+    Py_ssize_t size;
+    int result;
+
+    raw = PyObject_GetAttrString(raw_document, "raw");
+    if (!raw) {
+        return 0;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (PyBytes_AsStringAndSize(raw, &data, &size) == -1) {
+#else
+    if (PyString_AsStringAndSize(raw, &data, &size) == -1) {
+#endif
+        Py_DECREF(raw);
+        return 0;
+    }
+    if (size < BSON_MIN_SIZE || size > BSON_MAX_SIZE) {
+        PyObject* InvalidDocument = _error("InvalidDocument");
+        if (InvalidDocument) {
+            PyErr_SetString(InvalidDocument,
+                            "invalid RawBSONDocument size");
+            Py_DECREF(InvalidDocument);
+        }
+        Py_DECREF(raw);
+        return 0;
+    }
+    result = buffer_write_bytes(buffer, data, (int)size);
+    Py_DECREF(raw);
+    return result;
+}
+
+/* Encode `obj` with a CompiledCodec, if it's an instance of the codec's
+ * class.
+ *
+ * Returns 1 if the document was written, 0 if `obj` isn't an instance of
+ * the codec's class and -1 on failure. */
+static int write_compiled_document(buffer_t buffer, PyObject* obj,
+                                   const codec_options_t* options) {
+    PyObject* encoded;
+    char* data;
+    Py_ssize_t size;
+    int result = -1;
+
+    encoded = PyObject_CallMethod(options->document_class, "_encode", "(O)",
+                                  obj);
+    if (!encoded) {
+        return -1;
+    }
+    if (encoded == Py_None) {
+        Py_DECREF(encoded);
+        return 0;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (PyBytes_AsStringAndSize(encoded, &data, &size) != -1) {
+#else
+    if (PyString_AsStringAndSize(encoded, &data, &size) != -1) {
+#endif
+        if (size > BSON_MAX_SIZE) {
+            PyObject* InvalidDocument = _error("InvalidDocument");
+            if (InvalidDocument) {
+                PyErr_SetString(InvalidDocument, "document too large");
+                Py_DECREF(InvalidDocument);
+            }
+        } else if (buffer_write_bytes(buffer, data, (int)size)) {
+            result = 1;
+        }
+    }
+    Py_DECREF(encoded);
+    return result;
+}
+
 /* returns 0 on failure */
 int write_dict(PyObject* self, buffer_t buffer,
                PyObject* dict, unsigned char check_keys,
@@ -1368,9 +1898,27 @@ int write_dict(PyObject* self, buffer_t buffer,
     int length;
     int length_location;
     struct module_state *state = GETSTATE(self);
-    PyObject* mapping_type = _get_object(state->Mapping,
-                                         "collections", "Mapping");
+    PyObject* mapping_type;
+
+    /* A RawBSONDocument is already encoded. */
+    if (!PyDict_Check(dict)) {
+        long type_marker = _type_marker(dict);
+        if (type_marker < 0) {
+            return 0;
+        }
+        if (type_marker == RAW_BSON_DOCUMENT_MARKER) {
+            return write_raw_document(buffer, dict);
+        }
+        /* Instances of a CompiledCodec's class are encoded by the codec. */
+        if (top_level && options->is_compiled) {
+            int written = write_compiled_document(buffer, dict, options);
+            if (written) {
+                return written == 1;
+            }
+        }
+    }
 
+    mapping_type = _get_object(state->Mapping, "collections", "Mapping");
     if (mapping_type) {
         if (!PyObject_IsInstance(dict, mapping_type)) {
             PyObject* repr;
@@ -1507,28 +2055,427 @@ static PyObject* _cbson_dict_to_bson(PyObject* self, PyObject* args) {
     return result;
 }
 
-static PyObject* get_value(PyObject* self, const char* buffer,
-                           unsigned* position, unsigned char type,
-                           unsigned max, const codec_options_t* options) {
-    struct module_state *state = GETSTATE(self);
+static long long encoded_element_size(PyObject* self, PyObject* value,
+                                      unsigned char check_keys,
+                                      const codec_options_t* options);
 
-    PyObject* value = NULL;
-    switch (type) {
-    case 1:
-        {
-            double d;
-            if (max < 8) {
-                goto invalid;
-            }
-            memcpy(&d, buffer + *position, 8);
-            value = PyFloat_FromDouble(d);
-            *position += 8;
-            break;
-        }
-    case 2:
-    case 14:
-        {
-            unsigned value_length;
+/* Get the encoded size of a value by encoding it to a scratch buffer, for
+ * the types the size functions don't handle themselves. If `document` is
+ * true `value` is encoded as a document, otherwise as an element value.
+ *
+ * Returns -1 on failure. */
+static long long _size_by_encoding(PyObject* self, PyObject* value,
+                                   unsigned char check_keys,
+                                   const codec_options_t* options,
+                                   unsigned char document,
+                                   unsigned char top_level) {
+    long long size = -1;
+    int written;
+    buffer_t buffer = buffer_new();
+    if (!buffer) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    if (document) {
+        written = write_dict(self, buffer, value, check_keys, options,
+                             top_level);
+    } else {
+        int type_byte = buffer_save_space(buffer, 1);
+        if (type_byte == -1) {
+            PyErr_NoMemory();
+            buffer_free(buffer);
+            return -1;
+        }
+        /* Called by encoded_element_size, which already converted
+         * `value` with the type registry. */
+        written = _write_element_to_buffer(self, buffer, type_byte, value,
+                                           check_keys, options);
+    }
+    if (written) {
+        size = buffer_get_position(buffer) - (document ? 0 : 1);
+    }
+    buffer_free(buffer);
+    return size;
+}
+
+#if PY_VERSION_HEX >= 0x03030000
+/* Get the length of a string encoded to UTF-8, without encoding it.
+ *
+ * Returns -1 on failure, or -2 if the string has surrogates, which
+ * can't be encoded. */
+static Py_ssize_t _utf8_size(PyObject* string) {
+    Py_ssize_t length, i;
+    Py_ssize_t size = 0;
+    int kind;
+    void* data;
+
+    if (PyUnicode_READY(string) == -1) {
+        return -1;
+    }
+    length = PyUnicode_GET_LENGTH(string);
+    if (PyUnicode_IS_ASCII(string)) {
+        return length;
+    }
+    kind = PyUnicode_KIND(string);
+    data = PyUnicode_DATA(string);
+    for (i = 0; i < length; i++) {
+        Py_UCS4 c = PyUnicode_READ(kind, data, i);
+        if (c < 0x80) {
+            size += 1;
+        } else if (c < 0x800) {
+            size += 2;
+        } else if (c >= 0xD800 && c <= 0xDFFF) {
+            return -2;
+        } else if (c < 0x10000) {
+            size += 3;
+        } else {
+            size += 4;
+        }
+    }
+    return size;
+}
+#endif
+
+/* Get the encoded size of a document without encoding it.
+ *
+ * Returns -1 on failure. */
+static long long encoded_dict_size(PyObject* self, PyObject* dict,
+                                   unsigned char check_keys,
+                                   const codec_options_t* options,
+                                   unsigned char top_level) {
+    PyObject* key;
+    PyObject* value;
+    Py_ssize_t pos = 0;
+    /* The document length and trailing null byte. */
+    long long size = 5;
+
+    /* RawBSONDocuments, documents of a CompiledCodec and other mappings
+     * are sized by encoding them. */
+    if (!PyDict_CheckExact(dict)) {
+        return _size_by_encoding(self, dict, check_keys, options, 1,
+                                 top_level);
+    }
+
+    while (PyDict_Next(dict, &pos, &key, &value)) {
+        PyObject* encoded;
+        const char* data;
+        int name_size;
+        long long value_size;
+
+        if (!(encoded = _encode_key(key, &data, &name_size))) {
+            return -1;
+        }
+        if (check_keys && !check_key_name(data, name_size - 1)) {
+            Py_DECREF(encoded);
+            return -1;
+        }
+        Py_DECREF(encoded);
+        /* Sizing the value may run Python code that changes the dict. */
+        Py_INCREF(value);
+        value_size = encoded_element_size(self, value, check_keys, options);
+        Py_DECREF(value);
+        if (value_size < 0) {
+            return -1;
+        }
+        /* The type byte, name and value. */
+        size += 1 + name_size + value_size;
+    }
+    return size;
+}
+
+/* Get the encoded size of an element's value without encoding it.
+ *
+ * Returns -1 on failure. */
+static long long _encoded_element_size(PyObject* self, PyObject* value,
+                                       unsigned char check_keys,
+                                       const codec_options_t* options) {
+    long type_marker;
+
+    if (value == Py_None) {
+        return 0;
+    } else if (PyBool_Check(value)) {
+        return 1;
+#if PY_MAJOR_VERSION >= 3
+    } else if (PyLong_CheckExact(value)) {
+        const long long_value = PyLong_AsLong(value);
+#else
+    } else if (PyInt_CheckExact(value)) {
+        const long long_value = PyInt_AsLong(value);
+#endif
+        if (PyErr_Occurred() || long_value != (int)long_value) {
+            PyErr_Clear();
+            PyLong_AsLongLong(value);
+            if (PyErr_Occurred()) {
+                PyErr_SetString(PyExc_OverflowError,
+                                "MongoDB can only handle up to 8-byte ints");
+                return -1;
+            }
+            return 8;
+        }
+        return 4;
+#if PY_MAJOR_VERSION < 3
+    } else if (PyLong_CheckExact(value)) {
+        PyLong_AsLongLong(value);
+        if (PyErr_Occurred()) {
+            PyErr_SetString(PyExc_OverflowError,
+                            "MongoDB can only handle up to 8-byte ints");
+            return -1;
+        }
+        return 8;
+#endif
+    } else if (PyFloat_CheckExact(value)) {
+        return 8;
+    } else if (PyDict_CheckExact(value)) {
+        return encoded_dict_size(self, value, check_keys, options, 0);
+    } else if (PyList_CheckExact(value) || PyTuple_CheckExact(value)) {
+        Py_ssize_t items, i;
+        /* The array length and trailing null byte. */
+        long long size = 5;
+
+        if ((items = PySequence_Size(value)) > BSON_MAX_SIZE) {
+            PyObject* BSONError = _error("BSONError");
+            if (BSONError) {
+                PyErr_SetString(BSONError,
+                                "Too many items to serialize.");
+                Py_DECREF(BSONError);
+            }
+            return -1;
+        }
+        for (i = 0; i < items; i++) {
+            char name[16];
+            long long item_size;
+            PyObject* item_value = PySequence_GetItem(value, i);
+            if (!item_value) {
+                return -1;
+            }
+            item_size = encoded_element_size(self, item_value, check_keys,
+                                             options);
+            Py_DECREF(item_value);
+            if (item_size < 0) {
+                return -1;
+            }
+            INT2STRING(name, (int)i);
+            /* The type byte, name and its null byte, and value. */
+            size += 2 + (long long)strlen(name) + item_size;
+        }
+        return size;
+#if PY_MAJOR_VERSION >= 3
+    } else if (PyBytes_CheckExact(value)) {
+        /* Binary subtype 0: length, subtype and data. */
+        return 5 + (long long)PyBytes_GET_SIZE(value);
+#else
+    } else if (PyString_CheckExact(value)) {
+        Py_ssize_t size = PyString_GET_SIZE(value);
+        if (size < BSON_MAX_SIZE &&
+            check_string((const unsigned char*)PyString_AS_STRING(value),
+                         (int)size, 1, 0) != NOT_UTF_8) {
+            /* Length, data and null byte. */
+            return 5 + (long long)size;
+        }
+#endif
+    } else if (PyUnicode_CheckExact(value)) {
+#if PY_VERSION_HEX >= 0x03030000
+        Py_ssize_t size = _utf8_size(value);
+        if (size == -1) {
+            return -1;
+        }
+        if (size >= 0) {
+            /* Length, data and null byte. */
+            return 5 + (long long)size;
+        }
+#else
+        long long size;
+        PyObject* encoded = PyUnicode_AsUTF8String(value);
+        if (!encoded) {
+            return -1;
+        }
+        size = 5 + (long long)PyString_GET_SIZE(encoded);
+        Py_DECREF(encoded);
+        return size;
+#endif
+    } else if (PyDateTime_CheckExact(value)) {
+        return 8;
+    } else {
+        type_marker = _type_marker(value);
+        if (type_marker < 0) {
+            return -1;
+        }
+        switch (type_marker) {
+        case 7:
+            /* ObjectId */
+            return 12;
+        case 17:
+            /* Timestamp */
+            return 8;
+        case 127:
+        case 255:
+            /* MaxKey and MinKey */
+            return 0;
+        }
+    }
+
+    /* Other types, and values the encoder rejects. */
+    return _size_by_encoding(self, value, check_keys, options, 0, 0);
+}
+
+static long long encoded_element_size(PyObject* self, PyObject* value,
+                                      unsigned char check_keys,
+                                      const codec_options_t* options) {
+    long long size;
+    PyObject* converted = NULL;
+    if (Py_EnterRecursiveCall(" while sizing an object as BSON "))
+        return -1;
+    if (options->type_encoders) {
+        if (!(converted = _encode_custom_type(value, options))) {
+            Py_LeaveRecursiveCall();
+            return -1;
+        }
+        value = converted;
+    }
+    size = _encoded_element_size(self, value, check_keys, options);
+    Py_XDECREF(converted);
+    Py_LeaveRecursiveCall();
+    return size;
+}
+
+static PyObject* _cbson_encoded_size(PyObject* self, PyObject* args) {
+    PyObject* dict;
+    unsigned char check_keys;
+    codec_options_t options;
+    long long size;
+
+    if (!PyArg_ParseTuple(args, "ObO&", &dict, &check_keys,
+                          convert_codec_options, &options)) {
+        return NULL;
+    }
+    size = encoded_dict_size(self, dict, check_keys, &options, 1);
+    destroy_codec_options(&options);
+    if (size < 0) {
+        return NULL;
+    }
+    return PyLong_FromLongLong(size);
+}
+
+/* Copy `size` bytes of `data` to `offset` in `target`. A bytearray is
+ * grown as needed, any other target must support the writable buffer
+ * protocol and be large enough.
+ *
+ * Returns 0 and sets an exception on failure. */
+static int _copy_into(PyObject* target, Py_ssize_t offset,
+                      const char* data, int size) {
+    Py_buffer view;
+
+    if (PyByteArray_Check(target)) {
+        Py_ssize_t target_size = PyByteArray_GET_SIZE(target);
+        if (offset > target_size) {
+            PyErr_SetString(PyExc_ValueError,
+                            "offset is past the end of the buffer");
+            return 0;
+        }
+        if (offset + size > target_size &&
+                PyByteArray_Resize(target, offset + size) == -1) {
+            return 0;
+        }
+        memcpy(PyByteArray_AS_STRING(target) + offset, data, size);
+        return 1;
+    }
+
+    if (PyObject_GetBuffer(target, &view, PyBUF_WRITABLE) == -1) {
+        PyErr_Clear();
+#if PY_MAJOR_VERSION < 3
+        /* Objects like mmap only support the old buffer protocol in
+         * Python 2. */
+        {
+            void* buf;
+            Py_ssize_t len;
+            if (PyObject_AsWriteBuffer(target, &buf, &len) == 0 &&
+                    PyBuffer_FillInfo(&view, NULL, buf, len, 0,
+                                      PyBUF_WRITABLE) == 0) {
+                goto write;
+            }
+            PyErr_Clear();
+        }
+#endif
+        PyErr_SetString(PyExc_TypeError,
+                        "argument to encode_into must be a bytearray "
+                        "or a writable bytes-like object");
+        return 0;
+    }
+#if PY_MAJOR_VERSION < 3
+write:
+#endif
+    if (offset + size > view.len) {
+        PyErr_SetString(PyExc_ValueError, "buffer is too small");
+        PyBuffer_Release(&view);
+        return 0;
+    }
+    memcpy((char*)view.buf + offset, data, size);
+    PyBuffer_Release(&view);
+    return 1;
+}
+
+static PyObject* _cbson_encode_into(PyObject* self, PyObject* args) {
+    PyObject* dict;
+    PyObject* target;
+    PyObject* result = NULL;
+    Py_ssize_t offset;
+    unsigned char check_keys;
+    codec_options_t options;
+    buffer_t buffer;
+
+    if (!PyArg_ParseTuple(args, "OOnbO&", &dict, &target, &offset,
+                          &check_keys, convert_codec_options, &options)) {
+        return NULL;
+    }
+    if (offset < 0) {
+        destroy_codec_options(&options);
+        PyErr_SetString(PyExc_ValueError, "offset must not be negative");
+        return NULL;
+    }
+    buffer = buffer_new();
+    if (!buffer) {
+        destroy_codec_options(&options);
+        PyErr_NoMemory();
+        return NULL;
+    }
+
+    if (!write_dict(self, buffer, dict, check_keys, &options, 1)) {
+        destroy_codec_options(&options);
+        buffer_free(buffer);
+        return NULL;
+    }
+
+    if (_copy_into(target, offset, buffer_get_buffer(buffer),
+                   buffer_get_position(buffer))) {
+        result = Py_BuildValue("i", buffer_get_position(buffer));
+    }
+    destroy_codec_options(&options);
+    buffer_free(buffer);
+    return result;
+}
+
+static PyObject* get_value(PyObject* self, const char* buffer,
+                           unsigned* position, unsigned char type,
+                           unsigned max, const codec_options_t* options) {
+    struct module_state *state = GETSTATE(self);
+
+    PyObject* value = NULL;
+    switch (type) {
+    case 1:
+        {
+            double d;
+            if (max < 8) {
+                goto invalid;
+            }
+            memcpy(&d, buffer + *position, 8);
+            value = PyFloat_FromDouble(d);
+            *position += 8;
+            break;
+        }
+    case 2:
+    case 14:
+        {
+            unsigned value_length;
             if (max < 4) {
                 goto invalid;
             }
@@ -1570,8 +2517,9 @@ static PyObject* get_value(PyObject* self, const char* buffer,
                 goto invalid;
             }
 
-            /* Decoding for DBRefs */
-            if (PyMapping_HasKeyString(value, "$ref")) { /* DBRef */
+            /* Decoding for DBRefs, RawBSONDocuments are left as is. */
+            if (!options->is_raw_bson &&
+                    PyMapping_HasKeyString(value, "$ref")) { /* DBRef */
                 PyObject* dbref = NULL;
                 PyObject* dbref_type;
                 PyObject* id;
@@ -2167,6 +3115,18 @@ static PyObject* get_value(PyObject* self, const char* buffer,
         }
     }
 
+    if (value && options->type_decoders) {
+        /* Convert the value with the decoder for its type, if any. */
+        PyObject* decoder = PyDict_GetItem(options->type_decoders,
+                                           (PyObject*)Py_TYPE(value));
+        if (decoder) {
+            PyObject* converted = PyObject_CallFunctionObjArgs(decoder, value,
+                                                               NULL);
+            Py_DECREF(value);
+            value = converted;
+        }
+    }
+
     if (value) {
         return value;
     }
@@ -2219,6 +3179,57 @@ static PyObject* get_value(PyObject* self, const char* buffer,
     return NULL;
 }
 
+/* Decode the element name of `length` bytes at `string`.
+ *
+ * Returns a new reference, or NULL on error. */
+static PyObject* _decode_name(const char* string, size_t length,
+                              const codec_options_t* options) {
+    struct key_cache_entry* entry;
+    PyObject* name;
+    PyObject* old;
+    unsigned hash = 2166136261u;
+    size_t i;
+
+    if (!options->intern_keys || length > KEY_CACHE_MAX_LENGTH) {
+        return PyUnicode_DecodeUTF8(string, length, "strict");
+    }
+    if (!options->key_cache) {
+        /* The options are otherwise read-only while decoding, but they
+         * own the cache of the call they were converted for. */
+        struct key_cache_entry* cache = PyMem_Malloc(
+            KEY_CACHE_SIZE * sizeof(struct key_cache_entry));
+        if (!cache) {
+            PyErr_NoMemory();
+            return NULL;
+        }
+        for (i = 0; i < KEY_CACHE_SIZE; i++) {
+            cache[i].name = NULL;
+        }
+        ((codec_options_t*)options)->key_cache = cache;
+    }
+    /* FNV-1a */
+    for (i = 0; i < length; i++) {
+        hash = (hash ^ (unsigned char)string[i]) * 16777619u;
+    }
+    entry = &options->key_cache[hash % KEY_CACHE_SIZE];
+    if (entry->name && entry->length == length &&
+        memcmp(entry->encoded, string, length) == 0) {
+        Py_INCREF(entry->name);
+        return entry->name;
+    }
+    name = PyUnicode_DecodeUTF8(string, length, "strict");
+    if (!name) {
+        return NULL;
+    }
+    old = entry->name;
+    Py_INCREF(name);
+    entry->name = name;
+    entry->length = length;
+    memcpy(entry->encoded, string, length);
+    Py_XDECREF(old);
+    return name;
+}
+
 static PyObject* _elements_to_dict(PyObject* self, const char* string,
                                    unsigned max,
                                    const codec_options_t* options) {
@@ -2242,7 +3253,7 @@ static PyObject* _elements_to_dict(PyObject* self, const char* string,
             Py_DECREF(dict);
             return NULL;
         }
-        name = PyUnicode_DecodeUTF8(string + position, name_length, "strict");
+        name = _decode_name(string + position, name_length, options);
         if (!name) {
             Py_DECREF(dict);
             return NULL;
@@ -2263,10 +3274,35 @@ static PyObject* _elements_to_dict(PyObject* self, const char* string,
     return dict;
 }
 
+/* Create a RawBSONDocument holding a copy of the document whose elements
+ * start at `string`, or decode the copy with a CompiledCodec. */
+static PyObject* _raw_document(const char* string, unsigned max,
+                               const codec_options_t* options) {
+    PyObject* raw;
+    PyObject* result;
+
+    /* Include the length prefix and the trailing null byte. */
+#if PY_MAJOR_VERSION >= 3
+    raw = PyBytes_FromStringAndSize(string - 4, max + 5);
+#else
+    raw = PyString_FromStringAndSize(string - 4, max + 5);
+#endif
+    if (!raw) {
+        return NULL;
+    }
+    result = PyObject_CallFunctionObjArgs(options->document_class, raw,
+                                          options->options_obj, NULL);
+    Py_DECREF(raw);
+    return result;
+}
+
 static PyObject* elements_to_dict(PyObject* self, const char* string,
                                   unsigned max,
                                   const codec_options_t* options) {
     PyObject* result;
+    if (options->is_raw_bson || options->is_compiled) {
+        return _raw_document(string, max, options);
+    }
     if (Py_EnterRecursiveCall(" while decoding a BSON document"))
         return NULL;
     result = _elements_to_dict(self, string, max, options);
@@ -2274,34 +3310,29 @@ static PyObject* elements_to_dict(PyObject* self, const char* string,
     return result;
 }
 
+static int _get_buffer(PyObject* obj, Py_buffer* view, const char* func_name);
+
 static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
     int size;
     Py_ssize_t total_size;
     const char* string;
     PyObject* bson;
     codec_options_t options;
-    PyObject* result;
+    PyObject* result = NULL;
+    Py_buffer view;
 
     if (!PyArg_ParseTuple(
             args, "OO&", &bson, convert_codec_options, &options)) {
         return NULL;
     }
 
-#if PY_MAJOR_VERSION >= 3
-    if (!PyBytes_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a bytes object");
-#else
-    if (!PyString_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a string");
-#endif
+    if (!_get_buffer(bson, &view, "_bson_to_dict")) {
         destroy_codec_options(&options);
         return NULL;
     }
-#if PY_MAJOR_VERSION >= 3
-    total_size = PyBytes_Size(bson);
-#else
-    total_size = PyString_Size(bson);
-#endif
+    total_size = view.len;
+    string = (const char*)view.buf;
+
     if (total_size < BSON_MIN_SIZE) {
         PyObject* InvalidBSON = _error("InvalidBSON");
         if (InvalidBSON) {
@@ -2309,18 +3340,7 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
                             "not enough data for a BSON document");
             Py_DECREF(InvalidBSON);
         }
-        destroy_codec_options(&options);
-        return NULL;
-    }
-
-#if PY_MAJOR_VERSION >= 3
-    string = PyBytes_AsString(bson);
-#else
-    string = PyString_AsString(bson);
-#endif
-    if (!string) {
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
 
     memcpy(&size, string, 4);
@@ -2330,8 +3350,7 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
             PyErr_SetString(InvalidBSON, "invalid message size");
             Py_DECREF(InvalidBSON);
         }
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
 
     if (total_size < size || total_size > BSON_MAX_SIZE) {
@@ -2340,8 +3359,7 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
             PyErr_SetString(InvalidBSON, "objsize too large");
             Py_DECREF(InvalidBSON);
         }
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
 
     if (size != total_size || string[size - 1]) {
@@ -2350,58 +3368,275 @@ static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
             PyErr_SetString(InvalidBSON, "bad eoo");
             Py_DECREF(InvalidBSON);
         }
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
 
     result = elements_to_dict(self, string + 4, (unsigned)size - 5, &options);
+
+done:
+    PyBuffer_Release(&view);
     destroy_codec_options(&options);
     return result;
 }
 
-static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
-    int size;
-    Py_ssize_t total_size;
-    const char* string;
-    PyObject* bson;
-    PyObject* dict;
-    PyObject* result;
-    codec_options_t options;
+/* Get a contiguous view of an object supporting the buffer protocol
+ * (bytes, bytearray, memoryview, mmap...).
+ *
+ * Sets TypeError and returns 0 on failure. On success the caller must
+ * release the view with PyBuffer_Release. */
+static int _get_buffer(PyObject* obj, Py_buffer* view, const char* func_name) {
+    if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) == -1) {
+        PyErr_Clear();
+#if PY_MAJOR_VERSION < 3
+        /* Objects like mmap only support the old buffer protocol in
+         * Python 2. */
+        if (!PyUnicode_Check(obj) && PyObject_CheckReadBuffer(obj)) {
+            const void* buf;
+            Py_ssize_t len;
+            if (PyObject_AsReadBuffer(obj, &buf, &len) == 0) {
+                /* No owner, the caller holds a reference to obj. */
+                return PyBuffer_FillInfo(view, NULL, (void*)buf, len, 1,
+                                         PyBUF_SIMPLE) == 0;
+            }
+            PyErr_Clear();
+        }
+#endif
+        PyErr_Format(PyExc_TypeError,
+                     "argument to %s must be a bytes-like object",
+                     func_name);
+        return 0;
+    }
+    return 1;
+}
 
-    if (!PyArg_ParseTuple(
-            args, "O|O&",
-            &bson, convert_codec_options, &options)) {
+static long _value_size(const char* buffer, unsigned position,
+                        unsigned char type, unsigned max);
+
+static PyObject* fields_to_dict(PyObject* self, const char* string,
+                                unsigned max, const codec_options_t* options,
+                                PyObject* tree);
+
+/* Decode the fields selected by `tree` from the embedded document or
+ * array at `position`. Only the embedded documents of an array are
+ * decoded, other elements are skipped. */
+static PyObject* get_selected_fields(PyObject* self, const char* buffer,
+                                     unsigned* position, unsigned char type,
+                                     unsigned max,
+                                     const codec_options_t* options,
+                                     PyObject* tree) {
+    unsigned size;
+    unsigned end;
+    unsigned element;
+    PyObject* value;
+
+    if (max < 4) {
+        goto invalid;
+    }
+    memcpy(&size, buffer + *position, 4);
+    if (size < BSON_MIN_SIZE || max < size || buffer[*position + size - 1]) {
+        goto invalid;
+    }
+    if (type == 3) {
+        value = fields_to_dict(self, buffer + *position + 4, size - 5,
+                               options, tree);
+        if (value) {
+            *position += size;
+        }
+        return value;
+    }
+
+    if (!(value = PyList_New(0))) {
         return NULL;
     }
+    end = *position + size - 1;
+    element = *position + 4;
+    while (element < end) {
+        unsigned char element_type = (unsigned char)buffer[element++];
+        size_t name_length = strlen(buffer + element);
+        if (element + name_length >= end) {
+            Py_DECREF(value);
+            goto invalid;
+        }
+        element += (unsigned)name_length + 1;
+        if (element_type == 3) {
+            PyObject* item = get_selected_fields(self, buffer, &element, 3,
+                                                 end - element, options,
+                                                 tree);
+            if (!item) {
+                Py_DECREF(value);
+                return NULL;
+            }
+            if (PyList_Append(value, item) == -1) {
+                Py_DECREF(value);
+                Py_DECREF(item);
+                return NULL;
+            }
+            Py_DECREF(item);
+        } else {
+            long value_size = _value_size(buffer, element, element_type,
+                                          end - element);
+            if (value_size < 0) {
+                Py_DECREF(value);
+                goto invalid;
+            }
+            element += (unsigned)value_size;
+        }
+    }
+    *position += size;
+    return value;
 
-    if (PyTuple_GET_SIZE(args) < 2) {
-        default_codec_options(&options);
+invalid:
+    {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "invalid length or type code");
+            Py_DECREF(InvalidBSON);
+        }
     }
+    return NULL;
+}
 
-#if PY_MAJOR_VERSION >= 3
-    if (!PyBytes_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to decode_all must be a bytes object");
-#else
-    if (!PyString_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to decode_all must be a string");
-#endif
+/* Like _elements_to_dict, but only decode the elements named in `tree`.
+ * The others are skipped without creating Python objects for their
+ * values. */
+static PyObject* _fields_to_dict(PyObject* self, const char* string,
+                                 unsigned max,
+                                 const codec_options_t* options,
+                                 PyObject* tree) {
+    unsigned position = 0;
+    PyObject* dict = PyObject_CallObject(options->document_class, NULL);
+    if (!dict) {
         return NULL;
     }
-#if PY_MAJOR_VERSION >= 3
-    total_size = PyBytes_Size(bson);
-    string = PyBytes_AsString(bson);
-#else
-    total_size = PyString_Size(bson);
-    string = PyString_AsString(bson);
-#endif
-    if (!string) {
+    while (position < max) {
+        PyObject* name;
+        PyObject* value;
+        PyObject* selected;
+
+        unsigned char type = (unsigned char)string[position++];
+        size_t name_length = strlen(string + position);
+        if (name_length > BSON_MAX_SIZE || position + name_length >= max) {
+            goto invalid;
+        }
+        name = _decode_name(string + position, name_length, options);
+        if (!name) {
+            Py_DECREF(dict);
+            return NULL;
+        }
+        position += (unsigned)name_length + 1;
+
+        /* Borrowed reference. */
+        selected = PyDict_GetItem(tree, name);
+        if (selected == Py_True) {
+            value = get_value(self, string, &position, type,
+                              max - position, options);
+        } else if (selected && PyDict_Check(selected) &&
+                   (type == 3 || type == 4)) {
+            value = get_selected_fields(self, string, &position, type,
+                                        max - position, options, selected);
+        } else {
+            long value_size = _value_size(string, position, type,
+                                          max - position);
+            Py_DECREF(name);
+            if (value_size < 0) {
+                goto invalid;
+            }
+            position += (unsigned)value_size;
+            continue;
+        }
+        if (!value) {
+            Py_DECREF(name);
+            Py_DECREF(dict);
+            return NULL;
+        }
+
+        PyObject_SetItem(dict, name, value);
+        Py_DECREF(name);
+        Py_DECREF(value);
+    }
+    return dict;
+
+invalid:
+    Py_DECREF(dict);
+    {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "invalid length or type code");
+            Py_DECREF(InvalidBSON);
+        }
+    }
+    return NULL;
+}
+
+static PyObject* fields_to_dict(PyObject* self, const char* string,
+                                unsigned max, const codec_options_t* options,
+                                PyObject* tree) {
+    PyObject* result;
+    if (Py_EnterRecursiveCall(" while decoding a BSON document"))
+        return NULL;
+    result = _fields_to_dict(self, string, max, options, tree);
+    Py_LeaveRecursiveCall();
+    return result;
+}
+
+/* Turn a list of dotted field names into the tree of dicts used by
+ * fields_to_dict, with bson._fields_tree.
+ *
+ * Returns a new reference. */
+static PyObject* _fields_tree(PyObject* fields) {
+    PyObject* tree;
+    PyObject* bson = PyImport_ImportModule("bson");
+    if (!bson) {
         return NULL;
     }
+    tree = PyObject_CallMethod(bson, "_fields_tree", "O", fields);
+    Py_DECREF(bson);
+    return tree;
+}
 
-    if (!(result = PyList_New(0))) {
+static PyObject* _cbson_decode_all(PyObject* self, PyObject* args,
+                                   PyObject* kwargs) {
+    int size;
+    Py_ssize_t total_size;
+    const char* string;
+    PyObject* bson;
+    PyObject* dict;
+    PyObject* fields = Py_None;
+    PyObject* tree = NULL;
+    PyObject* result = NULL;
+    codec_options_t options;
+    Py_buffer view;
+    static char* kwlist[] = {"data", "codec_options", "fields", NULL};
+
+    options.document_class = NULL;
+    if (!PyArg_ParseTupleAndKeywords(
+            args, kwargs, "O|O&O", kwlist,
+            &bson, convert_codec_options, &options, &fields)) {
+        return NULL;
+    }
+
+    if (!options.document_class) {
+        default_codec_options(&options);
+    }
+
+    if (fields != Py_None && !options.is_raw_bson && !options.is_compiled) {
+        if (!(tree = _fields_tree(fields))) {
+            destroy_codec_options(&options);
+            return NULL;
+        }
+    }
+
+    if (!_get_buffer(bson, &view, "decode_all")) {
+        Py_XDECREF(tree);
         destroy_codec_options(&options);
         return NULL;
     }
+    total_size = view.len;
+    string = (const char*)view.buf;
+
+    if (!(result = PyList_New(0))) {
+        goto done;
+    }
 
     while (total_size > 0) {
         if (total_size < BSON_MIN_SIZE) {
@@ -2411,9 +3646,8 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
                                 "not enough data for a BSON document");
                 Py_DECREF(InvalidBSON);
             }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
+            Py_CLEAR(result);
+            goto done;
         }
 
         memcpy(&size, string, 4);
@@ -2423,9 +3657,8 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
                 PyErr_SetString(InvalidBSON, "invalid message size");
                 Py_DECREF(InvalidBSON);
             }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
+            Py_CLEAR(result);
+            goto done;
         }
 
         if (total_size < size) {
@@ -2434,9 +3667,8 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
                 PyErr_SetString(InvalidBSON, "objsize too large");
                 Py_DECREF(InvalidBSON);
             }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
+            Py_CLEAR(result);
+            goto done;
         }
 
         if (string[size - 1]) {
@@ -2445,16 +3677,20 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
                 PyErr_SetString(InvalidBSON, "bad eoo");
                 Py_DECREF(InvalidBSON);
             }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
+            Py_CLEAR(result);
+            goto done;
         }
 
-        dict = elements_to_dict(self, string + 4, (unsigned)size - 5, &options);
+        if (tree) {
+            dict = fields_to_dict(self, string + 4, (unsigned)size - 5,
+                                  &options, tree);
+        } else {
+            dict = elements_to_dict(self, string + 4, (unsigned)size - 5,
+                                    &options);
+        }
         if (!dict) {
-            Py_DECREF(result);
-            destroy_codec_options(&options);
-            return NULL;
+            Py_CLEAR(result);
+            goto done;
         }
         PyList_Append(result, dict);
         Py_DECREF(dict);
@@ -2462,17 +3698,1602 @@ static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
         total_size -= size;
     }
 
+done:
+    PyBuffer_Release(&view);
+    Py_XDECREF(tree);
     destroy_codec_options(&options);
     return result;
 }
 
+/* Check the length and terminator of each document in a buffer of
+ * concatenated BSON documents, without decoding them.
+ *
+ * Returns bytes holding the (offset, length) of each document as pairs of
+ * native long longs. */
+static PyObject* _cbson_document_offsets(PyObject* self, PyObject* bson) {
+    int size;
+    Py_ssize_t total_size;
+    Py_ssize_t count = 0;
+    const char* string;
+    const char* message = NULL;
+    long long* offsets;
+    PyObject* result = NULL;
+    Py_buffer view;
+
+    if (!_get_buffer(bson, &view, "document_offsets")) {
+        return NULL;
+    }
+
+    /* Check each document and count them, to allocate the result once. */
+    string = (const char*)view.buf;
+    total_size = view.len;
+    while (total_size > 0) {
+        if (total_size < BSON_MIN_SIZE) {
+            message = "not enough data for a BSON document";
+            goto invalid;
+        }
+        memcpy(&size, string, 4);
+        if (size < BSON_MIN_SIZE) {
+            message = "invalid message size";
+            goto invalid;
+        }
+        if (total_size < size) {
+            message = "objsize too large";
+            goto invalid;
+        }
+        if (string[size - 1]) {
+            message = "bad eoo";
+            goto invalid;
+        }
+        string += size;
+        total_size -= size;
+        count++;
+    }
+
+    result = PyBytes_FromStringAndSize(NULL,
+                                       count * 2 * sizeof(long long));
+    if (!result) {
+        goto done;
+    }
+    offsets = (long long*)PyBytes_AS_STRING(result);
+    string = (const char*)view.buf;
+    while (count--) {
+        memcpy(&size, string, 4);
+        *offsets++ = (long long)(string - (const char*)view.buf);
+        *offsets++ = size;
+        string += size;
+    }
+    goto done;
+
+invalid:
+    {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, message);
+            Py_DECREF(InvalidBSON);
+        }
+    }
+done:
+    PyBuffer_Release(&view);
+    return result;
+}
+
+/* Get the size of the value of type `type` at `position` without decoding
+ * it. `max` is the number of bytes left in the document.
+ *
+ * Returns -1 if the value is invalid or its type is unknown. */
+static long _value_size(const char* buffer, unsigned position,
+                        unsigned char type, unsigned max) {
+    int size;
+    long value_size;
+    size_t length;
+
+    switch (type) {
+    case 6:   /* Undefined */
+    case 10:  /* Null */
+    case 127: /* MaxKey */
+    case 255: /* MinKey */
+        return 0;
+    case 8:   /* Boolean */
+        return max < 1 ? -1 : 1;
+    case 16:  /* Int32 */
+        return max < 4 ? -1 : 4;
+    case 1:   /* Double */
+    case 9:   /* Datetime */
+    case 17:  /* Timestamp */
+    case 18:  /* Int64 */
+        return max < 8 ? -1 : 8;
+    case 7:   /* ObjectId */
+        return max < 12 ? -1 : 12;
+    case 2:   /* String */
+    case 13:  /* Code */
+    case 14:  /* Symbol */
+    case 3:   /* Document */
+    case 4:   /* Array */
+    case 15:  /* Code with scope */
+    case 5:   /* Binary */
+    case 12:  /* DBPointer */
+        if (max < 4) {
+            return -1;
+        }
+        memcpy(&size, buffer + position, 4);
+        /* The smallest valid length prefix of each type. */
+        if (size < 0 ||
+            ((type == 3 || type == 4) && size < BSON_MIN_SIZE) ||
+            (type == 15 && size < 14) ||
+            (type != 3 && type != 4 && type != 5 && size < 1)) {
+            return -1;
+        }
+        value_size = size;
+        if (type == 2 || type == 13 || type == 14) {
+            value_size += 4;
+        } else if (type == 5) {
+            value_size += 5;
+        } else if (type == 12) {
+            value_size += 16;
+        }
+        return value_size > (long)max ? -1 : value_size;
+    case 11:  /* Regex, pattern and flags c strings */
+        length = strlen(buffer + position);
+        if (length >= max) {
+            return -1;
+        }
+        length += strlen(buffer + position + length + 1) + 1;
+        if (length >= max) {
+            return -1;
+        }
+        return (long)length + 1;
+    }
+    return -1;
+}
+
+/* Check the size and eoo of the document in `bson`, a bytes object.
+ *
+ * Returns a pointer to its data, or NULL with InvalidBSON set. */
+static const char* _raw_document_data(PyObject* bson, int* size) {
+    const char* string;
+    Py_ssize_t total_size;
+
+#if PY_MAJOR_VERSION >= 3
+    if (!PyBytes_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "raw BSON must be a bytes object");
+        return NULL;
+    }
+    total_size = PyBytes_Size(bson);
+    string = PyBytes_AsString(bson);
+#else
+    if (!PyString_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "raw BSON must be a string");
+        return NULL;
+    }
+    total_size = PyString_Size(bson);
+    string = PyString_AsString(bson);
+#endif
+    if (total_size >= BSON_MIN_SIZE && total_size <= BSON_MAX_SIZE) {
+        memcpy(size, string, 4);
+        if (*size == total_size && !string[*size - 1]) {
+            return string;
+        }
+    }
+    {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "invalid object size");
+            Py_DECREF(InvalidBSON);
+        }
+    }
+    return NULL;
+}
+
+static PyObject* _cbson_raw_bson_index(PyObject* self, PyObject* bson) {
+    int size;
+    unsigned position = 4;
+    unsigned end;
+    const char* string;
+    PyObject* result;
+
+    if (!(string = _raw_document_data(bson, &size))) {
+        return NULL;
+    }
+    end = (unsigned)size - 1;
+    if (!(result = PyList_New(0))) {
+        return NULL;
+    }
+    while (position < end) {
+        unsigned element = position;
+        unsigned char type = (unsigned char)string[position++];
+        size_t name_length = strlen(string + position);
+        PyObject* name;
+        PyObject* pair;
+        long value_size;
+
+        if (name_length > BSON_MAX_SIZE || position + name_length >= end) {
+            goto invalid;
+        }
+        name = PyUnicode_DecodeUTF8(string + position, name_length, "strict");
+        if (!name) {
+            goto invalid;
+        }
+        position += (unsigned)name_length + 1;
+        value_size = _value_size(string, position, type, end - position);
+        if (value_size < 0) {
+            Py_DECREF(name);
+            goto invalid;
+        }
+        position += (unsigned)value_size;
+
+        pair = Py_BuildValue("(NI)", name, element);
+        if (!pair || PyList_Append(result, pair) == -1) {
+            Py_XDECREF(pair);
+            Py_DECREF(result);
+            return NULL;
+        }
+        Py_DECREF(pair);
+    }
+    if (position == end) {
+        return result;
+    }
+
+invalid:
+    Py_DECREF(result);
+    if (!PyErr_Occurred() ||
+            PyErr_ExceptionMatches(PyExc_UnicodeDecodeError)) {
+        PyObject* InvalidBSON;
+        PyErr_Clear();
+        InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "invalid length or type code");
+            Py_DECREF(InvalidBSON);
+        }
+    }
+    return NULL;
+}
+
+static PyObject* _cbson_raw_element_value(PyObject* self, PyObject* args) {
+    int size;
+    unsigned position;
+    unsigned end;
+    unsigned char type;
+    const char* string;
+    PyObject* bson;
+    PyObject* result;
+    codec_options_t options;
+
+    if (!PyArg_ParseTuple(args, "OIO&", &bson, &position,
+                          convert_codec_options, &options)) {
+        return NULL;
+    }
+    if (!(string = _raw_document_data(bson, &size))) {
+        destroy_codec_options(&options);
+        return NULL;
+    }
+    end = (unsigned)size - 1;
+    if (position < 4 || position >= end) {
+        PyErr_SetString(PyExc_ValueError, "invalid element position");
+        destroy_codec_options(&options);
+        return NULL;
+    }
+    type = (unsigned char)string[position++];
+    position += (unsigned)strlen(string + position) + 1;
+    if (position > end) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "invalid element name");
+            Py_DECREF(InvalidBSON);
+        }
+        destroy_codec_options(&options);
+        return NULL;
+    }
+    result = get_value(self, string, &position, type, end - position,
+                       &options);
+    destroy_codec_options(&options);
+    return result;
+}
+
+/* The column types of bson.decode_columns, in the order of
+ * bson._COLUMN_TYPES. */
+#define COLUMN_INT32 0
+#define COLUMN_INT64 1
+#define COLUMN_DOUBLE 2
+#define COLUMN_BOOL 3
+#define COLUMN_DATETIME 4
+#define COLUMN_OBJECTID 5
+
+static const int column_widths[] = {4, 8, 8, 1, 8, 12};
+
+typedef struct {
+    const char* name;
+    Py_ssize_t name_length;
+    int type;
+    PyObject* values;
+    PyObject* mask;
+    /* The number of rows in the column before this call. */
+    Py_ssize_t rows;
+} column_t;
+
+/* Write the value of type `type` at `buffer` to `dest` if `column` accepts
+ * it.
+ *
+ * Returns 1 if the value was written, 0 if it has another type. */
+static int _write_column_value(const column_t* column, const char* buffer,
+                               unsigned char type, char* dest) {
+    int i;
+    long long ll;
+    double d;
+
+    switch (column->type) {
+    case COLUMN_INT32:
+        if (type == 16) {
+            memcpy(dest, buffer, 4);
+            return 1;
+        }
+        return 0;
+    case COLUMN_INT64:
+        if (type == 18) {
+            memcpy(dest, buffer, 8);
+            return 1;
+        } else if (type == 16) {
+            memcpy(&i, buffer, 4);
+            ll = i;
+            memcpy(dest, &ll, 8);
+            return 1;
+        }
+        return 0;
+    case COLUMN_DOUBLE:
+        if (type == 1) {
+            memcpy(dest, buffer, 8);
+            return 1;
+        } else if (type == 16) {
+            memcpy(&i, buffer, 4);
+            d = (double)i;
+        } else if (type == 18) {
+            memcpy(&ll, buffer, 8);
+            d = (double)ll;
+        } else {
+            return 0;
+        }
+        memcpy(dest, &d, 8);
+        return 1;
+    case COLUMN_BOOL:
+        if (type == 8) {
+            *dest = *buffer ? 1 : 0;
+            return 1;
+        }
+        return 0;
+    case COLUMN_DATETIME:
+        if (type == 9) {
+            memcpy(dest, buffer, 8);
+            return 1;
+        }
+        return 0;
+    case COLUMN_OBJECTID:
+        if (type == 7) {
+            memcpy(dest, buffer, 12);
+            return 1;
+        }
+        return 0;
+    }
+    return 0;
+}
+
+/* Parse the (encoded name, type code, values, mask) tuples of
+ * bson._decode_columns.
+ *
+ * Returns 0 with an exception set on failure. */
+static int _convert_column_specs(PyObject* specs, column_t* columns,
+                                 Py_ssize_t count) {
+    Py_ssize_t i;
+    for (i = 0; i < count; i++) {
+        column_t* column = &columns[i];
+        char* name;
+        int name_length;
+        /* Borrowed reference. */
+        PyObject* spec = PyList_GET_ITEM(specs, i);
+#if PY_MAJOR_VERSION >= 3
+        if (!PyArg_ParseTuple(spec, "y#iOO", &name, &name_length,
+#else
+        if (!PyArg_ParseTuple(spec, "s#iOO", &name, &name_length,
+#endif
+                              &column->type, &column->values,
+                              &column->mask)) {
+            return 0;
+        }
+        column->name = name;
+        column->name_length = name_length;
+        if (column->type < COLUMN_INT32 || column->type > COLUMN_OBJECTID) {
+            PyErr_SetString(PyExc_ValueError, "invalid column type");
+            return 0;
+        }
+        if (!PyByteArray_Check(column->values) ||
+                !PyByteArray_Check(column->mask)) {
+            PyErr_SetString(PyExc_TypeError,
+                            "columns must be instances of bytearray");
+            return 0;
+        }
+        column->rows = PyByteArray_GET_SIZE(column->mask);
+        if (PyByteArray_GET_SIZE(column->values) !=
+                column->rows * column_widths[column->type]) {
+            PyErr_SetString(PyExc_ValueError,
+                            "column values and mask have different lengths");
+            return 0;
+        }
+    }
+    return 1;
+}
+
+/* Decode the elements of the document in `string` that are selected by
+ * `columns` to row `row`.
+ *
+ * Returns 0 if the document is invalid. */
+static int _document_to_columns(const char* string, unsigned max,
+                                column_t* columns, Py_ssize_t count,
+                                Py_ssize_t row) {
+    unsigned position = 0;
+    Py_ssize_t i;
+
+    while (position < max) {
+        unsigned char type = (unsigned char)string[position++];
+        const char* name = string + position;
+        size_t name_length = strlen(name);
+        long value_size;
+
+        if (name_length > BSON_MAX_SIZE || position + name_length >= max) {
+            return 0;
+        }
+        position += (unsigned)name_length + 1;
+        value_size = _value_size(string, position, type, max - position);
+        if (value_size < 0) {
+            return 0;
+        }
+        for (i = 0; i < count; i++) {
+            column_t* column = &columns[i];
+            Py_ssize_t index = column->rows + row;
+            char* mask = PyByteArray_AS_STRING(column->mask);
+            if ((size_t)column->name_length == name_length &&
+                    !memcmp(column->name, name, name_length) &&
+                    !mask[index]) {
+                char* dest = PyByteArray_AS_STRING(column->values) +
+                    index * column_widths[column->type];
+                mask[index] = (char)_write_column_value(
+                    column, string + position, type, dest);
+            }
+        }
+        position += (unsigned)value_size;
+    }
+    return position == max;
+}
+
+static PyObject* _cbson_decode_columns(PyObject* self, PyObject* args) {
+    int size;
+    Py_ssize_t total_size;
+    Py_ssize_t rows = 0;
+    Py_ssize_t count;
+    Py_ssize_t i;
+    const char* string;
+    PyObject* bson;
+    PyObject* specs;
+    PyObject* result = NULL;
+    column_t* columns = NULL;
+    Py_buffer view;
+
+    if (!PyArg_ParseTuple(args, "OO!", &bson, &PyList_Type, &specs)) {
+        return NULL;
+    }
+    if (!_get_buffer(bson, &view, "decode_columns")) {
+        return NULL;
+    }
+
+    count = PyList_GET_SIZE(specs);
+    columns = (column_t*)PyMem_Malloc(sizeof(column_t) * (count ? count : 1));
+    if (!columns) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    if (!_convert_column_specs(specs, columns, count)) {
+        goto done;
+    }
+
+    /* Check each document and count them, to grow each column once. */
+    string = (const char*)view.buf;
+    total_size = view.len;
+    while (total_size > 0) {
+        if (total_size < BSON_MIN_SIZE) {
+            goto invalid;
+        }
+        memcpy(&size, string, 4);
+        if (size < BSON_MIN_SIZE || total_size < size || string[size - 1]) {
+            goto invalid;
+        }
+        string += size;
+        total_size -= size;
+        rows++;
+    }
+
+    for (i = 0; i < count; i++) {
+        column_t* column = &columns[i];
+        Py_ssize_t width = column_widths[column->type];
+        if (PyByteArray_Resize(column->values,
+                               (column->rows + rows) * width) == -1 ||
+                PyByteArray_Resize(column->mask, column->rows + rows) == -1) {
+            goto undo;
+        }
+        memset(PyByteArray_AS_STRING(column->values) + column->rows * width,
+               0, rows * width);
+        memset(PyByteArray_AS_STRING(column->mask) + column->rows, 0, rows);
+    }
+
+    string = (const char*)view.buf;
+    for (i = 0; i < rows; i++) {
+        memcpy(&size, string, 4);
+        if (!_document_to_columns(string + 4, (unsigned)size - 5, columns,
+                                  count, i)) {
+            goto invalid;
+        }
+        string += size;
+    }
+
+    Py_INCREF(Py_None);
+    result = Py_None;
+    goto done;
+
+invalid:
+    {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "invalid length or type code");
+            Py_DECREF(InvalidBSON);
+        }
+    }
+undo:
+    /* Leave the columns as they were. */
+    for (i = 0; i < count; i++) {
+        column_t* column = &columns[i];
+        PyByteArray_Resize(column->values,
+                           column->rows * column_widths[column->type]);
+        PyByteArray_Resize(column->mask, column->rows);
+    }
+done:
+    PyMem_Free(columns);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+static PyObject* _cbson_object_ids(PyObject* self, PyObject* args) {
+    struct module_state *state = GETSTATE(self);
+    Py_ssize_t count;
+    Py_ssize_t i;
+    const char* prefix;
+    int prefix_length;
+    long inc;
+    unsigned long timestamp;
+    char* ids;
+    PyObject* reserved;
+    PyObject* result = NULL;
+
+    if (!PyArg_ParseTuple(args, "n", &count)) {
+        return NULL;
+    }
+    if (count < 0 || count > PY_SSIZE_T_MAX / 12) {
+        PyErr_SetString(PyExc_ValueError, "invalid number of ObjectIds");
+        return NULL;
+    }
+    reserved = PyObject_CallMethod(state->ObjectId, "_reserve_inc", "n",
+                                   count);
+    if (!reserved) {
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (!PyArg_ParseTuple(reserved, "y#l", &prefix, &prefix_length, &inc)) {
+#else
+    if (!PyArg_ParseTuple(reserved, "s#l", &prefix, &prefix_length, &inc)) {
+#endif
+        goto done;
+    }
+    if (prefix_length != 5) {
+        PyErr_SetString(PyExc_ValueError, "invalid ObjectId prefix");
+        goto done;
+    }
+    if (!(result = PyByteArray_FromStringAndSize(NULL, count * 12))) {
+        goto done;
+    }
+    ids = PyByteArray_AS_STRING(result);
+    timestamp = (unsigned long)time(NULL);
+    for (i = 0; i < count; i++) {
+        char* id = ids + i * 12;
+        unsigned long counter = (unsigned long)(inc + i) % 0xFFFFFF;
+        /* The timestamp and counter are big endian. */
+        id[0] = (char)(timestamp >> 24);
+        id[1] = (char)(timestamp >> 16);
+        id[2] = (char)(timestamp >> 8);
+        id[3] = (char)timestamp;
+        memcpy(id + 4, prefix, 5);
+        id[9] = (char)(counter >> 16);
+        id[10] = (char)(counter >> 8);
+        id[11] = (char)counter;
+    }
+
+done:
+    Py_DECREF(reserved);
+    return result;
+}
+
+static PyObject* _cbson_generate_object_ids(PyObject* self, PyObject* args) {
+    struct module_state *state = GETSTATE(self);
+    PyObject* cls;
+    Py_ssize_t count;
+    Py_ssize_t i;
+    const char* ids;
+    PyObject* object_ids_args;
+    PyObject* id_bytes = NULL;
+    PyObject* id_name = NULL;
+    PyObject* empty = NULL;
+    PyObject* result = NULL;
+
+    if (!PyArg_ParseTuple(args, "On", &cls, &count)) {
+        return NULL;
+    }
+    if (!PyType_Check(cls)) {
+        PyErr_SetString(PyExc_TypeError, "cls must be a class");
+        return NULL;
+    }
+    if (!(object_ids_args = Py_BuildValue("(n)", count))) {
+        return NULL;
+    }
+    id_bytes = _cbson_object_ids(self, object_ids_args);
+    Py_DECREF(object_ids_args);
+    if (!id_bytes) {
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    id_name = PyUnicode_InternFromString("_ObjectId__id");
+#else
+    id_name = PyString_InternFromString("_ObjectId__id");
+#endif
+    if (!id_name ||
+        !(empty = PyTuple_New(0)) ||
+        !(result = PyList_New(count))) {
+        goto fail;
+    }
+    ids = PyByteArray_AS_STRING(id_bytes);
+    for (i = 0; i < count; i++) {
+        PyObject* oid;
+#if PY_MAJOR_VERSION >= 3
+        PyObject* binary = PyBytes_FromStringAndSize(ids + i * 12, 12);
+#else
+        PyObject* binary = PyString_FromStringAndSize(ids + i * 12, 12);
+#endif
+        if (!binary) {
+            goto fail;
+        }
+        if (cls == state->ObjectId) {
+            /* Skip ObjectId.__init__, which would only check the bytes. */
+            oid = ((PyTypeObject*)cls)->tp_new((PyTypeObject*)cls, empty,
+                                               NULL);
+            if (oid && PyObject_SetAttr(oid, id_name, binary) == -1) {
+                Py_CLEAR(oid);
+            }
+        } else {
+            oid = PyObject_CallFunctionObjArgs(cls, binary, NULL);
+        }
+        Py_DECREF(binary);
+        if (!oid) {
+            goto fail;
+        }
+        PyList_SET_ITEM(result, i, oid);
+    }
+    Py_DECREF(id_bytes);
+    Py_DECREF(id_name);
+    Py_DECREF(empty);
+    return result;
+
+fail:
+    Py_DECREF(id_bytes);
+    Py_XDECREF(id_name);
+    Py_XDECREF(empty);
+    Py_XDECREF(result);
+    return NULL;
+}
+
+/* How write_json writes a value of a type other than the builtin ones. */
+enum json_kind {
+    JSON_ERROR,
+    JSON_FALLBACK,
+    JSON_DOCUMENT,
+    JSON_ARRAY,
+    JSON_OBJECTID,
+    JSON_DBREF,
+    JSON_DATETIME,
+    JSON_REGEX,
+    JSON_MINKEY,
+    JSON_MAXKEY,
+    JSON_TIMESTAMP,
+    JSON_BINARY,
+    JSON_BYTES,
+    JSON_UUID
+};
+
+static const char _json_hex_digits[] = "0123456789abcdef";
+
+static const char _base64_alphabet[] =
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+
+static int write_json(PyObject* self, buffer_t buffer,
+                      PyObject* value, PyObject* fallback);
+
+/* Write the str `text`, which holds only ASCII characters, and release
+ * it. `text` is a new reference, or NULL if getting it failed. */
+static int _write_json_ascii(buffer_t buffer, PyObject* text) {
+    PyObject* encoded;
+    int size;
+    int result;
+
+    if (!text) {
+        return 0;
+    }
+    if (PyUnicode_Check(text)) {
+        encoded = PyUnicode_AsASCIIString(text);
+        Py_DECREF(text);
+        if (!encoded) {
+            return 0;
+        }
+    } else {
+        encoded = text;
+    }
+    if ((size = _downcast_and_check(PyBytes_GET_SIZE(encoded), 0)) == -1) {
+        Py_DECREF(encoded);
+        return 0;
+    }
+    result = buffer_write_bytes(buffer, PyBytes_AS_STRING(encoded), size);
+    Py_DECREF(encoded);
+    return result;
+}
+
+/* Write the \uXXXX escape of the UTF-16 code unit `unit` to `out`. */
+static void _json_escape_unit(char* out, unsigned long unit) {
+    out[0] = '\\';
+    out[1] = 'u';
+    out[2] = _json_hex_digits[(unit >> 12) & 0xf];
+    out[3] = _json_hex_digits[(unit >> 8) & 0xf];
+    out[4] = _json_hex_digits[(unit >> 4) & 0xf];
+    out[5] = _json_hex_digits[unit & 0xf];
+}
+
+/* Write the escape json.dumps uses for the code point `c`. */
+static int _write_json_escape(buffer_t buffer, unsigned long c) {
+    char escape[12];
+    int size = 2;
+
+    escape[0] = '\\';
+    switch (c) {
+    case '\\':
+        escape[1] = '\\';
+        break;
+    case '"':
+        escape[1] = '"';
+        break;
+    case '\b':
+        escape[1] = 'b';
+        break;
+    case '\f':
+        escape[1] = 'f';
+        break;
+    case '\n':
+        escape[1] = 'n';
+        break;
+    case '\r':
+        escape[1] = 'r';
+        break;
+    case '\t':
+        escape[1] = 't';
+        break;
+    default:
+        if (c >= 0x10000) {
+            /* Escape as a UTF-16 surrogate pair. */
+            c -= 0x10000;
+            _json_escape_unit(escape, 0xd800 | (c >> 10));
+            _json_escape_unit(escape + 6, 0xdc00 | (c & 0x3ff));
+            size = 12;
+        } else {
+            _json_escape_unit(escape, c);
+            size = 6;
+        }
+    }
+    return buffer_write_bytes(buffer, escape, size);
+}
+
+/* Write the UTF-8 `data` as a JSON string, escaping all but printable
+ * ASCII characters like json.dumps with ensure_ascii. */
+static int _write_json_utf8(buffer_t buffer, const unsigned char* data,
+                            Py_ssize_t size) {
+    Py_ssize_t i = 0;
+
+    if (!buffer_write_bytes(buffer, "\"", 1)) {
+        return 0;
+    }
+    while (i < size) {
+        Py_ssize_t start = i;
+        unsigned long c;
+
+        while (i < size && data[i] >= 0x20 && data[i] < 0x7f &&
+               data[i] != '"' && data[i] != '\\') {
+            i++;
+        }
+        if (i > start &&
+            !buffer_write_bytes(buffer, (const char*)data + start,
+                                (int)(i - start))) {
+            return 0;
+        }
+        if (i == size) {
+            break;
+        }
+        c = data[i];
+        if (c < 0x80) {
+            i += 1;
+        } else if (c < 0xe0 && i + 1 < size) {
+            c = ((c & 0x1f) << 6) | (data[i + 1] & 0x3f);
+            i += 2;
+        } else if (c < 0xf0 && i + 2 < size) {
+            c = ((c & 0x0f) << 12) | ((data[i + 1] & 0x3f) << 6) |
+                (data[i + 2] & 0x3f);
+            i += 3;
+        } else if (i + 3 < size) {
+            c = ((c & 0x07) << 18) | ((data[i + 1] & 0x3f) << 12) |
+                ((data[i + 2] & 0x3f) << 6) | (data[i + 3] & 0x3f);
+            i += 4;
+        } else {
+            PyErr_SetString(PyExc_ValueError, "invalid UTF-8 data");
+            return 0;
+        }
+        if (!_write_json_escape(buffer, c)) {
+            return 0;
+        }
+    }
+    return buffer_write_bytes(buffer, "\"", 1);
+}
+
+static int _write_json_string(buffer_t buffer, PyObject* value) {
+    PyObject* encoded;
+    int result;
+
+#if PY_MAJOR_VERSION >= 3
+    encoded = PyUnicode_AsUTF8String(value);
+    if (!encoded && PyErr_ExceptionMatches(PyExc_UnicodeEncodeError)) {
+        /* json.dumps escapes lone surrogates like other characters. */
+        PyErr_Clear();
+        encoded = PyUnicode_AsEncodedString(value, "utf-8", "surrogatepass");
+    }
+#else
+    if (PyUnicode_Check(value)) {
+        encoded = PyUnicode_AsUTF8String(value);
+    } else {
+        /* Like json.dumps, decode a str to check it is valid UTF-8. */
+        PyObject* decoded = PyUnicode_FromEncodedObject(value, "utf-8",
+                                                        "strict");
+        if (!decoded) {
+            return 0;
+        }
+        encoded = PyUnicode_AsUTF8String(decoded);
+        Py_DECREF(decoded);
+    }
+#endif
+    if (!encoded) {
+        return 0;
+    }
+    result = _write_json_utf8(
+        buffer, (const unsigned char*)PyBytes_AS_STRING(encoded),
+        PyBytes_GET_SIZE(encoded));
+    Py_DECREF(encoded);
+    return result;
+}
+
+static int _write_json_int(buffer_t buffer, PyObject* value) {
+#if PY_MAJOR_VERSION >= 3
+    return _write_json_ascii(buffer, PyLong_Type.tp_repr(value));
+#else
+    if (PyInt_Check(value)) {
+        return _write_json_ascii(buffer, PyObject_Str(value));
+    }
+    return _write_json_ascii(buffer, PyLong_Type.tp_str(value));
+#endif
+}
+
+static int _write_json_long_long(buffer_t buffer, long long value) {
+    char digits[24];
+    int position = sizeof(digits);
+    unsigned long long magnitude = (unsigned long long)value;
+
+    if (value < 0) {
+        magnitude = 0ULL - magnitude;
+    }
+    do {
+        digits[--position] = (char)('0' + magnitude % 10);
+        magnitude /= 10;
+    } while (magnitude);
+    if (value < 0) {
+        digits[--position] = '-';
+    }
+    return buffer_write_bytes(buffer, digits + position,
+                              (int)sizeof(digits) - position);
+}
+
+static int _write_json_float(buffer_t buffer, PyObject* value) {
+    double d = PyFloat_AS_DOUBLE(value);
+
+    if (Py_IS_NAN(d)) {
+        return buffer_write_bytes(buffer, "NaN", 3);
+    }
+    if (Py_IS_INFINITY(d)) {
+        if (d > 0) {
+            return buffer_write_bytes(buffer, "Infinity", 8);
+        }
+        return buffer_write_bytes(buffer, "-Infinity", 9);
+    }
+    return _write_json_ascii(buffer, PyFloat_Type.tp_repr(value));
+}
+
+/* Write the value of the int attribute `name` of `value`. */
+static int _write_json_int_attr(buffer_t buffer, PyObject* value,
+                                char* name) {
+    int result;
+    PyObject* attr = PyObject_GetAttrString(value, name);
+
+    if (!attr) {
+        return 0;
+    }
+    result = _write_json_int(buffer, attr);
+    Py_DECREF(attr);
+    return result;
+}
+
+static int _write_json_fallback(buffer_t buffer, PyObject* value,
+                                PyObject* fallback) {
+    return _write_json_ascii(
+        buffer, PyObject_CallFunctionObjArgs(fallback, value, NULL));
+}
+
+static int _write_json_document(PyObject* self, buffer_t buffer,
+                                PyObject* value, PyObject* fallback) {
+    buffer_position start = buffer_get_position(buffer);
+    PyObject* items = NULL;
+    PyObject* key;
+    PyObject* item_value;
+    PyObject* pair = NULL;
+    Py_ssize_t pos = 0;
+    int first = 1;
+    /* 1 on success, 0 on error, -1 to write value with fallback. */
+    int status = 1;
+
+    if (Py_EnterRecursiveCall(" while encoding an object to JSON")) {
+        return 0;
+    }
+    if (!PyDict_CheckExact(value)) {
+#if PY_MAJOR_VERSION >= 3
+        PyObject* items_list = PyObject_CallMethod(value, "items", NULL);
+#else
+        PyObject* items_list = PyObject_CallMethod(value, "iteritems", NULL);
+#endif
+        if (!items_list) {
+            Py_LeaveRecursiveCall();
+            return 0;
+        }
+        items = PyObject_GetIter(items_list);
+        Py_DECREF(items_list);
+        if (!items) {
+            Py_LeaveRecursiveCall();
+            return 0;
+        }
+    }
+    while (1) {
+        if (items) {
+            Py_CLEAR(pair);
+            if (!(pair = PyIter_Next(items))) {
+                if (PyErr_Occurred()) {
+                    status = 0;
+                }
+                break;
+            }
+            if (!PyTuple_Check(pair) || PyTuple_GET_SIZE(pair) != 2) {
+                status = -1;
+                break;
+            }
+            key = PyTuple_GET_ITEM(pair, 0);
+            item_value = PyTuple_GET_ITEM(pair, 1);
+        } else if (!PyDict_Next(value, &pos, &key, &item_value)) {
+            break;
+        }
+#if PY_MAJOR_VERSION >= 3
+        if (!PyUnicode_Check(key)) {
+#else
+        if (!PyString_Check(key) && !PyUnicode_Check(key)) {
+#endif
+            /* Leave converting other keys to strings to json.dumps. */
+            status = -1;
+            break;
+        }
+        Py_INCREF(key);
+        Py_INCREF(item_value);
+        status = (buffer_write_bytes(buffer, first ? "{" : ", ",
+                                     first ? 1 : 2) &&
+                  _write_json_string(buffer, key) &&
+                  buffer_write_bytes(buffer, ": ", 2) &&
+                  write_json(self, buffer, item_value, fallback));
+        Py_DECREF(key);
+        Py_DECREF(item_value);
+        if (!status) {
+            break;
+        }
+        first = 0;
+    }
+    Py_XDECREF(pair);
+    Py_XDECREF(items);
+    Py_LeaveRecursiveCall();
+    if (status == -1) {
+        buffer_update_position(buffer, start);
+        return _write_json_fallback(buffer, value, fallback);
+    }
+    if (!status) {
+        return 0;
+    }
+    if (first) {
+        return buffer_write_bytes(buffer, "{}", 2);
+    }
+    return buffer_write_bytes(buffer, "}", 1);
+}
+
+static int _write_json_array(PyObject* self, buffer_t buffer,
+                             PyObject* value, PyObject* fallback) {
+    PyObject* iter = NULL;
+    PyObject* item;
+    Py_ssize_t i = 0;
+    int first = 1;
+    int status = 1;
+
+    if (Py_EnterRecursiveCall(" while encoding an object to JSON")) {
+        return 0;
+    }
+    if (!PyList_CheckExact(value) && !PyTuple_CheckExact(value)) {
+        if (!(iter = PyObject_GetIter(value))) {
+            Py_LeaveRecursiveCall();
+            return 0;
+        }
+    }
+    while (1) {
+        if (iter) {
+            if (!(item = PyIter_Next(iter))) {
+                if (PyErr_Occurred()) {
+                    status = 0;
+                }
+                break;
+            }
+        } else if (i < PySequence_Fast_GET_SIZE(value)) {
+            item = PySequence_Fast_GET_ITEM(value, i);
+            Py_INCREF(item);
+            i++;
+        } else {
+            break;
+        }
+        status = (buffer_write_bytes(buffer, first ? "[" : ", ",
+                                     first ? 1 : 2) &&
+                  write_json(self, buffer, item, fallback));
+        Py_DECREF(item);
+        if (!status) {
+            break;
+        }
+        first = 0;
+    }
+    Py_XDECREF(iter);
+    Py_LeaveRecursiveCall();
+    if (!status) {
+        return 0;
+    }
+    if (first) {
+        return buffer_write_bytes(buffer, "[]", 2);
+    }
+    return buffer_write_bytes(buffer, "]", 1);
+}
+
+static int _write_json_object_id(buffer_t buffer, PyObject* value) {
+    char hex[24];
+    const unsigned char* data;
+    int i;
+    PyObject* binary = PyObject_GetAttrString(value, "binary");
+
+    if (!binary) {
+        return 0;
+    }
+    if (!PyBytes_Check(binary) || PyBytes_GET_SIZE(binary) != 12) {
+        Py_DECREF(binary);
+        PyErr_SetString(PyExc_ValueError, "invalid ObjectId");
+        return 0;
+    }
+    data = (const unsigned char*)PyBytes_AS_STRING(binary);
+    for (i = 0; i < 12; i++) {
+        hex[2 * i] = _json_hex_digits[data[i] >> 4];
+        hex[2 * i + 1] = _json_hex_digits[data[i] & 0xf];
+    }
+    Py_DECREF(binary);
+    return (buffer_write_bytes(buffer, "{\"$oid\": \"", 10) &&
+            buffer_write_bytes(buffer, hex, 24) &&
+            buffer_write_bytes(buffer, "\"}", 2));
+}
+
+static int _write_json_datetime(buffer_t buffer, PyObject* value) {
+    long long millis;
+#if PY_MAJOR_VERSION >= 3
+    int microseconds;
+#endif
+    PyObject* utc_value;
+    PyObject* utcoffset = PyObject_CallMethod(value, "utcoffset", NULL);
+
+    if (!utcoffset) {
+        return 0;
+    }
+    if (utcoffset != Py_None) {
+        utc_value = PyNumber_Subtract(value, utcoffset);
+        Py_DECREF(utcoffset);
+        if (!utc_value) {
+            return 0;
+        }
+    } else {
+        Py_DECREF(utcoffset);
+        utc_value = value;
+        Py_INCREF(utc_value);
+    }
+    millis = millis_from_datetime(utc_value);
+#if PY_MAJOR_VERSION >= 3
+    /* json_util adds microsecond / 1000 as a float in Python 3, then
+     * truncates. Do the same to get the same number of milliseconds. */
+    microseconds = PyDateTime_DATE_GET_MICROSECOND(utc_value);
+    millis = (long long)((double)(millis - microseconds / 1000) +
+                         microseconds / 1000.0);
+#endif
+    Py_DECREF(utc_value);
+    return (buffer_write_bytes(buffer, "{\"$date\": ", 10) &&
+            _write_json_long_long(buffer, millis) &&
+            buffer_write_bytes(buffer, "}", 1));
+}
+
+static int _write_json_regex(buffer_t buffer, PyObject* value) {
+    char options[FLAGS_SIZE];
+    int options_length = 0;
+    long int_flags;
+    int result;
+    PyObject* pattern;
+    PyObject* py_flags = PyObject_GetAttrString(value, "flags");
+
+    if (!py_flags) {
+        return 0;
+    }
+#if PY_MAJOR_VERSION >= 3
+    int_flags = PyLong_AsLong(py_flags);
+#else
+    int_flags = PyInt_AsLong(py_flags);
+#endif
+    Py_DECREF(py_flags);
+    if (int_flags == -1 && PyErr_Occurred()) {
+        return 0;
+    }
+    if (int_flags & 2) {
+        options[options_length++] = 'i';
+    }
+    if (int_flags & 4) {
+        options[options_length++] = 'l';
+    }
+    if (int_flags & 8) {
+        options[options_length++] = 'm';
+    }
+    if (int_flags & 16) {
+        options[options_length++] = 's';
+    }
+    if (int_flags & 32) {
+        options[options_length++] = 'u';
+    }
+    if (int_flags & 64) {
+        options[options_length++] = 'x';
+    }
+
+    if (!(pattern = PyObject_GetAttrString(value, "pattern"))) {
+        return 0;
+    }
+    if (!PyUnicode_Check(pattern)) {
+        PyObject* decoded = PyUnicode_FromEncodedObject(pattern, "utf-8",
+                                                        "strict");
+        Py_DECREF(pattern);
+        if (!(pattern = decoded)) {
+            return 0;
+        }
+    }
+    result = (buffer_write_bytes(buffer, "{\"$regex\": ", 11) &&
+              _write_json_string(buffer, pattern) &&
+              buffer_write_bytes(buffer, ", \"$options\": \"", 15) &&
+              buffer_write_bytes(buffer, options, options_length) &&
+              buffer_write_bytes(buffer, "\"}", 2));
+    Py_DECREF(pattern);
+    return result;
+}
+
+static int _write_json_timestamp(buffer_t buffer, PyObject* value) {
+    return (buffer_write_bytes(buffer, "{\"$timestamp\": {\"t\": ", 21) &&
+            _write_json_int_attr(buffer, value, "time") &&
+            buffer_write_bytes(buffer, ", \"i\": ", 7) &&
+            _write_json_int_attr(buffer, value, "inc") &&
+            buffer_write_bytes(buffer, "}}", 2));
+}
+
+/* Write the bytes `value` as {"$binary": <base64>, "$type": <subtype>}. */
+static int _write_json_binary(buffer_t buffer, PyObject* value,
+                              long subtype) {
+    char type[32];
+    const unsigned char* data = (const unsigned char*)PyBytes_AS_STRING(value);
+    Py_ssize_t size = PyBytes_GET_SIZE(value);
+    Py_ssize_t i;
+    int encoded_size;
+    buffer_position position;
+    char* out;
+
+    if ((encoded_size = _downcast_and_check(
+             size / 3 * 4 + (size % 3 ? 4 : 0), 0)) == -1) {
+        return 0;
+    }
+    if (!buffer_write_bytes(buffer, "{\"$binary\": \"", 13)) {
+        return 0;
+    }
+    if ((position = buffer_save_space(buffer, encoded_size)) == -1) {
+        PyErr_NoMemory();
+        return 0;
+    }
+    out = buffer_get_buffer(buffer) + position;
+    for (i = 0; i + 2 < size; i += 3) {
+        *out++ = _base64_alphabet[data[i] >> 2];
+        *out++ = _base64_alphabet[((data[i] & 0x03) << 4) | (data[i + 1] >> 4)];
+        *out++ = _base64_alphabet[((data[i + 1] & 0x0f) << 2) |
+                                  (data[i + 2] >> 6)];
+        *out++ = _base64_alphabet[data[i + 2] & 0x3f];
+    }
+    if (size - i == 1) {
+        *out++ = _base64_alphabet[data[i] >> 2];
+        *out++ = _base64_alphabet[(data[i] & 0x03) << 4];
+        *out++ = '=';
+        *out++ = '=';
+    } else if (size - i == 2) {
+        *out++ = _base64_alphabet[data[i] >> 2];
+        *out++ = _base64_alphabet[((data[i] & 0x03) << 4) | (data[i + 1] >> 4)];
+        *out++ = _base64_alphabet[(data[i + 1] & 0x0f) << 2];
+        *out++ = '=';
+    }
+    PyOS_snprintf(type, sizeof(type), "\", \"$type\": \"%02lx\"}", subtype);
+    return buffer_write_bytes(buffer, type, (int)strlen(type));
+}
+
+static int _write_json_binary_subtype(buffer_t buffer, PyObject* value) {
+    long subtype;
+    PyObject* py_subtype = PyObject_GetAttrString(value, "subtype");
+
+    if (!py_subtype) {
+        return 0;
+    }
+#if PY_MAJOR_VERSION >= 3
+    subtype = PyLong_AsLong(py_subtype);
+#else
+    subtype = PyInt_AsLong(py_subtype);
+#endif
+    Py_DECREF(py_subtype);
+    if (subtype == -1 && PyErr_Occurred()) {
+        return 0;
+    }
+    return _write_json_binary(buffer, value, subtype);
+}
+
+static int _write_json_uuid(buffer_t buffer, PyObject* value) {
+    int result;
+    PyObject* hex = PyObject_GetAttrString(value, "hex");
+
+    if (!hex) {
+        return 0;
+    }
+    result = (buffer_write_bytes(buffer, "{\"$uuid\": ", 10) &&
+              _write_json_string(buffer, hex) &&
+              buffer_write_bytes(buffer, "}", 1));
+    Py_DECREF(hex);
+    return result;
+}
+
+/* Get how to write `value`, checking its type in the same order as
+ * json_util._json_convert and json_util.default. */
+static enum json_kind _json_kind(struct module_state* state,
+                                 PyObject* value) {
+    PyObject* type = (PyObject*)Py_TYPE(value);
+    int result;
+
+    /* Exact types first, skipping the attribute checks. */
+    if (type == state->ObjectId) {
+        return JSON_OBJECTID;
+    } else if (type == state->DBRef) {
+        return JSON_DBREF;
+    } else if (PyDateTime_CheckExact(value)) {
+        return JSON_DATETIME;
+    } else if (type == (PyObject*)state->REType || type == state->Regex) {
+        return JSON_REGEX;
+    } else if (type == state->MinKey) {
+        return JSON_MINKEY;
+    } else if (type == state->MaxKey) {
+        return JSON_MAXKEY;
+    } else if (type == state->Timestamp) {
+        return JSON_TIMESTAMP;
+    } else if (type == state->Code) {
+        /* default() leaves the scope of Code to json.dumps as it is. */
+        return JSON_FALLBACK;
+    } else if (type == state->Binary) {
+        return JSON_BINARY;
+#if PY_MAJOR_VERSION >= 3
+    } else if (PyBytes_CheckExact(value)) {
+        return JSON_BYTES;
+#endif
+    } else if (type == state->UUID) {
+        return JSON_UUID;
+    }
+
+    if (PyObject_HasAttrString(value, "iteritems") ||
+        PyObject_HasAttrString(value, "items")) {
+        return JSON_DOCUMENT;
+    }
+    if (PyObject_HasAttrString(value, "__iter__") &&
+        !PyUnicode_Check(value) && !PyBytes_Check(value)) {
+        return JSON_ARRAY;
+    }
+    if ((result = PyObject_IsInstance(value, state->ObjectId))) {
+        return result == 1 ? JSON_OBJECTID : JSON_ERROR;
+    }
+    if ((result = PyObject_IsInstance(value, state->DBRef))) {
+        return result == 1 ? JSON_DBREF : JSON_ERROR;
+    }
+    if (PyDateTime_Check(value)) {
+        return JSON_DATETIME;
+    }
+    if (PyObject_TypeCheck(value, state->REType)) {
+        return JSON_REGEX;
+    }
+    if ((result = PyObject_IsInstance(value, state->Regex))) {
+        return result == 1 ? JSON_REGEX : JSON_ERROR;
+    }
+    if ((result = PyObject_IsInstance(value, state->MinKey))) {
+        return result == 1 ? JSON_MINKEY : JSON_ERROR;
+    }
+    if ((result = PyObject_IsInstance(value, state->MaxKey))) {
+        return result == 1 ? JSON_MAXKEY : JSON_ERROR;
+    }
+    if ((result = PyObject_IsInstance(value, state->Timestamp))) {
+        return result == 1 ? JSON_TIMESTAMP : JSON_ERROR;
+    }
+    if ((result = PyObject_IsInstance(value, state->Code))) {
+        return result == 1 ? JSON_FALLBACK : JSON_ERROR;
+    }
+    if ((result = PyObject_IsInstance(value, state->Binary))) {
+        return result == 1 ? JSON_BINARY : JSON_ERROR;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (PyBytes_Check(value)) {
+        return JSON_BYTES;
+    }
+#endif
+    if ((result = PyObject_IsInstance(value, state->UUID))) {
+        return result == 1 ? JSON_UUID : JSON_ERROR;
+    }
+    return JSON_FALLBACK;
+}
+
+/* Write `value` as JSON, like json.dumps(json_util._json_convert(value)).
+ * Values of other types, and mappings with keys that aren't strings, are
+ * written with `fallback`. */
+static int write_json(PyObject* self, buffer_t buffer,
+                      PyObject* value, PyObject* fallback) {
+    struct module_state *state = GETSTATE(self);
+    PyTypeObject* type = Py_TYPE(value);
+    PyObject* doc;
+    int result;
+
+    if (value == Py_None) {
+        return buffer_write_bytes(buffer, "null", 4);
+    } else if (value == Py_True) {
+        return buffer_write_bytes(buffer, "true", 4);
+    } else if (value == Py_False) {
+        return buffer_write_bytes(buffer, "false", 5);
+    } else if (type == &PyUnicode_Type) {
+        return _write_json_string(buffer, value);
+#if PY_MAJOR_VERSION < 3
+    } else if (type == &PyString_Type) {
+        return _write_json_string(buffer, value);
+    } else if (type == &PyInt_Type) {
+        return _write_json_int(buffer, value);
+#endif
+    } else if (type == &PyLong_Type ||
+               (PyObject*)type == state->BSONInt64) {
+        return _write_json_int(buffer, value);
+    } else if (type == &PyFloat_Type) {
+        return _write_json_float(buffer, value);
+    } else if (type == &PyDict_Type) {
+        return _write_json_document(self, buffer, value, fallback);
+    } else if (type == &PyList_Type || type == &PyTuple_Type) {
+        return _write_json_array(self, buffer, value, fallback);
+    }
+
+    switch (_json_kind(state, value)) {
+    case JSON_DOCUMENT:
+        return _write_json_document(self, buffer, value, fallback);
+    case JSON_ARRAY:
+        return _write_json_array(self, buffer, value, fallback);
+    case JSON_OBJECTID:
+        return _write_json_object_id(buffer, value);
+    case JSON_DBREF:
+        if (!(doc = PyObject_CallMethod(value, "as_doc", NULL))) {
+            return 0;
+        }
+        result = _write_json_document(self, buffer, doc, fallback);
+        Py_DECREF(doc);
+        return result;
+    case JSON_DATETIME:
+        return _write_json_datetime(buffer, value);
+    case JSON_REGEX:
+        return _write_json_regex(buffer, value);
+    case JSON_MINKEY:
+        return buffer_write_bytes(buffer, "{\"$minKey\": 1}", 14);
+    case JSON_MAXKEY:
+        return buffer_write_bytes(buffer, "{\"$maxKey\": 1}", 14);
+    case JSON_TIMESTAMP:
+        return _write_json_timestamp(buffer, value);
+    case JSON_BINARY:
+        return _write_json_binary_subtype(buffer, value);
+    case JSON_BYTES:
+        return _write_json_binary(buffer, value, 0);
+    case JSON_UUID:
+        return _write_json_uuid(buffer, value);
+    case JSON_FALLBACK:
+        return _write_json_fallback(buffer, value, fallback);
+    default:
+        return 0;
+    }
+}
+
+static PyObject* _cbson_json_dumps(PyObject* self, PyObject* args) {
+    PyObject* value;
+    PyObject* fallback;
+    PyObject* result = NULL;
+    buffer_t buffer;
+
+    if (!PyArg_ParseTuple(args, "OO", &value, &fallback)) {
+        return NULL;
+    }
+    buffer = buffer_new();
+    if (!buffer) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    if (write_json(self, buffer, value, fallback)) {
+#if PY_MAJOR_VERSION >= 3
+        result = PyUnicode_DecodeASCII(buffer_get_buffer(buffer),
+                                       buffer_get_position(buffer),
+                                       "strict");
+#else
+        result = PyString_FromStringAndSize(buffer_get_buffer(buffer),
+                                            buffer_get_position(buffer));
+#endif
+    }
+    buffer_free(buffer);
+    return result;
+}
+
+/* Is `key` a string starting with "$"? */
+static int _json_is_operator(PyObject* key) {
+#if PY_MAJOR_VERSION < 3
+    if (PyString_Check(key)) {
+        return PyString_GET_SIZE(key) && PyString_AS_STRING(key)[0] == '$';
+    }
+#endif
+    if (!PyUnicode_Check(key)) {
+        return 0;
+    }
+#if PY_VERSION_HEX >= 0x03030000
+    if (PyUnicode_READY(key) == -1) {
+        PyErr_Clear();
+        return 1;
+    }
+    return (PyUnicode_GET_LENGTH(key) &&
+            PyUnicode_READ_CHAR(key, 0) == '$');
+#else
+    return PyUnicode_GET_SIZE(key) && PyUnicode_AS_UNICODE(key)[0] == '$';
+#endif
+}
+
+/* json_util.object_hook: call the parser for the first key of `parsers`,
+ * a tuple of (key, parser) pairs, that is in the document `dct`. */
+static PyObject* _cbson_json_object_hook(PyObject* self, PyObject* args) {
+    PyObject* parsers;
+    PyObject* dct;
+    Py_ssize_t i;
+
+    if (!PyArg_ParseTuple(args, "O!O", &PyTuple_Type, &parsers, &dct)) {
+        return NULL;
+    }
+    /* Rule out small documents without any "$" key in one pass over
+     * their keys, larger ones are cheaper to check key by key. */
+    if (PyDict_CheckExact(dct) &&
+        PyDict_Size(dct) <= PyTuple_GET_SIZE(parsers)) {
+        PyObject* key;
+        PyObject* value;
+        Py_ssize_t pos = 0;
+        int has_operator = 0;
+
+        while (!has_operator && PyDict_Next(dct, &pos, &key, &value)) {
+            has_operator = _json_is_operator(key);
+        }
+        if (!has_operator) {
+            Py_INCREF(dct);
+            return dct;
+        }
+    }
+    for (i = 0; i < PyTuple_GET_SIZE(parsers); i++) {
+        PyObject* pair = PyTuple_GET_ITEM(parsers, i);
+        int found;
+
+        if (!PyTuple_Check(pair) || PyTuple_GET_SIZE(pair) != 2) {
+            PyErr_SetString(PyExc_TypeError,
+                            "parsers must be (key, parser) pairs");
+            return NULL;
+        }
+        if (PyDict_CheckExact(dct)) {
+            found = PyDict_GetItem(dct, PyTuple_GET_ITEM(pair, 0)) != NULL;
+        } else if ((found = PySequence_Contains(
+                        dct, PyTuple_GET_ITEM(pair, 0))) == -1) {
+            return NULL;
+        }
+        if (found) {
+            return PyObject_CallFunctionObjArgs(PyTuple_GET_ITEM(pair, 1),
+                                                dct, NULL);
+        }
+    }
+    Py_INCREF(dct);
+    return dct;
+}
+
+static PyObject* _cbson_buffer_stats(PyObject* self, PyObject* unused) {
+    long hits;
+    long misses;
+    int cached;
+    buffer_arena_stats(&hits, &misses, &cached);
+    return Py_BuildValue("{s:l,s:l,s:i}", "hits", hits,
+                         "misses", misses, "cached", cached);
+}
+
 static PyMethodDef _CBSONMethods[] = {
     {"_dict_to_bson", _cbson_dict_to_bson, METH_VARARGS,
      "convert a dictionary to a string containing its BSON representation."},
+    {"_encoded_size", _cbson_encoded_size, METH_VARARGS,
+     "get the size of a dictionary's BSON representation without encoding it."},
+    {"_encode_into", _cbson_encode_into, METH_VARARGS,
+     "write the BSON representation of a dictionary into a buffer."},
     {"_bson_to_dict", _cbson_bson_to_dict, METH_VARARGS,
      "convert a BSON string to a SON object."},
-    {"decode_all", _cbson_decode_all, METH_VARARGS,
+    {"decode_all", (PyCFunction)_cbson_decode_all,
+     METH_VARARGS | METH_KEYWORDS,
      "convert binary data to a sequence of documents."},
+    {"_document_offsets", _cbson_document_offsets, METH_O,
+     "find the (offset, length) of each document in BSON data."},
+    {"_raw_bson_index", _cbson_raw_bson_index, METH_O,
+     "list the (name, position) of each element of a BSON document."},
+    {"_raw_element_value", _cbson_raw_element_value, METH_VARARGS,
+     "decode the element at a position in a BSON document."},
+    {"_decode_columns", _cbson_decode_columns, METH_VARARGS,
+     "append the fields of BSON documents to typed columns."},
+    {"_object_ids", _cbson_object_ids, METH_VARARGS,
+     "generate new ObjectIds as a bytearray."},
+    {"_generate_object_ids", _cbson_generate_object_ids, METH_VARARGS,
+     "generate a list of new ObjectIds."},
+    {"_json_dumps", _cbson_json_dumps, METH_VARARGS,
+     "write an object to extended JSON."},
+    {"_json_object_hook", _cbson_json_object_hook, METH_VARARGS,
+     "convert a document decoded from extended JSON to a BSON type."},
+    {"_buffer_stats", _cbson_buffer_stats, METH_NOARGS,
+     "get the reuse counters of the encoding buffer arena."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -56,6 +56,18 @@ typedef struct codec_options_t {
     PyObject* document_class;
     unsigned char tz_aware;
     unsigned char uuid_rep;
+    PyObject* options_obj;
+    unsigned char is_raw_bson;
+    unsigned char is_compiled;
+    unsigned char intern_keys;
+    /* The CodecOptions.type_registry, its cache of encoders by type and
+     * its decoders, or NULL. */
+    PyObject* type_registry;
+    PyObject* type_encoders;
+    PyObject* type_decoders;
+    /* The field names decoded so far with intern_keys, allocated on first
+     * use by the call these options were converted for, or NULL. */
+    struct key_cache_entry* key_cache;
 } codec_options_t;
 
 /* C API functions */
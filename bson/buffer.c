@@ -21,16 +21,38 @@
 
 #define INITIAL_BUFFER_SIZE 256
 
+/* Freed buffers are kept in an arena for buffer_new to reuse, up to
+ * ARENA_COUNT of them. A buffer that grew past ARENA_MAX_SIZE is trimmed
+ * back to ARENA_MAX_SIZE before it is kept, so one huge message doesn't
+ * pin its memory.
+ *
+ * The arena isn't locked: callers hold the GIL, so only one thread uses
+ * it at a time. */
+#define ARENA_COUNT 8
+#define ARENA_MAX_SIZE (64 * 1024)
+
 struct buffer {
     char* buffer;
     int size;
     int position;
 };
 
-/* Allocate and return a new buffer.
+static buffer_t arena[ARENA_COUNT];
+static int arena_count = 0;
+static long arena_hits = 0;
+static long arena_misses = 0;
+
+/* Allocate and return a new buffer, reusing a freed one if possible.
  * Return NULL on allocation failure. */
 buffer_t buffer_new(void) {
     buffer_t buffer;
+    if (arena_count > 0) {
+        arena_hits++;
+        buffer = arena[--arena_count];
+        buffer->position = 0;
+        return buffer;
+    }
+    arena_misses++;
     buffer = (buffer_t)malloc(sizeof(struct buffer));
     if (buffer == NULL) {
         return NULL;
@@ -47,17 +69,41 @@ buffer_t buffer_new(void) {
     return buffer;
 }
 
-/* Free the memory allocated for `buffer`.
+/* Free the memory allocated for `buffer`, or keep it for buffer_new to
+ * reuse.
  * Return non-zero on failure. */
 int buffer_free(buffer_t buffer) {
     if (buffer == NULL) {
         return 1;
     }
+    if (arena_count < ARENA_COUNT) {
+        if (buffer->size > ARENA_MAX_SIZE) {
+            char* trimmed = (char*)realloc(buffer->buffer,
+                                           sizeof(char) * ARENA_MAX_SIZE);
+            if (trimmed != NULL) {
+                buffer->buffer = trimmed;
+                buffer->size = ARENA_MAX_SIZE;
+            }
+        }
+        if (buffer->size <= ARENA_MAX_SIZE) {
+            arena[arena_count++] = buffer;
+            return 0;
+        }
+    }
     free(buffer->buffer);
     free(buffer);
     return 0;
 }
 
+/* Get the number of buffer_new calls that reused a buffer from the arena
+ * (`hits`) or allocated a new one (`misses`), and the number of buffers
+ * in the arena (`cached`). */
+void buffer_arena_stats(long* hits, long* misses, int* cached) {
+    *hits = arena_hits;
+    *misses = arena_misses;
+    *cached = arena_count;
+}
+
 /* Grow `buffer` to at least `min_length`.
  * Return non-zero on allocation failure. */
 static int buffer_grow(buffer_t buffer, int min_length) {
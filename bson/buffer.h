@@ -25,14 +25,20 @@ typedef struct buffer* buffer_t;
 /* A position in the buffer */
 typedef int buffer_position;
 
-/* Allocate and return a new buffer.
+/* Allocate and return a new buffer, reusing a freed one if possible.
  * Return NULL on allocation failure. */
 buffer_t buffer_new(void);
 
-/* Free the memory allocated for `buffer`.
+/* Free the memory allocated for `buffer`, or keep it for buffer_new to
+ * reuse.
  * Return non-zero on failure. */
 int buffer_free(buffer_t buffer);
 
+/* Get the number of buffer_new calls that reused a freed buffer (`hits`)
+ * or allocated a new one (`misses`), and the number of freed buffers kept
+ * for reuse (`cached`). */
+void buffer_arena_stats(long* hits, long* misses, int* cached);
+
 /* Save `size` bytes from the current position in `buffer` (and grow if needed).
  * Return offset for writing, or -1 on allocation failure. */
 buffer_position buffer_save_space(buffer_t buffer, int size);
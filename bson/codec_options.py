@@ -14,15 +14,129 @@
 
 """Tools for specifying BSON codec options."""
 
-from collections import MutableMapping, namedtuple
+import inspect
+
+from collections import Mapping, MutableMapping, namedtuple
 
 from bson.binary import (ALL_UUID_REPRESENTATIONS,
                          PYTHON_LEGACY,
                          UUID_REPRESENTATION_NAMES)
 
+# The _type_marker of bson.raw_bson.RawBSONDocument.
+_RAW_BSON_DOCUMENT_MARKER = 101
+
+
+# The _type_marker of bson.compiled_codec.CompiledCodec.
+_COMPILED_CODEC_MARKER = 102
+
+
+def _raw_document_class(document_class):
+    """Determine if a document_class is a RawBSONDocument class."""
+    marker = getattr(document_class, '_type_marker', None)
+    return marker == _RAW_BSON_DOCUMENT_MARKER
+
+
+def _compiled_codec(document_class):
+    """Determine if a document_class is a CompiledCodec."""
+    marker = getattr(document_class, '_type_marker', None)
+    return marker == _COMPILED_CODEC_MARKER
+
+
+class TypeRegistry(object):
+    """Encoders and decoders for custom types, used through the
+    `type_registry` of :class:`CodecOptions`.
+
+    An encoder converts an instance of a type to a value BSON can
+    encode. It is used for instances of the type and of its subclasses,
+    and takes precedence over the built-in encoding. A decoder converts
+    decoded values of a type, such as :class:`~bson.int64.Int64`, to
+    another value. For example, to store :class:`decimal.Decimal` values
+    as strings and decode 64-bit integers to :class:`int`::
+
+      >>> from decimal import Decimal
+      >>> from bson.int64 import Int64
+      >>> registry = TypeRegistry(encoders={Decimal: str},
+      ...                         decoders={Int64: int})
+      >>> coll = db.get_collection(
+      ...     'test', codec_options=CodecOptions(type_registry=registry))
+
+    The encoder for a subclass of a registered type is looked up through
+    the subclass's method resolution order the first time it is encoded,
+    and cached for later values.
+
+    :Parameters:
+      - `encoders` (optional): A mapping of types to functions converting
+        an instance to a value BSON can encode. The converted value is
+        encoded as is, its own type's encoder isn't applied.
+      - `decoders` (optional): A mapping of decoded types to functions
+        converting a decoded value.
+    """
+
+    def __init__(self, encoders=None, decoders=None):
+        encoders = self.__validate("encoders", encoders)
+        decoders = self.__validate("decoders", decoders)
+        self.__encoders = encoders
+        self.__decoders = decoders
+        # The encoder of each type encoded so far, or None. Read by the C
+        # encoder too.
+        self.__encoder_cache = {} if encoders else None
+
+    @staticmethod
+    def __validate(name, functions):
+        if functions is None:
+            return {}
+        if not isinstance(functions, Mapping):
+            raise TypeError("%s must be a mapping of types to "
+                            "functions" % (name,))
+        for python_type, function in functions.items():
+            if not isinstance(python_type, type):
+                raise TypeError("%s must be a mapping of types to "
+                                "functions, not %r" % (name, python_type))
+            if not callable(function):
+                raise TypeError("%s must be a mapping of types to "
+                                "functions, %r is not callable"
+                                % (name, function))
+        return dict(functions)
+
+    @property
+    def encoders(self):
+        """A copy of the mapping of types to encoders."""
+        return dict(self.__encoders)
+
+    @property
+    def decoders(self):
+        """A copy of the mapping of decoded types to decoders."""
+        return dict(self.__decoders)
+
+    def _encoder(self, value_type):
+        """Get the encoder for instances of `value_type`, or None."""
+        try:
+            return self.__encoder_cache[value_type]
+        except KeyError:
+            pass
+        except TypeError:
+            # There are no encoders.
+            return None
+        encoder = None
+        for base in inspect.getmro(value_type):
+            encoder = self.__encoders.get(base)
+            if encoder is not None:
+                break
+        self.__encoder_cache[value_type] = encoder
+        return encoder
+
+    def _decoder(self, value_type):
+        """Get the decoder for decoded values of `value_type`, or None."""
+        return self.__decoders.get(value_type)
+
+    def __repr__(self):
+        return "TypeRegistry(encoders=%r, decoders=%r)" % (self.__encoders,
+                                                           self.__decoders)
+
 
 _options_base = namedtuple(
-    'CodecOptions', ('document_class', 'tz_aware', 'uuid_representation'))
+    'CodecOptions', ('document_class', 'tz_aware', 'uuid_representation',
+                     'intern_keys', 'type_registry'))
 
 
 class CodecOptions(_options_base):
@@ -31,28 +145,54 @@ class CodecOptions(_options_base):
     :Parameters:
       - `document_class`: BSON documents returned in queries will be decoded
         to an instance of this class. Must be a subclass of
-        :class:`~collections.MutableMapping`. Defaults to :class:`dict`.
+        :class:`~collections.MutableMapping`, or
+        :class:`~bson.raw_bson.RawBSONDocument`. May also be a
+        :class:`~bson.compiled_codec.CompiledCodec`, to decode documents to
+        its class. Defaults to :class:`dict`.
       - `tz_aware`: If ``True``, BSON datetimes will be decoded to timezone
         aware instances of :class:`~datetime.datetime`. Otherwise they will be
         naive. Defaults to ``False``.
       - `uuid_representation`: The BSON representation to use when encoding
         and decoding instances of :class:`~uuid.UUID`. Defaults to
         :data:`~bson.binary.PYTHON_LEGACY`.
+      - `intern_keys`: If ``True``, decoded field names are looked up in a
+        bounded cache of the names decoded by the same call, so documents
+        decoded together, like a batch of query results, share one string
+        object per field name. This reduces the memory used by large
+        numbers of decoded documents. The cache is freed when the call
+        returns. Defaults to ``False``.
+      - `type_registry`: An instance of :class:`TypeRegistry` with
+        encoders and decoders for custom types, or ``None``. Defaults to
+        ``None``.
     """
 
+    __slots__ = ()
+
     def __new__(cls, document_class=dict,
-                tz_aware=False, uuid_representation=PYTHON_LEGACY):
-        if not issubclass(document_class, MutableMapping):
-            raise TypeError("document_class must be dict, bson.son.SON, or "
-                            "another subclass of collections.MutableMapping")
+                tz_aware=False, uuid_representation=PYTHON_LEGACY,
+                intern_keys=False, type_registry=None):
+        if not (_compiled_codec(document_class) or
+                issubclass(document_class, MutableMapping) or
+                _raw_document_class(document_class)):
+            raise TypeError("document_class must be dict, bson.son.SON, "
+                            "bson.raw_bson.RawBSONDocument, a "
+                            "bson.compiled_codec.CompiledCodec, or a "
+                            "subclass of collections.MutableMapping")
         if not isinstance(tz_aware, bool):
             raise TypeError("tz_aware must be True or False")
         if uuid_representation not in ALL_UUID_REPRESENTATIONS:
             raise ValueError("uuid_representation must be a value "
                              "from bson.binary.ALL_UUID_REPRESENTATIONS")
+        if not isinstance(intern_keys, bool):
+            raise TypeError("intern_keys must be True or False")
+        if not (type_registry is None or
+                isinstance(type_registry, TypeRegistry)):
+            raise TypeError("type_registry must be None or an instance of "
+                            "TypeRegistry")
 
         return tuple.__new__(
-            cls, (document_class, tz_aware, uuid_representation))
+            cls, (document_class, tz_aware, uuid_representation, intern_keys,
+                  type_registry))
 
     def __repr__(self):
         document_class_repr = (
@@ -64,7 +204,9 @@ class CodecOptions(_options_base):
 
         return (
             'CodecOptions(document_class=%s, tz_aware=%r, uuid_representation='
-            '%s)' % (document_class_repr, self.tz_aware, uuid_rep_repr))
+            '%s, intern_keys=%r, type_registry=%r)' % (
+                document_class_repr, self.tz_aware, uuid_rep_repr,
+                self.intern_keys, self.type_registry))
 
 
 DEFAULT_CODEC_OPTIONS = CodecOptions()
@@ -0,0 +1,356 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tools for encoding and decoding documents with a fixed shape.
+
+Compile a codec for the field layout of a collection's documents and map
+them to instances of a class instead of dicts::
+
+  >>> from collections import namedtuple
+  >>> from bson.codec_options import CodecOptions
+  >>> from bson.compiled_codec import compile_codec
+  >>> Point = namedtuple('Point', ['x', 'y'])
+  >>> codec = compile_codec([('x', 'double'), ('y', 'double')], Point)
+  >>> coll = db.get_collection(
+  ...     'points', codec_options=CodecOptions(document_class=codec))
+  >>> result = coll.insert_one(Point(1.5, 2.5))
+  >>> coll.find_one({}, {'_id': False})
+  Point(x=1.5, y=2.5)
+"""
+
+import calendar
+import datetime
+import operator
+import struct
+
+from bson import (EPOCH_AWARE,
+                  EPOCH_NAIVE,
+                  _bson_to_dict,
+                  _dict_to_bson,
+                  _make_c_string)
+from bson.codec_options import (CodecOptions,
+                                DEFAULT_CODEC_OPTIONS,
+                                _COMPILED_CODEC_MARKER)
+from bson.objectid import ObjectId
+from bson.py3compat import PY3, integer_types, string_type, text_type
+from bson.son import SON
+
+if PY3:
+    _INT_TYPES = (int,)
+else:
+    _INT_TYPES = (int, long)
+
+
+class _Deviation(Exception):
+    """A document doesn't have the shape of a compiled codec's schema."""
+
+
+def _to_int32(value):
+    if type(value) not in _INT_TYPES:
+        raise _Deviation()
+    return value
+
+
+def _to_int64(value):
+    if not isinstance(value, integer_types) or isinstance(value, bool):
+        raise _Deviation()
+    return value
+
+
+def _to_double(value):
+    if type(value) is not float:
+        raise _Deviation()
+    return value
+
+
+def _to_bool(value):
+    if type(value) is not bool:
+        raise _Deviation()
+    return value
+
+
+def _to_millis(value):
+    if not isinstance(value, datetime.datetime):
+        raise _Deviation()
+    if value.utcoffset() is not None:
+        value = value - value.utcoffset()
+    return int(calendar.timegm(value.timetuple()) * 1000 +
+               value.microsecond / 1000)
+
+
+def _to_oid_bytes(value):
+    if not isinstance(value, ObjectId):
+        raise _Deviation()
+    return value.binary
+
+
+def _to_utf8(value):
+    if not isinstance(value, text_type):
+        raise _Deviation()
+    return value.encode("utf-8")
+
+
+def _from_millis(tz_aware):
+    epoch = EPOCH_AWARE if tz_aware else EPOCH_NAIVE
+
+    def from_millis(millis):
+        diff = ((millis % 1000) + 1000) % 1000
+        seconds = (millis - diff) / 1000
+        return epoch + datetime.timedelta(seconds=seconds,
+                                          microseconds=diff * 1000)
+    return from_millis
+
+
+# For each field type: its BSON type byte, struct format, and the function
+# checking and converting a Python value to pack. Strings have no struct
+# format.
+_FIELD_TYPES = {
+    'int32': (b"\x10", "i", _to_int32),
+    'int64': (b"\x12", "q", _to_int64),
+    'double': (b"\x01", "d", _to_double),
+    'bool': (b"\x08", "?", _to_bool),
+    'datetime': (b"\x09", "q", _to_millis),
+    'objectid': (b"\x07", "12s", _to_oid_bytes),
+    'string': (b"\x02", None, _to_utf8),
+}
+
+_PACK_INT = struct.Struct("<i").pack
+_UNPACK_INT_FROM = struct.Struct("<i").unpack_from
+
+
+class CompiledCodec(object):
+    """A codec for documents with a fixed shape, created by
+    :func:`compile_codec`.
+
+    Pass a :class:`CompiledCodec` as the `document_class` of a
+    :class:`~bson.codec_options.CodecOptions` to decode documents to, and
+    encode them from, instances of its :attr:`document_class`.
+    """
+
+    _type_marker = _COMPILED_CODEC_MARKER
+
+    def __init__(self, schema, document_class,
+                 fallback_options=DEFAULT_CODEC_OPTIONS):
+        if not isinstance(document_class, type):
+            raise TypeError("document_class must be a class")
+        if not isinstance(fallback_options, CodecOptions):
+            raise TypeError("fallback_options must be an instance of "
+                            "CodecOptions")
+        if isinstance(fallback_options.document_class, CompiledCodec):
+            raise ValueError("fallback_options must not use a compiled "
+                             "codec")
+        if hasattr(schema, "items"):
+            schema = list(schema.items())
+        schema = list(schema)
+        if not schema:
+            raise ValueError("schema must have at least one field")
+
+        names = []
+        for name, field_type in schema:
+            if not isinstance(name, string_type):
+                raise TypeError("field names must be instances of %s"
+                                % (string_type.__name__,))
+            if (not name or name.startswith("$") or "." in name
+                    or "\x00" in name):
+                raise ValueError("invalid field name %r" % (name,))
+            if field_type not in _FIELD_TYPES:
+                raise ValueError("unknown field type %r, expected one of %s"
+                                 % (field_type,
+                                    ", ".join(sorted(_FIELD_TYPES))))
+            if name in names:
+                raise ValueError("duplicate field name %r" % (name,))
+            names.append(name)
+
+        self.__schema = tuple(schema)
+        self.__names = tuple(names)
+        self.__document_class = document_class
+        self.__fallback_options = fallback_options
+        if len(names) == 1:
+            getter = operator.attrgetter(names[0])
+            self.__getter = lambda obj: (getter(obj),)
+        else:
+            self.__getter = operator.attrgetter(*names)
+
+        # Split the fields into runs of fixed size fields, each run packed
+        # and unpacked with one Struct, optionally followed by a string.
+        self.__to_bson = []
+        self.__from_bson = []
+        self.__runs = []
+        headers = []
+        fmt = "<"
+        from_millis = _from_millis(fallback_options.tz_aware)
+        for index, (name, field_type) in enumerate(schema):
+            type_byte, code, to_bson = _FIELD_TYPES[field_type]
+            header = type_byte + _make_c_string(name)
+            self.__to_bson.append(to_bson)
+            if field_type == "datetime":
+                self.__from_bson.append((index, from_millis))
+            elif field_type == "objectid":
+                self.__from_bson.append((index, ObjectId))
+            if code is None:
+                self.__runs.append((struct.Struct(fmt), tuple(headers),
+                                    header))
+                headers = []
+                fmt = "<"
+            else:
+                headers.append(header)
+                fmt += "%ds%s" % (len(header), code)
+        if headers:
+            self.__runs.append((struct.Struct(fmt), tuple(headers), None))
+
+    @property
+    def schema(self):
+        """The (field name, field type) pairs of this codec."""
+        return self.__schema
+
+    @property
+    def document_class(self):
+        """The class documents are decoded to."""
+        return self.__document_class
+
+    @property
+    def fallback_options(self):
+        """The :class:`~bson.codec_options.CodecOptions` used to decode a
+        document that doesn't match :attr:`schema`."""
+        return self.__fallback_options
+
+    def __repr__(self):
+        return "CompiledCodec(%r, %s)" % (list(self.__schema),
+                                          self.__document_class.__name__)
+
+    def __decode_values(self, data):
+        """Get the values of the fields of `data`, raising _Deviation if
+        the document doesn't match the schema."""
+        end = len(data) - 1
+        if _UNPACK_INT_FROM(data, 0)[0] != end + 1:
+            raise _Deviation()
+        values = []
+        position = 4
+        for run, headers, string_header in self.__runs:
+            if headers:
+                unpacked = run.unpack_from(data, position)
+                if unpacked[::2] != headers:
+                    raise _Deviation()
+                values.extend(unpacked[1::2])
+                position += run.size
+            if string_header is not None:
+                header_end = position + len(string_header)
+                if data[position:header_end] != string_header:
+                    raise _Deviation()
+                length = _UNPACK_INT_FROM(data, header_end)[0]
+                position = header_end + 4 + length
+                if length < 1 or data[position - 1:position] != b"\x00":
+                    raise _Deviation()
+                values.append(
+                    data[header_end + 4:position - 1].decode("utf-8"))
+        if position != end or data[end:] != b"\x00":
+            raise _Deviation()
+        for index, from_bson in self.__from_bson:
+            values[index] = from_bson(values[index])
+        return values
+
+    def __call__(self, data, codec_options=None):
+        """Decode the BSON document `data` to an instance of
+        :attr:`document_class`, or with :attr:`fallback_options` if it
+        doesn't match :attr:`schema`.
+        """
+        try:
+            values = self.__decode_values(data)
+        except (_Deviation, struct.error, UnicodeError):
+            return _bson_to_dict(data, self.__fallback_options)
+        return self.__document_class(*values)
+
+    def _encode(self, obj):
+        """Encode `obj`, an instance of :attr:`document_class`, to BSON.
+
+        A document whose values don't match :attr:`schema` is encoded
+        like a mapping of the field names to the values. Returns None if
+        `obj` isn't an instance of :attr:`document_class`.
+        """
+        if not isinstance(obj, self.__document_class):
+            return None
+        values = self.__getter(obj)
+        try:
+            converted = [to_bson(value) for to_bson, value
+                         in zip(self.__to_bson, values)]
+            chunks = []
+            index = 0
+            for run, headers, string_header in self.__runs:
+                if headers:
+                    args = []
+                    for header in headers:
+                        args.append(header)
+                        args.append(converted[index])
+                        index += 1
+                    chunks.append(run.pack(*args))
+                if string_header is not None:
+                    value = converted[index]
+                    index += 1
+                    chunks.append(string_header)
+                    chunks.append(_PACK_INT(len(value) + 1))
+                    chunks.append(value)
+                    chunks.append(b"\x00")
+        except (_Deviation, struct.error):
+            return _dict_to_bson(SON(zip(self.__names, values)), False,
+                                 self.__fallback_options)
+        encoded = b"".join(chunks)
+        return _PACK_INT(len(encoded) + 5) + encoded + b"\x00"
+
+
+def compile_codec(schema, document_class,
+                  fallback_options=DEFAULT_CODEC_OPTIONS):
+    """Compile a codec for documents with a fixed shape.
+
+    The codec decodes a document whose fields match `schema`, in order
+    and with the given types, straight to an instance of `document_class`
+    created with the field values as positional arguments, like a
+    :func:`~collections.namedtuple` or a class with ``__slots__``. It
+    encodes an instance of `document_class` by reading attributes named
+    after the fields. Both are done with precompiled
+    :class:`struct.Struct` formats instead of switching on the type and
+    name of each element.
+
+    A document with other fields or types is decoded as usual with
+    `fallback_options`. An instance whose attribute values don't have the
+    field types is encoded as a document holding those values.
+
+    Use the codec as the `document_class` of a
+    :class:`~bson.codec_options.CodecOptions`, e.g. with
+    :meth:`~pymongo.database.Database.get_collection`, and cursors and
+    :meth:`~pymongo.collection.Collection.insert_many` use it. The field
+    types are:
+
+    ============ ========================================
+    Field type   Python type
+    ============ ========================================
+    ``int32``    :class:`int`
+    ``int64``    :class:`int` or :class:`~bson.int64.Int64`
+    ``double``   :class:`float`
+    ``bool``     :class:`bool`
+    ``datetime`` :class:`~datetime.datetime`
+    ``objectid`` :class:`~bson.objectid.ObjectId`
+    ``string``   :class:`str` (:class:`unicode` in Python 2)
+    ============ ========================================
+
+    :Parameters:
+      - `schema`: a sequence of (field name, field type) pairs, or an
+        ordered mapping of field names to field types
+      - `document_class`: the class to decode documents to
+      - `fallback_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions` used to decode documents
+        that don't match `schema`, and for its `tz_aware` option.
+
+    .. versionadded:: 3.0
+    """
+    return CompiledCodec(schema, document_class, fallback_options)
@@ -24,6 +24,8 @@ class DBRef(object):
     """A reference to a document stored in MongoDB.
     """
 
+    __slots__ = ('__collection', '__id', '__database', '__kwargs')
+
     # DBRef isn't actually a BSON "type" so this number was arbitrarily chosen.
     _type_marker = 100
 
@@ -84,11 +86,23 @@ class DBRef(object):
         except KeyError:
             raise AttributeError(key)
 
+    def __getstate__(self):
+        """Get the state to pickle, the same as when DBRef had a
+        ``__dict__``.
+        """
+        return {"_DBRef__collection": self.__collection,
+                "_DBRef__id": self.__id,
+                "_DBRef__database": self.__database,
+                "_DBRef__kwargs": self.__kwargs}
+
     # Have to provide __setstate__ to avoid
     # infinite recursion since we override
     # __getattr__.
     def __setstate__(self, state):
-        self.__dict__.update(state)
+        self.__collection = state["_DBRef__collection"]
+        self.__id = state["_DBRef__id"]
+        self.__database = state["_DBRef__database"]
+        self.__kwargs = state["_DBRef__kwargs"]
 
     def as_doc(self):
         """Get the SON document representation of this DBRef.
@@ -15,4 +15,11 @@ class Int64(long):
       - `value`: the numeric value to represent
     """
 
+    __slots__ = ()
+
     _type_marker = 18
+
+    def __setstate__(self, state):
+        # Instances pickled before __slots__ was defined have an empty
+        # __dict__ as their state.
+        pass
@@ -44,8 +44,9 @@ Example usage (deserialization):
 
 Alternatively, you can manually pass the `default` to :func:`json.dumps`.
 It won't handle :class:`~bson.binary.Binary` and :class:`~bson.code.Code`
-instances (as they are extended strings you can't provide custom defaults),
-but it will be faster as there is less recursion.
+instances (as they are extended strings you can't provide custom defaults).
+:func:`dumps` without extra arguments is faster, as it writes JSON in a
+single pass, in C when the C extension is available.
 
 .. versionchanged:: 2.8
    The output format for :class:`~bson.timestamp.Timestamp` has changed from
@@ -68,14 +69,17 @@ but it will be faster as there is less recursion.
 """
 
 import base64
+import binascii
 import calendar
 import collections
 import datetime
+import functools
+import io
 import json
 import re
 import uuid
 
-from bson import EPOCH_AWARE, RE_TYPE, SON
+from bson import EPOCH_AWARE, RE_TYPE, SON, _USE_C
 from bson.binary import Binary
 from bson.code import Code
 from bson.dbref import DBRef
@@ -87,7 +91,11 @@ from bson.regex import Regex
 from bson.timestamp import Timestamp
 from bson.tz_util import utc
 
-from bson.py3compat import PY3, iteritems, string_type, text_type
+from bson.py3compat import (PY3, integer_types, iteritems, string_type,
+                            text_type)
+
+if _USE_C:
+    from bson import _cbson
 
 
 _RE_OPT_TABLE = {
@@ -99,6 +107,9 @@ _RE_OPT_TABLE = {
     "x": re.X,
 }
 
+# How much JSON dump_cursor collects before writing it to the file.
+_DUMP_CHUNK_SIZE = 1024 * 1024
+
 
 def dumps(obj, *args, **kwargs):
     """Helper function that wraps :class:`json.dumps`.
@@ -106,11 +117,21 @@ def dumps(obj, *args, **kwargs):
     Recursive function that handles all BSON types including
     :class:`~bson.binary.Binary` and :class:`~bson.code.Code`.
 
+    Without extra arguments `obj` is written to JSON in a single pass,
+    producing the same output as :func:`json.dumps` with its default
+    settings.
+
+    .. versionchanged:: 3.0
+       Writes JSON directly instead of converting `obj` to SON first,
+       unless `args` or `kwargs` are passed.
+
     .. versionchanged:: 2.7
        Preserves order when rendering SON, Timestamp, Code, Binary, and DBRef
        instances.
     """
-    return json.dumps(_json_convert(obj), *args, **kwargs)
+    if args or kwargs:
+        return json.dumps(_json_convert(obj), *args, **kwargs)
+    return _json_dumps(obj, _json_fallback)
 
 
 def loads(s, *args, **kwargs):
@@ -118,10 +139,122 @@ def loads(s, *args, **kwargs):
 
     Automatically passes the object_hook for BSON type conversion.
     """
-    kwargs['object_hook'] = lambda dct: object_hook(dct)
+    kwargs['object_hook'] = _object_hook
     return json.loads(s, *args, **kwargs)
 
 
+def dump_cursor(cursor, fileobj):
+    """Write the documents from a cursor to `fileobj` as newline-delimited
+    JSON, one document per line.
+
+    Documents are written as they are read from `cursor`, in chunks of
+    about 1MB, so memory use doesn't grow with the number of documents::
+
+      >>> with open('test.jsonl', 'w') as fileobj:
+      ...     dump_cursor(db.test.find(), fileobj)
+      ...
+      3
+
+    The file can be read back with
+    :meth:`~pymongo.collection.Collection.import_jsonl`.
+
+    :Parameters:
+      - `cursor`: a :class:`~pymongo.cursor.Cursor`, or any other iterable
+        of documents
+      - `fileobj`: a file-like object opened for writing, in text or
+        binary mode
+
+    Returns the number of documents written.
+
+    .. versionadded:: 3.0
+    """
+    if isinstance(fileobj, io.TextIOBase):
+        convert = text_type
+    elif isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase)):
+        def convert(data):
+            return data.encode("ascii")
+    else:
+        convert = str
+    count = 0
+    lines = []
+    size = 0
+    for doc in cursor:
+        line = dumps(doc)
+        lines.append(line)
+        size += len(line) + 1
+        count += 1
+        if size >= _DUMP_CHUNK_SIZE:
+            lines.append("")
+            fileobj.write(convert("\n".join(lines)))
+            lines = []
+            size = 0
+    if lines:
+        lines.append("")
+        fileobj.write(convert("\n".join(lines)))
+    return count
+
+
+def _jsonl_batches(fileobj, batch_bytes, workers=0):
+    """Parse the newline-delimited JSON read from `fileobj` in batches.
+
+    Yields lists of the documents from consecutive lines whose text adds
+    up to about `batch_bytes`. With `workers`, the batches are parsed by
+    a pool of that many threads, at most `workers` batches ahead of the
+    one being yielded.
+    """
+    batches = _jsonl_line_batches(fileobj, batch_bytes)
+    if not workers:
+        for first_line, lines in batches:
+            yield _parse_jsonl(first_line, lines)
+        return
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(workers)
+    try:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_parse_jsonl, batch))
+            if len(pending) > workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def _jsonl_line_batches(fileobj, batch_bytes):
+    """Group the lines of `fileobj` into (first line number, lines)
+    pairs whose text adds up to about `batch_bytes`.
+    """
+    first_line = 1
+    lines = []
+    size = 0
+    for number, line in enumerate(fileobj, 1):
+        lines.append(line)
+        size += len(line)
+        if size >= batch_bytes:
+            yield first_line, lines
+            first_line = number + 1
+            lines = []
+            size = 0
+    if lines:
+        yield first_line, lines
+
+
+def _parse_jsonl(first_line, lines):
+    """Parse one document from each line, skipping blank lines."""
+    documents = []
+    for number, line in enumerate(lines, first_line):
+        try:
+            if PY3 and isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if line.strip():
+                documents.append(loads(line))
+        except ValueError as exc:
+            raise ValueError("line %d: %s" % (number, exc))
+    return documents
+
+
 def _json_convert(obj):
     """Recursive helper method that converts BSON types so they can be
     converted into json.
@@ -137,69 +270,12 @@ def _json_convert(obj):
 
 
 def object_hook(dct):
-    if "$oid" in dct:
-        return ObjectId(str(dct["$oid"]))
-    if "$ref" in dct:
-        return DBRef(dct["$ref"], dct["$id"], dct.get("$db", None))
-    if "$date" in dct:
-        dtm = dct["$date"]
-        # mongoexport 2.6 and newer
-        if isinstance(dtm, string_type):
-            aware = datetime.datetime.strptime(
-                dtm[:23], "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=utc)
-            offset = dtm[23:]
-            if not offset or offset == 'Z':
-                # UTC
-                return aware
-            else:
-                if len(offset) == 5:
-                    # Offset from mongoexport is in format (+|-)HHMM
-                    secs = (int(offset[1:3]) * 3600 + int(offset[3:]) * 60)
-                elif ':' in offset and len(offset) == 6:
-                    # RFC-3339 format (+|-)HH:MM
-                    hours, minutes = offset[1:].split(':')
-                    secs = (int(hours) * 3600 + int(minutes) * 60)
-                else:
-                    # Not RFC-3339 compliant or mongoexport output.
-                    raise ValueError("invalid format for offset")
-                if offset[0] == "-":
-                    secs *= -1
-                return aware - datetime.timedelta(seconds=secs)
-        # mongoexport 2.6 and newer, time before the epoch (SERVER-15275)
-        elif isinstance(dtm, collections.Mapping):
-            secs = float(dtm["$numberLong"]) / 1000.0
-        # mongoexport before 2.6
-        else:
-            secs = float(dtm) / 1000.0
-        return EPOCH_AWARE + datetime.timedelta(seconds=secs)
-    if "$regex" in dct:
-        flags = 0
-        # PyMongo always adds $options but some other tools may not.
-        for opt in dct.get("$options", ""):
-            flags |= _RE_OPT_TABLE.get(opt, 0)
-        return Regex(dct["$regex"], flags)
-    if "$minKey" in dct:
-        return MinKey()
-    if "$maxKey" in dct:
-        return MaxKey()
-    if "$binary" in dct:
-        if isinstance(dct["$type"], int):
-            dct["$type"] = "%02x" % dct["$type"]
-        subtype = int(dct["$type"], 16)
-        if subtype >= 0xffffff80:  # Handle mongoexport values
-            subtype = int(dct["$type"][6:], 16)
-        return Binary(base64.b64decode(dct["$binary"].encode()), subtype)
-    if "$code" in dct:
-        return Code(dct["$code"], dct.get("$scope"))
-    if "$uuid" in dct:
-        return uuid.UUID(dct["$uuid"])
-    if "$undefined" in dct:
-        return None
-    if "$numberLong" in dct:
-        return Int64(dct["$numberLong"])
-    if "$timestamp" in dct:
-        tsp = dct["$timestamp"]
-        return Timestamp(tsp["t"], tsp["i"])
+    # Rule out small documents without any of the keys in one pass over
+    # their keys, larger ones are cheaper to check key by key.
+    if len(dct) > len(_PARSERS) or not _PARSER_KEYS.isdisjoint(dct):
+        for key, parser in _PARSERS:
+            if key in dct:
+                return parser(dct)
     return dct
 
 
@@ -211,31 +287,10 @@ def default(obj):
     if isinstance(obj, DBRef):
         return _json_convert(obj.as_doc())
     if isinstance(obj, datetime.datetime):
-        # TODO share this code w/ bson.py?
-        if obj.utcoffset() is not None:
-            obj = obj - obj.utcoffset()
-        millis = int(calendar.timegm(obj.timetuple()) * 1000 +
-                     obj.microsecond / 1000)
-        return {"$date": millis}
+        return {"$date": _datetime_to_millis(obj)}
     if isinstance(obj, (RE_TYPE, Regex)):
-        flags = ""
-        if obj.flags & re.IGNORECASE:
-            flags += "i"
-        if obj.flags & re.LOCALE:
-            flags += "l"
-        if obj.flags & re.MULTILINE:
-            flags += "m"
-        if obj.flags & re.DOTALL:
-            flags += "s"
-        if obj.flags & re.UNICODE:
-            flags += "u"
-        if obj.flags & re.VERBOSE:
-            flags += "x"
-        if isinstance(obj.pattern, text_type):
-            pattern = obj.pattern
-        else:
-            pattern = obj.pattern.decode('utf-8')
-        return SON([("$regex", pattern), ("$options", flags)])
+        return SON([("$regex", _regex_pattern(obj)),
+                    ("$options", _regex_options(obj))])
     if isinstance(obj, MinKey):
         return {"$minKey": 1}
     if isinstance(obj, MaxKey):
@@ -255,3 +310,356 @@ def default(obj):
     if isinstance(obj, uuid.UUID):
         return {"$uuid": obj.hex}
     raise TypeError("%r is not JSON serializable" % obj)
+
+
+def _json_fallback(obj):
+    """Write `obj` to JSON by converting it with :func:`_json_convert`
+    first, for values the single-pass writer leaves to :func:`json.dumps`.
+    """
+    return json.dumps(_json_convert(obj))
+
+
+def _json_dumps(obj, fallback):
+    """Write `obj` to JSON in a single pass.
+
+    Values of other types, and mappings with keys that aren't strings, are
+    written with `fallback`.
+    """
+    chunks = []
+    _write_json(obj, chunks, fallback)
+    return "".join(chunks)
+if _USE_C:
+    _json_dumps = _cbson._json_dumps
+
+
+def _write_json(obj, chunks, fallback):
+    writer = _JSON_WRITERS.get(type(obj))
+    if writer is None:
+        writer = _json_writer(obj)
+    writer(obj, chunks, fallback)
+
+
+def _json_writer(obj):
+    """Get the writer for `obj`, checking its type in the same order as
+    :func:`_json_convert` and :func:`default`.
+    """
+    if hasattr(obj, 'iteritems') or hasattr(obj, 'items'):
+        return _write_document
+    if hasattr(obj, '__iter__') and not isinstance(obj, (text_type, bytes)):
+        return _write_array
+    for cls, writer in _DEFAULT_WRITERS:
+        if isinstance(obj, cls):
+            return writer
+    return _write_fallback
+
+
+def _write_document(obj, chunks, fallback):
+    start = len(chunks)
+    separator = "{"
+    for key, value in iteritems(obj):
+        if not isinstance(key, string_type):
+            # Leave converting other keys to strings to json.dumps.
+            del chunks[start:]
+            chunks.append(fallback(obj))
+            return
+        chunks.append(separator)
+        chunks.append(_encode_string(key))
+        chunks.append(": ")
+        _write_json(value, chunks, fallback)
+        separator = ", "
+    chunks.append("{}" if separator == "{" else "}")
+
+
+def _write_array(obj, chunks, fallback):
+    separator = "["
+    for value in obj:
+        chunks.append(separator)
+        _write_json(value, chunks, fallback)
+        separator = ", "
+    chunks.append("[]" if separator == "[" else "]")
+
+
+def _write_fallback(obj, chunks, fallback):
+    chunks.append(fallback(obj))
+
+
+def _write_string(obj, chunks, fallback):
+    chunks.append(_encode_string(obj))
+
+
+def _write_int(obj, chunks, fallback):
+    chunks.append(_int_to_string(obj))
+
+
+def _write_float(obj, chunks, fallback):
+    if obj != obj:
+        chunks.append("NaN")
+    elif obj == _INFINITY:
+        chunks.append("Infinity")
+    elif obj == -_INFINITY:
+        chunks.append("-Infinity")
+    else:
+        chunks.append(float.__repr__(obj))
+
+
+def _write_none(obj, chunks, fallback):
+    chunks.append("null")
+
+
+def _write_bool(obj, chunks, fallback):
+    chunks.append("true" if obj else "false")
+
+
+def _write_object_id(obj, chunks, fallback):
+    chunks.append('{"$oid": "%s"}' % (_native(binascii.hexlify(obj.binary)),))
+
+
+def _write_dbref(obj, chunks, fallback):
+    _write_document(obj.as_doc(), chunks, fallback)
+
+
+def _write_datetime(obj, chunks, fallback):
+    chunks.append('{"$date": %d}' % (_datetime_to_millis(obj),))
+
+
+def _write_regex(obj, chunks, fallback):
+    chunks.append('{"$regex": %s, "$options": "%s"}' % (
+        _encode_string(_regex_pattern(obj)), _regex_options(obj)))
+
+
+def _write_min_key(obj, chunks, fallback):
+    chunks.append('{"$minKey": 1}')
+
+
+def _write_max_key(obj, chunks, fallback):
+    chunks.append('{"$maxKey": 1}')
+
+
+def _write_timestamp(obj, chunks, fallback):
+    chunks.append('{"$timestamp": {"t": %d, "i": %d}}' % (obj.time, obj.inc))
+
+
+def _write_binary(obj, chunks, fallback):
+    chunks.append('{"$binary": "%s", "$type": "%02x"}' % (
+        _native(base64.b64encode(obj)), obj.subtype))
+
+
+def _write_bytes(obj, chunks, fallback):
+    chunks.append('{"$binary": "%s", "$type": "00"}' % (
+        _native(base64.b64encode(obj)),))
+
+
+def _write_uuid(obj, chunks, fallback):
+    chunks.append('{"$uuid": "%s"}' % (obj.hex,))
+
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+_INFINITY = float("inf")
+
+_NUMBER_TYPES = (integer_types, float)
+
+if PY3:
+    _int_to_string = int.__repr__
+
+    def _native(data):
+        return data.decode()
+else:
+    _int_to_string = str
+
+    def _native(data):
+        return data
+
+# The writer for each type, in the order default() checks them.
+_DEFAULT_WRITERS = [
+    (ObjectId, _write_object_id),
+    (DBRef, _write_dbref),
+    (datetime.datetime, _write_datetime),
+    ((RE_TYPE, Regex), _write_regex),
+    (MinKey, _write_min_key),
+    (MaxKey, _write_max_key),
+    (Timestamp, _write_timestamp),
+    # default() leaves the scope of Code to json.dumps as it is.
+    (Code, _write_fallback),
+    (Binary, _write_binary),
+    (uuid.UUID, _write_uuid),
+]
+if PY3:
+    _DEFAULT_WRITERS.insert(-1, (bytes, _write_bytes))
+
+# The writer for exact types, skipping the checks in _json_writer.
+_JSON_WRITERS = {
+    type(None): _write_none,
+    bool: _write_bool,
+    int: _write_int,
+    Int64: _write_int,
+    float: _write_float,
+    text_type: _write_string,
+    dict: _write_document,
+    SON: _write_document,
+    list: _write_array,
+    tuple: _write_array,
+    ObjectId: _write_object_id,
+    DBRef: _write_dbref,
+    datetime.datetime: _write_datetime,
+    RE_TYPE: _write_regex,
+    Regex: _write_regex,
+    MinKey: _write_min_key,
+    MaxKey: _write_max_key,
+    Timestamp: _write_timestamp,
+    Code: _write_fallback,
+    Binary: _write_binary,
+    uuid.UUID: _write_uuid,
+}
+if PY3:
+    _JSON_WRITERS[bytes] = _write_bytes
+else:
+    _JSON_WRITERS[long] = _write_int
+    _JSON_WRITERS[str] = _write_string
+
+
+def _parse_oid(dct):
+    return ObjectId(str(dct["$oid"]))
+
+
+def _parse_dbref(dct):
+    return DBRef(dct["$ref"], dct["$id"], dct.get("$db", None))
+
+
+def _parse_date(dct):
+    dtm = dct["$date"]
+    # PyMongo and mongoexport before 2.6
+    if isinstance(dtm, _NUMBER_TYPES):
+        return EPOCH_AWARE + datetime.timedelta(seconds=float(dtm) / 1000.0)
+    # mongoexport 2.6 and newer
+    if isinstance(dtm, string_type):
+        aware = datetime.datetime.strptime(
+            dtm[:23], "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=utc)
+        offset = dtm[23:]
+        if not offset or offset == 'Z':
+            # UTC
+            return aware
+        else:
+            if len(offset) == 5:
+                # Offset from mongoexport is in format (+|-)HHMM
+                secs = (int(offset[1:3]) * 3600 + int(offset[3:]) * 60)
+            elif ':' in offset and len(offset) == 6:
+                # RFC-3339 format (+|-)HH:MM
+                hours, minutes = offset[1:].split(':')
+                secs = (int(hours) * 3600 + int(minutes) * 60)
+            else:
+                # Not RFC-3339 compliant or mongoexport output.
+                raise ValueError("invalid format for offset")
+            if offset[0] == "-":
+                secs *= -1
+            return aware - datetime.timedelta(seconds=secs)
+    # mongoexport 2.6 and newer, time before the epoch (SERVER-15275)
+    elif isinstance(dtm, collections.Mapping):
+        secs = float(dtm["$numberLong"]) / 1000.0
+    # mongoexport before 2.6
+    else:
+        secs = float(dtm) / 1000.0
+    return EPOCH_AWARE + datetime.timedelta(seconds=secs)
+
+
+def _parse_regex(dct):
+    flags = 0
+    # PyMongo always adds $options but some other tools may not.
+    for opt in dct.get("$options", ""):
+        flags |= _RE_OPT_TABLE.get(opt, 0)
+    return Regex(dct["$regex"], flags)
+
+
+def _parse_min_key(dct):
+    return MinKey()
+
+
+def _parse_max_key(dct):
+    return MaxKey()
+
+
+def _parse_binary(dct):
+    if isinstance(dct["$type"], int):
+        dct["$type"] = "%02x" % dct["$type"]
+    subtype = int(dct["$type"], 16)
+    if subtype >= 0xffffff80:  # Handle mongoexport values
+        subtype = int(dct["$type"][6:], 16)
+    return Binary(base64.b64decode(dct["$binary"].encode()), subtype)
+
+
+def _parse_code(dct):
+    return Code(dct["$code"], dct.get("$scope"))
+
+
+def _parse_uuid(dct):
+    return uuid.UUID(dct["$uuid"])
+
+
+def _parse_undefined(dct):
+    return None
+
+
+def _parse_number_long(dct):
+    return Int64(dct["$numberLong"])
+
+
+def _parse_timestamp(dct):
+    tsp = dct["$timestamp"]
+    return Timestamp(tsp["t"], tsp["i"])
+
+
+# The key marking each extended JSON type and its parser, in the order
+# object_hook checks them when a document has more than one of the keys.
+_PARSERS = (
+    ("$oid", _parse_oid),
+    ("$ref", _parse_dbref),
+    ("$date", _parse_date),
+    ("$regex", _parse_regex),
+    ("$minKey", _parse_min_key),
+    ("$maxKey", _parse_max_key),
+    ("$binary", _parse_binary),
+    ("$code", _parse_code),
+    ("$uuid", _parse_uuid),
+    ("$undefined", _parse_undefined),
+    ("$numberLong", _parse_number_long),
+    ("$timestamp", _parse_timestamp),
+)
+
+_PARSER_KEYS = frozenset(key for key, _ in _PARSERS)
+
+
+# The object_hook loads passes to json.loads.
+_object_hook = object_hook
+if _USE_C:
+    _object_hook = functools.partial(_cbson._json_object_hook, _PARSERS)
+
+
+def _datetime_to_millis(obj):
+    # TODO share this code w/ bson.py?
+    if obj.utcoffset() is not None:
+        obj = obj - obj.utcoffset()
+    return int(calendar.timegm(obj.timetuple()) * 1000 +
+               obj.microsecond / 1000)
+
+
+def _regex_pattern(obj):
+    if isinstance(obj.pattern, text_type):
+        return obj.pattern
+    return obj.pattern.decode('utf-8')
+
+
+def _regex_options(obj):
+    flags = ""
+    if obj.flags & re.IGNORECASE:
+        flags += "i"
+    if obj.flags & re.LOCALE:
+        flags += "l"
+    if obj.flags & re.MULTILINE:
+        flags += "m"
+    if obj.flags & re.DOTALL:
+        flags += "s"
+    if obj.flags & re.UNICODE:
+        flags += "u"
+    if obj.flags & re.VERBOSE:
+        flags += "x"
+    return flags
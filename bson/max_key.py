@@ -23,8 +23,15 @@ class MaxKey(object):
        ``MaxKey`` now implements comparison operators.
     """
 
+    __slots__ = ()
+
     _type_marker = 127
 
+    def __setstate__(self, state):
+        # Instances pickled before __slots__ was defined have an empty
+        # __dict__ as their state.
+        pass
+
     def __eq__(self, other):
         return isinstance(other, MaxKey)
 
@@ -28,7 +28,8 @@ import threading
 import time
 
 from bson.errors import InvalidId
-from bson.py3compat import PY3, bytes_from_hex, string_type, text_type
+from bson.py3compat import (PY3, bytes_from_hex, integer_types, string_type,
+                            text_type)
 from bson.tz_util import utc
 
 
@@ -61,7 +62,7 @@ class ObjectId(object):
 
     _machine_bytes = _machine_bytes()
 
-    __slots__ = ('__id')
+    __slots__ = ('__id',)
 
     _type_marker = 7
 
@@ -182,6 +183,41 @@ class ObjectId(object):
 
         self.__id = oid
 
+    @classmethod
+    def generate_many(cls, count):
+        """Generate a list of `count` new ObjectIds at once.
+
+        This is much faster than creating new ObjectIds one by one: the
+        counter is reserved once for the whole batch, and the time and
+        process id are read once.
+
+        :Parameters:
+          - `count`: the number of ObjectIds to generate
+
+        .. versionadded:: 3.0
+        """
+        if not isinstance(count, integer_types):
+            raise TypeError("count must be an integer")
+        if count < 0:
+            raise ValueError("count must be non-negative")
+        # Imported here, bson imports this module.
+        from bson import _generate_object_ids
+        return _generate_object_ids(cls, count)
+
+    @classmethod
+    def _reserve_inc(cls, count):
+        """Reserve `count` consecutive counter values for new ObjectIds.
+
+        Returns the 5 machine and process id bytes of a new ObjectId and
+        the first reserved counter value.
+        """
+        prefix = ObjectId._machine_bytes + struct.pack(">H",
+                                                       os.getpid() % 0xFFFF)
+        with ObjectId._inc_lock:
+            inc = ObjectId._inc
+            ObjectId._inc = (ObjectId._inc + count) % 0xFFFFFF
+        return prefix, inc
+
     def __validate(self, oid):
         """Validate and use the given id for this ObjectId.
 
@@ -0,0 +1,134 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tools for representing raw BSON documents.
+
+Decode query results to :class:`RawBSONDocument` to avoid decoding fields
+that are never used::
+
+  >>> from bson.codec_options import CodecOptions
+  >>> from bson.raw_bson import RawBSONDocument
+  >>> coll = db.get_collection(
+  ...     'test', codec_options=CodecOptions(document_class=RawBSONDocument))
+  >>> doc = coll.find_one()
+  >>> doc['x']  # Only 'x' is decoded.
+  1
+"""
+
+import collections
+
+from bson import _raw_bson_index, _raw_element_value
+from bson.codec_options import CodecOptions, _RAW_BSON_DOCUMENT_MARKER
+
+
+class RawBSONDocument(collections.Mapping):
+    """Representation for a MongoDB document that provides access to the raw
+    BSON bytes that compose it.
+
+    Field names are scanned the first time the document is used as a
+    mapping. Each value is decoded the first time it is accessed and then
+    cached. Embedded documents are decoded according to `codec_options`,
+    by default to :class:`RawBSONDocument` too.
+
+    A :class:`RawBSONDocument` is read-only. It is encoded by copying
+    :attr:`raw`, so it can be passed back to methods like
+    :meth:`~pymongo.collection.Collection.insert_one` or
+    :meth:`~pymongo.collection.Collection.replace_one` at no cost. No
+    ``_id`` is added to a document inserted this way.
+    """
+
+    __slots__ = ('__raw', '__codec_options', '__index', '__names', '__cache')
+    _type_marker = _RAW_BSON_DOCUMENT_MARKER
+
+    def __init__(self, bson_bytes, codec_options=None):
+        """Create a new :class:`RawBSONDocument`.
+
+        :Parameters:
+          - `bson_bytes`: the BSON bytes that compose this document
+          - `codec_options` (optional): An instance of
+            :class:`~bson.codec_options.CodecOptions` used to decode the
+            document's values. Defaults to
+            :data:`DEFAULT_RAW_BSON_OPTIONS`.
+        """
+        if not isinstance(bson_bytes, bytes):
+            raise TypeError("bson_bytes must be an instance of bytes")
+        if codec_options is None:
+            codec_options = DEFAULT_RAW_BSON_OPTIONS
+        elif not isinstance(codec_options, CodecOptions):
+            raise TypeError("codec_options must be an instance of "
+                            "CodecOptions")
+        self.__raw = bson_bytes
+        self.__codec_options = codec_options
+        self.__index = None
+        self.__names = None
+        self.__cache = {}
+
+    @property
+    def raw(self):
+        """The raw BSON bytes composing this document."""
+        return self.__raw
+
+    @property
+    def codec_options(self):
+        """The :class:`~bson.codec_options.CodecOptions` used to decode
+        this document's values.
+        """
+        return self.__codec_options
+
+    def __get_index(self):
+        if self.__index is None:
+            pairs = _raw_bson_index(self.__raw)
+            self.__names = [name for name, _ in pairs]
+            self.__index = dict(pairs)
+        return self.__index
+
+    def __getitem__(self, key):
+        try:
+            return self.__cache[key]
+        except KeyError:
+            pass
+        position = self.__get_index()[key]
+        value = _raw_element_value(self.__raw, position,
+                                   self.__codec_options)
+        self.__cache[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self.__get_index()
+
+    def __iter__(self):
+        self.__get_index()
+        return iter(self.__names)
+
+    def __len__(self):
+        return len(self.__get_index())
+
+    def __eq__(self, other):
+        if isinstance(other, RawBSONDocument):
+            return self.__raw == other.raw
+        return collections.Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return ("RawBSONDocument(%r, codec_options=%r)"
+                % (self.__raw, self.__codec_options))
+
+
+DEFAULT_RAW_BSON_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+"""The default :class:`~bson.codec_options.CodecOptions` for
+:class:`RawBSONDocument`, decoding embedded documents to
+:class:`RawBSONDocument` too.
+"""
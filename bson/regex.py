@@ -41,6 +41,8 @@ def str_flags_to_int(str_flags):
 
 class Regex(object):
     """BSON regular expression data."""
+    __slots__ = ('pattern', 'flags')
+
     _type_marker = 11
 
     @classmethod
@@ -98,6 +100,16 @@ class Regex(object):
             raise TypeError(
                 "flags must be a string or int, not %s" % type(flags))
 
+    def __getstate__(self):
+        """Get the state to pickle, the same as when Regex had a
+        ``__dict__``.
+        """
+        return {"pattern": self.pattern, "flags": self.flags}
+
+    def __setstate__(self, state):
+        self.pattern = state["pattern"]
+        self.flags = state["flags"]
+
     def __eq__(self, other):
         if isinstance(other, Regex):
             return self.pattern == self.pattern and self.flags == other.flags
@@ -22,7 +22,13 @@ import collections
 import copy
 import re
 
-from bson.py3compat import iteritems
+try:
+    from collections import OrderedDict as _OrderedDict
+except ImportError:
+    # Python 2.6.
+    from ordereddict import OrderedDict as _OrderedDict
+
+from bson.py3compat import PY3, iteritems
 
 
 # This sort of sucks, but seems to be as good as it gets...
@@ -30,12 +36,12 @@ from bson.py3compat import iteritems
 RE_TYPE = type(re.compile(""))
 
 
-class SON(dict):
+class SON(_OrderedDict):
     """SON data.
 
-    A subclass of dict that maintains ordering of keys and provides a
-    few extra niceties for dealing with SON. SON objects can be
-    converted to and from BSON.
+    A subclass of :class:`collections.OrderedDict` that provides a few
+    extra niceties for dealing with SON. SON objects can be converted to
+    and from BSON.
 
     The mapping from Python types to BSON types is as follows:
 
@@ -87,121 +93,63 @@ class SON(dict):
     """
 
     def __init__(self, data=None, **kwargs):
-        self.__keys = []
-        dict.__init__(self)
+        _OrderedDict.__init__(self)
         self.update(data)
         self.update(kwargs)
 
-    def __new__(cls, *args, **kwargs):
-        instance = super(SON, cls).__new__(cls, *args, **kwargs)
-        instance.__keys = []
-        return instance
-
     def __repr__(self):
         result = []
-        for key in self.__keys:
-            result.append("(%r, %r)" % (key, self[key]))
+        for key, value in self.iteritems():
+            result.append("(%r, %r)" % (key, value))
         return "SON([%s])" % ", ".join(result)
 
-    def __setitem__(self, key, value):
-        if key not in self.__keys:
-            self.__keys.append(key)
-        dict.__setitem__(self, key, value)
-
-    def __delitem__(self, key):
-        self.__keys.remove(key)
-        dict.__delitem__(self, key)
+    def __setstate__(self, state):
+        # SONs pickled by PyMongo before 3.0 were plain dicts with the
+        # order of their keys in a list.
+        keys = state.pop("_SON__keys", None)
+        if keys is not None:
+            items = [(key, dict.__getitem__(self, key)) for key in keys]
+            dict.clear(self)
+            _OrderedDict.__init__(self)
+            _OrderedDict.clear(self)
+            self.update(items)
+        self.__dict__.update(state)
 
     def keys(self):
-        return list(self.__keys)
+        return list(_OrderedDict.keys(self))
 
-    def copy(self):
-        other = SON()
-        other.update(self)
-        return other
-
-    # TODO this is all from UserDict.DictMixin. it could probably be made more
-    # efficient.
-    # second level definitions support higher levels
-    def __iter__(self):
-        for k in self.__keys:
-            yield k
+    def values(self):
+        return list(_OrderedDict.values(self))
 
-    def has_key(self, key):
-        return key in self.__keys
+    def items(self):
+        return list(_OrderedDict.items(self))
 
-    # third level takes advantage of second level definitions
-    def iteritems(self):
-        for k in self:
-            yield (k, self[k])
+    def copy(self):
+        return SON(self)
 
-    def iterkeys(self):
-        return self.__iter__()
+    def has_key(self, key):
+        return key in self
 
-    # fourth level uses definitions from lower levels
-    def itervalues(self):
-        for _, v in self.iteritems():
-            yield v
+    if PY3:
+        def iterkeys(self):
+            return iter(self)
 
-    def values(self):
-        return [v for _, v in self.iteritems()]
+        def itervalues(self):
+            return iter(_OrderedDict.values(self))
 
-    def items(self):
-        return [(key, self[key]) for key in self]
-
-    def clear(self):
-        self.__keys = []
-        super(SON, self).clear()
-
-    def setdefault(self, key, default=None):
-        try:
-            return self[key]
-        except KeyError:
-            self[key] = default
-        return default
-
-    def pop(self, key, *args):
-        if len(args) > 1:
-            raise TypeError("pop expected at most 2 arguments, got "\
-                                + repr(1 + len(args)))
-        try:
-            value = self[key]
-        except KeyError:
-            if args:
-                return args[0]
-            raise
-        del self[key]
-        return value
+        def iteritems(self):
+            return iter(_OrderedDict.items(self))
 
     def popitem(self):
-        try:
-            k, v = next(self.iteritems())
-        except StopIteration:
+        if not self:
             raise KeyError('container is empty')
-        del self[k]
-        return (k, v)
+        return _OrderedDict.popitem(self, last=False)
 
     def update(self, other=None, **kwargs):
-        # Make progressively weaker assumptions about "other"
-        if other is None:
-            pass
-        elif hasattr(other, 'iteritems'):  # iteritems saves memory and lookups
-            for k, v in other.iteritems():
-                self[k] = v
-        elif hasattr(other, 'keys'):
-            for k in other.keys():
-                self[k] = other[k]
-        else:
-            for k, v in other:
-                self[k] = v
+        if other is not None:
+            _OrderedDict.update(self, other)
         if kwargs:
-            self.update(kwargs)
-
-    def get(self, key, default=None):
-        try:
-            return self[key]
-        except KeyError:
-            return default
+            _OrderedDict.update(self, kwargs)
 
     def __eq__(self, other):
         """Comparison to another SON is order-sensitive while comparison to a
@@ -214,9 +162,6 @@ class SON(dict):
     def __ne__(self, other):
         return not self == other
 
-    def __len__(self):
-        return len(self.__keys)
-
     def to_dict(self):
         """Convert a SON document to a normal Python dictionary instance.
 
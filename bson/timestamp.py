@@ -27,6 +27,8 @@ class Timestamp(object):
     """MongoDB internal timestamps used in the opLog.
     """
 
+    __slots__ = ('__time', '__inc')
+
     _type_marker = 17
 
     def __init__(self, time, inc):
@@ -75,6 +77,17 @@ class Timestamp(object):
         """
         return self.__inc
 
+    def __getstate__(self):
+        """Get the state to pickle, the same as when Timestamp had a
+        ``__dict__``.
+        """
+        return {"_Timestamp__time": self.__time,
+                "_Timestamp__inc": self.__inc}
+
+    def __setstate__(self, state):
+        self.__time = state["_Timestamp__time"]
+        self.__inc = state["_Timestamp__inc"]
+
     def __eq__(self, other):
         if isinstance(other, Timestamp):
             return (self.__time == other.time and self.__inc == other.inc)
@@ -867,11 +867,31 @@ insertfail:
     return NULL;
 }
 
+/* Get a read-only view of a buffer's contents, without copying them.
+ *
+ * The view must not outlive the buffer. Returns a new reference. */
+static PyObject*
+_buffer_view(buffer_t buffer) {
+#if PY_VERSION_HEX >= 0x02070000
+    Py_buffer info;
+    if (PyBuffer_FillInfo(&info, NULL, buffer_get_buffer(buffer),
+                          buffer_get_position(buffer), 1, PyBUF_SIMPLE) == -1) {
+        return NULL;
+    }
+    return PyMemoryView_FromBuffer(&info);
+#else
+    /* Python 2.6 has no memoryview. */
+    return PyBuffer_FromMemory(buffer_get_buffer(buffer),
+                               buffer_get_position(buffer));
+#endif
+}
+
 static PyObject*
 _send_write_command(PyObject* sock_info, buffer_t buffer,
                     int lst_len_loc, int cmd_len_loc, unsigned char* errors) {
 
     PyObject* result;
+    PyObject* view;
 
     int request_id = rand();
     int position = buffer_get_position(buffer);
@@ -882,12 +902,29 @@ _send_write_command(PyObject* sock_info, buffer_t buffer,
     memcpy(buffer_get_buffer(buffer), &position, 4);
     memcpy(buffer_get_buffer(buffer) + 4, &request_id, 4);
 
-    /* Send the current batch */
+    /* Send the current batch straight from our buffer. */
+    if (!(view = _buffer_view(buffer))) {
+        return NULL;
+    }
     result = PyObject_CallMethod(sock_info, "write_command",
-                                 "i" BYTES_FORMAT_STRING,
-                                 request_id,
-                                 buffer_get_buffer(buffer),
-                                 buffer_get_position(buffer));
+                                 "iO", request_id, view);
+#if PY_MAJOR_VERSION >= 3
+    {
+        /* Invalidate the view in case anything kept a reference to it. */
+        PyObject *etype = NULL, *evalue = NULL, *etrace = NULL;
+        PyObject* released;
+        PyErr_Fetch(&etype, &evalue, &etrace);
+        released = PyObject_CallMethod(view, "release", NULL);
+        if (etype) {
+            /* Keep the original error. */
+            PyErr_Restore(etype, evalue, etrace);
+        } else if (!released) {
+            Py_CLEAR(result);
+        }
+        Py_XDECREF(released);
+    }
+#endif
+    Py_DECREF(view);
     if (result && PyDict_GetItemString(result, "writeErrors"))
         *errors = 1;
     return result;
@@ -927,8 +964,36 @@ _command_buffer_new(char* ns, int ns_len) {
 #define _UPDATE 1
 #define _DELETE 2
 
+/* Writes the next document of a batched write command to the buffer.
+ *
+ * Returns 1 if a document was written, 0 if there are no more documents
+ * and -1 on error. */
+typedef int (*write_next_fn)(PyObject* self, buffer_t buffer, void* source,
+                             unsigned char check_keys,
+                             const codec_options_t* options);
+
+static int
+_write_next_document(PyObject* self, buffer_t buffer, void* source,
+                     unsigned char check_keys,
+                     const codec_options_t* options) {
+    struct module_state *state = GETSTATE(self);
+    PyObject* doc = PyIter_Next((PyObject*)source);
+    int written;
+    if (!doc) {
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    written = write_dict(state->_cbson, buffer, doc, check_keys, options, 1);
+    Py_DECREF(doc);
+    return written ? 1 : -1;
+}
+
 static PyObject*
-_cbson_do_batched_write_command(PyObject* self, PyObject* args) {
+_do_batched_write_command(PyObject* self, char* ns, int ns_len,
+                          unsigned char op, PyObject* command,
+                          write_next_fn write_next, void* source,
+                          unsigned char check_keys,
+                          const codec_options_t* options,
+                          PyObject* sock_info) {
     struct module_state *state = GETSTATE(self);
 
     long max_bson_size;
@@ -938,32 +1003,16 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
     int idx = 0;
     int cmd_len_loc;
     int lst_len_loc;
-    int ns_len;
     int ordered;
-    char *ns = NULL;
+    int written;
     PyObject* max_bson_size_obj;
     PyObject* max_write_batch_size_obj;
-    PyObject* command;
-    PyObject* doc;
-    PyObject* docs;
-    PyObject* sock_info;
-    PyObject* iterator;
     PyObject* result;
     PyObject* results;
-    unsigned char op;
-    unsigned char check_keys;
-    codec_options_t options;
     unsigned char empty = 1;
     unsigned char errors = 0;
     buffer_t buffer;
 
-    if (!PyArg_ParseTuple(args, "et#bOObO&O", "utf-8",
-                          &ns, &ns_len, &op, &command, &docs, &check_keys,
-                          convert_codec_options, &options,
-                          &sock_info)) {
-        return NULL;
-    }
-
     max_bson_size_obj = PyObject_GetAttrString(sock_info, "max_bson_size");
 #if PY_MAJOR_VERSION >= 3
     max_bson_size = PyLong_AsLong(max_bson_size_obj);
@@ -972,8 +1021,6 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
 #endif
     Py_XDECREF(max_bson_size_obj);
     if (max_bson_size == -1) {
-        destroy_codec_options(&options);
-        PyMem_Free(ns);
         return NULL;
     }
     /*
@@ -990,8 +1037,6 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
 #endif
     Py_XDECREF(max_write_batch_size_obj);
     if (max_write_batch_size == -1) {
-        destroy_codec_options(&options);
-        PyMem_Free(ns);
         return NULL;
     }
 
@@ -999,24 +1044,18 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
     ordered = !((PyDict_GetItemString(command, "ordered")) == Py_False);
 
     if (!(results = PyList_New(0))) {
-        destroy_codec_options(&options);
-        PyMem_Free(ns);
         return NULL;
     }
 
     if (!(buffer = _command_buffer_new(ns, ns_len))) {
-        destroy_codec_options(&options);
-        PyMem_Free(ns);
         Py_DECREF(results);
         return NULL;
     }
 
-    PyMem_Free(ns);
-
     /* Position of command document length */
     cmd_len_loc = buffer_get_position(buffer);
     if (!write_dict(state->_cbson, buffer, command, 0,
-                    &options, 0)) {
+                    options, 0)) {
         goto cmdfail;
     }
 
@@ -1064,36 +1103,28 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
         goto cmdfail;
     }
 
-    iterator = PyObject_GetIter(docs);
-    if (iterator == NULL) {
-        PyObject* InvalidOperation = _error("InvalidOperation");
-        if (InvalidOperation) {
-            PyErr_SetString(InvalidOperation, "input is not iterable");
-            Py_DECREF(InvalidOperation);
-        }
-        goto cmdfail;
-    }
-    while ((doc = PyIter_Next(iterator)) != NULL) {
+    while (1) {
         int sub_doc_begin = buffer_get_position(buffer);
         int cur_doc_begin;
         int cur_size;
         int enough_data = 0;
         int enough_documents = 0;
         char key[16];
-        empty = 0;
         INT2STRING(key, idx);
         if (!buffer_write_bytes(buffer, "\x03", 1) ||
             !buffer_write_bytes(buffer, key, (int)strlen(key) + 1)) {
-            Py_DECREF(doc);
-            goto cmditerfail;
+            goto cmdfail;
         }
         cur_doc_begin = buffer_get_position(buffer);
-        if (!write_dict(state->_cbson, buffer, doc,
-                        check_keys, &options, 1)) {
-            Py_DECREF(doc);
-            goto cmditerfail;
+        written = write_next(self, buffer, source, check_keys, options);
+        if (written == -1) {
+            goto cmdfail;
+        } else if (!written) {
+            /* No more documents, drop the element header. */
+            buffer_update_position(buffer, sub_doc_begin);
+            break;
         }
-        Py_DECREF(doc);
+        empty = 0;
 
         /* We have enough data, maybe send this batch. */
         enough_data = (buffer_get_position(buffer) > max_cmd_size);
@@ -1118,12 +1149,12 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
                         Py_DECREF(DocumentTooLarge);
                     }
                 }
-                goto cmditerfail;
+                goto cmdfail;
             }
 
             if (!(new_buffer = buffer_new())) {
                 PyErr_NoMemory();
-                goto cmditerfail;
+                goto cmdfail;
             }
             /* New buffer including the current overflow document */
             if (!buffer_write_bytes(new_buffer,
@@ -1132,7 +1163,7 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
                 !buffer_write_bytes(new_buffer,
                 (const char*)buffer_get_buffer(buffer) + cur_doc_begin, cur_size)) {
                 buffer_free(new_buffer);
-                goto cmditerfail;
+                goto cmdfail;
             }
             /*
              * Roll the existing buffer back to the beginning
@@ -1142,7 +1173,7 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
 
             if (!buffer_write_bytes(buffer, "\x00\x00", 2)) {
                 buffer_free(new_buffer);
-                goto cmditerfail;
+                goto cmdfail;
             }
 
             result = _send_write_command(sock_info, buffer,
@@ -1152,7 +1183,7 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
             buffer = new_buffer;
 
             if (!result)
-                goto cmditerfail;
+                goto cmdfail;
 
 #if PY_MAJOR_VERSION >= 3
             result = Py_BuildValue("NN",
@@ -1162,14 +1193,12 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
                                    PyInt_FromLong(idx_offset), result);
 #endif
             if (!result)
-                goto cmditerfail;
+                goto cmdfail;
 
             PyList_Append(results, result);
             Py_DECREF(result);
 
             if (errors && ordered) {
-                destroy_codec_options(&options);
-                Py_DECREF(iterator);
                 buffer_free(buffer);
                 return results;
             }
@@ -1178,11 +1207,6 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
         }
         idx += 1;
     }
-    Py_DECREF(iterator);
-
-    if (PyErr_Occurred()) {
-        goto cmdfail;
-    }
 
     if (empty) {
         PyObject* InvalidOperation = _error("InvalidOperation");
@@ -1213,18 +1237,212 @@ _cbson_do_batched_write_command(PyObject* self, PyObject* args) {
 
     PyList_Append(results, result);
     Py_DECREF(result);
-    destroy_codec_options(&options);
     return results;
 
-cmditerfail:
-    Py_DECREF(iterator);
 cmdfail:
-    destroy_codec_options(&options);
     Py_DECREF(results);
     buffer_free(buffer);
     return NULL;
 }
 
+static PyObject*
+_cbson_do_batched_write_command(PyObject* self, PyObject* args) {
+    int ns_len;
+    char *ns = NULL;
+    PyObject* command;
+    PyObject* docs;
+    PyObject* sock_info;
+    PyObject* iterator;
+    PyObject* results;
+    unsigned char op;
+    unsigned char check_keys;
+    codec_options_t options;
+
+    if (!PyArg_ParseTuple(args, "et#bOObO&O", "utf-8",
+                          &ns, &ns_len, &op, &command, &docs, &check_keys,
+                          convert_codec_options, &options,
+                          &sock_info)) {
+        return NULL;
+    }
+
+    iterator = PyObject_GetIter(docs);
+    if (iterator == NULL) {
+        PyObject* InvalidOperation = _error("InvalidOperation");
+        if (InvalidOperation) {
+            PyErr_SetString(InvalidOperation, "input is not iterable");
+            Py_DECREF(InvalidOperation);
+        }
+        destroy_codec_options(&options);
+        PyMem_Free(ns);
+        return NULL;
+    }
+
+    results = _do_batched_write_command(self, ns, ns_len, op, command,
+                                        _write_next_document, iterator,
+                                        check_keys, &options, sock_info);
+    Py_DECREF(iterator);
+    destroy_codec_options(&options);
+    PyMem_Free(ns);
+    return results;
+}
+
+/* The column types of bson.decode_columns, in the order of
+ * bson._COLUMN_TYPES, with the width and BSON type of their values. */
+#define COLUMN_BOOL 3
+#define COLUMN_OBJECTID 5
+
+static const int column_widths[] = {4, 8, 8, 1, 8, 12};
+static const char column_bson_types[] = {0x10, 0x12, 0x01, 0x08, 0x09, 0x07};
+
+typedef struct {
+    const char* name;
+    int name_length;
+    int type;
+    Py_buffer values;
+    Py_buffer mask;
+    int has_mask;
+} column_t;
+
+typedef struct {
+    column_t* columns;
+    Py_ssize_t count;
+    Py_ssize_t rows;
+    Py_ssize_t row;
+} column_source_t;
+
+/* Write the next row of a column_source_t as a BSON document. */
+static int
+_write_next_row(PyObject* self, buffer_t buffer, void* source_ptr,
+                unsigned char check_keys, const codec_options_t* options) {
+    column_source_t* source = (column_source_t*)source_ptr;
+    Py_ssize_t i;
+    int start;
+    int length;
+
+    if (source->row >= source->rows) {
+        return 0;
+    }
+    start = buffer_save_space(buffer, 4);
+    if (start == -1) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    for (i = 0; i < source->count; i++) {
+        const column_t* column = &source->columns[i];
+        int width = column_widths[column->type];
+        const char* value;
+        if (column->has_mask && !((const char*)column->mask.buf)[source->row]) {
+            continue;
+        }
+        value = (const char*)column->values.buf + source->row * width;
+        if (!buffer_write_bytes(buffer,
+                                &column_bson_types[column->type], 1) ||
+            !buffer_write_bytes(buffer, column->name,
+                                column->name_length + 1)) {
+            return -1;
+        }
+        if (column->type == COLUMN_BOOL) {
+            if (!buffer_write_bytes(buffer, *value ? "\x01" : "\x00", 1)) {
+                return -1;
+            }
+        } else if (!buffer_write_bytes(buffer, value, width)) {
+            return -1;
+        }
+    }
+    if (!buffer_write_bytes(buffer, "\x00", 1)) {
+        return -1;
+    }
+    length = buffer_get_position(buffer) - start;
+    memcpy(buffer_get_buffer(buffer) + start, &length, 4);
+    source->row++;
+    return 1;
+}
+
+static PyObject*
+_cbson_do_batched_insert_columns(PyObject* self, PyObject* args) {
+    int ns_len;
+    char *ns = NULL;
+    PyObject* command;
+    PyObject* specs;
+    PyObject* sock_info;
+    PyObject* results = NULL;
+    codec_options_t options;
+    column_source_t source;
+    Py_ssize_t i;
+
+    if (!PyArg_ParseTuple(args, "et#OO!nO&O", "utf-8",
+                          &ns, &ns_len, &command, &PyList_Type, &specs,
+                          &source.rows, convert_codec_options, &options,
+                          &sock_info)) {
+        return NULL;
+    }
+
+    source.row = 0;
+    source.count = 0;
+    source.columns = (column_t*)PyMem_Malloc(
+        sizeof(column_t) * (PyList_GET_SIZE(specs) + 1));
+    if (!source.columns) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    for (i = 0; i < PyList_GET_SIZE(specs); i++) {
+        column_t* column = &source.columns[i];
+        PyObject* values;
+        PyObject* mask;
+        if (!PyArg_ParseTuple(PyList_GET_ITEM(specs, i),
+                              BYTES_FORMAT_STRING "iOO", &column->name,
+                              &column->name_length, &column->type,
+                              &values, &mask)) {
+            goto done;
+        }
+        if (column->type < 0 || column->type > COLUMN_OBJECTID) {
+            PyErr_SetString(PyExc_ValueError, "invalid column type");
+            goto done;
+        }
+        if (PyObject_GetBuffer(values, &column->values, PyBUF_SIMPLE) == -1) {
+            goto done;
+        }
+        column->has_mask = (mask != Py_None);
+        if (column->has_mask &&
+                PyObject_GetBuffer(mask, &column->mask, PyBUF_SIMPLE) == -1) {
+            PyBuffer_Release(&column->values);
+            goto done;
+        }
+        source.count++;
+        if (column->values.len <
+                source.rows * column_widths[column->type] ||
+                (column->has_mask && column->mask.len < source.rows)) {
+            PyErr_SetString(PyExc_ValueError, "column is too short");
+            goto done;
+        }
+    }
+
+    results = _do_batched_write_command(self, ns, ns_len, _INSERT, command,
+                                        _write_next_row, &source, 0,
+                                        &options, sock_info);
+
+done:
+    for (i = 0; i < source.count; i++) {
+        PyBuffer_Release(&source.columns[i].values);
+        if (source.columns[i].has_mask) {
+            PyBuffer_Release(&source.columns[i].mask);
+        }
+    }
+    PyMem_Free(source.columns);
+    destroy_codec_options(&options);
+    PyMem_Free(ns);
+    return results;
+}
+
+static PyObject* _cbson_buffer_stats(PyObject* self, PyObject* unused) {
+    long hits;
+    long misses;
+    int cached;
+    buffer_arena_stats(&hits, &misses, &cached);
+    return Py_BuildValue("{s:l,s:l,s:i}", "hits", hits,
+                         "misses", misses, "cached", cached);
+}
+
 static PyMethodDef _CMessageMethods[] = {
     {"_insert_message", _cbson_insert_message, METH_VARARGS,
      "Create an insert message to be sent to MongoDB"},
@@ -1238,6 +1456,11 @@ static PyMethodDef _CMessageMethods[] = {
      "insert a batch of documents, splitting the batch as needed"},
     {"_do_batched_write_command", _cbson_do_batched_write_command, METH_VARARGS,
      "execute a batch of insert, update, or delete commands"},
+    {"_do_batched_insert_columns", _cbson_do_batched_insert_columns,
+     METH_VARARGS,
+     "insert the rows of typed columns with batched insert commands"},
+    {"_buffer_stats", _cbson_buffer_stats, METH_NOARGS,
+     "get the reuse counters of the message buffer arena."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -0,0 +1,1015 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client for using MongoDB from :mod:`asyncio` code.
+
+Requires Python 3.5.2 or later. Every method that talks to the server
+returns an :class:`asyncio.Task`::
+
+  client = AsyncMongoClient('mongodb://localhost:27017')
+  collection = client.test.test
+  result = await collection.insert_one({'x': 1})
+  doc = await collection.find_one({'x': 1})
+  docs = await collection.find({'x': {'$gt': 0}}).to_list()
+
+Use ``async for`` to iterate a cursor.
+
+Messages are built and parsed by the same code as
+:class:`~pymongo.mongo_client.MongoClient`, which an
+:class:`AsyncMongoClient` uses for server discovery and monitoring. Each
+server gets a pool of asyncio connections, and each connection carries any
+number of operations at once: requests are pipelined and replies are matched
+to them by request id, so one event loop thread can have thousands of
+operations in flight on a handful of sockets.
+
+New connections are opened, and authenticated, by the server's
+:class:`~pymongo.pool.Pool` on a thread from the event loop's default
+executor, and then handed over to the event loop. Server selection only
+waits on the executor while no suitable server is known.
+"""
+
+import asyncio
+import collections
+import functools
+import struct
+import types
+
+from collections.abc import Coroutine
+
+from bson.objectid import ObjectId
+from bson.py3compat import string_type
+from bson.raw_bson import RawBSONDocument
+from bson.son import SON
+from pymongo import common, helpers, message
+from pymongo.collection import Collection
+from pymongo.compression_support import (decompress,
+                                         OP_COMPRESSED,
+                                         _should_compress)
+from pymongo.database import Database
+from pymongo.errors import (AutoReconnect,
+                            ConfigurationError,
+                            ConnectionFailure,
+                            DocumentTooLarge,
+                            NetworkTimeout,
+                            NotMasterError,
+                            OperationFailure,
+                            ServerSelectionTimeoutError)
+from pymongo.message import _Query, _GetMore, _INSERT, _UPDATE, _DELETE
+from pymongo.mongo_client import MongoClient
+from pymongo.read_preferences import ReadPreference
+from pymongo.results import (DeleteResult,
+                             InsertManyResult,
+                             InsertOneResult,
+                             UpdateResult)
+from pymongo.server_selectors import (address_server_selector,
+                                      writable_server_selector)
+from pymongo.server_type import SERVER_TYPE
+from pymongo.topology_description import TOPOLOGY_TYPE
+
+_HEADER = struct.Struct("<iiii")
+
+
+class _Return(Exception):
+    """Raise _Return(value) to return a value from a _coroutine."""
+
+    def __init__(self, value=None):
+        super(_Return, self).__init__()
+        self.value = value
+
+
+def _coroutine(func):
+    """Run a generator method that yields awaitables as an asyncio Task.
+
+    Like :func:`asyncio.coroutine`, but without ``yield from``, so this
+    module still byte-compiles on Python 2. The generator returns a value
+    by raising :class:`_Return`. The method's object must have a ``_loop``.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return self._loop.create_task(
+            _GeneratorCoroutine(func(self, *args, **kwargs)))
+    return wrapper
+
+
+class _GeneratorCoroutine(Coroutine):
+    """Adapts a generator that yields awaitables to the coroutine protocol
+    a Task drives, awaiting each yielded value as ``yield from`` would.
+    """
+
+    def __init__(self, gen):
+        self._gen = gen
+        # The iterator of the awaitable the generator is waiting for.
+        self._awaiting = None
+
+    def __await__(self):
+        return self
+
+    __iter__ = __await__
+
+    def __next__(self):
+        return self.send(None)
+
+    def send(self, value):
+        return self._resume(value, None)
+
+    def throw(self, typ, val=None, tb=None):
+        if val is None:
+            val = typ() if isinstance(typ, type) else typ
+        return self._resume(None, val)
+
+    def close(self):
+        self._gen.close()
+
+    def _resume(self, value, error):
+        while True:
+            if self._awaiting is not None:
+                try:
+                    if error is None:
+                        return self._awaiting.send(value)
+                    return self._awaiting.throw(error)
+                except StopIteration as exc:
+                    value, error = exc.value, None
+                except (Exception, asyncio.CancelledError) as exc:
+                    value, error = None, exc
+                self._awaiting = None
+            try:
+                if error is None:
+                    yielded = self._gen.send(value)
+                else:
+                    yielded = self._gen.throw(error)
+            except _Return as exc:
+                raise StopIteration(exc.value)
+            if isinstance(yielded, types.GeneratorType):
+                # A generator-based coroutine, like asyncio's own before
+                # Python 3.8.
+                self._awaiting = yielded
+            else:
+                self._awaiting = yielded.__await__()
+            value = error = None
+
+
+class _BatchCollector(object):
+    """Stands in for a SocketInfo to collect the messages built by
+    :func:`~pymongo.message._do_batched_write_command` without sending
+    them.
+    """
+
+    def __init__(self, sock_info):
+        self.max_bson_size = sock_info.max_bson_size
+        self.max_write_batch_size = sock_info.max_write_batch_size
+        self.messages = []
+
+    def write_command(self, request_id, msg):
+        # The C extension passes a view of a buffer it frees afterwards.
+        self.messages.append((request_id, bytearray(msg)))
+        return {'ok': 1}
+
+
+class _AsyncConnection(asyncio.Protocol):
+    """One socket to a server, with any number of requests in flight."""
+
+    def __init__(self, pool, sock_info):
+        self.pool = pool
+        self.sock_info = sock_info
+        self.transport = None
+        self.closed = False
+        # Maps request ids to Futures for their replies.
+        self.pending = {}
+        self._buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, request_id, data, max_doc_size=0, compress=True):
+        """Send a message and return a Future for the body of the reply."""
+        max_bson_size = self.sock_info.max_bson_size
+        if max_bson_size is not None and max_doc_size > max_bson_size:
+            raise DocumentTooLarge(
+                "BSON document too large (%d bytes) - the connected server"
+                "supports BSON document sizes up to %d bytes." %
+                (max_doc_size, max_bson_size))
+        if self.closed:
+            raise AutoReconnect("%s:%d: connection closed" %
+                                self.pool.address)
+
+        context = self.sock_info.compression_context
+        if context is not None and compress:
+            data = context.compress(data)
+
+        loop = self.pool.loop
+        future = loop.create_future()
+        self.pending[request_id] = future
+        self.transport.write(data)
+        timeout = self.pool.socket_timeout
+        if timeout:
+            handle = loop.call_later(timeout, self._timeout, request_id)
+            future.add_done_callback(lambda _: handle.cancel())
+        return future
+
+    def _timeout(self, request_id):
+        # A late reply is discarded in data_received, so unlike a blocking
+        # socket the connection stays usable.
+        future = self.pending.pop(request_id, None)
+        if future is not None and not future.done():
+            future.set_exception(NetworkTimeout(
+                "%s:%d: timed out" % self.pool.address))
+
+    def data_received(self, data):
+        buf = self._buffer
+        buf.extend(data)
+        pos = 0
+        while len(buf) - pos >= 16:
+            length, _, response_to, op_code = _HEADER.unpack_from(buf, pos)
+            if len(buf) - pos < length:
+                break
+            body = buf[pos + 16:pos + length]
+            pos += length
+            future = self.pending.pop(response_to, None)
+            if future is None or future.done():
+                # Timed out or cancelled.
+                continue
+            if op_code == OP_COMPRESSED:
+                try:
+                    body = decompress(body, 1)
+                except Exception as exc:
+                    future.set_exception(exc)
+                    continue
+            elif op_code != 1:
+                future.set_exception(AssertionError(
+                    "opcodes don't match 1 %r" % (op_code,)))
+                continue
+            future.set_result(body)
+        del buf[:pos]
+
+    def connection_lost(self, exc):
+        self.closed = True
+        error = AutoReconnect("%s:%d: connection closed" % self.pool.address)
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pool._remove(self)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.transport.close()
+
+
+class _AsyncPool(object):
+    """The asyncio connections to one server.
+
+    Sockets are checked out of the server's :class:`~pymongo.pool.Pool`, so
+    they count against its max_pool_size, and are discarded from it when
+    they close.
+    """
+
+    def __init__(self, client, server):
+        self.client = client
+        self.server = server
+        self.address = server.description.address
+        self.loop = self._loop = client._loop
+        opts = server.pool.opts
+        self.max_size = opts.max_pool_size
+        self.socket_timeout = opts.socket_timeout
+        self.connections = []
+        self._connecting = 0
+        self._waiters = collections.deque()
+
+    @_coroutine
+    def get_connection(self):
+        """Get an idle connection, open a new one, or share the least busy
+        one if the pool is full.
+        """
+        while True:
+            best = None
+            for conn in self.connections:
+                if best is None or len(conn.pending) < len(best.pending):
+                    best = conn
+            size = len(self.connections) + self._connecting
+            full = self.max_size is not None and size >= self.max_size
+            if best is not None and (full or not best.pending):
+                raise _Return(best)
+            if not full:
+                conn = yield self._connect()
+                raise _Return(conn)
+            # Every connection is still being opened.
+            waiter = self.loop.create_future()
+            self._waiters.append(waiter)
+            yield waiter
+
+    def _connect(self):
+        # Count the connection now, before the Task first runs, so other
+        # callers see the pool fill up.
+        self._connecting += 1
+        task = self._open()
+        task.add_done_callback(self._opened)
+        return task
+
+    @_coroutine
+    def _open(self):
+        sock_info = yield self.loop.run_in_executor(None, self._checkout)
+        try:
+            _, conn = yield self.loop.create_connection(
+                lambda: _AsyncConnection(self, sock_info),
+                sock=sock_info.sock)
+        except Exception:
+            self._discard(sock_info)
+            raise
+        self.connections.append(conn)
+        raise _Return(conn)
+
+    def _opened(self, task):
+        self._connecting -= 1
+        self._wake()
+
+    def _checkout(self):
+        # Runs on an executor thread: connect and authenticate.
+        with self.server.get_socket(self.client._credentials(),
+                                    checkout=True) as sock_info:
+            return sock_info
+
+    def _discard(self, sock_info):
+        sock_info.close()
+        self.server.pool.return_socket(sock_info)
+
+    def _remove(self, conn):
+        if conn in self.connections:
+            self.connections.remove(conn)
+        self._discard(conn.sock_info)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def close(self):
+        for conn in list(self.connections):
+            conn.close()
+
+
+class AsyncMongoClient(common.BaseObject):
+
+    def __init__(self, *args, **kwargs):
+        """Client for a MongoDB instance, a replica set, or a set of
+        mongoses, for use from asyncio code.
+
+        Takes the same arguments as
+        :class:`~pymongo.mongo_client.MongoClient`, plus:
+
+          - `loop` (optional): the :mod:`asyncio` event loop to use.
+            Defaults to :func:`asyncio.get_event_loop`.
+
+        SSL is not supported yet.
+
+        .. versionadded:: 3.0
+        """
+        loop = kwargs.pop('loop', None) or asyncio.get_event_loop()
+        self.__client = client = MongoClient(*args, **kwargs)
+        if client._topology_settings.pool_options.ssl_context is not None:
+            client.close()
+            raise ConfigurationError(
+                "AsyncMongoClient does not support SSL")
+        super(AsyncMongoClient, self).__init__(client.codec_options,
+                                               client.read_preference,
+                                               client.write_concern)
+        self._loop = loop
+        self.__pools = {}
+
+    @property
+    def delegate(self):
+        """The :class:`~pymongo.mongo_client.MongoClient` this client uses
+        for server monitoring, authentication, and killing cursors.
+        """
+        return self.__client
+
+    def _credentials(self):
+        return self.__client._MongoClient__all_credentials
+
+    def __getattr__(self, name):
+        """Get a database by name."""
+        if name.startswith('_'):
+            raise AttributeError(
+                "AsyncMongoClient has no attribute %r. To access the %s"
+                " database, use client[%r]." % (name, name, name))
+        return self.__getitem__(name)
+
+    def __getitem__(self, name):
+        """Get a database by name."""
+        return AsyncDatabase(self, name)
+
+    def get_database(self, name, codec_options=None,
+                     read_preference=None, write_concern=None):
+        """Get an :class:`AsyncDatabase` with the given name and options.
+
+        See :meth:`~pymongo.mongo_client.MongoClient.get_database`.
+        """
+        return AsyncDatabase(
+            self, name, codec_options, read_preference, write_concern)
+
+    def close(self):
+        """Close all connections and stop monitoring.
+
+        The client reconnects if it is used again.
+        """
+        pools, self.__pools = self.__pools, {}
+        for pool in pools.values():
+            pool.close()
+        self.__client.close()
+
+    def __repr__(self):
+        return "AsyncMongoClient(%r)" % (self.__client,)
+
+    def _get_pool(self, server):
+        pool = self.__pools.get(server.description.address)
+        if pool is None or pool.server is not server:
+            if pool is not None:
+                pool.close()
+            pool = _AsyncPool(self, server)
+            self.__pools[pool.address] = pool
+        return pool
+
+    @_coroutine
+    def _select_server(self, selector, address=None):
+        """Select a server without blocking the event loop."""
+        topology = self.__client._get_topology()
+        if address is not None:
+            selector = functools.partial(address_server_selector, address)
+        try:
+            server = topology.select_server(selector, 0)
+        except ServerSelectionTimeoutError:
+            # Wait for the monitors on an executor thread.
+            server = yield self._loop.run_in_executor(
+                None, topology.select_server, selector)
+        raise _Return(server)
+
+    def _set_slave_ok(self, server):
+        """Always set slaveOk for a direct connection to a mongod."""
+        topology = self.__client._get_topology()
+        return (topology.description.topology_type == TOPOLOGY_TYPE.Single
+                and server.description.server_type != SERVER_TYPE.Mongos)
+
+    @_coroutine
+    def _send(self, server, conn, request_id, data, max_doc_size=0,
+              compress=True):
+        """Send a message and return the body of the reply.
+
+        Reset the server on network errors, like MongoClient does.
+        """
+        try:
+            reply = yield conn.send(request_id, data, max_doc_size, compress)
+        except NetworkTimeout:
+            raise
+        except ConnectionFailure:
+            address = server.description.address
+            self.__client._get_topology().reset_server(address)
+            pool = self.__pools.pop(address, None)
+            if pool is not None:
+                pool.close()
+            raise
+        raise _Return(reply)
+
+    def _not_master(self, server):
+        self.__client._reset_server_and_request_check(
+            server.description.address)
+
+    @_coroutine
+    def _send_message_with_response(self, operation, read_preference=None,
+                                    address=None):
+        """Send a _Query or _GetMore, returning (reply body, address)."""
+        server = yield self._select_server(
+            read_preference or writable_server_selector, address)
+        conn = yield self._get_pool(server).get_connection()
+        request_id, data, max_doc_size = server._split_message(
+            operation.get_message(self._set_slave_ok(server),
+                                  conn.sock_info.is_mongos))
+        reply = yield self._send(server, conn, request_id, data, max_doc_size)
+        raise _Return((reply, server.description.address))
+
+    @_coroutine
+    def _command(self, dbname, spec, read_preference, codec_options,
+                 check=True, allowable_errors=None):
+        """Run a command and return the response document."""
+        server = yield self._select_server(read_preference)
+        conn = yield self._get_pool(server).get_connection()
+        sock_info = conn.sock_info
+        flags = 0
+        if (self._set_slave_ok(server) or
+                read_preference != ReadPreference.PRIMARY):
+            flags = 4
+        if sock_info.is_mongos:
+            spec = message._maybe_add_read_preference(spec, read_preference)
+        request_id, data, _ = message.query(
+            flags, dbname + '.$cmd', 0, -1, spec, None, codec_options)
+        reply = yield self._send(server, conn, request_id, data,
+                                 compress=_should_compress(spec))
+        response = helpers._unpack_response(
+            reply, codec_options=codec_options)['data'][0]
+        if check:
+            msg = "command %s on namespace %s failed: %%s" % (
+                repr(spec).replace("%", "%%"), dbname + '.$cmd')
+            try:
+                helpers._check_command_response(
+                    response, msg, allowable_errors)
+            except NotMasterError:
+                self._not_master(server)
+                raise
+        raise _Return(response)
+
+    @_coroutine
+    def _write_command(self, dbname, operation, command, docs, check_keys,
+                       codec_options):
+        """Execute an insert, update, or delete command, in batches.
+
+        Returns a list of (offset, result) pairs like
+        :func:`~pymongo.message._do_batched_write_command`. The batches of an
+        unordered write are pipelined, an ordered write stops at the first
+        batch with errors.
+        """
+        server = yield self._select_server(writable_server_selector)
+        conn = yield self._get_pool(server).get_connection()
+        if conn.sock_info.max_wire_version < 2:
+            raise ConfigurationError(
+                "AsyncMongoClient requires MongoDB 2.6 or later")
+
+        collector = _BatchCollector(conn.sock_info)
+        offsets = [offset for offset, _ in message._do_batched_write_command(
+            dbname + '.$cmd', operation, command, docs, check_keys,
+            codec_options, collector)]
+
+        def unpack(reply):
+            result = helpers._unpack_response(reply)['data'][0]
+            try:
+                helpers._check_command_response(result)
+            except NotMasterError:
+                self._not_master(server)
+                raise
+            return result
+
+        results = []
+        if command.get('ordered', True):
+            for offset, (request_id, data) in zip(offsets,
+                                                  collector.messages):
+                reply = yield self._send(server, conn, request_id, data)
+                result = unpack(reply)
+                results.append((offset, result))
+                if "writeErrors" in result:
+                    break
+        else:
+            replies = yield asyncio.gather(
+                *[self._send(server, conn, request_id, data)
+                  for request_id, data in collector.messages])
+            results = [(offset, unpack(reply))
+                       for offset, reply in zip(offsets, replies)]
+
+        helpers._check_write_command_response(results)
+        raise _Return(results)
+
+
+class AsyncDatabase(common.BaseObject):
+
+    def __init__(self, client, name, codec_options=None,
+                 read_preference=None, write_concern=None):
+        """A database on an :class:`AsyncMongoClient`.
+
+        See :class:`~pymongo.database.Database`.
+        """
+        self.__delegate = Database(client.delegate, name, codec_options,
+                                   read_preference, write_concern)
+        super(AsyncDatabase, self).__init__(
+            codec_options or client.codec_options,
+            read_preference or client.read_preference,
+            write_concern or client.write_concern)
+        self.__client = client
+        self._loop = client._loop
+
+    @property
+    def client(self):
+        """The :class:`AsyncMongoClient` for this database."""
+        return self.__client
+
+    @property
+    def name(self):
+        """The name of this database."""
+        return self.__delegate.name
+
+    def __getattr__(self, name):
+        """Get a collection of this database by name."""
+        if name.startswith('_'):
+            raise AttributeError(
+                "AsyncDatabase has no attribute %r. To access the %s"
+                " collection, use database[%r]." % (name, name, name))
+        return self.__getitem__(name)
+
+    def __getitem__(self, name):
+        """Get a collection of this database by name."""
+        return AsyncCollection(self, name)
+
+    def get_collection(self, name, codec_options=None,
+                       read_preference=None, write_concern=None):
+        """Get an :class:`AsyncCollection` with the given name and options.
+
+        See :meth:`~pymongo.database.Database.get_collection`.
+        """
+        return AsyncCollection(
+            self, name, codec_options, read_preference, write_concern)
+
+    def __repr__(self):
+        return "AsyncDatabase(%r, %r)" % (self.__client, self.name)
+
+    def command(self, command, value=1, check=True, allowable_errors=None,
+                read_preference=ReadPreference.PRIMARY,
+                codec_options=None, **kwargs):
+        """Issue a MongoDB command, returning a Future for the response.
+
+        See :meth:`~pymongo.database.Database.command`.
+        """
+        if isinstance(command, string_type):
+            command = SON([(command, value)])
+        command.update(kwargs)
+        return self.__client._command(
+            self.name, command, read_preference,
+            codec_options or self.codec_options, check, allowable_errors)
+
+
+class AsyncCollection(common.BaseObject):
+
+    def __init__(self, database, name, codec_options=None,
+                 read_preference=None, write_concern=None):
+        """A collection of an :class:`AsyncDatabase`.
+
+        See :class:`~pymongo.collection.Collection`.
+        """
+        self.__delegate = Collection(
+            database.client.delegate[database.name], name)
+        super(AsyncCollection, self).__init__(
+            codec_options or database.codec_options,
+            read_preference or database.read_preference,
+            write_concern or database.write_concern)
+        self.__database = database
+        self._loop = database._loop
+
+    @property
+    def database(self):
+        """The :class:`AsyncDatabase` this collection belongs to."""
+        return self.__database
+
+    @property
+    def name(self):
+        """The name of this collection."""
+        return self.__delegate.name
+
+    @property
+    def full_name(self):
+        """The full name of this collection, "<database>.<collection>"."""
+        return self.__delegate.full_name
+
+    def __repr__(self):
+        return "AsyncCollection(%r, %r)" % (self.__database, self.name)
+
+    def _write(self, operation, command, docs, check_keys=True):
+        concern = self.write_concern.document
+        if concern:
+            command['writeConcern'] = concern
+        return self.__database.client._write_command(
+            self.__database.name, operation, command, docs, check_keys,
+            self.codec_options)
+
+    @_coroutine
+    def insert_one(self, document):
+        """Insert a single document.
+
+        Returns a Future for an :class:`~pymongo.results.InsertOneResult`.
+        """
+        common.validate_is_document_type("document", document)
+        if not (isinstance(document, RawBSONDocument) or "_id" in document):
+            document["_id"] = ObjectId.generate_many(1)[0]
+        yield self._write(_INSERT, SON([('insert', self.name),
+                                        ('ordered', True)]), [document])
+        raise _Return(InsertOneResult(document.get("_id"),
+                                      self.write_concern.acknowledged))
+
+    @_coroutine
+    def insert_many(self, documents, ordered=True):
+        """Insert a list of documents.
+
+        Returns a Future for an :class:`~pymongo.results.InsertManyResult`.
+        Large lists are split into batches, which are all sent at once if
+        `ordered` is ``False``.
+        """
+        if not isinstance(documents, list) or not documents:
+            raise TypeError("documents must be a non-empty list")
+        missing_ids = []
+        for document in documents:
+            common.validate_is_document_type("document", document)
+            if not (isinstance(document, RawBSONDocument) or
+                    "_id" in document):
+                missing_ids.append(document)
+        # Generate the missing _ids at once.
+        for document, oid in zip(missing_ids,
+                                 ObjectId.generate_many(len(missing_ids))):
+            document["_id"] = oid
+        inserted_ids = [document.get("_id") for document in documents]
+        yield self._write(_INSERT, SON([('insert', self.name),
+                                        ('ordered', ordered)]), documents)
+        raise _Return(InsertManyResult(inserted_ids,
+                                       self.write_concern.acknowledged))
+
+    @_coroutine
+    def _update(self, filter, document, upsert, check_keys, multi):
+        common.validate_is_mapping("filter", filter)
+        common.validate_boolean("upsert", upsert)
+        docs = [SON([('q', filter), ('u', document),
+                     ('multi', multi), ('upsert', upsert)])]
+        results = yield self._write(_UPDATE, SON([('update', self.name)]),
+                                    docs, check_keys)
+        _, result = results[0]
+        # Add the updatedExisting field for compatibility.
+        if result.get('n') and 'upserted' not in result:
+            result['updatedExisting'] = True
+        else:
+            result['updatedExisting'] = False
+            # MongoDB >= 2.6.0 returns the upsert _id in an array
+            # element. Break it out for backward compatibility.
+            if 'upserted' in result:
+                result['upserted'] = result['upserted'][0]['_id']
+        raise _Return(UpdateResult(result, self.write_concern.acknowledged))
+
+    def replace_one(self, filter, replacement, upsert=False):
+        """Replace a single document matching the filter.
+
+        Returns a Future for an :class:`~pymongo.results.UpdateResult`.
+        """
+        common.validate_ok_for_replace(replacement)
+        return self._update(filter, replacement, upsert, True, False)
+
+    def update_one(self, filter, update, upsert=False):
+        """Update a single document matching the filter.
+
+        Returns a Future for an :class:`~pymongo.results.UpdateResult`.
+        """
+        common.validate_ok_for_update(update)
+        return self._update(filter, update, upsert, False, False)
+
+    def update_many(self, filter, update, upsert=False):
+        """Update all documents matching the filter.
+
+        Returns a Future for an :class:`~pymongo.results.UpdateResult`.
+        """
+        common.validate_ok_for_update(update)
+        return self._update(filter, update, upsert, False, True)
+
+    @_coroutine
+    def _delete(self, filter, multi):
+        common.validate_is_mapping("filter", filter)
+        docs = [SON([('q', filter), ('limit', int(not multi))])]
+        results = yield self._write(_DELETE, SON([('delete', self.name)]),
+                                    docs, False)
+        _, result = results[0]
+        raise _Return(DeleteResult(result, self.write_concern.acknowledged))
+
+    def delete_one(self, filter):
+        """Delete a single document matching the filter.
+
+        Returns a Future for a :class:`~pymongo.results.DeleteResult`.
+        """
+        return self._delete(filter, False)
+
+    def delete_many(self, filter):
+        """Delete all documents matching the filter.
+
+        Returns a Future for a :class:`~pymongo.results.DeleteResult`.
+        """
+        return self._delete(filter, True)
+
+    def find(self, filter=None, projection=None, skip=0, limit=0, sort=None,
+             batch_size=0):
+        """Query the collection, returning an :class:`AsyncCursor`.
+
+        The arguments have the same meaning as for
+        :meth:`~pymongo.collection.Collection.find`.
+        """
+        return AsyncCursor(self, filter, projection, skip, limit, sort,
+                           batch_size)
+
+    @_coroutine
+    def find_one(self, filter=None, projection=None, sort=None):
+        """Get a single document, returning a Future for the document or
+        ``None``.
+
+        `filter` may also be the value of the ``_id`` to find.
+        """
+        if (filter is not None and not
+                isinstance(filter, collections.Mapping)):
+            filter = {"_id": filter}
+        docs = yield AsyncCursor(self, filter, projection, limit=-1,
+                                 sort=sort).to_list()
+        raise _Return(docs[0] if docs else None)
+
+    @_coroutine
+    def count(self, filter=None, **kwargs):
+        """Count the documents matching `filter`, returning a Future.
+
+        See :meth:`~pymongo.collection.Collection.count` for options.
+        """
+        cmd = SON([("count", self.name)])
+        if filter is not None:
+            kwargs["query"] = filter
+        if "hint" in kwargs and not isinstance(kwargs["hint"], string_type):
+            kwargs["hint"] = helpers._index_document(kwargs["hint"])
+        cmd.update(kwargs)
+        res = yield self.__database.client._command(
+            self.__database.name, cmd, self.read_preference,
+            self.codec_options, allowable_errors=["ns missing"])
+        if res.get("errmsg", "") == "ns missing":
+            raise _Return(0)
+        raise _Return(int(res["n"]))
+
+
+class AsyncCursor(object):
+
+    def __init__(self, collection, filter=None, projection=None, skip=0,
+                 limit=0, sort=None, batch_size=0):
+        """A cursor over the results of a query on an
+        :class:`AsyncCollection`.
+
+        Iterate it with ``async for``, or get the documents with
+        :meth:`to_list`. Should not be called directly, use
+        :meth:`AsyncCollection.find`.
+        """
+        spec = filter
+        if spec is None:
+            spec = {}
+        common.validate_is_mapping("filter", spec)
+        if not isinstance(skip, int):
+            raise TypeError("skip must be an instance of int")
+        if not isinstance(limit, int):
+            raise TypeError("limit must be an instance of int")
+        if not isinstance(batch_size, int):
+            raise TypeError("batch_size must be an instance of int")
+        if batch_size < 0:
+            raise ValueError("batch_size must be >= 0")
+        if projection is not None:
+            if not projection:
+                projection = {"_id": 1}
+            projection = helpers._fields_list_to_dict(projection,
+                                                      "projection")
+        if sort is not None:
+            spec = SON([("$query", spec),
+                        ("$orderby", helpers._index_document(sort))])
+
+        self.__collection = collection
+        self._loop = collection._loop
+        self.__spec = spec
+        self.__projection = projection
+        self.__skip = skip
+        self.__limit = limit
+        self.__batch_size = batch_size
+        self.__read_preference = collection.read_preference
+        self.__codec_options = collection.codec_options
+
+        self.__flags = 0
+        if self.__read_preference != ReadPreference.PRIMARY:
+            self.__flags |= 4
+
+        self.__data = collections.deque()
+        self.__id = None
+        self.__address = None
+        self.__retrieved = 0
+        self.__killed = False
+
+    @property
+    def collection(self):
+        """The :class:`AsyncCollection` this cursor is iterating."""
+        return self.__collection
+
+    @property
+    def alive(self):
+        """Does this cursor have the potential to return more data?"""
+        return bool(len(self.__data) or (not self.__killed))
+
+    @property
+    def cursor_id(self):
+        """The cursor id, or None if the query hasn't been sent yet."""
+        return self.__id
+
+    def __del__(self):
+        if self.__id and not self.__killed:
+            self.__die()
+
+    def __die(self):
+        """Schedule the server-side cursor to be killed."""
+        if self.__id and not self.__killed:
+            client = self.__collection.database.client
+            client.delegate.kill_cursors([self.__id], self.__address)
+        self.__killed = True
+
+    def close(self):
+        """Close this cursor, freeing its resources on the server soon."""
+        self.__die()
+
+    @_coroutine
+    def _refresh(self):
+        """Get the next batch of results from the server."""
+        if len(self.__data) or self.__killed:
+            raise _Return(len(self.__data))
+
+        if self.__id is None:  # Query
+            ntoreturn = self.__batch_size
+            if self.__limit:
+                if self.__batch_size:
+                    ntoreturn = min(self.__limit, self.__batch_size)
+                else:
+                    ntoreturn = self.__limit
+            operation = _Query(self.__flags,
+                               self.__collection.full_name,
+                               self.__skip,
+                               ntoreturn,
+                               self.__spec,
+                               self.__projection,
+                               self.__codec_options,
+                               self.__read_preference)
+        elif self.__id:  # Get More
+            if self.__limit:
+                limit = self.__limit - self.__retrieved
+                if self.__batch_size:
+                    limit = min(limit, self.__batch_size)
+            else:
+                limit = self.__batch_size
+            operation = _GetMore(self.__collection.full_name,
+                                 limit,
+                                 self.__id)
+        else:  # Cursor id is zero nothing else to return
+            self.__killed = True
+            raise _Return(0)
+
+        client = self.__collection.database.client
+        try:
+            data, self.__address = yield client._send_message_with_response(
+                operation, self.__read_preference, self.__address)
+        except AutoReconnect:
+            self.__killed = True
+            raise
+
+        try:
+            doc = helpers._unpack_response(response=data,
+                                           cursor_id=self.__id,
+                                           codec_options=self.__codec_options)
+        except NotMasterError:
+            self.__killed = True
+            client.delegate._reset_server_and_request_check(self.__address)
+            raise
+        except OperationFailure:
+            self.__killed = True
+            raise
+
+        self.__id = doc["cursor_id"]
+        if not self.__id or self.__limit < 0:
+            self.__killed = True
+        assert doc["starting_from"] == self.__retrieved, (
+            "Result batch started from %s, expected %s" % (
+                doc['starting_from'], self.__retrieved))
+        self.__retrieved += doc["number_returned"]
+        self.__data.extend(doc["data"])
+        if self.__limit > 0 and self.__retrieved >= self.__limit:
+            self.__die()
+        raise _Return(len(self.__data))
+
+    def __aiter__(self):
+        return self
+
+    @_coroutine
+    def __anext__(self):
+        if not self.__data and not self.__killed:
+            yield self._refresh()
+        if self.__data:
+            raise _Return(self.__data.popleft())
+        raise StopAsyncIteration()
+
+    @_coroutine
+    def to_list(self, length=None):
+        """Get a list of up to `length` documents, or all of the remaining
+        documents if `length` is ``None``.
+        """
+        docs = []
+        while length is None or len(docs) < length:
+            if not self.__data:
+                if self.__killed:
+                    break
+                yield self._refresh()
+                continue
+            docs.append(self.__data.popleft())
+        raise _Return(docs)
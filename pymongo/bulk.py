@@ -20,9 +20,10 @@
 from __future__ import unicode_literals
 
 from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
 from bson.son import SON
 from pymongo.common import (validate_is_mapping,
-                            validate_is_mutable_mapping,
+                            validate_is_document_type,
                             validate_ok_for_replace,
                             validate_ok_for_update)
 from pymongo.errors import (BulkWriteError,
@@ -192,6 +193,8 @@ class _Bulk(object):
         self.collection = collection
         self.ordered = ordered
         self.ops = []
+        # Inserted documents lacking an _id.
+        self.missing_ids = []
         self.name = "%s.%s" % (collection.database.name, collection.name)
         self.namespace = collection.database.name + '.$cmd'
         self.executed = False
@@ -199,10 +202,10 @@ class _Bulk(object):
     def add_insert(self, document):
         """Add an insert document to the list of ops.
         """
-        validate_is_mutable_mapping("document", document)
-        # Generate ObjectId client side.
-        if '_id' not in document:
-            document['_id'] = ObjectId()
+        validate_is_document_type("document", document)
+        # Generate ObjectId client side, in execute.
+        if not (isinstance(document, RawBSONDocument) or '_id' in document):
+            self.missing_ids.append(document)
         self.ops.append((_INSERT, document))
 
     def add_update(self, selector, update, multi=False, upsert=False):
@@ -409,6 +412,11 @@ class _Bulk(object):
             raise InvalidOperation('Bulk operations can '
                                    'only be executed once.')
         self.executed = True
+        # Generate the missing _ids at once.
+        for document, oid in zip(self.missing_ids,
+                                 ObjectId.generate_many(
+                                     len(self.missing_ids))):
+            document['_id'] = oid
         write_concern = (WriteConcern(**write_concern) if
                          write_concern else self.collection.write_concern)
 
@@ -556,6 +564,9 @@ class BulkOperationBuilder(object):
     def insert(self, document):
         """Insert a single document.
 
+        If `document` has no ``_id``, one is added to it when the bulk
+        operation is executed.
+
         :Parameters:
           - `document` (dict): the document to insert
         """
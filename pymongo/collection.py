@@ -17,14 +17,18 @@
 from __future__ import unicode_literals
 
 import collections
+import itertools
 import warnings
 
+import bson
 from bson.code import Code
 from bson.objectid import ObjectId
 from bson.py3compat import (_unicode,
                             integer_types,
                             string_type)
-from bson.codec_options import CodecOptions
+from bson.codec_options import CodecOptions, _compiled_codec
+from bson.json_util import _jsonl_batches
+from bson.raw_bson import RawBSONDocument
 from bson.son import SON
 from pymongo import (common,
                      helpers,
@@ -35,10 +39,12 @@ from pymongo.cursor import Cursor
 from pymongo.errors import ConfigurationError, InvalidName, OperationFailure
 from pymongo.helpers import _check_write_command_response
 from pymongo.message import _INSERT, _UPDATE, _DELETE
+from pymongo.monotonic import time as _time
 from pymongo.operations import _WriteOp, IndexModel
 from pymongo.read_preferences import ReadPreference
 from pymongo.results import (BulkWriteResult,
                              DeleteResult,
+                             ImportResult,
                              InsertOneResult,
                              InsertManyResult,
                              UpdateResult)
@@ -51,6 +57,24 @@ except ImportError:
     _ORDERED_TYPES = (SON,)
 
 _NO_OBJ_ERROR = "No matching object found"
+# How many _ids to generate at a time for documents from an iterator.
+_OBJECT_ID_BLOCK_SIZE = 100
+
+
+def _compiled_document(codec_options, document):
+    """Is `document` an instance of the class of the CompiledCodec used by
+    `codec_options`?
+    """
+    codec = codec_options.document_class
+    return (_compiled_codec(codec) and
+            isinstance(document, codec.document_class))
+
+
+def _new_object_ids(block_size):
+    """Yield new ObjectIds, generated `block_size` at a time."""
+    while True:
+        for oid in ObjectId.generate_many(block_size):
+            yield oid
 
 
 class ReturnDocument(object):
@@ -386,13 +410,19 @@ class Collection(common.BaseObject):
                 check_keys=True, manipulate=False, write_concern=None):
         """Internal insert helper."""
         return_one = False
-        if isinstance(docs, collections.MutableMapping):
+        if (isinstance(docs, collections.Mapping) or
+                _compiled_document(self.codec_options, docs)):
             return_one = True
             docs = [docs]
 
         ids = []
 
         if manipulate:
+            if isinstance(docs, list):
+                new_ids = _new_object_ids(len(docs))
+            else:
+                new_ids = _new_object_ids(_OBJECT_ID_BLOCK_SIZE)
+
             def gen():
                 """Generator that applies SON manipulators to each document
                 and adds _id if necessary.
@@ -404,7 +434,7 @@ class Collection(common.BaseObject):
                     # see PYTHON-709.
                     doc = _db._apply_incoming_manipulators(doc, self)
                     if '_id' not in doc:
-                        doc['_id'] = ObjectId()
+                        doc['_id'] = next(new_ids)
 
                     doc = _db._apply_incoming_copying_manipulators(doc, self)
                     ids.append(doc['_id'])
@@ -413,7 +443,10 @@ class Collection(common.BaseObject):
             def gen():
                 """Generator that only tracks existing _ids."""
                 for doc in docs:
-                    ids.append(doc.get('_id'))
+                    if _compiled_document(self.codec_options, doc):
+                        ids.append(getattr(doc, '_id', None))
+                    else:
+                        ids.append(doc.get('_id'))
                     yield doc
 
         concern = (write_concern or self.write_concern).document
@@ -454,17 +487,24 @@ class Collection(common.BaseObject):
 
         :Parameters:
           - `document`: The document to insert. Must be a mutable mapping
-            type. If the document does not have an _id field one will be
-            added automatically.
+            type, a :class:`~bson.raw_bson.RawBSONDocument`, or an instance
+            of the class of a :class:`~bson.compiled_codec.CompiledCodec`
+            used by this collection's :attr:`codec_options`. If the
+            document does not have an _id field one will be added
+            automatically, except to a
+            :class:`~bson.raw_bson.RawBSONDocument` or an instance of a
+            compiled codec's class.
 
         :Returns:
           - An instance of :class:`~pymongo.results.InsertOneResult`.
 
         .. versionadded:: 3.0
         """
-        common.validate_is_mutable_mapping("document", document)
-        if "_id" not in document:
-            document["_id"] = ObjectId()
+        if not _compiled_document(self.codec_options, document):
+            common.validate_is_document_type("document", document)
+            if not (isinstance(document, RawBSONDocument) or
+                    "_id" in document):
+                document["_id"] = ObjectId.generate_many(1)[0]
         with self._socket_for_writes() as sock_info:
             return InsertOneResult(self._insert(sock_info, document),
                                    self.write_concern.acknowledged)
@@ -496,20 +536,253 @@ class Collection(common.BaseObject):
         if not isinstance(documents, list) or not documents:
             raise TypeError("documents must be a non-empty list")
         inserted_ids = []
+        missing_ids = []
         def gen():
             """A generator that validates documents and handles _ids."""
             for document in documents:
-                common.validate_is_mutable_mapping("document", document)
-                if "_id" not in document:
-                    document["_id"] = ObjectId()
-                inserted_ids.append(document["_id"])
+                if _compiled_document(self.codec_options, document):
+                    inserted_ids.append(getattr(document, "_id", None))
+                    yield (_INSERT, document)
+                    continue
+                common.validate_is_document_type("document", document)
+                if not (isinstance(document, RawBSONDocument) or
+                        "_id" in document):
+                    missing_ids.append(len(inserted_ids))
+                    inserted_ids.append(None)
+                else:
+                    inserted_ids.append(document.get("_id"))
                 yield (_INSERT, document)
 
         blk = _Bulk(self, ordered)
         blk.ops = [doc for doc in gen()]
+        # Generate the missing _ids at once.
+        for index, oid in zip(missing_ids,
+                              ObjectId.generate_many(len(missing_ids))):
+            documents[index]["_id"] = oid
+            inserted_ids[index] = oid
         blk.execute(self.write_concern.document)
         return InsertManyResult(inserted_ids, self.write_concern.acknowledged)
 
+    def insert_columns(self, columns, schema=None, ordered=True):
+        """Insert one document for each row of a set of typed columns.
+
+        `columns` maps field names to arrays supporting the buffer
+        protocol, like :class:`bytearray`, :class:`array.array` or NumPy
+        arrays, all with the same number of values. Each row is encoded
+        straight from the arrays into the insert command, no document is
+        created for it::
+
+          >>> import numpy
+          >>> result = db.test.insert_columns({
+          ...     'v': numpy.arange(3, dtype='i8'),
+          ...     'ok': numpy.array([True, False, True])})
+          >>> db.test.find_one({}, {'_id': False})
+          {u'v': 0L, u'ok': True}
+
+        The column type of an array of 4 or 8 byte integers, doubles or
+        booleans is inferred from its format, other arrays need their
+        column type in `schema`, see :func:`bson.decode_columns`. Values
+        are copied as they are, so a typed array must hold little-endian
+        values of its column type, only arrays of bytes can hold any. A
+        field can also map to a ``(values, mask)`` pair, like the results
+        of :meth:`~pymongo.cursor.Cursor.to_columns`, to leave out the
+        field from the rows whose mask byte is 0.
+
+        If `columns` has no ``_id`` field a new
+        :class:`~bson.objectid.ObjectId` is generated for each row.
+
+        :Parameters:
+          - `columns`: A mapping of field names to arrays.
+          - `schema` (optional): A mapping of field names to column types.
+          - `ordered` (optional): If ``True`` (the default) documents will be
+            inserted on the server serially, in the order provided. If an error
+            occurs all remaining inserts are aborted. If ``False``, documents
+            will be inserted on the server in arbitrary order, possibly in
+            parallel, and all document inserts will be attempted.
+
+        :Returns:
+          An instance of :class:`~pymongo.results.InsertManyResult`. Its
+          `inserted_ids` is the ``_id`` column: the given array, or a
+          :class:`bytearray` of the 12 byte binary ObjectIds generated.
+
+        .. versionadded:: 3.0
+        """
+        common.validate_boolean("ordered", ordered)
+        specs, rows, ids = bson._column_specs(columns, schema)
+        concern = self.write_concern.document
+        safe = concern.get("w") != 0
+        with self._socket_for_writes() as sock_info:
+            if sock_info.max_wire_version > 1 and safe:
+                # Insert command.
+                command = SON([('insert', self.name),
+                               ('ordered', ordered)])
+
+                if concern:
+                    command['writeConcern'] = concern
+
+                results = message._do_batched_insert_columns(
+                    self.database.name + ".$cmd", command, specs, rows,
+                    self.codec_options, sock_info)
+                _check_write_command_response(results)
+            else:
+                # Legacy batched OP_INSERT.
+                docs = (RawBSONDocument(doc)
+                        for doc in bson._encode_column_rows(specs, rows))
+                message._do_batched_insert(self.__full_name, docs, False,
+                                           safe, concern, not ordered,
+                                           self.codec_options, sock_info)
+        return InsertManyResult(ids, self.write_concern.acknowledged)
+
+    def import_jsonl(self, fileobj, batch_bytes=1024 * 1024, ordered=True,
+                     workers=0):
+        """Insert the documents from a file of newline-delimited JSON.
+
+        Reads one document per line, in MongoDB Extended JSON as written by
+        :func:`bson.json_util.dump_cursor`, and inserts them with
+        :meth:`insert_many` in batches of about `batch_bytes` of JSON text.
+        Lines are parsed as they are read, so memory use doesn't grow with
+        the size of the file::
+
+          >>> with open('test.jsonl') as fileobj:
+          ...     result = db.test.import_jsonl(fileobj)
+          ...
+          >>> result.inserted_count
+          3
+
+        With `workers`, batches are parsed by a pool of that many threads
+        while the previous batch is sent to the server. Blank lines are
+        skipped, a line that isn't valid JSON raises :exc:`ValueError`
+        with its line number. The import stops at the first batch that
+        fails to insert, the batches before it stay inserted.
+
+        :Parameters:
+          - `fileobj`: A file-like object opened for reading, in text or
+            binary mode.
+          - `batch_bytes` (optional): The size of JSON text to parse and
+            insert at a time. Defaults to 1MB.
+          - `ordered` (optional): If ``True`` (the default) documents will be
+            inserted on the server serially, in the order provided. If an error
+            occurs all remaining inserts are aborted. If ``False``, documents
+            will be inserted on the server in arbitrary order, possibly in
+            parallel, and all document inserts in the batch will be
+            attempted.
+          - `workers` (optional): The number of threads parsing batches, or
+            0 (the default) to parse them in the calling thread.
+
+        :Returns:
+          An instance of :class:`~pymongo.results.ImportResult`.
+
+        .. versionadded:: 3.0
+        """
+        if common.validate_integer("batch_bytes", batch_bytes) < 1:
+            raise ValueError("batch_bytes must be >= 1")
+        common.validate_boolean("ordered", ordered)
+        common.validate_positive_integer("workers", workers)
+        start = _time()
+        count = 0
+        for documents in _jsonl_batches(fileobj, batch_bytes, workers):
+            if documents:
+                self.insert_many(documents, ordered=ordered)
+                count += len(documents)
+        return ImportResult(count, _time() - start,
+                            self.write_concern.acknowledged)
+
+    def dump_raw(self, fileobj, filter=None, **kwargs):
+        """Write the documents in this collection to `fileobj` as
+        concatenated BSON, like the ``.bson`` files written by mongodump.
+
+        The documents in each batch returned by the server are written
+        to the file as they are, without decoding them::
+
+          >>> from pymongo.cursor import CursorType
+          >>> with open('test.bson', 'wb') as fileobj:
+          ...     db.test.dump_raw(fileobj, cursor_type=CursorType.EXHAUST)
+          ...
+          3
+
+        With an exhaust cursor the server streams all the batches without
+        waiting for a getMore request for each. SON manipulators are not
+        applied. The file can be read back with :meth:`restore_raw`.
+
+        :Parameters:
+          - `fileobj`: A file-like object opened for writing in binary mode.
+          - `filter` (optional): A query that matches the documents to
+            write, see :meth:`find`.
+          - `**kwargs` (optional): Any other arguments :meth:`find` accepts,
+            like `cursor_type` or `batch_size`.
+
+        Returns the number of documents written.
+
+        .. versionadded:: 3.0
+        """
+        return self.find(filter, **kwargs)._dump_raw(fileobj)
+
+    def restore_raw(self, fileobj, ordered=True):
+        """Insert the documents from a file of concatenated BSON, like one
+        written by :meth:`dump_raw` or mongodump.
+
+        The file is read in chunks and each document's bytes are copied
+        into batched insert commands as they are, no document is decoded
+        or encoded. Only the length and terminating byte of each document
+        are checked, a truncated file raises
+        :class:`~bson.errors.InvalidBSON`. The server adds an ``_id`` to
+        documents without one::
+
+          >>> with open('test.bson', 'rb') as fileobj:
+          ...     result = db.test.restore_raw(fileobj)
+          ...
+          >>> result.inserted_count
+          3
+
+        :Parameters:
+          - `fileobj`: A file-like object opened for reading in binary mode.
+          - `ordered` (optional): If ``True`` (the default) documents will be
+            inserted on the server serially, in the order provided. If an error
+            occurs all remaining inserts are aborted. If ``False``, documents
+            will be inserted on the server in arbitrary order, possibly in
+            parallel, and all document inserts will be attempted.
+
+        :Returns:
+          An instance of :class:`~pymongo.results.ImportResult`.
+
+        .. versionadded:: 3.0
+        """
+        common.validate_boolean("ordered", ordered)
+        start = _time()
+        raw_docs = bson._raw_file_iter(fileobj)
+        first = next(raw_docs, None)
+        count = [0]
+
+        def gen():
+            """A generator that wraps each document's bytes, counting them."""
+            for raw in itertools.chain([first], raw_docs):
+                count[0] += 1
+                yield RawBSONDocument(raw)
+
+        if first is not None:
+            concern = self.write_concern.document
+            safe = concern.get("w") != 0
+            with self._socket_for_writes() as sock_info:
+                if sock_info.max_wire_version > 1 and safe:
+                    # Insert command.
+                    command = SON([('insert', self.name),
+                                   ('ordered', ordered)])
+
+                    if concern:
+                        command['writeConcern'] = concern
+
+                    results = message._do_batched_write_command(
+                        self.database.name + ".$cmd", _INSERT, command,
+                        gen(), False, self.codec_options, sock_info)
+                    _check_write_command_response(results)
+                else:
+                    # Legacy batched OP_INSERT.
+                    message._do_batched_insert(self.__full_name, gen(), False,
+                                               safe, concern, not ordered,
+                                               self.codec_options, sock_info)
+        return ImportResult(count[0], _time() - start,
+                            self.write_concern.acknowledged)
+
     def _update(self, sock_info, filter, document, upsert=False,
                 check_keys=True, multi=False, manipulate=False,
                 write_concern=None):
@@ -878,6 +1151,12 @@ class Collection(common.BaseObject):
             a single batch.
           - `manipulate` (optional): **DEPRECATED** - If True (the default),
             apply any outgoing SON manipulators before returning.
+          - `prefetch` (optional): If True, request the next batch of results
+            on a background thread while the current batch is iterated.
+            Can not be used with tailable or exhaust cursors.
+          - `max_prefetch_batches` (optional): The maximum number of batches
+            fetched ahead of the cursor when `prefetch` is True. Defaults to
+            2.
 
         .. note:: There are a number of caveats to using
           :attr:`~pymongo.cursor.CursorType.EXHAUST` as cursor_type:
@@ -908,6 +1187,7 @@ class Collection(common.BaseObject):
            objects. Use :meth:`~bson.regex.Regex.try_compile` to attempt to
            convert from a BSON regular expression to a Python regular
            expression object. Soft deprecated the `manipulate` option.
+           Added the `prefetch` and `max_prefetch_batches` options.
 
         .. versionchanged:: 2.7
            Added `compile_re` option. If set to False, PyMongo represented BSON
@@ -162,12 +162,28 @@ class CommandCursor(object):
     def __iter__(self):
         return self
 
+    def iter_batches(self):
+        """Iterate over the results a batch at a time.
+
+        Yields each batch of documents returned by the server as a list,
+        with any outgoing SON manipulators already applied. If this cursor
+        has already been partially iterated the first list holds the rest
+        of the current batch.
+
+        .. versionadded:: 3.0
+        """
+        coll = self.__collection
+        while len(self.__data) or self._refresh():
+            batch = list(self.__data)
+            self.__data = deque()
+            yield coll.database._fix_outgoing_batch(batch, coll)
+
     def next(self):
         """Advance the cursor.
         """
         if len(self.__data) or self._refresh():
             coll = self.__collection
-            return coll.database._fix_incoming(self.__data.popleft(), coll)
+            return coll.database._fix_outgoing(self.__data.popleft(), coll)
         else:
             raise StopIteration
 
@@ -20,8 +20,11 @@ import collections
 from bson.binary import (STANDARD, PYTHON_LEGACY,
                          JAVA_LEGACY, CSHARP_LEGACY)
 from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from bson.py3compat import string_type, integer_types
 from pymongo.auth import MECHANISMS
+from pymongo.compression_support import (validate_compressors,
+                                         validate_zlib_compression_level)
 from pymongo.errors import ConfigurationError
 from pymongo.read_preferences import (read_pref_mode_from_name,
                                       _ServerMode)
@@ -338,6 +341,15 @@ def validate_is_mutable_mapping(option, value):
                         "collections.MutableMapping" % (option,))
 
 
+def validate_is_document_type(option, value):
+    """Validate the type of method arguments that expect a MongoDB document."""
+    if not isinstance(value, (collections.MutableMapping, RawBSONDocument)):
+        raise TypeError("%s must be an instance of dict, bson.son.SON, "
+                        "bson.raw_bson.RawBSONDocument, or "
+                        "a type that inherits from "
+                        "collections.MutableMapping" % (option,))
+
+
 def validate_ok_for_replace(replacement):
     """Validate a replacement document."""
     validate_is_mapping("replacement", replacement)
@@ -372,6 +384,8 @@ VALIDATORS = {
     'connecttimeoutms': validate_timeout_or_none,
     'maxpoolsize': validate_positive_integer_or_none,
     'socketkeepalive': validate_boolean_or_string,
+    'compressors': validate_compressors,
+    'zlibcompressionlevel': validate_zlib_compression_level,
     'sockettimeoutms': validate_timeout_or_none,
     'waitqueuetimeoutms': validate_timeout_or_none,
     'waitqueuemultiple': validate_positive_integer_or_none,
@@ -0,0 +1,218 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Support for compressing messages with OP_COMPRESSED.
+
+Compression is opt-in: the client sends its list of compressors in the
+``ismaster`` handshake and uses the first one, in its own order of
+preference, that the server also lists. zlib is always available. Other
+compressors can be added with :func:`register_compressor`.
+"""
+
+import struct
+import warnings
+import zlib
+
+from bson.py3compat import PY3, string_type
+
+OP_COMPRESSED = 2012
+
+_HEADER = struct.Struct("<iiii")
+_COMPRESSION_HEADER = struct.Struct("<iiB")
+
+# Commands that must never be compressed, from the compression spec.
+_NO_COMPRESSION = frozenset([
+    'ismaster', 'saslstart', 'saslcontinue', 'getnonce', 'authenticate',
+    'createuser', 'updateuser', 'copydbsaslstart', 'copydbgetnonce',
+    'copydb'])
+
+_COMPRESSORS = {}
+_COMPRESSORS_BY_ID = {}
+
+
+class _Compressor(object):
+    """A registered compressor."""
+
+    __slots__ = ('name', 'compressor_id', 'compress', 'decompress')
+
+    def __init__(self, name, compressor_id, compress, decompress):
+        self.name = name
+        self.compressor_id = compressor_id
+        self.compress = compress
+        self.decompress = decompress
+
+
+def register_compressor(name, compressor_id, compress, decompress):
+    """Make a compressor available for OP_COMPRESSED messages.
+
+    :Parameters:
+      - `name`: the name the compressor is negotiated by, e.g. ``'zlib'``
+      - `compressor_id`: the compressor's id byte in OP_COMPRESSED
+      - `compress`: function taking a bytes-like object and the
+        :class:`CompressionSettings` in use, returning compressed bytes
+      - `decompress`: function taking a bytes-like object and returning
+        the decompressed bytes
+    """
+    if not 0 < compressor_id < 256:
+        raise ValueError("compressor_id must be between 1 and 255")
+    compressor = _Compressor(name, compressor_id, compress, decompress)
+    _COMPRESSORS[name] = compressor
+    _COMPRESSORS_BY_ID[compressor_id] = compressor
+
+
+if PY3:
+    def _zlib_compress(data, settings):
+        return zlib.compress(data, settings.zlib_compression_level)
+
+    def _zlib_decompress(data):
+        return zlib.decompress(data)
+else:
+    # Python 2's zlib only accepts str and read-only buffers.
+    def _zlib_compress(data, settings):
+        return zlib.compress(bytes(data), settings.zlib_compression_level)
+
+    def _zlib_decompress(data):
+        return zlib.decompress(bytes(data))
+
+
+register_compressor('zlib', 2, _zlib_compress, _zlib_decompress)
+
+
+def validate_compressors(dummy, value):
+    """Validate a list of compressor names, or a comma separated string.
+
+    Unknown compressors are dropped with a warning.
+    """
+    if isinstance(value, string_type):
+        value = value.split(',')
+    try:
+        names = [name.strip() for name in value]
+    except (AttributeError, TypeError):
+        raise TypeError("compressors must be a comma separated string "
+                        "or a list of compressor names")
+    compressors = []
+    for name in names:
+        if name in _COMPRESSORS:
+            if name not in compressors:
+                compressors.append(name)
+        elif name:
+            warnings.warn("Unsupported compressor: %s" % (name,))
+    return compressors
+
+
+def validate_zlib_compression_level(option, value):
+    """Validate a zlib compression level, an integer from -1 to 9."""
+    try:
+        level = int(value)
+    except (TypeError, ValueError):
+        raise TypeError("%s must be an integer, not %r" % (option, value))
+    if not -1 <= level <= 9:
+        raise ValueError("%s must be between -1 and 9, not %d" %
+                         (option, level))
+    return level
+
+
+class CompressionSettings(object):
+    """The compressors a client offers, in order of preference."""
+
+    __slots__ = ('__compressors', '__zlib_compression_level')
+
+    def __init__(self, compressors=(), zlib_compression_level=-1):
+        self.__compressors = list(compressors)
+        self.__zlib_compression_level = zlib_compression_level
+
+    @property
+    def compressors(self):
+        """The list of compressor names to offer the server."""
+        return self.__compressors
+
+    @property
+    def zlib_compression_level(self):
+        """The zlib compression level, -1 for zlib's default."""
+        return self.__zlib_compression_level
+
+    def get_compression_context(self, server_compressors):
+        """Return a :class:`CompressionContext` for the first of our
+        compressors the server supports, or None.
+        """
+        if server_compressors:
+            for name in self.__compressors:
+                if name in server_compressors:
+                    return CompressionContext(_COMPRESSORS[name], self)
+        return None
+
+
+class CompressionContext(object):
+    """The compressor negotiated for one connection."""
+
+    __slots__ = ('compressor', 'settings')
+
+    def __init__(self, compressor, settings):
+        self.compressor = compressor
+        self.settings = settings
+
+    @property
+    def name(self):
+        return self.compressor.name
+
+    def compress(self, data):
+        """Wrap each message in `data` in an OP_COMPRESSED message.
+
+        `data` is a bytes-like object holding one or more complete
+        messages (e.g. an insert followed by a getlasterror query).
+        """
+        if not isinstance(data, (bytes, bytearray)):
+            # E.g. a memoryview, which struct can't read in Python 2.
+            data = bytearray(data)
+        output = []
+        compressor = self.compressor
+        pos = 0
+        while pos < len(data):
+            (length, request_id,
+             response_to, op_code) = _HEADER.unpack_from(data, pos)
+            body = data[pos + 16:pos + length]
+            compressed = compressor.compress(body, self.settings)
+            output.append(_HEADER.pack(25 + len(compressed), request_id,
+                                       response_to, OP_COMPRESSED))
+            output.append(_COMPRESSION_HEADER.pack(
+                op_code, len(body), compressor.compressor_id))
+            output.append(compressed)
+            pos += length
+        return b"".join(output)
+
+
+def _should_compress(spec):
+    """Return False for commands that must be sent uncompressed."""
+    for name in spec:
+        return name.lower() not in _NO_COMPRESSION
+    return True
+
+
+def decompress(data, operation):
+    """Unwrap the body of an OP_COMPRESSED message.
+
+    Returns the original message body as a :class:`bytearray`, checking
+    that it was an `operation` message.
+    """
+    op_code, uncompressed_size, compressor_id = (
+        _COMPRESSION_HEADER.unpack_from(data))
+    assert operation == op_code, "opcodes don't match %r %r" % (
+        operation, op_code)
+    assert compressor_id in _COMPRESSORS_BY_ID, (
+        "unknown compressor id %r" % (compressor_id,))
+    compressor = _COMPRESSORS_BY_ID[compressor_id]
+    body = bytearray(compressor.decompress(data[9:]))
+    assert len(body) == uncompressed_size, "sizes don't match %r %r" % (
+        len(body), uncompressed_size)
+    return body
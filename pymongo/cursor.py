@@ -15,9 +15,11 @@
 """Cursor class to iterate over Mongo query results."""
 
 import copy
+import struct
+import threading
 from collections import deque
 
-from bson import RE_TYPE
+from bson import RE_TYPE, decode_columns
 from bson.code import Code
 from bson.py3compat import (iteritems,
                             integer_types,
@@ -33,6 +35,8 @@ from pymongo.errors import (AutoReconnect,
 from pymongo.message import _GetMore, _Query
 from pymongo.read_preferences import ReadPreference
 
+_UNPACK_REPLY_HEADER = struct.Struct("<iqii").unpack_from
+
 _QUERY_OPTIONS = {
     "tailable_cursor": 2,
     "slave_okay": 4,
@@ -94,6 +98,106 @@ class _SocketManager:
             self.sock, self.pool = None, None
 
 
+class _Prefetcher(object):
+    """Sends a cursor's getMore messages on a background thread.
+
+    At most `max_batches` raw replies are buffered ahead of the cursor; the
+    thread waits for the cursor to consume one before fetching the next.
+    The thread holds no reference to the cursor, so an abandoned cursor is
+    still garbage collected and killed.
+    """
+    def __init__(self, client, ns, cursor_id, address, read_preference,
+                 limit, batch_size, retrieved, max_batches):
+        self.__client = client
+        self.__ns = ns
+        self.__cursor_id = cursor_id
+        self.__address = address
+        self.__read_preference = read_preference
+        self.__limit = limit
+        self.__batch_size = batch_size
+        self.__retrieved = retrieved
+        self.__max_batches = max_batches
+        self.__batches = deque()
+        self.__condition = threading.Condition()
+        self.__stopped = False
+        self.__done = False
+
+        thread = threading.Thread(target=self.__run)
+        thread.daemon = True
+        thread.start()
+
+    def __run(self):
+        condition = self.__condition
+        try:
+            while True:
+                with condition:
+                    while (len(self.__batches) >= self.__max_batches
+                           and not self.__stopped):
+                        condition.wait()
+                    if self.__stopped:
+                        return
+
+                if self.__limit:
+                    ntoreturn = self.__limit - self.__retrieved
+                    if self.__batch_size:
+                        ntoreturn = min(ntoreturn, self.__batch_size)
+                else:
+                    ntoreturn = self.__batch_size
+                try:
+                    response = self.__client._send_message_with_response(
+                        _GetMore(self.__ns, ntoreturn, self.__cursor_id),
+                        read_preference=self.__read_preference,
+                        address=self.__address)
+                    batch = response.data
+                except Exception as exc:
+                    batch = exc
+
+                with condition:
+                    if self.__stopped:
+                        return
+                    self.__batches.append(batch)
+                    condition.notify_all()
+
+                if isinstance(batch, Exception):
+                    return
+                # Peek at the reply header, the cursor decodes the rest.
+                flags, self.__cursor_id, _, number_returned = (
+                    _UNPACK_REPLY_HEADER(bytes(batch[:20])))
+                self.__retrieved += number_returned
+                # CursorNotFound or QueryFailure, or no more results.
+                if flags & 3 or not self.__cursor_id:
+                    return
+                if self.__limit and self.__retrieved >= self.__limit:
+                    return
+        finally:
+            with condition:
+                self.__done = True
+                condition.notify_all()
+
+    def next(self):
+        """Wait for the next raw reply, or re-raise the error fetching it.
+
+        Returns None if there are no more replies.
+        """
+        with self.__condition:
+            while not self.__batches and not self.__done:
+                self.__condition.wait()
+            if not self.__batches:
+                return None
+            batch = self.__batches.popleft()
+            self.__condition.notify_all()
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def stop(self):
+        """Stop fetching and discard any buffered replies."""
+        with self.__condition:
+            self.__stopped = True
+            self.__batches.clear()
+            self.__condition.notify_all()
+
+
 class Cursor(object):
     """A cursor / iterator over Mongo query results.
     """
@@ -102,7 +206,8 @@ class Cursor(object):
                  limit=0, no_cursor_timeout=False,
                  cursor_type=CursorType.NON_TAILABLE,
                  sort=None, allow_partial_results=False, oplog_replay=False,
-                 modifiers=None, batch_size=0, manipulate=True):
+                 modifiers=None, batch_size=0, manipulate=True,
+                 prefetch=False, max_prefetch_batches=2):
         """Create a new cursor.
 
         Should not be called directly by application developers - see
@@ -133,6 +238,14 @@ class Cursor(object):
             raise TypeError("batch_size must be an integer")
         if batch_size < 0:
             raise ValueError("batch_size must be >= 0")
+        validate_boolean("prefetch", prefetch)
+        if not isinstance(max_prefetch_batches, integer_types):
+            raise TypeError("max_prefetch_batches must be an integer")
+        if max_prefetch_batches < 1:
+            raise ValueError("max_prefetch_batches must be >= 1")
+        if prefetch and cursor_type != CursorType.NON_TAILABLE:
+            raise InvalidOperation("Can't use prefetch with tailable or "
+                                   "exhaust cursors.")
 
         if projection is not None:
             if not projection:
@@ -155,6 +268,12 @@ class Cursor(object):
         self.__max = None
         self.__min = None
         self.__manipulate = manipulate
+        self.__prefetch = prefetch
+        self.__max_prefetch_batches = max_prefetch_batches
+        self.__prefetcher = None
+        self.__decode_fields = None
+        self.__columns = None
+        self.__raw_file = None
 
         # Exhaust cursor support
         self.__exhaust = False
@@ -219,6 +338,7 @@ class Cursor(object):
         be sent to the server, even if the resultant data has already been
         retrieved by this cursor.
         """
+        self.__stop_prefetching()
         self.__data = deque()
         self.__id = None
         self.__address = None
@@ -244,7 +364,8 @@ class Cursor(object):
                            "max_time_ms", "comment", "max", "min",
                            "ordering", "explain", "hint", "batch_size",
                            "max_scan", "manipulate", "query_flags",
-                           "modifiers")
+                           "modifiers", "prefetch", "max_prefetch_batches",
+                           "decode_fields")
         data = dict((k, v) for k, v in iteritems(self.__dict__)
                     if k.startswith('_Cursor__') and k[9:] in values_to_clone)
         if deepcopy:
@@ -257,9 +378,15 @@ class Cursor(object):
         """
         return Cursor(self.__collection)
 
+    def __stop_prefetching(self):
+        if self.__prefetcher is not None:
+            self.__prefetcher.stop()
+            self.__prefetcher = None
+
     def __die(self):
         """Closes this cursor.
         """
+        self.__stop_prefetching()
         if self.__id and not self.__killed:
             if self.__exhaust and self.__exhaust_mgr:
                 # If this is an exhaust cursor and we haven't completely
@@ -548,6 +675,36 @@ class Cursor(object):
         self.__max_scan = max_scan
         return self
 
+    def decode_fields(self, fields):
+        """Only decode the given fields of each result document.
+
+        The server still returns whole documents, but fields that are not
+        listed are skipped without being decoded. Useful when a
+        `projection` can't be used, e.g. because the documents are also
+        needed whole elsewhere. Fields of embedded documents are selected
+        with dot notation, see :func:`bson.decode_all`.
+
+        Raises :class:`~pymongo.errors.InvalidOperation` if this
+        cursor has already been used. Only the last :meth:`decode_fields`
+        applied to this cursor has any effect.
+
+        :Parameters:
+          - `fields`: a list of field names to decode, or None to decode
+            whole documents
+
+        .. versionadded:: 3.0
+        """
+        self.__check_okay_to_chain()
+        if fields is not None:
+            if isinstance(fields, string_type):
+                raise TypeError("fields must be a list of field names")
+            fields = list(fields)
+            for field in fields:
+                if not isinstance(field, string_type):
+                    raise TypeError("fields must be a list of field names")
+        self.__decode_fields = fields
+        return self
+
     def max(self, spec):
         """Adds `max` operator that specifies upper bound for specific index.
 
@@ -808,15 +965,22 @@ class Cursor(object):
                 kwargs["address"] = self.__address
 
             try:
-                response = client._send_message_with_response(operation,
-                                                              **kwargs)
-                self.__address = response.address
-                if self.__exhaust:
-                    # 'response' is an ExhaustResponse.
-                    self.__exhaust_mgr = _SocketManager(response.socket_info,
-                                                        response.pool)
-
-                data = response.data
+                if (self.__prefetcher is not None and
+                        isinstance(operation, _GetMore)):
+                    data = self.__prefetcher.next()
+                    if data is None:
+                        self.__killed = True
+                        return
+                else:
+                    response = client._send_message_with_response(operation,
+                                                                  **kwargs)
+                    self.__address = response.address
+                    if self.__exhaust:
+                        # 'response' is an ExhaustResponse.
+                        self.__exhaust_mgr = _SocketManager(
+                            response.socket_info, response.pool)
+
+                    data = response.data
             except AutoReconnect:
                 # Don't try to send kill cursors on another socket
                 # or to another server. It can cause a _pinValue
@@ -835,7 +999,10 @@ class Cursor(object):
         try:
             doc = helpers._unpack_response(response=data,
                                            cursor_id=self.__id,
-                                           codec_options=self.__codec_options)
+                                           codec_options=self.__codec_options,
+                                           fields=self.__decode_fields,
+                                           columns=self.__columns,
+                                           fileobj=self.__raw_file)
         except OperationFailure:
             self.__killed = True
 
@@ -872,6 +1039,15 @@ class Cursor(object):
 
         if self.__limit and self.__id and self.__limit <= self.__retrieved:
             self.__die()
+        elif (self.__prefetch and self.__id and self.__prefetcher is None
+                and not self.__exhaust and not self.__query_flags &
+                _QUERY_OPTIONS["tailable_cursor"]):
+            # Fetch the following batches while this one is consumed.
+            self.__prefetcher = _Prefetcher(
+                client, self.__collection.full_name, self.__id,
+                self.__address, self.__read_preference, self.__limit,
+                self.__batch_size, self.__retrieved,
+                self.__max_prefetch_batches)
 
         # Don't wait for garbage collection to call __del__, return the
         # socket to the pool now.
@@ -961,6 +1137,74 @@ class Cursor(object):
     def __iter__(self):
         return self
 
+    def iter_batches(self):
+        """Iterate over the results a batch at a time.
+
+        Yields each batch of documents returned by the server as a list,
+        with any outgoing SON manipulators already applied. If this cursor
+        has already been partially iterated the first list holds the rest
+        of the current batch. Batches can be sized with
+        :meth:`batch_size`.
+
+        .. versionadded:: 3.0
+        """
+        if self.__empty:
+            return
+        _db = self.__collection.database
+        while len(self.__data) or self._refresh():
+            batch = list(self.__data)
+            self.__data = deque()
+            if self.__manipulate:
+                batch = _db._fix_outgoing_batch(batch, self.__collection)
+            yield batch
+
+    def to_columns(self, schema):
+        """Decode all the results to typed columns.
+
+        Each batch returned by the server is decoded straight into the
+        columns, without creating a document for each result. Returns a
+        dict mapping each field name in `schema` to a ``(values, mask)``
+        pair of :class:`bytearray`, see :func:`bson.decode_columns`. SON
+        manipulators are not applied.
+
+        Raises :class:`~pymongo.errors.InvalidOperation` if this
+        cursor has already been used.
+
+        :Parameters:
+          - `schema`: a mapping of top-level field names to column types
+
+        .. versionadded:: 3.0
+        """
+        self.__check_okay_to_chain()
+        columns = decode_columns(b"", schema)
+        if self.__empty:
+            return columns
+        self.__columns = (schema, columns)
+        try:
+            while self.alive:
+                self._refresh()
+        finally:
+            self.__columns = None
+        return columns
+
+    def _dump_raw(self, fileobj):
+        """Write the BSON of all the results to `fileobj` without decoding
+        them, returning the number of documents written.
+
+        Each batch returned by the server is written as one slice of the
+        reply. SON manipulators are not applied.
+        """
+        self.__check_okay_to_chain()
+        if self.__empty:
+            return 0
+        self.__raw_file = fileobj
+        try:
+            while self.alive:
+                self._refresh()
+        finally:
+            self.__raw_file = None
+        return self.__retrieved
+
     def __next__(self):
         if self.__empty:
             raise StopIteration
@@ -349,6 +349,20 @@ class Database(common.BaseObject):
             son = manipulator.transform_outgoing(son, collection)
         return son
 
+    def _fix_outgoing_batch(self, docs, collection):
+        """Apply manipulators to a list of documents coming out of the
+        database.
+
+        Each manipulator is applied to the whole batch in turn, so a batch
+        costs one pass per manipulator rather than one call per document.
+        """
+        manipulators = (list(reversed(self.__outgoing_manipulators)) +
+                        list(reversed(self.__outgoing_copying_manipulators)))
+        for manipulator in manipulators:
+            transform = manipulator.transform_outgoing
+            docs = [transform(son, collection) for son in docs]
+        return docs
+
     def _command(self, sock_info, command, slave_ok=False, value=1, check=True,
                  allowable_errors=None, read_preference=ReadPreference.PRIMARY,
                  codec_options=CodecOptions(), **kwargs):
@@ -32,6 +32,13 @@ from pymongo.errors import (CursorNotFound,
                             WriteConcernError,
                             WTimeoutError)
 
+try:
+    _memoryview = memoryview
+except NameError:
+    # Python 2.6. Slicing a reply copies it, as it always has.
+    def _memoryview(data):
+        return data
+
 
 def _gen_index_name(keys):
     """Generate an index name from the set of fields it is over."""
@@ -81,7 +88,8 @@ def _index_document(index_list):
     return index
 
 
-def _unpack_response(response, cursor_id=None, codec_options=CodecOptions()):
+def _unpack_response(response, cursor_id=None, codec_options=CodecOptions(),
+                     fields=None, columns=None, fileobj=None):
     """Unpack a response from the database.
 
     Check the response for errors and unpack, returning a dictionary
@@ -91,12 +99,19 @@ def _unpack_response(response, cursor_id=None, codec_options=CodecOptions()):
     OperationFailure.
 
     :Parameters:
-      - `response`: byte string as returned from the database
+      - `response`: bytes or bytearray as returned from the database
       - `cursor_id` (optional): cursor_id we sent to get this response -
         used for raising an informative exception when we get cursor id not
         valid at server response
       - `codec_options` (optional): an instance of
         :class:`~bson.codec_options.CodecOptions`
+      - `fields` (optional): a list of the field names to decode from each
+        document, see :func:`bson.decode_all`
+      - `columns` (optional): a (schema, columns) pair. The documents are
+        appended to `columns` with :func:`bson.decode_columns` instead of
+        being returned in "data"
+      - `fileobj` (optional): a file the documents' BSON is written to,
+        undecoded, instead of being returned in "data"
     """
     response_flag = struct.unpack("<i", response[:4])[0]
     if response_flag & 1:
@@ -122,7 +137,18 @@ def _unpack_response(response, cursor_id=None, codec_options=CodecOptions()):
     result["cursor_id"] = struct.unpack("<q", response[4:12])[0]
     result["starting_from"] = struct.unpack("<i", response[12:16])[0]
     result["number_returned"] = struct.unpack("<i", response[16:20])[0]
-    result["data"] = bson.decode_all(response[20:], codec_options)
+    # Decode the documents in place rather than copying them out first.
+    if columns is not None:
+        schema, columns = columns
+        bson.decode_columns(_memoryview(response)[20:], schema, columns)
+        result["data"] = []
+        return result
+    if fileobj is not None:
+        fileobj.write(_memoryview(response)[20:])
+        result["data"] = []
+        return result
+    result["data"] = bson.decode_all(_memoryview(response)[20:],
+                                     codec_options, fields)
     assert len(result["data"]) == result["number_returned"]
     return result
 
@@ -25,7 +25,8 @@ import struct
 
 import bson
 from bson.codec_options import DEFAULT_CODEC_OPTIONS
-from bson.py3compat import b, StringIO
+from bson.py3compat import b
+from bson.raw_bson import RawBSONDocument
 from bson.son import SON
 try:
     from pymongo import _cmessage
@@ -273,40 +274,48 @@ def _do_batched_insert(collection_name, docs, check_keys,
                        safe, last_error_args, continue_on_error, opts,
                        sock_info):
     """Insert `docs` using multiple batches.
+
+    Documents are encoded straight into the message buffer.
     """
-    def _insert_message(insert_message, send_safe):
-        """Build the insert message with header and GLE.
+    def _send_insert(data, send_safe):
+        """Write the header and send the insert message, with GLE.
         """
-        request_id, final_message = __pack_message(2002, insert_message)
+        request_id = random.randint(MIN_INT32, MAX_INT32)
+        struct.pack_into("<ii", data, 0, len(data), request_id)
         if send_safe:
             request_id, error_message, _ = __last_error(collection_name,
                                                         last_error_args)
-            final_message += error_message
-        return request_id, final_message
+            # Removed again with the batch's documents.
+            data += error_message
+        sock_info.legacy_write(request_id, data, 0, send_safe)
 
     send_safe = safe or not continue_on_error
     last_error = None
-    data = StringIO()
-    data.write(struct.pack("<i", int(continue_on_error)))
-    data.write(bson._make_c_string(collection_name))
-    message_length = begin_loc = data.tell()
+    data = bytearray()
+    # Save space for message length and request id, responseTo, opCode
+    data += _ZERO_64
+    data += b"\x00\x00\x00\x00\xd2\x07\x00\x00"
+    data += struct.pack("<i", int(continue_on_error))
+    data += bson._make_c_string(collection_name)
+    begin_loc = len(data)
     has_docs = False
     for doc in docs:
-        encoded = bson.BSON.encode(doc, check_keys, opts)
-        encoded_length = len(encoded)
+        doc_start = len(data)
+        encoded_length = bson.encode_into(doc, data, doc_start,
+                                          check_keys, opts)
         too_large = (encoded_length > sock_info.max_bson_size)
 
-        message_length += encoded_length
-        if message_length < sock_info.max_message_size and not too_large:
-            data.write(encoded)
+        if len(data) < sock_info.max_message_size + 16 and not too_large:
             has_docs = True
             continue
 
+        # Keep the document that didn't fit for the next batch.
+        encoded = data[doc_start:]
+        del data[doc_start:]
         if has_docs:
             # We have enough data, send this message.
             try:
-                request_id, msg = _insert_message(data.getvalue(), send_safe)
-                sock_info.legacy_write(request_id, msg, 0, send_safe)
+                _send_insert(data, send_safe)
             # Exception type could be OperationFailure or a subtype
             # (e.g. DuplicateKeyError)
             except OperationFailure as exc:
@@ -328,16 +337,13 @@ def _do_batched_insert(collection_name, docs, check_keys,
                                    " bytes." %
                                    (encoded_length, sock_info.max_bson_size))
 
-        message_length = begin_loc + encoded_length
-        data.seek(begin_loc)
-        data.truncate()
-        data.write(encoded)
+        del data[begin_loc:]
+        data += encoded
 
     if not has_docs:
         raise InvalidOperation("cannot do an empty bulk insert")
 
-    request_id, msg = _insert_message(data.getvalue(), safe)
-    sock_info.legacy_write(request_id, msg, 0, safe)
+    _send_insert(data, safe)
 
     # Re-raise any exception stored due to continue_on_error
     if last_error is not None:
@@ -346,9 +352,31 @@ if _use_c:
     _do_batched_insert = _cmessage._do_batched_insert
 
 
+def _send_write_command(sock_info, data, command_start, list_start):
+    """Finalize and send an OP_QUERY message.
+
+    `data` is a bytearray holding the message header, the command document
+    up to the end of its array of operations, and the encoded array
+    elements. The array and command documents are closed in place.
+    """
+    # Close list and command documents
+    data += _ZERO_16
+    length = len(data)
+
+    # Write document lengths and request id
+    request_id = random.randint(MIN_INT32, MAX_INT32)
+    struct.pack_into('<ii', data, 0, length, request_id)
+    struct.pack_into('<i', data, command_start, length - command_start)
+    struct.pack_into('<i', data, list_start, length - list_start - 1)
+    return sock_info.write_command(request_id, data)
+
+
 def _do_batched_write_command(namespace, operation, command,
                               docs, check_keys, opts, sock_info):
     """Execute a batch of insert, update, or delete commands.
+
+    Each document is encoded straight into the message buffer, so a batch
+    is never copied into the message.
     """
     max_bson_size = sock_info.max_bson_size
     max_write_batch_size = sock_info.max_write_batch_size
@@ -358,29 +386,26 @@ def _do_batched_write_command(namespace, operation, command,
 
     ordered = command.get('ordered', True)
 
-    buf = StringIO()
+    data = bytearray()
     # Save space for message length and request id
-    buf.write(_ZERO_64)
+    data += _ZERO_64
     # responseTo, opCode
-    buf.write(b"\x00\x00\x00\x00\xd4\x07\x00\x00")
+    data += b"\x00\x00\x00\x00\xd4\x07\x00\x00"
     # No options
-    buf.write(_ZERO_32)
+    data += _ZERO_32
     # Namespace as C string
-    buf.write(b(namespace))
-    buf.write(_ZERO_8)
+    data += b(namespace)
+    data += _ZERO_8
     # Skip: 0, Limit: -1
-    buf.write(_SKIPLIM)
+    data += _SKIPLIM
 
     # Where to write command document length
-    command_start = buf.tell()
-    buf.write(bson.BSON.encode(command))
-
-    # Start of payload
-    buf.seek(-1, 2)
-    # Work around some Jython weirdness.
-    buf.truncate()
+    command_start = len(data)
+    # Drop the command document's trailing NUL, we close it when sending.
+    bson.encode_into(command, data, command_start)
+    del data[-1]
     try:
-        buf.write(_OP_MAP[operation])
+        data += _OP_MAP[operation]
     except KeyError:
         raise InvalidOperation('Unknown command')
 
@@ -388,26 +413,9 @@ def _do_batched_write_command(namespace, operation, command,
         check_keys = False
 
     # Where to write list document length
-    list_start = buf.tell() - 4
-
-    def send_message():
-        """Finalize and send the current OP_QUERY message.
-        """
-        # Close list and command documents
-        buf.write(_ZERO_16)
-
-        # Write document lengths and request id
-        length = buf.tell()
-        buf.seek(list_start)
-        buf.write(struct.pack('<i', length - list_start - 1))
-        buf.seek(command_start)
-        buf.write(struct.pack('<i', length - command_start))
-        buf.seek(4)
-        request_id = random.randint(MIN_INT32, MAX_INT32)
-        buf.write(struct.pack('<i', request_id))
-        buf.seek(0)
-        buf.write(struct.pack('<i', length))
-        return sock_info.write_command(request_id, buf.getvalue())
+    list_start = len(data) - 4
+    # Where the list elements start
+    prefix_length = len(data)
 
     # If there are multiple batches we'll
     # merge results in the caller.
@@ -419,10 +427,15 @@ def _do_batched_write_command(namespace, operation, command,
     for doc in docs:
         has_docs = True
         # Encode the current operation
-        key = b(str(idx))
-        value = bson.BSON.encode(doc, check_keys, opts)
+        element_start = len(data)
+        data += _BSONOBJ
+        data += b(str(idx))
+        data += _ZERO_8
+        value_start = len(data)
+        value_length = bson.encode_into(doc, data, value_start,
+                                        check_keys, opts)
         # Send a batch?
-        enough_data = (buf.tell() + len(key) + len(value) + 2) >= max_cmd_size
+        enough_data = len(data) >= max_cmd_size
         enough_documents = (idx >= max_write_batch_size)
         if enough_data or enough_documents:
             if not idx:
@@ -430,32 +443,51 @@ def _do_batched_write_command(namespace, operation, command,
                     raise DocumentTooLarge("BSON document too large (%d bytes)"
                                            " - the connected server supports"
                                            " BSON document sizes up to %d"
-                                           " bytes." % (len(value),
+                                           " bytes." % (value_length,
                                                         max_bson_size))
                 # There's nothing intelligent we can say
                 # about size for update and remove
                 raise DocumentTooLarge("command document too large")
-            result = send_message()
+            # Keep the document that didn't fit for the next batch.
+            value = data[value_start:]
+            del data[element_start:]
+            result = _send_write_command(sock_info, data,
+                                         command_start, list_start)
             results.append((idx_offset, result))
             if ordered and "writeErrors" in result:
                 return results
 
-            # Truncate back to the start of list elements
-            buf.seek(list_start + 4)
-            buf.truncate()
+            # Start again from the start of list elements
+            del data[prefix_length:]
             idx_offset += idx
             idx = 0
-            key = b'0'
-        buf.write(_BSONOBJ)
-        buf.write(key)
-        buf.write(_ZERO_8)
-        buf.write(value)
+            data += _BSONOBJ
+            data += b'0'
+            data += _ZERO_8
+            data += value
         idx += 1
 
     if not has_docs:
         raise InvalidOperation("cannot do an empty bulk write")
 
-    results.append((idx_offset, send_message()))
+    results.append((idx_offset,
+                    _send_write_command(sock_info, data,
+                                        command_start, list_start)))
     return results
 if _use_c:
     _do_batched_write_command = _cmessage._do_batched_write_command
+
+
+def _do_batched_insert_columns(namespace, command, specs, rows, opts,
+                               sock_info):
+    """Execute batched insert commands for the rows of typed columns.
+
+    `specs` and `rows` are as returned by :func:`bson._column_specs`. The C
+    extension encodes each row straight into the command buffer.
+    """
+    docs = (RawBSONDocument(doc)
+            for doc in bson._encode_column_rows(specs, rows))
+    return _do_batched_write_command(namespace, _INSERT, command, docs,
+                                     False, opts, sock_info)
+if _use_c:
+    _do_batched_insert_columns = _cmessage._do_batched_insert_columns
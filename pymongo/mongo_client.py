@@ -133,6 +133,13 @@ class MongoClient(common.BaseObject):
           - `socketKeepAlive`: (boolean) Whether to send periodic keep-alive
             packets on connected sockets. Defaults to ``False`` (do not send
             keep-alive packets).
+          - `compressors`: Comma separated list, or Python list, of
+            compressors to offer the server for compressing messages, in
+            order of preference. The first one the server also supports is
+            used. Only ``'zlib'`` is built in. Defaults to no compression.
+          - `zlibCompressionLevel`: (integer) The zlib compression level,
+            from -1 (zlib's default) to 9 (best compression). Defaults to
+            ``-1``.
 
           | **Write Concern options:**
           | (Only set if passed. No default values.)
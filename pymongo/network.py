@@ -18,13 +18,17 @@ import select
 import struct
 
 from pymongo import helpers, message
+from pymongo.compression_support import (decompress,
+                                         OP_COMPRESSED,
+                                         _should_compress)
 from pymongo.errors import AutoReconnect
 
 _UNPACK_INT = struct.Struct("<i").unpack
 
 
 def command(sock, dbname, spec, slave_ok, is_mongos, read_preference,
-            codec_options, check=True, allowable_errors=None):
+            codec_options, check=True, allowable_errors=None,
+            compression_ctx=None):
     """Execute a command over the socket, or raise socket.error.
 
     :Parameters:
@@ -37,6 +41,8 @@ def command(sock, dbname, spec, slave_ok, is_mongos, read_preference,
       - `codec_options`: a CodecOptions instance
       - `check`: raise OperationFailure if there are errors
       - `allowable_errors`: errors to ignore if `check` is True
+      - `compression_ctx`: optional CompressionContext to compress the
+        command with, unless it is a handshake or authentication command
     """
     ns = dbname + '.$cmd'
     flags = 4 if slave_ok else 0
@@ -44,6 +50,8 @@ def command(sock, dbname, spec, slave_ok, is_mongos, read_preference,
         spec = message._maybe_add_read_preference(spec, read_preference)
     request_id, msg, _ = message.query(flags, ns, 0, -1, spec,
                                        None, codec_options)
+    if compression_ctx is not None and _should_compress(spec):
+        msg = compression_ctx.compress(msg)
     sock.sendall(msg)
     response = receive_message(sock, 1, request_id)
     unpacked = helpers._unpack_response(response, codec_options=codec_options)
@@ -56,7 +64,11 @@ def command(sock, dbname, spec, slave_ok, is_mongos, read_preference,
 
 
 def receive_message(sock, operation, request_id):
-    """Receive a raw BSON message or raise socket.error."""
+    """Receive a raw BSON message or raise socket.error.
+
+    Returns the message body, everything after the 16 byte header, as a
+    :class:`bytearray`. An OP_COMPRESSED reply is decompressed first.
+    """
     header = _receive_data_on_socket(sock, 16)
     length = _UNPACK_INT(header[:4])[0]
 
@@ -66,21 +78,47 @@ def receive_message(sock, operation, request_id):
         assert request_id == response_id, "ids don't match %r %r" % (
             request_id, response_id)
 
-    assert operation == _UNPACK_INT(header[12:])[0]
-    return _receive_data_on_socket(sock, length - 16)
+    op_code = _UNPACK_INT(header[12:])[0]
+    if op_code == OP_COMPRESSED:
+        return decompress(_receive_data_on_socket(sock, length - 16),
+                          operation)
 
+    assert operation == op_code
+    return _receive_data_on_socket(sock, length - 16)
 
-def _receive_data_on_socket(sock, length):
-    msg = b""
-    while length:
-        chunk = sock.recv(length)
-        if chunk == b"":
-            raise AutoReconnect("connection closed")
-
-        length -= len(chunk)
-        msg += chunk
 
-    return msg
+try:
+    memoryview
+except NameError:
+    # Python 2.6 has no memoryview, so recv_into can't fill a buffer
+    # at an offset. Fall back to concatenating chunks.
+    def _receive_data_on_socket(sock, length):
+        msg = b""
+        while length:
+            chunk = sock.recv(length)
+            if chunk == b"":
+                raise AutoReconnect("connection closed")
+
+            length -= len(chunk)
+            msg += chunk
+
+        return bytearray(msg)
+else:
+    def _receive_data_on_socket(sock, length):
+        # Read straight into one preallocated buffer. Building the reply
+        # with "msg += chunk" is quadratic for large batches.
+        buf = bytearray(length)
+        mv = memoryview(buf)
+        bytes_read = 0
+        while bytes_read < length:
+            chunk_length = sock.recv_into(mv[bytes_read:],
+                                          length - bytes_read)
+            if chunk_length == 0:
+                raise AutoReconnect("connection closed")
+
+            bytes_read += chunk_length
+
+        return buf
 
 
 def socket_closed(sock):
@@ -19,7 +19,9 @@ import threading
 
 from bson import DEFAULT_CODEC_OPTIONS
 from bson.py3compat import u, itervalues
+from bson.son import SON
 from pymongo import auth, helpers, thread_util
+from pymongo.compression_support import CompressionSettings
 from pymongo.errors import (AutoReconnect,
                             ConnectionFailure,
                             DocumentTooLarge,
@@ -62,12 +64,14 @@ class PoolOptions(object):
 
     __slots__ = ('__max_pool_size', '__connect_timeout', '__socket_timeout',
                  '__wait_queue_timeout', '__wait_queue_multiple',
-                 '__ssl_context', '__ssl_match_hostname', '__socket_keepalive')
+                 '__ssl_context', '__ssl_match_hostname', '__socket_keepalive',
+                 '__compression_settings')
 
     def __init__(self, max_pool_size=100, connect_timeout=None,
                  socket_timeout=None, wait_queue_timeout=None,
                  wait_queue_multiple=None, ssl_context=None,
-                 ssl_match_hostname=True, socket_keepalive=False):
+                 ssl_match_hostname=True, socket_keepalive=False,
+                 compression_settings=None):
 
         self.__max_pool_size = max_pool_size
         self.__connect_timeout = connect_timeout
@@ -77,6 +81,8 @@ class PoolOptions(object):
         self.__ssl_context = ssl_context
         self.__ssl_match_hostname = ssl_match_hostname
         self.__socket_keepalive = socket_keepalive
+        self.__compression_settings = (
+            compression_settings or CompressionSettings())
 
     @property
     def max_pool_size(self):
@@ -131,6 +137,13 @@ class PoolOptions(object):
         """
         return self.__socket_keepalive
 
+    @property
+    def compression_settings(self):
+        """A CompressionSettings instance: the compressors to offer the
+        server in the ismaster handshake.
+        """
+        return self.__compression_settings
+
 
 class SocketInfo(object):
     """Store a socket with some metadata.
@@ -156,8 +169,13 @@ class SocketInfo(object):
 
         if ismaster:
             self.is_mongos = ismaster.server_type == SERVER_TYPE.Mongos
+            # The compressor negotiated in the handshake, or None.
+            self.compression_context = (
+                pool.opts.compression_settings.get_compression_context(
+                    ismaster.compressors))
         else:
             self.is_mongos = None
+            self.compression_context = None
 
         # The pool's pool_id changes with each reset() so we can close sockets
         # created before the last reset.
@@ -181,7 +199,8 @@ class SocketInfo(object):
         try:
             return command(self.sock, dbname, spec,
                            slave_ok, self.is_mongos, read_preference,
-                           codec_options, check, allowable_errors)
+                           codec_options, check, allowable_errors,
+                           self.compression_context)
         except OperationFailure:
             raise
         # Catch socket.error, KeyboardInterrupt, etc. and close ourselves.
@@ -191,6 +210,9 @@ class SocketInfo(object):
     def send_message(self, message, max_doc_size):
         """Send a raw BSON message or raise ConnectionFailure.
 
+        `message` is a bytes-like object. If a compressor was negotiated in
+        the handshake the message is sent as OP_COMPRESSED.
+
         If a network exception is raised, the socket is closed.
         """
         if (self.max_bson_size is not None
@@ -201,7 +223,10 @@ class SocketInfo(object):
                 (max_doc_size, self.max_bson_size))
 
         try:
-            self.sock.sendall(message)
+            if self.compression_context is not None:
+                self.sock.sendall(self.compression_context.compress(message))
+            else:
+                self.sock.sendall(message)
         except BaseException as error:
             self._raise_connection_failure(error)
 
@@ -222,8 +247,8 @@ class SocketInfo(object):
 
         :Parameters:
           - `request_id`: an int.
-          - `msg`: bytes, an OP_INSERT, OP_UPDATE, or OP_DELETE message,
-            perhaps with a getlasterror command appended.
+          - `msg`: an OP_INSERT, OP_UPDATE, or OP_DELETE message, perhaps
+            with a getlasterror command appended, as a bytes-like object.
           - `max_doc_size`: size in bytes of the largest document in `msg`.
           - `with_last_error`: True if a getlasterror command is appended.
         """
@@ -243,7 +268,7 @@ class SocketInfo(object):
 
         :Parameters:
           - `request_id`: an int.
-          - `msg`: bytes, the command message.
+          - `msg`: the command message, as a bytes-like object.
         """
         self.send_message(msg, 0)
         response = helpers._unpack_response(self.receive_message(1, request_id))
@@ -470,7 +495,11 @@ class Pool:
         try:
             sock = _configured_socket(self.address, self.opts)
             if self.handshake:
-                ismaster = IsMaster(command(sock, 'admin', {'ismaster': 1},
+                spec = SON([('ismaster', 1)])
+                compressors = self.opts.compression_settings.compressors
+                if compressors:
+                    spec['compression'] = compressors
+                ismaster = IsMaster(command(sock, 'admin', spec,
                                             False, False,
                                             ReadPreference.PRIMARY,
                                             DEFAULT_CODEC_OPTIONS))
@@ -89,6 +89,37 @@ class InsertManyResult(_WriteResult):
         return self.__inserted_ids
 
 
+class ImportResult(_WriteResult):
+    """The return type for
+    :meth:`~pymongo.collection.Collection.import_jsonl` and
+    :meth:`~pymongo.collection.Collection.restore_raw`.
+    """
+
+    __slots__ = ("__inserted_count", "__elapsed", "__acknowledged")
+
+    def __init__(self, inserted_count, elapsed, acknowledged):
+        self.__inserted_count = inserted_count
+        self.__elapsed = elapsed
+        super(ImportResult, self).__init__(acknowledged)
+
+    @property
+    def inserted_count(self):
+        """The number of documents read from the file and inserted."""
+        return self.__inserted_count
+
+    @property
+    def elapsed(self):
+        """The time the import took, in seconds."""
+        return self.__elapsed
+
+    @property
+    def documents_per_second(self):
+        """The number of documents inserted per second of the import."""
+        if not self.__elapsed:
+            return 0.0
+        return self.__inserted_count / float(self.__elapsed)
+
+
 class UpdateResult(_WriteResult):
     """The return type for :meth:`~pymongo.collection.Collection.update_one`,
     :meth:`~pymongo.collection.Collection.update_many`, and
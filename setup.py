@@ -249,6 +249,8 @@ extra_opts = {
 }
 if sys.version_info[:2] == (2, 6):
     extra_opts['tests_require'] = "unittest2"
+    # bson.son.SON is an OrderedDict.
+    extra_opts['install_requires'] = ["ordereddict"]
 
 if "--no_ext" in sys.argv:
     sys.argv.remove("--no_ext")
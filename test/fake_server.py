@@ -0,0 +1,105 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A fake server speaking the wire protocol, to test without mongod."""
+
+import socket
+import struct
+import threading
+
+from bson import BSON
+
+
+def recv_all(sock, length):
+    """Receive exactly `length` bytes, raising EOFError if the connection
+    is closed first."""
+    data = b""
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+class FakeServer(threading.Thread):
+    """A server listening on localhost that serves each connection on its
+    own thread.
+
+    Subclasses implement :meth:`handle` to answer each request with an
+    OP_REPLY. Requests are handled one at a time, holding `lock`.
+    """
+
+    def __init__(self):
+        super(FakeServer, self).__init__()
+        self.daemon = True
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.listener = socket.socket()
+        self.listener.bind(('localhost', 0))
+        self.listener.listen(128)
+        self.address = self.listener.getsockname()[:2]
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except socket.error:
+                return
+            with self.lock:
+                self.connections += 1
+            thread = threading.Thread(target=self.serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.listener.close()
+
+    def serve(self, conn):
+        try:
+            while True:
+                request_id, op_code, body = self.receive(conn)
+                with self.lock:
+                    response = self.handle(op_code, body)
+                if response is None:
+                    continue
+                flags, cursor_id, start, docs = response
+                reply = struct.pack("<iqii", flags, cursor_id, start,
+                                    len(docs))
+                reply += b"".join(BSON.encode(doc) for doc in docs)
+                self.send(conn, request_id, 1, reply)
+        except (EOFError, socket.error):
+            pass
+        finally:
+            conn.close()
+
+    def receive(self, conn):
+        """Read a message, returning its request id, op code and body."""
+        header = recv_all(conn, 16)
+        length, request_id, _, op_code = struct.unpack("<iiii", header)
+        return request_id, op_code, recv_all(conn, length - 16)
+
+    def send(self, conn, response_to, op_code, body):
+        """Send a message in response to request `response_to`."""
+        conn.sendall(struct.pack("<iiii", 16 + len(body), 0, response_to,
+                                 op_code) + body)
+
+    def handle(self, op_code, body):
+        """Answer a request, returning the response flags, cursor id,
+        starting position and documents of the reply.
+
+        Return None to send no reply, as for OP_KILL_CURSORS, or raise
+        EOFError to close the connection without replying.
+        """
+        raise NotImplementedError
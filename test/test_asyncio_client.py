@@ -0,0 +1,306 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the asyncio client against a fake server."""
+
+import itertools
+import struct
+import sys
+import time
+
+sys.path[0:0] = [""]
+
+from bson import decode_all
+from pymongo.errors import AutoReconnect, DuplicateKeyError, NetworkTimeout
+from test import unittest
+from test.fake_server import FakeServer
+from test.utils import wait_until
+
+try:
+    import asyncio
+    from pymongo.asyncio_client import AsyncMongoClient
+except ImportError:
+    asyncio = None
+
+
+def _matches(doc, spec):
+    return all(doc.get(key) == value for key, value in spec.items())
+
+
+class CollectionServer(FakeServer):
+    """A standalone that stores documents for one collection, "db.coll".
+
+    Replies are returned in batches of at most `batch_size` documents.
+    Queries on the collection are answered after `delay` seconds, or drop
+    the connection if `drop` is set.
+    """
+
+    def __init__(self, batch_size=2):
+        super(CollectionServer, self).__init__()
+        self.batch_size = batch_size
+        self.max_write_batch_size = 1000
+        self.delay = 0
+        self.drop = False
+        self.docs = []
+        self.cursors = {}
+        self.cursor_ids = itertools.count(1)
+        self.killed = []
+
+    def handle(self, op_code, body):
+        if op_code == 2007:
+            count = struct.unpack("<i", body[4:8])[0]
+            for cursor_id in struct.unpack("<%dq" % count, body[8:]):
+                self.cursors.pop(cursor_id, None)
+                self.killed.append(cursor_id)
+            return None
+        if op_code == 2005:
+            ntoreturn, cursor_id = struct.unpack("<iq", body[-12:])
+            start, docs = self.cursors.pop(cursor_id)
+            return self.next_batch(cursor_id, start, docs, ntoreturn)
+
+        assert op_code == 2004
+        ns_end = body.index(b"\x00", 4)
+        ns = body[4:ns_end].decode()
+        skip, ntoreturn = struct.unpack("<ii", body[ns_end + 1:ns_end + 9])
+        spec = decode_all(body[ns_end + 9:])[0]
+        if ns == 'db.coll':
+            if self.drop:
+                raise EOFError()
+            time.sleep(self.delay)
+            spec = spec.get('$query', spec)
+            docs = [doc for doc in self.docs if _matches(doc, spec)][skip:]
+            if ntoreturn < 0:
+                return 0, 0, 0, docs[:-ntoreturn]
+            return self.next_batch(next(self.cursor_ids), 0, docs, ntoreturn)
+
+        name = next(iter(spec))
+        if name == 'ismaster':
+            return 0, 0, 0, [{'ok': 1, 'ismaster': True, 'maxWireVersion': 3,
+                              'maxWriteBatchSize': self.max_write_batch_size}]
+        elif name == 'insert':
+            reply = {'ok': 1, 'n': 0}
+            for index, doc in enumerate(spec['documents']):
+                if any(doc['_id'] == other['_id'] for other in self.docs):
+                    reply.setdefault('writeErrors', []).append(
+                        {'index': index, 'code': 11000, 'errmsg': 'dup'})
+                    if spec['ordered']:
+                        break
+                else:
+                    self.docs.append(doc)
+                    reply['n'] += 1
+            return 0, 0, 0, [reply]
+        elif name == 'update':
+            n = 0
+            for update in spec['updates']:
+                for doc in self.docs:
+                    if _matches(doc, update['q']):
+                        doc.update(update['u']['$set'])
+                        n += 1
+                        if not update['multi']:
+                            break
+            return 0, 0, 0, [{'ok': 1, 'n': n, 'nModified': n}]
+        elif name == 'delete':
+            n = 0
+            for delete in spec['deletes']:
+                for doc in list(self.docs):
+                    if _matches(doc, delete['q']):
+                        self.docs.remove(doc)
+                        n += 1
+                        if delete['limit']:
+                            break
+            return 0, 0, 0, [{'ok': 1, 'n': n}]
+        elif name == 'count':
+            return 0, 0, 0, [{'ok': 1, 'n': len(
+                [doc for doc in self.docs
+                 if _matches(doc, spec.get('query', {}))])}]
+        return 0, 0, 0, [{'ok': 0, 'errmsg': 'no such cmd: %s' % name}]
+
+    def next_batch(self, cursor_id, start, docs, ntoreturn):
+        size = self.batch_size
+        if ntoreturn > 0:
+            size = min(size, ntoreturn)
+        batch, rest = docs[:size], docs[size:]
+        if not rest:
+            return 0, 0, start, batch
+        self.cursors[cursor_id] = (start + len(batch), rest)
+        return 0, cursor_id, start, batch
+
+
+@unittest.skipIf(asyncio is None, "requires Python 3.5.2 or later")
+class TestAsyncMongoClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CollectionServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.client = self.make_client(maxPoolSize=4)
+        self.collection = self.client.db.coll
+
+    def make_client(self, **kwargs):
+        client = AsyncMongoClient('%s:%d' % self.server.address,
+                                  loop=self.loop, **kwargs)
+        self.addCleanup(self.close_client, client)
+        return client
+
+    def close_client(self, client):
+        client.close()
+        # Let the transports finish closing.
+        self.run_loop(asyncio.sleep(0))
+
+    def run_loop(self, future):
+        return self.loop.run_until_complete(future)
+
+    def test_crud(self):
+        coll = self.collection
+        result = self.run_loop(coll.insert_one({'_id': 1, 'x': 1}))
+        self.assertEqual(1, result.inserted_id)
+        result = self.run_loop(
+            coll.insert_many([{'_id': i, 'x': 2} for i in range(2, 5)]))
+        self.assertEqual([2, 3, 4], result.inserted_ids)
+        self.assertRaises(DuplicateKeyError, self.run_loop,
+                          coll.insert_one({'_id': 1}))
+
+        self.assertEqual({'_id': 1, 'x': 1}, self.run_loop(coll.find_one(1)))
+        self.assertIsNone(self.run_loop(coll.find_one({'x': 3})))
+        self.assertEqual(4, self.run_loop(coll.count()))
+
+        result = self.run_loop(coll.update_many({'x': 2}, {'$set': {'y': 1}}))
+        self.assertEqual(3, result.matched_count)
+        result = self.run_loop(coll.delete_one({'y': 1}))
+        self.assertEqual(1, result.deleted_count)
+        self.assertEqual(2, self.run_loop(coll.count({'y': 1})))
+
+    def test_cursor(self):
+        docs = [{'_id': i} for i in range(7)]
+        self.run_loop(self.collection.insert_many(docs))
+
+        # The fake server returns batches of 2 documents.
+        cursor = self.collection.find()
+        self.assertEqual(docs, self.run_loop(cursor.to_list()))
+        self.assertFalse(cursor.alive)
+
+        cursor = self.collection.find()
+        self.assertEqual(docs[:3], self.run_loop(cursor.to_list(3)))
+        self.assertEqual(docs[3:], self.run_loop(cursor.to_list()))
+
+        cursor = self.collection.find()
+        iterated = []
+        while True:
+            try:
+                iterated.append(self.run_loop(cursor.__anext__()))
+            except Exception as exc:
+                self.assertEqual('StopAsyncIteration', type(exc).__name__)
+                break
+        self.assertEqual(docs, iterated)
+
+    def test_find_skip_limit(self):
+        docs = [{'_id': i} for i in range(10)]
+        self.run_loop(self.collection.insert_many(docs))
+
+        # Batches of 2, then the last document of the limit.
+        cursor = self.collection.find(skip=2, limit=5)
+        self.assertEqual(docs[2:7], self.run_loop(cursor.to_list()))
+        self.assertFalse(cursor.alive)
+        # The server's cursor still had documents, so it is killed.
+        cursor_id = cursor.cursor_id
+        self.assertTrue(cursor_id)
+        wait_until(lambda: cursor_id in self.server.killed,
+                   "kill the cursor after reaching the limit")
+
+        cursor = self.collection.find(skip=8, limit=5)
+        self.assertEqual(docs[8:], self.run_loop(cursor.to_list()))
+        self.assertEqual(0, cursor.cursor_id)
+
+    def test_close_cursor(self):
+        docs = [{'_id': i} for i in range(10)]
+        self.run_loop(self.collection.insert_many(docs))
+
+        cursor = self.collection.find()
+        self.assertEqual(docs[:3], self.run_loop(cursor.to_list(3)))
+        cursor_id = cursor.cursor_id
+        self.assertTrue(cursor_id)
+        self.assertNotIn(cursor_id, self.server.killed)
+        cursor.close()
+        self.assertEqual([docs[3]], self.run_loop(cursor.to_list()))
+        self.assertFalse(cursor.alive)
+        wait_until(lambda: cursor_id in self.server.killed,
+                   "kill the cursor closed early")
+        self.assertNotIn(cursor_id, self.server.cursors)
+
+    def test_unordered_write_errors(self):
+        self.server.max_write_batch_size = 2
+        self.run_loop(self.collection.insert_many([{'_id': 1}, {'_id': 4}]))
+
+        # Batches [0, 1], [2, 3] and [4, 5] are all sent, the first and
+        # last fail on a duplicate key.
+        docs = [{'_id': i} for i in range(6)]
+        with self.assertRaises(DuplicateKeyError) as context:
+            self.run_loop(self.collection.insert_many(docs, ordered=False))
+        self.assertEqual(4, context.exception.details['index'])
+        self.assertEqual([1, 4, 0, 2, 3, 5],
+                         [doc['_id'] for doc in self.server.docs])
+
+        # An ordered insert stops at the first batch with an error.
+        docs = [{'_id': i} for i in range(6, 12)]
+        docs[1] = {'_id': 0}
+        with self.assertRaises(DuplicateKeyError) as context:
+            self.run_loop(self.collection.insert_many(docs))
+        self.assertEqual(1, context.exception.details['index'])
+        self.assertEqual(7, len(self.server.docs))
+
+    def test_timeout(self):
+        client = self.make_client(socketTimeoutMS=100)
+        coll = client.db.coll
+        self.run_loop(coll.insert_one({'_id': 1}))
+        connections = self.server.connections
+        self.server.delay = 0.5
+        self.assertRaises(NetworkTimeout, self.run_loop, coll.find_one(1))
+
+        # The late reply is discarded and the connection stays usable.
+        self.run_loop(asyncio.sleep(0.6))
+        self.server.delay = 0
+        self.assertEqual({'_id': 1}, self.run_loop(coll.find_one(1)))
+        self.assertEqual(connections, self.server.connections)
+
+    def test_connection_lost(self):
+        client = self.make_client(maxPoolSize=1)
+        coll = client.db.coll
+        self.run_loop(coll.insert_one({'_id': 1}))
+        connections = self.server.connections
+        self.server.drop = True
+        futures = [coll.find_one(1) for _ in range(5)]
+        results = self.run_loop(
+            asyncio.gather(*futures, return_exceptions=True))
+        for result in results:
+            self.assertIsInstance(result, AutoReconnect)
+        # All five were in flight on the one connection.
+        self.assertEqual(connections, self.server.connections)
+
+    def test_concurrent_operations(self):
+        coll = self.collection
+        futures = [coll.insert_one({'_id': i}) for i in range(500)]
+        self.run_loop(asyncio.gather(*futures))
+        futures = [coll.find_one(i) for i in range(500)]
+        found = self.run_loop(asyncio.gather(*futures))
+        self.assertEqual([{'_id': i} for i in range(500)], found)
+
+        # One monitor connection plus at most maxPoolSize for operations,
+        # each carrying many operations at once.
+        self.assertLessEqual(self.server.connections, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
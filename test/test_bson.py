@@ -16,10 +16,15 @@
 
 """Test the bson module."""
 
+import array
 import collections
 import datetime
+import mmap
+import os
 import re
+import struct
 import sys
+import tempfile
 import uuid
 
 sys.path[0:0] = [""]
@@ -28,12 +33,13 @@ import bson
 from bson import (BSON,
                   decode_all,
                   decode_file_iter,
+                  decode_file_mmap,
                   decode_iter,
                   is_valid,
                   Regex)
 from bson.binary import Binary, UUIDLegacy
 from bson.code import Code
-from bson.codec_options import CodecOptions
+from bson.codec_options import CodecOptions, TypeRegistry
 from bson.int64 import Int64
 from bson.objectid import ObjectId
 from bson.dbref import DBRef
@@ -53,6 +59,11 @@ from test import qcheck, SkipTest, unittest
 if PY3:
     long = int
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class NotADict(collections.MutableMapping):
     """Non-dict type that implements the mapping protocol."""
@@ -296,6 +307,15 @@ class TestBSON(unittest.TestCase):
         self.assertRaises(InvalidBSON, list, decode_iter(data))
         self.assertRaises(InvalidBSON, list, decode_file_iter(StringIO(data)))
 
+        # decode_iter yields the documents before an invalid one.
+        data = BSON.encode({"a": 1}) + b"\x05\x00\x00\x00\xFF"
+        docs = decode_iter(data)
+        self.assertEqual({"a": 1}, next(docs))
+        self.assertRaises(InvalidBSON, next, docs)
+        docs = decode_iter(BSON.encode({"a": 1}) + b"\x05\x00")
+        self.assertEqual({"a": 1}, next(docs))
+        self.assertRaises(InvalidBSON, next, docs)
+
     def test_data_timestamp(self):
         self.assertEqual({"test": Timestamp(4, 20)},
                          BSON(b"\x13\x00\x00\x00\x11\x74\x65\x73\x74\x00\x14"
@@ -763,6 +783,259 @@ class TestBSON(unittest.TestCase):
                           {"_id": {'$oid': "52d0b971b3ba219fdeb4170e"}}, True)
         BSON.encode({"_id": {'$oid': "52d0b971b3ba219fdeb4170e"}})
 
+    def test_encoded_size(self):
+        from bson.raw_bson import RawBSONDocument
+        raw = RawBSONDocument(BSON.encode({'a': [1, 2]}))
+        docs = [
+            {},
+            {'_id': ObjectId(), 'a': 1, 'b': 2 ** 40, 'c': Int64(3),
+             'd': 1.5, 'e': None, 'f': True, 'g': MinKey(), 'h': MaxKey()},
+            {'a': u('x'), 'b': u('\u00e9t\u00e9'), 'c': u('\u20ac'),
+             'd': u('\U0001f600'), u('\u00e9'): b'bytes'},
+            {'a': {'b': [1, (2, {'c': [3] * 12})], 'd': SON([('e', 1)])}},
+            {'a': datetime.datetime(2015, 1, 1),
+             'b': datetime.datetime(2015, 1, 1, tzinfo=utc),
+             'c': Timestamp(1, 2), 'd': Binary(b'x', 2),
+             'e': Code('f', {'a': 1}), 'f': re.compile('x', re.I),
+             'g': Regex('y'), 'h': DBRef('c', 1, 'db'), 'i': uuid.uuid4()},
+            SON([('b', 1), ('_id', 2)]),
+            collections.OrderedDict([('a', {'b': 1})]),
+            {'raw': raw, 'list': list(range(1001))},
+            raw,
+        ]
+        for doc in docs:
+            self.assertEqual(len(BSON.encode(doc)), bson.encoded_size(doc))
+        self.assertEqual(len(BSON.encode(docs[1], True)),
+                         bson.encoded_size(docs[1], True))
+        options = CodecOptions(uuid_representation=4)
+        self.assertEqual(len(BSON.encode(docs[4], codec_options=options)),
+                         bson.encoded_size(docs[4], codec_options=options))
+
+        # Sizing raises the encoder's errors.
+        self.assertRaises(InvalidDocument, bson.encoded_size,
+                          {'a': {'$b': 1}}, True)
+        self.assertRaises(InvalidDocument, bson.encoded_size,
+                          {'a': [{'b.c': 1}]}, True)
+        self.assertRaises(InvalidDocument, bson.encoded_size, {1: 2})
+        self.assertRaises(InvalidDocument, bson.encoded_size,
+                          {'a': object()})
+        self.assertRaises(InvalidDocument, bson.encoded_size,
+                          {'a\x00b': 1})
+        self.assertRaises(OverflowError, bson.encoded_size, {'a': 2 ** 64})
+        self.assertRaises(TypeError, bson.encoded_size, [])
+        self.assertRaises(TypeError, bson.encoded_size, {}, False, {})
+        if not PY3:
+            self.assertRaises(InvalidStringData, bson.encoded_size,
+                              {'a': b'\xff'})
+        else:
+            self.assertRaises(UnicodeEncodeError, bson.encoded_size,
+                              {'a': '\udc80'})
+
+    def test_encode_numeric_buffer(self):
+        if not PY3:
+            raise SkipTest("Python 2's array.array doesn't support the new "
+                           "buffer protocol")
+        doc = {'i': array.array('i', [1, -2]),
+               'q': array.array('q', [2 ** 40]),
+               'H': array.array('H', [65535]),
+               'I': array.array('I', [1]),
+               'd': array.array('d', [0.5]),
+               'f': array.array('f', []),
+               'cast': memoryview(struct.pack('<3i', 1, 2, 3)).cast('i')}
+        encoded = BSON.encode(doc)
+        self.assertEqual({'i': [1, -2], 'q': [2 ** 40], 'H': [65535],
+                          'I': [1], 'd': [0.5], 'f': [], 'cast': [1, 2, 3]},
+                         BSON(encoded).decode())
+        self.assertEqual(BSON.encode({'a': [Int64(1)]}),
+                         BSON.encode({'a': array.array('I', [1])}))
+        self.assertEqual(len(encoded), bson.encoded_size(doc))
+        self.assertRaises(OverflowError, BSON.encode,
+                          {'a': array.array('Q', [2 ** 63])})
+
+        # Byte strings and other buffers aren't numbers.
+        for value in (bytearray(b'x'), memoryview(b'x'),
+                      array.array('b', [1]), array.array('u', u('x'))):
+            self.assertRaises(InvalidDocument, BSON.encode, {'a': value})
+
+    def test_encode_numpy(self):
+        if numpy is None:
+            raise SkipTest("numpy is not installed")
+        # NumPy scalars only support the buffer protocol on Python 3.
+        if PY3:
+            scalars = {'i1': numpy.int8(-1), 'u1': numpy.uint8(255),
+                       'i4': numpy.int32(2), 'u4': numpy.uint32(2 ** 31),
+                       'i8': numpy.int64(2 ** 40), 'f4': numpy.float32(0.5),
+                       'f8': numpy.float64(1.5), 'b': numpy.bool_(True)}
+            self.assertEqual(
+                BSON.encode({'i1': -1, 'u1': 255, 'i4': 2,
+                             'u4': Int64(2 ** 31), 'i8': 2 ** 40, 'f4': 0.5,
+                             'f8': 1.5, 'b': True}),
+                BSON.encode(scalars))
+            self.assertEqual(len(BSON.encode(scalars)),
+                             bson.encoded_size(scalars))
+            self.assertRaises(OverflowError, BSON.encode,
+                              {'a': numpy.uint64(2 ** 63)})
+
+        arrays = {'a': numpy.arange(10, dtype=numpy.int16)[::3],
+                  'b': numpy.array([1, 2], dtype='>i8'),
+                  'c': numpy.array([True, False]),
+                  'd': numpy.zeros(0)}
+        self.assertEqual(
+            BSON.encode({'a': [0, 3, 6, 9], 'b': [Int64(1), Int64(2)],
+                         'c': [True, False], 'd': []}),
+            BSON.encode(arrays))
+        self.assertEqual(len(BSON.encode(arrays)),
+                         bson.encoded_size(arrays))
+
+        self.assertRaises(InvalidDocument, BSON.encode,
+                          {'a': numpy.zeros((2, 2))})
+
+        # datetime64 and timedelta64 scalars export their items as bytes,
+        # they aren't numbers. Check both the C and Python encoders.
+        for value in (numpy.datetime64('2015-01-01T00:00:00.123', 'ms'),
+                      numpy.timedelta64(5, 's'),
+                      numpy.array(['2015-01-01'], dtype='M8[D]'),
+                      numpy.array([5], dtype='m8[s]')):
+            self.assertRaises(InvalidDocument, BSON.encode, {'a': value})
+            self.assertEqual(None, bson._numeric_buffer(value))
+            self.assertRaises(InvalidDocument, bson._name_value_to_bson,
+                              b'a\x00', value, False, CodecOptions())
+
+    def test_encode_into(self):
+        docs = [{'a': 1}, SON([('b', u('x')), ('_id', 2)])]
+        buf = bytearray(b'xx')
+        for doc in docs:
+            self.assertEqual(len(BSON.encode(doc)),
+                             bson.encode_into(doc, buf, len(buf)))
+        self.assertEqual(docs, decode_all(bytes(buf[2:])))
+        # _id is moved first, as by BSON.encode.
+        self.assertEqual(list(decode_all(bytes(buf[2:]))[1]),
+                         ['_id', 'b'])
+
+        # Overwrite in place, growing the bytearray only when needed.
+        encoded = BSON.encode({'a': 2})
+        self.assertEqual(len(encoded), bson.encode_into({'a': 2}, buf, 2))
+        self.assertEqual(encoded, buf[2:2 + len(encoded)])
+        self.assertEqual(2 + len(BSON.encode(docs[0])) +
+                         len(BSON.encode(docs[1])), len(buf))
+
+        with tempfile.TemporaryFile() as file_obj:
+            file_obj.write(b'\x00' * 20)
+            file_obj.flush()
+            mapping = mmap.mmap(file_obj.fileno(), 0)
+            self.assertEqual(12, bson.encode_into({'a': 1}, mapping, 4))
+            self.assertEqual(BSON.encode({'a': 1}), mapping[4:16])
+            self.assertRaises(ValueError, bson.encode_into, {'a': 1},
+                              mapping, 10)
+            mapping.close()
+
+        self.assertRaises(ValueError, bson.encode_into, {}, bytearray(), 1)
+        self.assertRaises(ValueError, bson.encode_into, {}, bytearray(), -1)
+        self.assertRaises(InvalidDocument, bson.encode_into, {'$a': 1},
+                          bytearray(), 0, True)
+        self.assertRaises(TypeError, bson.encode_into, {}, b'x' * 10)
+        self.assertRaises(TypeError, bson.encode_into, {}, bytearray(), 0,
+                          False, {})
+
+    def test_buffer_arena(self):
+        if not bson.has_c():
+            raise SkipTest("C extension not available")
+        from bson import _cbson
+        before = _cbson._buffer_stats()
+        for _ in range(10):
+            BSON.encode({'s': 'x' * 100000})
+        after = _cbson._buffer_stats()
+        # Only the first encoding may allocate a buffer.
+        self.assertTrue(after['hits'] - before['hits'] >= 9)
+        self.assertTrue(after['misses'] - before['misses'] <= 1)
+        self.assertTrue(after['cached'] >= 1)
+
+    def test_document_offsets(self):
+        docs = [{}, {'a': 1}, {'s': 'x' * 100, 'sub': {'b': [1, 2]}}]
+        encoded = [BSON.encode(doc) for doc in docs]
+        data = b"".join(encoded)
+        for buf in (data, bytearray(data)):
+            offsets = bson.document_offsets(buf)
+            self.assertEqual(8, offsets.itemsize)
+            self.assertEqual([0, 5, 5, 12, 17, len(encoded[2])],
+                             list(offsets))
+            for i, raw in enumerate(encoded):
+                position, length = offsets[2 * i], offsets[2 * i + 1]
+                self.assertEqual(raw, buf[position:position + length])
+        self.assertEqual([], list(bson.document_offsets(b"")))
+
+        for bad in (data + b"\x05", data[:-1], data[:-1] + b"\x01",
+                    b"\x01\x00\x00\x00\x00", b"\xff\xff\xff\xff\x00"):
+            self.assertRaises(InvalidBSON, bson.document_offsets, bad)
+        self.assertRaises(TypeError, bson.document_offsets, u('string'))
+
+
+class TestDecodeColumns(unittest.TestCase):
+
+    def test_decode_columns(self):
+        oid = ObjectId()
+        dt = datetime.datetime(2015, 1, 1)
+        docs = [{'i': 1, 'l': Int64(2), 'f': 1.5, 'b': True, 'd': dt,
+                 '_id': oid, 'skip': [{'x': Code('f')}, Regex('a')]},
+                {'i': Int64(3), 'l': 4, 'f': 5, 'b': False, 'd': None},
+                {'i': -1, 'f': Int64(-2), 'b': 1, 'd': 'x'}]
+        data = b''.join(BSON.encode(doc) for doc in docs)
+        schema = {'i': 'int32', 'l': 'int64', 'f': 'double', 'b': 'bool',
+                  'd': 'datetime64', '_id': 'objectid', 'missing': 'int32'}
+        columns = bson.decode_columns(data, schema)
+        self.assertEqual(sorted(schema), sorted(columns))
+
+        def column(name, fmt):
+            values, mask = columns[name]
+            self.assertIsInstance(values, bytearray)
+            self.assertIsInstance(mask, bytearray)
+            return (list(struct.unpack('<' + fmt * 3, bytes(values))),
+                    list(bytearray(mask)))
+
+        self.assertEqual(([1, 0, -1], [1, 0, 1]), column('i', 'i'))
+        self.assertEqual(([2, 4, 0], [1, 1, 0]), column('l', 'q'))
+        self.assertEqual(([1.5, 5.0, -2.0], [1, 1, 1]), column('f', 'd'))
+        self.assertEqual(([1, 0, 0], [1, 1, 0]), column('b', 'B'))
+        self.assertEqual(([1420070400000, 0, 0], [1, 0, 0]),
+                         column('d', 'q'))
+        self.assertEqual(([oid.binary, b'\x00' * 12, b'\x00' * 12],
+                          [1, 0, 0]), column('_id', '12s'))
+        self.assertEqual(([0, 0, 0], [0, 0, 0]), column('missing', 'i'))
+
+        # Rows are appended to existing columns.
+        appended = {'i': columns['i']}
+        self.assertIs(appended, bson.decode_columns(
+            bytearray(BSON.encode({'i': 7})), {'i': 'int32'}, appended))
+        self.assertEqual(bytearray(b'\x01\x00\x01\x01'), columns['i'][1])
+        self.assertEqual(16, len(columns['i'][0]))
+
+    def test_decode_columns_errors(self):
+        data = BSON.encode({'a': 1, 'b': 'x'})
+        self.assertRaises(TypeError, bson.decode_columns, data, ['a'])
+        self.assertRaises(TypeError, bson.decode_columns, data, {1: 'int32'})
+        self.assertRaises(ValueError, bson.decode_columns, data,
+                          {'a': 'int16'})
+        self.assertRaises(ValueError, bson.decode_columns, data,
+                          {'a': 'int32'}, {'b': None})
+
+        columns = bson.decode_columns(data, {'a': 'int32'})
+        for bad in (data[:-1], data[:-1] + b'\x01',
+                    data.replace(b'\x02b', b'\x99b')):
+            self.assertRaises(InvalidBSON, bson.decode_columns, bad,
+                              {'a': 'int32'}, columns)
+            # The columns are left as they were.
+            self.assertEqual((bytearray(b'\x01\x00\x00\x00'),
+                              bytearray(b'\x01')), columns['a'])
+
+        # A string length of -7 in an element that isn't a column.
+        bad = b'\x10\x00\x00\x00\x02a\x00\xf9\xff\xff\xffxxx\x00\x00'
+        self.assertRaises(InvalidBSON, bson.decode_columns, bad,
+                          {'b': 'int64'})
+        self.assertRaises(InvalidBSON, bson.decode_columns,
+                          data + bad, {'a': 'int32'}, columns)
+        self.assertEqual((bytearray(b'\x01\x00\x00\x00'),
+                          bytearray(b'\x01')), columns['a'])
+
 
 class TestCodecOptions(unittest.TestCase):
     def test_document_class(self):
@@ -779,9 +1052,42 @@ class TestCodecOptions(unittest.TestCase):
         self.assertRaises(ValueError, CodecOptions, uuid_representation=7)
         self.assertRaises(ValueError, CodecOptions, uuid_representation=2)
 
+    def test_intern_keys(self):
+        self.assertRaises(TypeError, CodecOptions, intern_keys=1)
+        self.assertFalse(CodecOptions().intern_keys)
+
+        options = CodecOptions(document_class=SON, intern_keys=True)
+        doc = SON([('a', 1), (u('\u00e9l\u00e8ve'), {'b': 2})])
+        data = BSON.encode(doc) * 3
+        for docs in (bson.decode_all(data, options),
+                     bson.decode_all(data, options, fields=['a'])):
+            keys = [list(decoded.keys())[0] for decoded in docs]
+            self.assertIs(keys[0], keys[1])
+            self.assertIs(keys[0], keys[2])
+        docs = bson.decode_all(data, options)
+        self.assertEqual([doc] * 3, docs)
+        names = [list(decoded.keys())[1] for decoded in docs]
+        self.assertIs(names[0], names[2])
+        # Names in embedded documents are shared too.
+        self.assertIs(list(docs[0][names[0]])[0],
+                      list(docs[2][names[2]])[0])
+
+        # Long names are decoded as usual.
+        name = 'x' * 100
+        docs = bson.decode_all(BSON.encode({name: 1}) * 2, options)
+        self.assertEqual([{name: 1}] * 2, docs)
+
+        # Each call has its own cache of names.
+        key = list(bson.decode_all(data, options)[0])[1]
+        self.assertIsNot(key, list(bson.decode_all(data, options)[0])[1])
+        self.assertEqual(options, bson._decoding_options(options))
+        self.assertEqual(CodecOptions(),
+                         bson._decoding_options(CodecOptions()))
+
     def test_codec_options_repr(self):
         r = ('CodecOptions(document_class=dict, tz_aware=False, '
-             'uuid_representation=PYTHON_LEGACY)')
+             'uuid_representation=PYTHON_LEGACY, intern_keys=False, '
+             'type_registry=None)')
         self.assertEqual(r, repr(CodecOptions()))
 
     def test_decode_all_defaults(self):
@@ -798,6 +1104,233 @@ class TestCodecOptions(unittest.TestCase):
         self.assertEqual(decoded['uuid'], doc['uuid'])
         self.assertIsNone(decoded['dt'].tzinfo)
 
+    def test_decode_all_buffer(self):
+        docs = [{'_id': ObjectId(), 'a': [1, 2]}, {'b': u('b\xe9')}]
+        data = b"".join(BSON.encode(doc) for doc in docs)
+        self.assertEqual(docs, decode_all(bytearray(data)))
+        if sys.version_info[:2] > (2, 6):
+            view = memoryview(b"\x00" * 20 + data)[20:]
+            self.assertEqual(docs, decode_all(view))
+        self.assertRaises(TypeError, decode_all, u('string'))
+        self.assertRaises(TypeError, decode_all, 100)
+
+    def test_buffer_inputs(self):
+        docs = [{'_id': ObjectId(), 'a': [1, 2]}, {'b': u('b\xe9')}]
+        data = b"".join(BSON.encode(doc) for doc in docs)
+        inputs = [bytearray(data)]
+        if sys.version_info[:2] > (2, 6):
+            inputs.append(memoryview(b"\x00" * 20 + data)[20:])
+        with tempfile.TemporaryFile() as file_obj:
+            file_obj.write(data)
+            file_obj.flush()
+            mapping = mmap.mmap(file_obj.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+            inputs.append(mapping)
+            for data in inputs:
+                self.assertEqual(docs, decode_all(data))
+                self.assertEqual(docs, list(decode_iter(data)))
+                self.assertTrue(is_valid(data[:len(BSON.encode(docs[0]))]))
+                self.assertFalse(is_valid(data))
+            mapping.close()
+        self.assertRaises(TypeError, list, decode_iter(u('string')))
+
+    def test_decode_file_mmap(self):
+        docs = [{'_id': i, 's': 'x' * i} for i in range(100)]
+        data = b"".join(BSON.encode(doc) for doc in docs)
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        os.close(fd)
+
+        for content, expected in ((data, docs), (b"", [])):
+            with open(path, "wb") as file_obj:
+                file_obj.write(content)
+            self.assertEqual(expected, list(decode_file_mmap(path)))
+
+        with open(path, "wb") as file_obj:
+            file_obj.write(data[:-1])
+        self.assertRaises(InvalidBSON, list, decode_file_mmap(path))
+
+        # Stop iterating early.
+        with open(path, "wb") as file_obj:
+            file_obj.write(data)
+        docs = decode_file_mmap(path)
+        self.assertEqual({'_id': 0, 's': ''}, next(docs))
+        docs.close()
+        self.assertRaises(TypeError, next, decode_file_mmap(path, {}))
+
+    def test_raw_file_iter(self):
+        encoded = [BSON.encode({'_id': i, 's': 'x' * i}) for i in range(100)]
+        data = b"".join(encoded)
+        for chunk_size in (1, 7, 1000, len(data)):
+            self.assertEqual(encoded, list(bson._raw_file_iter(
+                StringIO(data), chunk_size)))
+        self.assertEqual([], list(bson._raw_file_iter(StringIO(b""))))
+
+        self.assertRaises(InvalidBSON, list,
+                          bson._raw_file_iter(StringIO(data[:-1])))
+        self.assertRaises(InvalidBSON, list,
+                          bson._raw_file_iter(StringIO(data[:-1] + b"\x01")))
+        self.assertRaises(InvalidBSON, list,
+                          bson._raw_file_iter(StringIO(b"\x04\x00\x00\x00")))
+
+        # The rest of a document larger than a chunk is read at once.
+        class CountingFile(object):
+            def __init__(self, data):
+                self.file_obj = StringIO(data)
+                self.reads = []
+
+            def read(self, size):
+                self.reads.append(size)
+                return self.file_obj.read(size)
+
+        large = BSON.encode({'s': 'x' * 10000})
+        file_obj = CountingFile(large + encoded[0])
+        self.assertEqual([large, encoded[0]],
+                         list(bson._raw_file_iter(file_obj, 100)))
+        self.assertEqual([100, len(large) - 100, 100, 100], file_obj.reads)
+
+    def test_decode_all_fields(self):
+        doc = SON([('_id', 1),
+                   ('name', 'x'),
+                   ('skip', SON([('regex', Regex('a')),
+                                 ('code', Code('f', {'s': 1})),
+                                 ('bin', Binary(b'1', 128)),
+                                 ('list', [MinKey(), None, 1.5])])),
+                   ('sub', SON([('a', 1), ('b', {'c': 2, 'd': 3})])),
+                   ('items', [{'a': 1, 'b': 2}, 3, [4], {'b': 5}]),
+                   ('dt', datetime.datetime(2015, 1, 1))])
+        data = BSON.encode(doc) * 2
+
+        def decode(fields, opts=CodecOptions(document_class=SON)):
+            docs = decode_all(data, opts, fields)
+            self.assertEqual(docs[0], docs[1])
+            return docs[0]
+
+        self.assertEqual(SON([('_id', 1), ('dt', doc['dt'])]),
+                         decode(['dt', '_id', 'missing']))
+        self.assertEqual({'sub': {'b': {'c': 2}}}, decode(['sub.b.c']))
+        self.assertEqual({'sub': {'a': 1, 'b': {'c': 2, 'd': 3}}},
+                         decode(['sub.a', 'sub', 'sub.b.c']))
+        self.assertEqual({'items': [{'a': 1}, {}]}, decode(['items.a']))
+        # Subfields of values that aren't documents are skipped.
+        self.assertEqual({}, decode(['name.first', 'dt.year']))
+        self.assertEqual(SON(), decode([]))
+        self.assertEqual(doc, decode(list(doc)))
+        self.assertEqual(doc, decode(None))
+        self.assertEqual({'name': 'x'}, decode_all(data, fields=['name'])[0])
+
+        self.assertRaises(TypeError, decode_all, data, CodecOptions(), 'name')
+        self.assertRaises(TypeError, decode_all, data, CodecOptions(), [1])
+        self.assertRaises(InvalidBSON, decode_all, data[:-1], CodecOptions(),
+                          ['name'])
+
+    def test_decode_all_fields_invalid(self):
+        data = BSON.encode(SON([('x', [{'a': 1}, 2]), ('y', 1)]))
+        array_size = struct.unpack("<i", data[7:11])[0]
+        cases = [
+            # A string length of -7.
+            (b"\x10\x00\x00\x00\x02a\x00\xf9\xff\xff\xffxxx\x00\x00",
+             ['b']),
+            # An int32 running past the end of the document.
+            (b"\x08\x00\x00\x00\x10$\x02\x00", ['a']),
+            # Array lengths ending inside the array's elements.
+            (data[:7] + struct.pack("<i", array_size - 1) + data[11:],
+             ['x.a']),
+            (data[:7] + struct.pack("<i", array_size - 5) + data[11:],
+             ['y'])]
+        opts = CodecOptions()
+        for data, fields in cases:
+            self.assertRaises(InvalidBSON, decode_all, data, opts, fields)
+            # The pure Python decoder rejects it too when the C extension
+            # is in use.
+            self.assertRaises(InvalidBSON, bson._elements_to_dict_fields,
+                              data, 4, len(data) - 1,
+                              bson._decoding_options(opts),
+                              bson._fields_tree(fields))
+        for data, _ in cases[:2]:
+            self.assertRaises(InvalidBSON, decode_all, data, opts)
+
+
+class Celsius(object):
+    def __init__(self, degrees):
+        self.degrees = degrees
+
+
+class Kelvin(Celsius):
+    pass
+
+
+class Flag(int):
+    pass
+
+
+class TestTypeRegistry(unittest.TestCase):
+
+    def test_type_registry(self):
+        self.assertRaises(TypeError, CodecOptions, type_registry={})
+        self.assertRaises(TypeError, TypeRegistry, [])
+        self.assertRaises(TypeError, TypeRegistry, {'a': str})
+        self.assertRaises(TypeError, TypeRegistry, {Celsius: 1})
+        self.assertRaises(TypeError, TypeRegistry, None, {Int64: 1})
+        registry = TypeRegistry({Celsius: float})
+        self.assertEqual({Celsius: float}, registry.encoders)
+        self.assertEqual({}, registry.decoders)
+        self.assertIs(registry,
+                      CodecOptions(type_registry=registry).type_registry)
+
+    def test_encode(self):
+        options = CodecOptions(type_registry=TypeRegistry(
+            {Celsius: lambda value: {'celsius': value.degrees},
+             Flag: bool}))
+        doc = {'_id': Flag(1), 'a': Celsius(1.5),
+               'b': [Kelvin(2.5), {'c': Celsius(3)}], 'd': 4}
+        expected = {'_id': True, 'a': {'celsius': 1.5},
+                    'b': [{'celsius': 2.5}, {'c': {'celsius': 3}}], 'd': 4}
+        encoded = BSON.encode(doc, codec_options=options)
+        self.assertEqual(BSON.encode(expected), encoded)
+        self.assertEqual(len(encoded),
+                         bson.encoded_size(doc, codec_options=options))
+        self.assertEqual(expected, BSON(encoded).decode())
+        # Without the registry, Flag is encoded like an int.
+        self.assertEqual({'f': 1}, BSON.encode({'f': Flag(1)}).decode())
+        self.assertRaises(InvalidDocument, BSON.encode, {'a': Celsius(1)})
+
+        # Values are converted once, not by the encoder of their new type.
+        options = CodecOptions(type_registry=TypeRegistry(
+            {Celsius: lambda value: Kelvin(value.degrees + 273)}))
+        self.assertRaises(InvalidDocument, BSON.encode, {'a': Celsius(1)},
+                          codec_options=options)
+        self.assertRaises(InvalidDocument, bson.encoded_size,
+                          {'a': Celsius(1)}, codec_options=options)
+
+        def fail(value):
+            raise ValueError(value)
+        options = CodecOptions(type_registry=TypeRegistry({Celsius: fail}))
+        self.assertRaises(ValueError, BSON.encode, {'a': Celsius(1)},
+                          codec_options=options)
+
+    def test_decode(self):
+        oid = ObjectId()
+        options = CodecOptions(type_registry=TypeRegistry(
+            decoders={Int64: int, ObjectId: str,
+                      dict: lambda doc: doc.get('celsius', doc)}))
+        data = BSON.encode({'_id': oid, 'a': Int64(1),
+                            'b': [{'celsius': 2.5}, oid], 'c': {'d': 3}})
+        expected = {'_id': str(oid), 'a': 1, 'b': [2.5, str(oid)],
+                    'c': {'d': 3}}
+        for decoded in (BSON(data).decode(options),
+                        decode_all(data, options)[0],
+                        decode_all(data, options, ['_id', 'a', 'b', 'c'])[0],
+                        list(decode_iter(data, options))[0]):
+            self.assertEqual(expected, decoded)
+            self.assertEqual(int, type(decoded['a']))
+        self.assertEqual(Int64, type(BSON(data).decode()['a']))
+
+        options = CodecOptions(type_registry=TypeRegistry(
+            decoders={text_type: int}))
+        self.assertRaises(InvalidBSON, BSON.encode({'a': 'x'}).decode,
+                          options)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -179,6 +179,18 @@ class TestBulk(BulkTestBase):
         self.assertEqual(1, result.inserted_count)
         self.assertEqual(3, self.coll.count())
 
+        # The missing _ids are generated together when the bulk executes.
+        docs = [{} for _ in range(3)]
+        bulk = self.coll.initialize_ordered_bulk_op()
+        for doc in docs:
+            bulk.insert(doc)
+        self.assertNotIn('_id', docs[0])
+        bulk.execute()
+        oids = [doc['_id'] for doc in docs]
+        self.assertEqual(sorted(oids), oids)
+        self.assertEqual(3, len(set(oids)))
+        self.assertEqual(6, self.coll.count())
+
     def test_insert_check_keys(self):
         bulk = self.coll.initialize_ordered_bulk_op()
         bulk.insert({'$dollar': 1})
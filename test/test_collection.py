@@ -16,12 +16,16 @@
 
 """Test the collection module."""
 
+import io
 import re
+import struct
 import sys
 import threading
 
 sys.path[0:0] = [""]
 
+from bson import BSON, json_util
+from bson.errors import InvalidBSON
 from bson.regex import Regex
 from bson.code import Code
 from bson.objectid import ObjectId
@@ -33,14 +37,16 @@ from pymongo import MongoClient
 from pymongo.collection import Collection, ReturnDocument
 from pymongo.command_cursor import CommandCursor
 from pymongo.cursor import CursorType
-from pymongo.errors import (DuplicateKeyError,
+from pymongo.errors import (BulkWriteError,
+                            DuplicateKeyError,
                             InvalidDocument,
                             InvalidName,
                             InvalidOperation,
                             OperationFailure)
 from pymongo.operations import IndexModel
 from pymongo.read_preferences import ReadPreference
-from pymongo.results import (InsertOneResult,
+from pymongo.results import (ImportResult,
+                             InsertOneResult,
                              InsertManyResult,
                              UpdateResult,
                              DeleteResult)
@@ -608,6 +614,121 @@ class TestCollection(IntegrationTest):
         self.assertFalse(result.acknowledged)
         self.assertEqual(15, db.test.count())
 
+    def test_insert_columns(self):
+        db = self.db
+        db.test.drop()
+
+        values = bytearray(struct.pack('<5q', *range(5)))
+        mask = bytearray(b'\x01\x00\x01\x01\x01')
+        result = db.test.insert_columns({'v': (values, mask)}, {'v': 'int64'})
+        self.assertTrue(isinstance(result, InsertManyResult))
+        self.assertTrue(result.acknowledged)
+        self.assertEqual(60, len(result.inserted_ids))
+        _id = ObjectId(bytes(result.inserted_ids[:12]))
+        self.assertEqual({'_id': _id, 'v': 0}, db.test.find_one(_id))
+        self.assertEqual(4, db.test.count({'v': {'$exists': True}}))
+
+        columns = db.test.find().sort('_id').to_columns(
+            {'_id': 'objectid', 'v': 'int64'})
+        self.assertEqual(result.inserted_ids, columns['_id'][0])
+        self.assertEqual((values[:8] + bytearray(8) + values[16:], mask),
+                         columns['v'])
+
+        ids = bytearray(struct.pack('<2i', 1, 2))
+        result = db.test.insert_columns(SON([('_id', ids)]),
+                                        {'_id': 'int32'})
+        self.assertIs(ids, result.inserted_ids)
+        self.assertRaises(DuplicateKeyError, db.test.insert_columns,
+                          {'_id': ids}, {'_id': 'int32'})
+
+        db = db.client.get_database(db.name,
+                                    write_concern=WriteConcern(w=0))
+        result = db.test.insert_columns({'v': values}, {'v': 'int64'})
+        self.assertFalse(result.acknowledged)
+        self.assertEqual(12, db.test.count())
+
+    def test_dump_raw_restore_raw(self):
+        db = self.db
+        db.test.drop()
+        docs = [{'_id': i, 's': 'x' * i} for i in range(1000)]
+        db.test.insert_many(docs)
+
+        for cursor_type in (CursorType.NON_TAILABLE, CursorType.EXHAUST):
+            if cursor_type == CursorType.EXHAUST and is_mongos(db.client):
+                continue
+            fileobj = io.BytesIO()
+            self.assertEqual(1000, db.test.dump_raw(
+                fileobj, sort=[('_id', ASCENDING)], batch_size=100,
+                cursor_type=cursor_type))
+            self.assertEqual(b"".join(BSON.encode(doc) for doc in docs),
+                             fileobj.getvalue())
+        self.assertEqual(
+            10, db.test.dump_raw(io.BytesIO(), {'_id': {'$lt': 10}}))
+
+        db.test_restore.drop()
+        fileobj.seek(0)
+        result = db.test_restore.restore_raw(fileobj)
+        self.assertTrue(isinstance(result, ImportResult))
+        self.assertEqual(1000, result.inserted_count)
+        self.assertEqual(docs, list(db.test_restore.find().sort('_id')))
+        fileobj.seek(0)
+        self.assertRaises(DuplicateKeyError, db.test_restore.restore_raw,
+                          fileobj)
+
+        self.assertEqual(0, db.test_restore.restore_raw(
+            io.BytesIO()).inserted_count)
+        self.assertRaises(InvalidBSON, db.test_restore.restore_raw,
+                          io.BytesIO(fileobj.getvalue()[:-1]))
+        db.test_restore.drop()
+
+    def test_import_jsonl(self):
+        db = self.db
+        db.test.drop()
+        docs = [{'_id': i, 'x': 'y' * i} for i in range(1000)]
+        db.test.insert_many(docs)
+
+        fileobj = io.BytesIO()
+        self.assertEqual(
+            1000, json_util.dump_cursor(db.test.find().sort('_id'), fileobj))
+        db.test.drop()
+        fileobj.seek(0)
+        result = db.test.import_jsonl(fileobj, batch_bytes=10000)
+        self.assertTrue(isinstance(result, ImportResult))
+        self.assertEqual(1000, result.inserted_count)
+        self.assertTrue(result.documents_per_second > 0)
+        self.assertEqual(docs, list(db.test.find().sort('_id')))
+
+        self.assertRaises(ValueError, db.test.import_jsonl,
+                          io.BytesIO(b"{bad\n"))
+        self.assertRaises(ValueError, db.test.import_jsonl,
+                          io.BytesIO(), batch_bytes=-1)
+        self.assertRaises(ValueError, db.test.import_jsonl,
+                          io.BytesIO(), batch_bytes=0)
+        db.test.drop()
+
+    def test_import_jsonl_workers(self):
+        db = self.db
+        db.test.drop()
+        # The _ids are out of order, so the natural order shows the order
+        # the documents were inserted in.
+        docs = [{'_id': (i * 7) % 1000, 'i': i} for i in range(1000)]
+        lines = [json_util.dumps(doc) + "\n" for doc in docs]
+        fileobj = io.BytesIO("".join(lines).encode("ascii"))
+        result = db.test.import_jsonl(fileobj, batch_bytes=1000, workers=2)
+        self.assertEqual(1000, result.inserted_count)
+        self.assertEqual(docs, list(db.test.find().sort('$natural', 1)))
+
+        # An ordered import stops at the first document that fails, in a
+        # batch parsed while the ones before it were inserted.
+        db.test.drop()
+        lines[600] = json_util.dumps({'_id': docs[0]['_id']}) + "\n"
+        self.assertRaises(BulkWriteError, db.test.import_jsonl,
+                          io.BytesIO("".join(lines).encode("ascii")),
+                          batch_bytes=1000, workers=2)
+        self.assertEqual(docs[:600],
+                         list(db.test.find().sort('$natural', 1)))
+        db.test.drop()
+
     def test_delete_one(self):
         self.db.test.drop()
 
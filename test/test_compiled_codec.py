@@ -0,0 +1,207 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the compiled_codec module."""
+
+import collections
+import datetime
+import sys
+
+sys.path[0:0] = [""]
+
+from bson import BSON, decode_all, decode_iter, encode_into
+from bson.codec_options import CodecOptions
+from bson.compiled_codec import CompiledCodec, compile_codec
+from bson.errors import InvalidBSON
+from bson.int64 import Int64
+from bson.objectid import ObjectId
+from bson.py3compat import u
+from bson.son import SON
+from bson.tz_util import utc
+from pymongo import message
+from test import unittest, IntegrationTest
+
+
+Person = collections.namedtuple('Person', ['name', 'age', 'born', 'score'])
+
+
+class Account(object):
+    __slots__ = ('_id', 'balance', 'active')
+
+    def __init__(self, _id, balance, active):
+        self._id = _id
+        self.balance = balance
+        self.active = active
+
+    def __eq__(self, other):
+        return (isinstance(other, Account) and
+                (self._id, self.balance, self.active) ==
+                (other._id, other.balance, other.active))
+
+    def __ne__(self, other):
+        return not self == other
+
+
+PERSON_CODEC = compile_codec([('name', 'string'),
+                              ('age', 'int32'),
+                              ('born', 'datetime'),
+                              ('score', 'double')], Person)
+PERSON_OPTIONS = CodecOptions(document_class=PERSON_CODEC)
+
+ACCOUNT_CODEC = compile_codec(SON([('_id', 'objectid'),
+                                   ('balance', 'int64'),
+                                   ('active', 'bool')]), Account)
+ACCOUNT_OPTIONS = CodecOptions(document_class=ACCOUNT_CODEC)
+
+
+class TestCompiledCodec(unittest.TestCase):
+
+    person = Person(u('Ir\xe8ne'), 38, datetime.datetime(1897, 9, 12), 9.5)
+    person_doc = SON([('name', u('Ir\xe8ne')), ('age', 38),
+                      ('born', datetime.datetime(1897, 9, 12)),
+                      ('score', 9.5)])
+    account = Account(ObjectId(), 2 ** 40, True)
+
+    def test_encode(self):
+        self.assertEqual(BSON.encode(self.person_doc),
+                         BSON.encode(self.person,
+                                     codec_options=PERSON_OPTIONS))
+        # int64 fields are always encoded as int64.
+        encoded = BSON.encode(Account(self.account._id, 1, False),
+                              codec_options=ACCOUNT_OPTIONS)
+        decoded = BSON(encoded).decode(CodecOptions(SON))
+        self.assertEqual(SON([('_id', self.account._id),
+                              ('balance', 1), ('active', False)]), decoded)
+        self.assertIsInstance(decoded['balance'], Int64)
+
+        buf = bytearray()
+        encode_into(self.person, buf, 0, codec_options=PERSON_OPTIONS)
+        self.assertEqual(BSON.encode(self.person_doc), bytes(buf))
+
+        # Mappings are still encoded as usual.
+        self.assertEqual(BSON.encode(self.person_doc),
+                         BSON.encode(self.person_doc,
+                                     codec_options=PERSON_OPTIONS))
+
+    def test_decode(self):
+        data = BSON.encode(self.person_doc)
+        decoded = BSON(data).decode(PERSON_OPTIONS)
+        self.assertIsInstance(decoded, Person)
+        self.assertEqual(self.person, decoded)
+        self.assertEqual([self.person] * 2,
+                         decode_all(data * 2, PERSON_OPTIONS))
+        self.assertEqual([self.person] * 2,
+                         list(decode_iter(data * 2, PERSON_OPTIONS)))
+
+        data = BSON.encode(self.account, codec_options=ACCOUNT_OPTIONS)
+        self.assertEqual(self.account, BSON(data).decode(ACCOUNT_OPTIONS))
+
+        codec = compile_codec([('born', 'datetime')],
+                              collections.namedtuple('Born', ['born']),
+                              CodecOptions(tz_aware=True))
+        born = BSON.encode({'born': datetime.datetime(1897, 9, 12)})
+        self.assertEqual(datetime.datetime(1897, 9, 12, tzinfo=utc),
+                         BSON(born).decode(CodecOptions(codec)).born)
+
+    def test_fallback(self):
+        # Documents that deviate from the schema are decoded as usual.
+        for doc in (SON([('age', 38), ('name', u('x')),
+                         ('born', datetime.datetime(1897, 9, 12)),
+                         ('score', 9.5)]),
+                    SON([('name', u('x')), ('age', 38),
+                         ('born', datetime.datetime(1897, 9, 12)),
+                         ('score', 9)]),
+                    SON([('name', u('x')), ('age', 38)]),
+                    SON(list(self.person_doc.items()) + [('extra', 1)])):
+            decoded = BSON(BSON.encode(doc)).decode(PERSON_OPTIONS)
+            self.assertIsInstance(decoded, dict)
+            self.assertEqual(doc, decoded)
+
+        # Values that don't have the field types are encoded as usual.
+        person = Person(u('x'), None, datetime.datetime(1897, 9, 12), 1)
+        encoded = BSON.encode(person, codec_options=PERSON_OPTIONS)
+        self.assertEqual({'name': u('x'), 'age': None,
+                          'born': datetime.datetime(1897, 9, 12),
+                          'score': 1}, BSON(encoded).decode())
+        # An int too large for int32 is encoded as int64.
+        encoded = BSON.encode(Person(u('x'), 2 ** 40, None, None),
+                              codec_options=PERSON_OPTIONS)
+        self.assertEqual({'name': u('x'), 'age': 2 ** 40, 'born': None,
+                          'score': None}, BSON(encoded).decode())
+
+        options = CodecOptions(document_class=compile_codec(
+            [('a', 'int32')], Person, CodecOptions(document_class=SON)))
+        self.assertIsInstance(BSON.encode({'b': 1}).decode(options), SON)
+
+    def test_invalid(self):
+        data = BSON.encode(self.person_doc)
+        for bad in (data[:-1], data[:-1] + b'\x01'):
+            self.assertRaises(InvalidBSON, BSON(bad).decode, PERSON_OPTIONS)
+            self.assertRaises(InvalidBSON, decode_all, bad, PERSON_OPTIONS)
+
+    def test_compile_errors(self):
+        self.assertRaises(ValueError, compile_codec, [], Person)
+        self.assertRaises(ValueError, compile_codec, [('a', 'int16')], Person)
+        self.assertRaises(ValueError, compile_codec,
+                          [('a', 'int32'), ('a', 'int64')], Person)
+        for name in ('', '$a', 'a.b', 'a\x00'):
+            self.assertRaises(ValueError, compile_codec,
+                              [(name, 'int32')], Person)
+        self.assertRaises(TypeError, compile_codec, [(1, 'int32')], Person)
+        self.assertRaises(TypeError, compile_codec, [('a', 'int32')],
+                          Person(1, 2, 3, 4))
+        self.assertRaises(TypeError, compile_codec, [('a', 'int32')],
+                          Person, {})
+        self.assertRaises(ValueError, compile_codec, [('a', 'int32')],
+                          Person, PERSON_OPTIONS)
+
+    def test_codec_options(self):
+        self.assertIsInstance(PERSON_CODEC, CompiledCodec)
+        self.assertIs(Person, PERSON_CODEC.document_class)
+        self.assertEqual((('name', 'string'), ('age', 'int32'),
+                          ('born', 'datetime'), ('score', 'double')),
+                         PERSON_CODEC.schema)
+        self.assertIn('CompiledCodec', repr(PERSON_OPTIONS))
+
+    def test_insert_message(self):
+        _, msg, _ = message.insert('db.coll', [self.person], True, False, {},
+                                   False, PERSON_OPTIONS)
+        self.assertTrue(msg.endswith(BSON.encode(self.person_doc)))
+
+
+class TestCompiledCodecCollection(IntegrationTest):
+
+    def test_round_trip(self):
+        db = self.db
+        db.drop_collection('test_compiled')
+        coll = db.get_collection('test_compiled',
+                                 codec_options=ACCOUNT_OPTIONS)
+        accounts = [Account(ObjectId(), i, i % 2 == 0) for i in range(10)]
+        result = coll.insert_many(accounts)
+        self.assertEqual([account._id for account in accounts],
+                         result.inserted_ids)
+        account = Account(ObjectId(), 100, False)
+        self.assertEqual(account._id, coll.insert_one(account).inserted_id)
+
+        found = list(coll.find().sort('balance'))
+        self.assertEqual(accounts + [account], found)
+
+        # Documents of another shape are decoded to dicts.
+        coll.insert_one({'_id': 1, 'balance': 'none'})
+        self.assertEqual({'_id': 1, 'balance': 'none'},
+                         coll.find_one({'_id': 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test OP_COMPRESSED against a fake server."""
+
+import struct
+import sys
+import threading
+import zlib
+
+sys.path[0:0] = [""]
+
+from bson import decode_all
+from bson.codec_options import CodecOptions
+from bson.son import SON
+from pymongo import helpers, message
+from pymongo.client_options import ClientOptions
+from pymongo.compression_support import (CompressionSettings,
+                                         validate_compressors)
+from pymongo.pool import Pool, PoolOptions
+from test import unittest
+from test.fake_server import FakeServer
+
+
+class CompressionServer(FakeServer):
+    """Answer queries, getMores and commands, compressing replies to
+    compressed requests.
+    """
+
+    def __init__(self, compressors):
+        super(CompressionServer, self).__init__()
+        self.compressors = compressors
+        # Whether the request being handled on each connection's thread
+        # was compressed.
+        self.local = threading.local()
+        # (op_code, was_compressed, first document) for each request.
+        self.requests = []
+
+    def receive(self, conn):
+        request_id, op_code, body = super(CompressionServer,
+                                          self).receive(conn)
+        self.local.compressed = op_code == 2012
+        if self.local.compressed:
+            op_code, size, compressor_id = struct.unpack("<iiB", body[:9])
+            assert compressor_id == 2
+            body = zlib.decompress(body[9:])
+            assert len(body) == size
+        return request_id, op_code, body
+
+    def send(self, conn, response_to, op_code, body):
+        if self.local.compressed:
+            data = zlib.compress(body)
+            body = struct.pack("<iiB", op_code, len(body), 2) + data
+            op_code = 2012
+        super(CompressionServer, self).send(conn, response_to, op_code, body)
+
+    def handle(self, op_code, body):
+        if op_code == 2004:
+            # Skip the flags, namespace, skip and limit.
+            start = body.index(b"\x00", 4) + 9
+            doc = decode_all(body[start:])[0]
+            name = next(iter(doc))
+            if name == 'ismaster':
+                reply = {'ok': 1, 'ismaster': True, 'maxWireVersion': 3}
+                if self.compressors:
+                    reply['compression'] = self.compressors
+                docs = [reply]
+            elif name == 'insert':
+                docs = [{'ok': 1, 'n': len(doc['documents'])}]
+            else:
+                docs = [{'_id': i} for i in range(3)]
+        else:
+            assert op_code == 2005
+            doc = None
+            docs = [{'_id': i} for i in range(3, 5)]
+        self.requests.append((op_code, self.local.compressed, doc))
+        return 0, 0, 0, docs
+
+
+class TestCompression(unittest.TestCase):
+
+    def get_socket(self, server_compressors, client_compressors):
+        server = CompressionServer(server_compressors)
+        server.start()
+        self.addCleanup(server.stop)
+        options = PoolOptions(compression_settings=CompressionSettings(
+            client_compressors))
+        pool = Pool(server.address, options)
+        sock_info = pool.connect()
+        self.addCleanup(sock_info.close)
+        return server, sock_info
+
+    def test_round_trip(self):
+        server, sock_info = self.get_socket(['zlib'], ['zlib'])
+        self.assertEqual('zlib', sock_info.compression_context.name)
+
+        request_id, msg, max_doc_size = message.query(
+            0, 'db.coll', 0, 0, {'x': 1}, None, CodecOptions())
+        sock_info.send_message(msg, max_doc_size)
+        reply = helpers._unpack_response(
+            sock_info.receive_message(1, request_id))
+        self.assertEqual([{'_id': i} for i in range(3)], reply['data'])
+
+        request_id, msg = message.get_more('db.coll', 0, 1)
+        sock_info.send_message(msg, 0)
+        reply = helpers._unpack_response(
+            sock_info.receive_message(1, request_id))
+        self.assertEqual([{'_id': 3}, {'_id': 4}], reply['data'])
+
+        docs = [{'_id': i, 's': 'x' * 100} for i in range(10)]
+        results = message._do_batched_write_command(
+            'db.$cmd', message._INSERT,
+            SON([('insert', 'coll'), ('ordered', True)]), docs, True,
+            CodecOptions(), sock_info)
+        self.assertEqual([(0, {'ok': 1, 'n': 10})], results)
+
+        # The handshake is never compressed, everything after it is.
+        self.assertEqual([(2004, False), (2004, True), (2005, True),
+                          (2004, True)],
+                         [(op, compressed)
+                          for op, compressed, _ in server.requests])
+        self.assertEqual(['zlib'], server.requests[0][2]['compression'])
+        self.assertEqual(docs, server.requests[3][2]['documents'])
+
+    def test_command(self):
+        server, sock_info = self.get_socket(['zlib'], ['zlib'])
+        self.assertEqual({'_id': 0},
+                         sock_info.command('db', {'count': 1}, check=False))
+        sock_info.command('admin', {'saslStart': 1}, check=False)
+        self.assertEqual([False, True, False],
+                         [compressed for _, compressed, _ in server.requests])
+
+    def test_not_negotiated(self):
+        server, sock_info = self.get_socket([], ['zlib'])
+        self.assertIsNone(sock_info.compression_context)
+        request_id, msg, max_doc_size = message.query(
+            0, 'db.coll', 0, 0, {'x': 1}, None, CodecOptions())
+        sock_info.send_message(msg, max_doc_size)
+        sock_info.receive_message(1, request_id)
+        self.assertEqual([False, False],
+                         [compressed for _, compressed, _ in server.requests])
+
+    def test_not_requested(self):
+        server, sock_info = self.get_socket(['zlib'], [])
+        self.assertIsNone(sock_info.compression_context)
+        self.assertNotIn('compression', server.requests[0][2])
+
+    def test_options(self):
+        self.assertEqual(['zlib'], validate_compressors('c', 'zlib, zlib'))
+        self.assertEqual(['zlib'], validate_compressors('c', ['zlib']))
+        self.assertRaises(TypeError, validate_compressors, 'c', 1)
+        opts = ClientOptions(None, None, None, {
+            'compressors': 'zlib', 'zlibCompressionLevel': '9'})
+        settings = opts.pool_options.compression_settings
+        self.assertEqual(['zlib'], settings.compressors)
+        self.assertEqual(9, settings.zlib_compression_level)
+        self.assertRaises(ValueError, ClientOptions, None, None, None,
+                          {'zlibCompressionLevel': 10})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,6 +17,7 @@ import copy
 import itertools
 import random
 import re
+import struct
 import sys
 
 sys.path[0:0] = [""]
@@ -64,6 +65,15 @@ class TestCursorNoConnect(unittest.TestCase):
         cursor2 = copy.deepcopy(cursor)
         self.assertEqual(cursor._Cursor__spec, cursor2._Cursor__spec)
 
+    def test_decode_fields_validation(self):
+        cursor = self.db.test.find()
+        self.assertRaises(TypeError, cursor.decode_fields, 'a')
+        self.assertRaises(TypeError, cursor.decode_fields, ['a', 1])
+        cursor.decode_fields(('a', 'b.c'))
+        self.assertEqual(['a', 'b.c'], cursor._Cursor__decode_fields)
+        self.assertEqual(['a', 'b.c'],
+                         cursor.clone()._Cursor__decode_fields)
+
     def test_add_remove_option(self):
         cursor = self.db.test.find()
         self.assertEqual(0, cursor._Cursor__query_flags)
@@ -940,6 +950,64 @@ class TestCursor(IntegrationTest):
         db.test.insert_many([{'i': i} for i in range(10)])
         self.assertEqual(10, len(list(db.test.find().batch_size(5))))
 
+    def test_decode_fields(self):
+        db = self.db
+        db.drop_collection("test")
+        db.test.insert_many([{'_id': i, 'a': i, 'b': {'c': i, 'd': i}}
+                             for i in range(5)])
+        self.assertEqual(
+            [{'a': i, 'b': {'c': i}} for i in range(5)],
+            list(db.test.find().sort('_id').batch_size(2).decode_fields(
+                ['a', 'b.c'])))
+        cursor = db.test.find().decode_fields(['a'])
+        next(cursor)
+        self.assertRaises(InvalidOperation, cursor.decode_fields, None)
+
+    def test_to_columns(self):
+        db = self.db
+        db.drop_collection("test")
+        db.test.insert_many([{'_id': i, 'x': float(i)} for i in range(10)])
+        columns = db.test.find().sort('_id').batch_size(3).to_columns(
+            {'x': 'double', 'y': 'int32'})
+        values, mask = columns['x']
+        self.assertEqual([float(i) for i in range(10)],
+                         list(struct.unpack('<10d', bytes(values))))
+        self.assertEqual(bytearray(b'\x01' * 10), mask)
+        self.assertEqual(bytearray(10), columns['y'][1])
+
+    def test_iter_batches(self):
+        db = self.db
+        db.drop_collection("test")
+        db.test.insert_many([{'i': i} for i in range(10)])
+
+        cursor = db.test.find({}, {'_id': False}).batch_size(4)
+        batches = list(cursor.iter_batches())
+        self.assertEqual([4, 4, 2], [len(batch) for batch in batches])
+        self.assertEqual([{'i': i} for i in range(10)],
+                         list(itertools.chain(*batches)))
+        self.assertFalse(cursor.alive)
+
+        # The rest of a partially iterated batch comes first.
+        cursor = db.test.find({}, {'_id': False}).batch_size(4)
+        self.assertEqual({'i': 0}, next(cursor))
+        self.assertEqual([3, 4, 2],
+                         [len(batch) for batch in cursor.iter_batches()])
+        self.assertEqual([], list(db.test.find().limit(-1).iter_batches())[1:])
+
+    @client_context.require_version_min(2, 5, 1)
+    def test_iter_batches_command_cursor(self):
+        db = self.db
+        db.drop_collection("test")
+        db.test.insert_many([{'i': i} for i in range(10)])
+
+        cursor = db.test.aggregate([{'$project': {'_id': False, 'i': True}}],
+                                   batchSize=4)
+        batches = list(cursor.iter_batches())
+        self.assertEqual(4, len(batches[0]))
+        self.assertEqual([{'i': i} for i in range(10)],
+                         sorted(itertools.chain(*batches),
+                                key=lambda doc: doc['i']))
+
     def test_tailable(self):
         db = self.db
         db.drop_collection("test")
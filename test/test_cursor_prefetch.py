@@ -0,0 +1,172 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test prefetching cursors against a fake server."""
+
+import struct
+import sys
+import time
+
+sys.path[0:0] = [""]
+
+from bson import decode_all
+from pymongo import MongoClient
+from pymongo.cursor import CursorType
+from pymongo.errors import InvalidOperation, OperationFailure
+from test import unittest
+from test.fake_server import FakeServer
+
+
+class BatchServer(FakeServer):
+    """A standalone returning `num_docs` documents in batches of 2 for any
+    query on "db.coll".
+    """
+
+    def __init__(self, num_docs):
+        super(BatchServer, self).__init__()
+        self.num_docs = num_docs
+        self.get_mores = 0
+        self.fail_get_more = False
+        # Map cursor ids to the position of the next batch.
+        self.cursors = {}
+        self.next_cursor_id = 1
+
+    def handle(self, op_code, body):
+        if op_code == 2007:
+            # OP_KILL_CURSORS.
+            raise EOFError()
+        if op_code == 2005:
+            self.get_mores += 1
+            if self.fail_get_more:
+                return 2, 0, 0, [{'$err': 'failed', 'code': 2}]
+            ns_end = body.index(b"\x00", 4)
+            ntoreturn, cursor_id = struct.unpack("<iq",
+                                                 body[ns_end + 1:ns_end + 13])
+            start = self.cursors.pop(cursor_id)
+            end = min(start + 2, self.num_docs)
+            if ntoreturn:
+                end = min(end, start + ntoreturn)
+            return self.batch(start, end)
+
+        ns_end = body.index(b"\x00", 4)
+        ns = body[4:ns_end].decode()
+        spec = decode_all(body[ns_end + 9:])[0]
+        if ns == 'db.coll':
+            return self.batch(0, min(2, self.num_docs))
+        if next(iter(spec)) == 'ismaster':
+            return 0, 0, 0, [{'ok': 1, 'ismaster': True, 'maxWireVersion': 3}]
+        return 0, 0, 0, [{'ok': 1}]
+
+    def batch(self, start, end):
+        cursor_id = 0
+        if end < self.num_docs:
+            cursor_id = self.next_cursor_id
+            self.next_cursor_id += 1
+            self.cursors[cursor_id] = end
+        return 0, cursor_id, start, [{'_id': i} for i in range(start, end)]
+
+
+class TestCursorPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BatchServer(11)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = MongoClient('%s:%d' % self.server.address)
+        self.addCleanup(self.client.close)
+        self.collection = self.client.db.coll
+
+    def wait_for_get_mores(self, count):
+        start = time.time()
+        while self.server.get_mores < count and time.time() - start < 10:
+            time.sleep(0.01)
+        # Give an over-eager prefetcher time to send one more.
+        time.sleep(0.1)
+
+    def test_prefetch(self):
+        cursor = self.collection.find(prefetch=True)
+        self.assertEqual([{'_id': i} for i in range(11)], list(cursor))
+        self.assertFalse(cursor.alive)
+        self.assertEqual(5, self.server.get_mores)
+
+    def test_iter_batches(self):
+        cursor = self.collection.find(prefetch=True)
+        self.assertEqual([2, 2, 2, 2, 2, 1],
+                         [len(batch) for batch in cursor.iter_batches()])
+
+    def test_to_columns(self):
+        for prefetch in (False, True):
+            cursor = self.collection.find(prefetch=prefetch)
+            values, mask = cursor.to_columns({'_id': 'int64'})['_id']
+            self.assertEqual(list(range(11)),
+                             list(struct.unpack('<11q', bytes(values))))
+            self.assertEqual(bytearray(b'\x01' * 11), mask)
+            self.assertFalse(cursor.alive)
+
+        cursor = self.collection.find(limit=3)
+        values, mask = cursor.to_columns({'_id': 'int32'})['_id']
+        self.assertEqual(3, len(mask))
+
+        cursor = self.collection.find()
+        next(cursor)
+        self.assertRaises(InvalidOperation, cursor.to_columns,
+                          {'_id': 'int32'})
+
+    def test_limit(self):
+        cursor = self.collection.find(prefetch=True, limit=5)
+        self.assertEqual([{'_id': i} for i in range(5)], list(cursor))
+        self.assertEqual(2, self.server.get_mores)
+
+    def test_max_prefetch_batches(self):
+        cursor = self.collection.find(prefetch=True, max_prefetch_batches=2)
+        self.assertEqual({'_id': 0}, next(cursor))
+        # The first batch is being consumed, two more are buffered.
+        self.wait_for_get_mores(2)
+        self.assertEqual(2, self.server.get_mores)
+
+        # Taking a buffered batch makes room for one more.
+        for i in range(1, 3):
+            self.assertEqual({'_id': i}, next(cursor))
+        self.wait_for_get_mores(3)
+        self.assertEqual(3, self.server.get_mores)
+        cursor.close()
+
+    def test_error(self):
+        self.server.fail_get_more = True
+        cursor = self.collection.find(prefetch=True)
+        self.assertEqual({'_id': 0}, next(cursor))
+        self.assertEqual({'_id': 1}, next(cursor))
+        self.assertRaises(OperationFailure, next, cursor)
+        self.assertFalse(cursor.alive)
+
+    def test_rewind_and_clone(self):
+        cursor = self.collection.find(prefetch=True, max_prefetch_batches=1)
+        self.assertEqual({'_id': 0}, next(cursor))
+        cursor.rewind()
+        self.assertEqual(11, len(list(cursor)))
+        self.assertEqual(11, len(list(cursor.clone())))
+
+    def test_options(self):
+        find = self.collection.find
+        self.assertRaises(TypeError, find, prefetch=1)
+        self.assertRaises(TypeError, find, max_prefetch_batches='1')
+        self.assertRaises(ValueError, find, max_prefetch_batches=0)
+        self.assertRaises(InvalidOperation, find, prefetch=True,
+                          cursor_type=CursorType.TAILABLE)
+        self.assertRaises(InvalidOperation, find, prefetch=True,
+                          cursor_type=CursorType.EXHAUST)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -124,6 +124,17 @@ class TestDBRef(unittest.TestCase):
             dbr2 = pickle.loads(pkl)
             self.assertEqual(dbr, dbr2)
 
+        # Pickled before DBRef defined __slots__.
+        pickled_with_dict = (
+            b"ccopy_reg\n_reconstructor\np0\n(cbson.dbref\nDBRef\np1\n"
+            b"c__builtin__\nobject\np2\nNtp3\nRp4\n(dp5\n"
+            b"S'_DBRef__kwargs'\np6\n(dp7\nS'foo'\np8\nI2\nss"
+            b"S'_DBRef__collection'\np9\nS'c'\np10\n"
+            b"sS'_DBRef__database'\np11\nS'db'\np12\n"
+            b"sS'_DBRef__id'\np13\nI1\nsb.")
+        self.assertEqual(DBRef('c', 1, 'db', foo=2),
+                         pickle.loads(pickled_with_dict))
+
     def test_dbref_hash(self):
         dbref_1a = DBRef('collection', 'id', 'database')
         dbref_1b = DBRef('collection', 'id', 'database')
@@ -15,6 +15,7 @@
 """Test some utilities for working with JSON and PyMongo."""
 
 import datetime
+import io
 import json
 import re
 import sys
@@ -31,6 +32,7 @@ from bson.max_key import MaxKey
 from bson.min_key import MinKey
 from bson.objectid import ObjectId
 from bson.regex import Regex
+from bson.son import SON
 from bson.timestamp import Timestamp
 from bson.tz_util import utc
 
@@ -216,6 +218,96 @@ class TestJsonUtil(unittest.TestCase):
         self.assertEqual(json_util.loads(json)['weight'],
                          Int64(65535))
 
+    def test_dumps_single_pass(self):
+        oid = ObjectId("509b8db456c02c5ab7e63c34")
+        docs = [
+            {}, [], None, True, 1.5, float("nan"), float("-inf"), 2 ** 70,
+            json.loads(r'"\u00e9\ud83d\ude00\ud800\n\t\"\\\u0001\u007f"'),
+            SON([("z", 1), ("a", [1, (2, 3), {}, SON([("b", None)])])]),
+            {"oid": oid, "ref": DBRef("coll", oid, "db", extra=1)},
+            {"dt": datetime.datetime(2009, 12, 9, 15, 1, 2, 191000)},
+            {"dt": datetime.datetime(1901, 1, 1, 0, 0, 0, 999)},
+            {"dt": datetime.datetime(2009, 12, 9, 15, 1, 2, 191000, utc)},
+            [re.compile("^a", re.I | re.M), Regex(b"b", "sx")],
+            [MinKey(), MaxKey(), Timestamp(4, 13), Int64(-2 ** 62)],
+            [Binary(b"\x00\x01\xff"), Binary(b"abcd", USER_DEFINED_SUBTYPE)],
+            [uuid.UUID(int=255), Code("return z", {"z": Code("1")})],
+            # Left to json.dumps.
+            {1: oid, "a": 2}, {None: 1.5},
+        ]
+        if PY3:
+            docs.append([b"bytes", bytearray(b"bytes")])
+        for doc in docs:
+            # With extra arguments dumps converts doc to SON for json.dumps.
+            self.assertEqual(json_util.dumps(doc, sort_keys=False),
+                             json_util.dumps(doc))
+        self.assertEqual('[1, {"$oid": "509b8db456c02c5ab7e63c34"}]',
+                         json_util.dumps(value for value in [1, oid]))
+        self.assertRaises(TypeError, json_util.dumps, {"a": object()})
+        self.assertRaises(TypeError, json_util.dumps, {(1, 2): 1})
+
+    def test_object_hook(self):
+        oid = ObjectId("509b8db456c02c5ab7e63c34")
+        self.assertEqual(
+            {"a": 1, "$id": 2},
+            json_util.loads('{"a": 1, "$id": 2}'))
+        self.assertEqual(
+            oid, json_util.loads('{"$oid": "%s", "$ref": "coll"}' % (oid,)))
+        self.assertEqual(
+            Binary(b"\x01", 5),
+            json_util.loads('{"$type": "05", "$binary": "AQ=="}'))
+        self.assertEqual(
+            Regex("a", re.I),
+            json_util.loads('{"$options": "i", "$regex": "a"}'))
+        # Wider documents than the table of keys are checked key by key.
+        doc = dict(("key%d" % (i,), i) for i in range(20))
+        self.assertEqual(doc, json_util.loads(json.dumps(doc)))
+        doc["$oid"] = str(oid)
+        self.assertEqual(oid, json_util.loads(json.dumps(doc)))
+        self.assertEqual(oid, json_util.object_hook({"$oid": str(oid)}))
+
+    def test_dump_cursor(self):
+        docs = [{"_id": ObjectId("509b8db456c02c5ab7e63c34"), "x": 1},
+                {"a": [1, 2], "b": json.loads('"\\u00e9"')},
+                {"d": datetime.datetime(2015, 1, 1, tzinfo=utc)}]
+        text = "".join(json_util.dumps(doc) + "\n" for doc in docs)
+
+        fileobj = io.StringIO()
+        self.assertEqual(3, json_util.dump_cursor(iter(docs), fileobj))
+        self.assertEqual(text, fileobj.getvalue())
+        fileobj = io.BytesIO()
+        self.assertEqual(3, json_util.dump_cursor(iter(docs), fileobj))
+        self.assertEqual(text.encode("ascii"), fileobj.getvalue())
+        fileobj = io.StringIO()
+        self.assertEqual(0, json_util.dump_cursor([], fileobj))
+        self.assertEqual("", fileobj.getvalue())
+
+    def test_jsonl_batches(self):
+        docs = [{"_id": i, "s": "x" * i} for i in range(50)]
+        lines = [json_util.dumps(doc) + "\n" for doc in docs]
+        lines.insert(10, "\n")
+        for workers in (0, 1, 4):
+            batches = list(json_util._jsonl_batches(
+                iter(lines), 200, workers))
+            self.assertTrue(len(batches) > 1)
+            self.assertEqual(docs, sum(batches, []))
+            for batch in batches[:-1]:
+                self.assertTrue(
+                    sum(len(json_util.dumps(doc)) + 1 for doc in batch) >= 200)
+
+        data = io.BytesIO("".join(lines).encode("ascii"))
+        self.assertEqual(
+            docs, sum(json_util._jsonl_batches(data, 1000), []))
+
+        lines[20] = "{bad\n"
+        for workers in (0, 2):
+            try:
+                list(json_util._jsonl_batches(iter(lines), 200, workers))
+            except ValueError as exc:
+                self.assertTrue(str(exc).startswith("line 21: "))
+            else:
+                self.fail("ValueError not raised")
+
 
 class TestJsonUtilRoundtrip(IntegrationTest):
     def test_cursor(self):
@@ -236,5 +328,6 @@ class TestJsonUtilRoundtrip(IntegrationTest):
         for doc in docs:
             self.assertTrue(doc in reloaded_docs)
 
+
 if __name__ == "__main__":
     unittest.main()
@@ -243,6 +243,13 @@ class TestLegacy(IntegrationTest):
                            itertools.repeat(None, 10)))
         self.assertEqual(db.test.find().count(), 10)
 
+        # _ids for documents from an iterator are generated in blocks.
+        docs = [{"x": i} for i in range(150)]
+        ids = db.test.insert(iter(docs))
+        self.assertEqual([doc["_id"] for doc in docs], ids)
+        self.assertEqual(sorted(ids), ids)
+        self.assertEqual(150, len(set(ids)))
+
     def test_insert_manipulate_false(self):
         # Test three aspects of legacy insert with manipulate=False:
         #   1. The return value is None or [None] as appropriate.
@@ -0,0 +1,269 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the message module."""
+
+import array
+import datetime
+import struct
+import sys
+
+sys.path[0:0] = [""]
+
+import bson
+from bson import BSON, decode_all
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidDocument
+from bson.objectid import ObjectId
+from bson.son import SON
+from pymongo import message
+from pymongo.errors import DocumentTooLarge
+from test import SkipTest, unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FakeSocketInfo(object):
+    """Record the write command messages sent by the message module."""
+
+    def __init__(self, max_bson_size=16 * 1024 * 1024,
+                 max_write_batch_size=1000, max_message_size=48000000):
+        self.max_bson_size = max_bson_size
+        self.max_write_batch_size = max_write_batch_size
+        self.max_message_size = max_message_size
+        self.messages = []
+        self.inserts = []
+
+    def write_command(self, request_id, msg):
+        msg = bytes(bytearray(msg))
+        length, sent_request_id, _, op_code = struct.unpack("<iiii", msg[:16])
+        self.messages.append(msg)
+        assert length == len(msg)
+        assert sent_request_id == request_id
+        assert op_code == 2004
+        return {'ok': 1}
+
+    def legacy_write(self, request_id, msg, max_doc_size, with_last_error):
+        msg = bytes(bytearray(msg))
+        length, _, _, op_code = struct.unpack("<iiii", msg[:16])
+        self.inserts.append(msg[:length])
+        assert op_code == 2002
+        if with_last_error:
+            assert len(msg) > length
+        return None
+
+    def inserted(self):
+        """Decode the documents of each OP_INSERT message."""
+        inserted = []
+        for msg in self.inserts:
+            # Skip the header, flags and collection name.
+            start = msg.index(b"\x00", 20) + 1
+            inserted.append(decode_all(msg[start:]))
+        return inserted
+
+    def commands(self):
+        """Decode the command document of each message."""
+        commands = []
+        for msg in self.messages:
+            # Skip the header, flags, namespace, skip and limit.
+            start = msg.index(b"\x00", 20) + 9
+            commands.append(decode_all(msg[start:])[0])
+        return commands
+
+
+class TestMessage(unittest.TestCase):
+
+    def test_batched_write_command(self):
+        docs = [{'_id': i, 's': 'x' * 100} for i in range(10)]
+        sock_info = FakeSocketInfo()
+        command = SON([('insert', 'coll'), ('ordered', True)])
+        results = message._do_batched_write_command(
+            'db.$cmd', message._INSERT, command, docs, True,
+            CodecOptions(), sock_info)
+        self.assertEqual([(0, {'ok': 1})], results)
+        self.assertEqual([SON([('insert', 'coll'), ('ordered', True),
+                               ('documents', docs)])],
+                         sock_info.commands())
+
+    def test_batched_write_command_splits(self):
+        docs = [{'_id': i} for i in range(7)]
+        sock_info = FakeSocketInfo(max_write_batch_size=3)
+        command = SON([('delete', 'coll'), ('ordered', False)])
+        results = message._do_batched_write_command(
+            'db.$cmd', message._DELETE, command, docs, False,
+            CodecOptions(), sock_info)
+        self.assertEqual([0, 3, 6], [offset for offset, _ in results])
+        self.assertEqual([docs[:3], docs[3:6], docs[6:]],
+                         [cmd['deletes'] for cmd in sock_info.commands()])
+
+    def test_batched_write_command_too_large(self):
+        sock_info = FakeSocketInfo(max_bson_size=100)
+        command = SON([('insert', 'coll'), ('ordered', True)])
+        self.assertRaises(DocumentTooLarge,
+                          message._do_batched_write_command,
+                          'db.$cmd', message._INSERT, command,
+                          [{'s': 'x' * 20000}], False, CodecOptions(),
+                          sock_info)
+        self.assertEqual([], sock_info.messages)
+
+    def test_buffer_arena(self):
+        if not message._use_c:
+            raise SkipTest("C extension not available")
+        from pymongo import _cmessage
+        docs = [{'_id': i} for i in range(10)]
+        command = SON([('insert', 'coll'), ('ordered', True)])
+        before = _cmessage._buffer_stats()
+        for _ in range(10):
+            message._do_batched_write_command(
+                'db.$cmd', message._INSERT, command, docs, False,
+                CodecOptions(), FakeSocketInfo(max_write_batch_size=3))
+        after = _cmessage._buffer_stats()
+        self.assertTrue(after['hits'] - before['hits'] >= 9)
+        self.assertTrue(after['misses'] - before['misses'] <= 1)
+
+    def test_batched_insert(self):
+        docs = [{'_id': i, 's': 'x' * 100} for i in range(10)]
+        for safe in (True, False):
+            # Room for three documents per message.
+            sock_info = FakeSocketInfo(max_message_size=400)
+            message._do_batched_insert('db.coll', docs, True, safe, {},
+                                       not safe, CodecOptions(), sock_info)
+            self.assertEqual([docs[:3], docs[3:6], docs[6:9], docs[9:]],
+                             sock_info.inserted())
+
+        sock_info = FakeSocketInfo(max_bson_size=100)
+        self.assertRaises(DocumentTooLarge, message._do_batched_insert,
+                          'db.coll', [{'s': 'x' * 200}], False, True, {},
+                          False, CodecOptions(), sock_info)
+        self.assertEqual([], sock_info.inserts)
+
+    def test_batched_insert_columns(self):
+        columns = SON([('i', array.array('i', [1, 2, 3, 4, 5])),
+                       ('d', array.array('d', [0.5, 1, 2, 3, 4])),
+                       ('b', (bytearray(b'\x00\x02\x01\x00\x01'),
+                              bytearray(b'\x01\x01\x01\x00\x01'))),
+                       ('t', (bytearray(struct.pack('<5q', *range(5))),
+                              bytearray(b'\x00\x01\x00\x00\x00')))])
+        schema = {'b': 'bool', 't': 'datetime64'}
+        if sys.version_info[0] == 2:
+            # Python 2's array.array doesn't support the new buffer protocol.
+            columns['i'] = bytearray(columns['i'].tostring())
+            columns['d'] = bytearray(columns['d'].tostring())
+            schema.update({'i': 'int32', 'd': 'double'})
+        specs, rows, ids = bson._column_specs(columns, schema)
+        self.assertEqual(5, rows)
+        self.assertEqual(60, len(ids))
+        self.assertEqual(b'_id', specs[0][0])
+
+        sock_info = FakeSocketInfo(max_write_batch_size=2)
+        command = SON([('insert', 'coll'), ('ordered', True)])
+        results = message._do_batched_insert_columns(
+            'db.$cmd', command, specs, rows, CodecOptions(), sock_info)
+        self.assertEqual([0, 2, 4], [offset for offset, _ in results])
+        docs = sum([cmd['documents'] for cmd in sock_info.commands()], [])
+        # The pure Python encoder gives the same documents.
+        self.assertEqual(docs, [BSON(doc).decode() for doc in
+                                bson._encode_column_rows(specs, rows)])
+        self.assertEqual(
+            [ObjectId(bytes(ids[i * 12:(i + 1) * 12])) for i in range(5)],
+            [doc.pop('_id') for doc in docs])
+        self.assertEqual([
+            {'i': 1, 'd': 0.5, 'b': False},
+            {'i': 2, 'd': 1.0, 'b': True,
+             't': datetime.datetime(1970, 1, 1, 0, 0, 0, 1000)},
+            {'i': 3, 'd': 2.0, 'b': True},
+            {'i': 4, 'd': 3.0},
+            {'i': 5, 'd': 4.0, 'b': True}], docs)
+
+    def test_column_specs(self):
+        ids = bytearray(b'x' * 24)
+        specs, rows, result_ids = bson._column_specs(
+            SON([('v', bytearray(2)), ('_id', ids)]),
+            {'v': 'bool', '_id': 'objectid'})
+        self.assertEqual(2, rows)
+        self.assertIs(ids, result_ids)
+        self.assertEqual([b'_id', b'v'], [spec[0] for spec in specs])
+
+        new_ids = bson._object_ids(3)
+        self.assertEqual(36, len(new_ids))
+        self.assertEqual(3, len(set(bytes(new_ids[i:i + 12])
+                                    for i in range(0, 36, 12))))
+
+        _column_specs = bson._column_specs
+        self.assertRaises(TypeError, _column_specs, {})
+        self.assertRaises(TypeError, _column_specs, {'a': [1, 2]})
+        self.assertRaises(TypeError, _column_specs, {'a': bytearray(4)})
+        self.assertRaises(ValueError, _column_specs, {'a': bytearray(4)},
+                          {'a': 'int16'})
+        self.assertRaises(ValueError, _column_specs, {'a': bytearray(6)},
+                          {'a': 'int32'})
+        self.assertRaises(ValueError, _column_specs,
+                          {'a': bytearray(4), 'b': bytearray(8)},
+                          {'a': 'int32', 'b': 'int32'})
+        self.assertRaises(ValueError, _column_specs,
+                          {'a': (bytearray(4), bytearray(2))},
+                          {'a': 'int32'})
+        self.assertRaises(ValueError, _column_specs, {'a': bytearray()},
+                          {'a': 'int32'})
+        self.assertRaises(InvalidDocument, _column_specs,
+                          {'$a': bytearray(4)}, {'$a': 'int32'})
+        self.assertRaises(InvalidDocument, _column_specs,
+                          {'a.b': bytearray(4)}, {'a.b': 'int32'})
+
+    def test_column_specs_typed_buffers(self):
+        if sys.version_info[0] == 2:
+            raise SkipTest("Python 2's array.array doesn't support the new "
+                           "buffer protocol")
+        _column_specs = bson._column_specs
+        doubles = array.array('d', [1.5, 2.5])
+        self.assertEqual(2, _column_specs({'a': doubles}, {'a': 'double'})[1])
+        # Values are copied as they are, a typed buffer can't be read as
+        # another column type of the same width.
+        for column_type in ('int64', 'datetime64'):
+            self.assertRaises(ValueError, _column_specs, {'a': doubles},
+                              {'a': column_type})
+        self.assertRaises(ValueError, _column_specs,
+                          {'a': array.array('q', [1, 2])}, {'a': 'double'})
+        self.assertRaises(ValueError, _column_specs,
+                          {'a': array.array('I', [1, 2])}, {'a': 'int32'})
+        self.assertRaises(ValueError, _column_specs,
+                          {'a': array.array('h', [1, 2])}, {'a': 'int32'})
+        # Buffers of bytes can still hold any column type.
+        data = bytearray(doubles.tobytes())
+        self.assertEqual(2, _column_specs({'a': data}, {'a': 'int64'})[1])
+
+    def test_column_specs_byte_order(self):
+        if numpy is None:
+            raise SkipTest("numpy is not installed")
+        _column_specs = bson._column_specs
+        for dtype in ('>i8', '>f8'):
+            values = numpy.array([1, 2], dtype=dtype)
+            self.assertRaises(ValueError, _column_specs, {'a': values},
+                              {'a': 'int64'})
+            self.assertRaises(ValueError, _column_specs, {'a': values},
+                              {'a': 'double'})
+        self.assertRaises(ValueError, _column_specs,
+                          {'a': numpy.array([1.5, 2.5])}, {'a': 'int64'})
+        specs, rows, _ = _column_specs(
+            {'a': numpy.array([1, 2], dtype='<i8')}, {'a': 'int64'})
+        self.assertEqual([{'a': 1}, {'a': 2}],
+                         [BSON(doc).decode() for doc in
+                          bson._encode_column_rows(specs[1:], rows)])
+
+
+if __name__ == "__main__":
+    unittest.main()
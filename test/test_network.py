@@ -0,0 +1,70 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the network module."""
+
+import struct
+import sys
+
+sys.path[0:0] = [""]
+
+from bson import BSON
+from pymongo import helpers
+from pymongo.errors import AutoReconnect
+from pymongo.network import receive_message
+from test import unittest
+
+
+class FakeSocket(object):
+    """Return at most `chunk_size` bytes of `data` per receive call."""
+
+    def __init__(self, data, chunk_size=7):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def recv(self, length):
+        chunk = self.data[:min(length, self.chunk_size)]
+        self.data = self.data[len(chunk):]
+        return chunk
+
+    def recv_into(self, buf, length):
+        chunk = self.recv(length)
+        buf[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def _reply(request_id, docs):
+    body = struct.pack("<iqii", 0, 0, 0, len(docs))
+    body += b"".join(BSON.encode(doc) for doc in docs)
+    header = struct.pack("<iiii", 16 + len(body), 0, request_id, 1)
+    return header + body
+
+
+class TestNetwork(unittest.TestCase):
+
+    def test_receive_message(self):
+        docs = [{'a': i, 's': 'x' * i} for i in range(50)]
+        sock = FakeSocket(_reply(42, docs))
+        response = receive_message(sock, 1, 42)
+        self.assertIsInstance(response, bytearray)
+        self.assertEqual(docs, helpers._unpack_response(response)['data'])
+
+    def test_receive_message_connection_closed(self):
+        data = _reply(42, [{'a': 1}])
+        sock = FakeSocket(data[:-3])
+        self.assertRaises(AutoReconnect, receive_message, sock, 1, 42)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -100,6 +100,28 @@ class TestObjectId(unittest.TestCase):
         d2 = d2.replace(tzinfo=None)
         self.assertTrue(d2 - d1 < datetime.timedelta(seconds=2))
 
+    def test_generate_many(self):
+        before = ObjectId()
+        oids = ObjectId.generate_many(100)
+        self.assertEqual(100, len(oids))
+        self.assertEqual(100, len(set(oids)))
+        for oid in oids:
+            self.assertIsInstance(oid, ObjectId)
+            self.assertEqual(oid, ObjectId(oid.binary))
+            self.assertTrue(oid_generated_on_client(oid))
+        # The counter keeps increasing.
+        self.assertEqual(sorted(oids), oids)
+        self.assertLess(before, oids[0])
+        self.assertLess(oids[-1], ObjectId())
+        self.assertEqual([], ObjectId.generate_many(0))
+
+        class MyObjectId(ObjectId):
+            pass
+        self.assertIsInstance(MyObjectId.generate_many(1)[0], MyObjectId)
+
+        self.assertRaises(TypeError, ObjectId.generate_many, 1.5)
+        self.assertRaises(ValueError, ObjectId.generate_many, -1)
+
     def test_from_datetime(self):
         if 'PyPy 1.8.0' in sys.version:
             # See https://bugs.pypy.org/issue1092
@@ -0,0 +1,161 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the raw_bson module."""
+
+import datetime
+import sys
+
+sys.path[0:0] = [""]
+
+from bson import BSON, decode_all, decode_iter
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidBSON
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument, DEFAULT_RAW_BSON_OPTIONS
+from bson.son import SON
+from bson.tz_util import utc
+from pymongo import message
+from test import unittest, IntegrationTest
+
+
+class TestRawBSONDocument(unittest.TestCase):
+
+    document = SON([('_id', ObjectId('556df68b6e32ab21a95e0785')),
+                    ('name', 'Sherlock'),
+                    ('address', SON([('street', 'Baker Street'),
+                                     ('number', 221)])),
+                    ('cases', [1, {'solved': True}]),
+                    ('born', datetime.datetime(1854, 1, 6))])
+    bson_bytes = BSON.encode(document)
+
+    def test_decode(self):
+        docs = decode_all(self.bson_bytes * 2, DEFAULT_RAW_BSON_OPTIONS)
+        self.assertEqual(2, len(docs))
+        raw = docs[0]
+        self.assertIsInstance(raw, RawBSONDocument)
+        self.assertEqual(self.bson_bytes, raw.raw)
+        self.assertEqual(['_id', 'name', 'address', 'cases', 'born'],
+                         list(raw))
+        self.assertEqual(5, len(raw))
+        self.assertIn('name', raw)
+        self.assertNotIn('missing', raw)
+        self.assertRaises(KeyError, lambda: raw['missing'])
+
+        self.assertEqual('Sherlock', raw['name'])
+        self.assertEqual(datetime.datetime(1854, 1, 6), raw['born'])
+        address = raw['address']
+        self.assertIsInstance(address, RawBSONDocument)
+        self.assertEqual(221, address['number'])
+        self.assertIsInstance(raw['cases'][1], RawBSONDocument)
+        self.assertEqual(True, raw['cases'][1]['solved'])
+
+        self.assertEqual(raw, BSON(self.bson_bytes).decode(
+            DEFAULT_RAW_BSON_OPTIONS))
+        self.assertEqual(raw, next(decode_iter(self.bson_bytes,
+                                               DEFAULT_RAW_BSON_OPTIONS)))
+
+    def test_lazy(self):
+        raw = RawBSONDocument(self.bson_bytes)
+        cache = raw._RawBSONDocument__cache
+        self.assertIsNone(raw._RawBSONDocument__index)
+        self.assertEqual('Sherlock', raw['name'])
+        self.assertEqual(['name'], list(cache))
+        self.assertIs(raw['address'], raw['address'])
+        self.assertEqual(set(['name', 'address']), set(cache))
+
+    def test_codec_options(self):
+        options = CodecOptions(document_class=RawBSONDocument, tz_aware=True)
+        raw = decode_all(self.bson_bytes, options)[0]
+        self.assertEqual(options, raw.codec_options)
+        self.assertEqual(utc, raw['born'].tzinfo)
+        self.assertEqual(options, raw['address'].codec_options)
+
+        # Embedded documents follow codec_options.document_class.
+        raw = RawBSONDocument(self.bson_bytes, CodecOptions(dict))
+        self.assertEqual({'street': 'Baker Street', 'number': 221},
+                         raw['address'])
+        self.assertIsInstance(raw['address'], dict)
+
+        self.assertRaises(TypeError, RawBSONDocument, bytearray(b'x'))
+        self.assertRaises(TypeError, RawBSONDocument, self.bson_bytes, {})
+
+    def test_encode(self):
+        raw = RawBSONDocument(self.bson_bytes)
+        self.assertEqual(self.bson_bytes, BSON.encode(raw))
+        self.assertEqual(BSON.encode({'doc': self.document}),
+                         BSON.encode({'doc': raw}))
+        self.assertEqual(BSON.encode({'docs': [self.document]}),
+                         BSON.encode({'docs': [raw]}))
+        # check_keys is not applied to raw documents.
+        raw = RawBSONDocument(BSON.encode({'$bad.key': 1}))
+        self.assertEqual(raw.raw, BSON.encode(raw, check_keys=True))
+
+    def test_insert_message(self):
+        raw = RawBSONDocument(self.bson_bytes)
+        _, msg, _ = message.insert('db.coll', [raw], True, False, {},
+                                   False, CodecOptions())
+        self.assertTrue(msg.endswith(self.bson_bytes))
+
+    def test_invalid(self):
+        data = BSON.encode({'a': 'x'})
+        for bad in (data[:-1] + b'\x01', data[:-1],
+                    b'\x06\x00\x00\x00\x10\x00'):
+            self.assertRaises(InvalidBSON, list, RawBSONDocument(bad))
+        # Lengths that are too small or run past the end of the document.
+        for bad in (b'\x10\x00\x00\x00\x02a\x00\xf9\xff\xff\xffxxx\x00\x00',
+                    b'\x10\x00\x00\x00\x02a\x00\x00\x00\x00\x00xxx\x00\x00',
+                    b'\x10\x00\x00\x00\x02a\x00\x05\x00\x00\x00xxx\x00\x00',
+                    b'\x0c\x00\x00\x00\x03a\x00\x04\x00\x00\x00\x00',
+                    b'\x0c\x00\x00\x00\x05a\x00\xff\xff\xff\xff\x00'):
+            self.assertRaises(InvalidBSON, list, RawBSONDocument(bad))
+        # Values are only validated when they are decoded.
+        raw = RawBSONDocument(data.replace(b'x', b'\xff'))
+        self.assertEqual(['a'], list(raw))
+        self.assertRaises(InvalidBSON, raw.__getitem__, 'a')
+
+    def test_dbref_not_decoded(self):
+        raw = RawBSONDocument(BSON.encode({'ref': {'$ref': 'c', '$id': 1}}))
+        self.assertIsInstance(raw['ref'], RawBSONDocument)
+        self.assertEqual('c', raw['ref']['$ref'])
+
+
+class TestRawBSONDocumentCollection(IntegrationTest):
+
+    def test_round_trip(self):
+        db = self.db
+        db.drop_collection('test_raw')
+        coll = db.get_collection(
+            'test_raw', codec_options=DEFAULT_RAW_BSON_OPTIONS)
+        raw = RawBSONDocument(TestRawBSONDocument.bson_bytes)
+        result = coll.insert_one(raw)
+        self.assertEqual(raw['_id'], result.inserted_id)
+
+        found = coll.find_one()
+        self.assertIsInstance(found, RawBSONDocument)
+        self.assertEqual(raw, found)
+
+        replacement = RawBSONDocument(BSON.encode({'name': 'Mycroft'}))
+        coll.replace_one({'_id': raw['_id']}, replacement)
+        self.assertEqual('Mycroft', coll.find_one()['name'])
+
+        # No _id is added to a RawBSONDocument.
+        raw = RawBSONDocument(BSON.encode({'name': 'Watson'}))
+        self.assertIsNone(coll.insert_one(raw).inserted_id)
+        self.assertNotIn('_id', raw)
+        self.assertEqual(2, coll.count())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -120,6 +120,18 @@ class TestSON(unittest.TestCase):
         son_2_1_1 = pickle.loads(pickled_with_2_1_1)
         self.assertEqual(son_2_1_1, SON([]))
 
+        # The order of keys pickled in a list is restored.
+        pickled_with_keys = b(
+            "ccopy_reg\n_reconstructor\np0\n(cbson.son\nSON\np1\n"
+            "c__builtin__\ndict\np2\n(dp3\nS'b'\nI2\nsS'a'\nI1\nstp4\n"
+            "Rp5\n(dp6\nS'_SON__keys'\np7\n(lp8\nS'b'\naS'a'\nasb."
+        )
+        son = pickle.loads(pickled_with_keys)
+        self.assertEqual(son, SON([('b', 2), ('a', 1)]))
+        son['c'] = 3
+        del son['b']
+        self.assertEqual(['a', 'c'], list(son))
+
     def test_copying(self):
         simple_son = SON([])
         complex_son = SON([('son', simple_son),
@@ -185,6 +197,23 @@ class TestSON(unittest.TestCase):
         self.assertEqual(0, len(test_son.keys()))
         self.assertEqual({}, test_son.to_dict())
 
+    def test_order(self):
+        test_son = SON([(1, 100), (2, 200), (3, 300)])
+        test_son[1] = 101
+        self.assertEqual([1, 2, 3], test_son.keys())
+        del test_son[2]
+        test_son[2] = 201
+        self.assertEqual([1, 3, 2], test_son.keys())
+        self.assertEqual([101, 300, 201], test_son.values())
+        self.assertEqual(300, test_son.pop(3))
+        self.assertEqual(None, test_son.setdefault(4))
+        self.assertEqual([(1, 101), (2, 201), (4, None)], test_son.items())
+        # popitem removes the first item.
+        self.assertEqual((1, 101), test_son.popitem())
+        self.assertEqual("SON([(2, 201), (4, None)])", repr(test_son))
+        test_son.clear()
+        self.assertRaises(KeyError, test_son.popitem)
+
     def test_len(self):
         """
         Test len
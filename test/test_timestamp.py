@@ -50,6 +50,21 @@ class TestTimestamp(unittest.TestCase):
             dp = pickle.loads(pkl)
             self.assertEqual(dp, t.as_datetime())
 
+    def test_pickling(self):
+        t = Timestamp(123, 456)
+        self.assertFalse(hasattr(t, '__dict__'))
+        for protocol in [0, 1, 2, -1]:
+            pkl = pickle.dumps(t, protocol=protocol)
+            self.assertEqual(t, pickle.loads(pkl))
+
+        # Pickled before Timestamp defined __slots__.
+        pickled_with_dict = (
+            b"ccopy_reg\n_reconstructor\np0\n(cbson.timestamp\nTimestamp\n"
+            b"p1\nc__builtin__\nobject\np2\nNtp3\nRp4\n(dp5\n"
+            b"S'_Timestamp__time'\np6\nI1\nsS'_Timestamp__inc'\np7\nI2\n"
+            b"sb.")
+        self.assertEqual(Timestamp(1, 2), pickle.loads(pickled_with_dict))
+
     def test_exceptions(self):
         self.assertRaises(TypeError, Timestamp)
         self.assertRaises(TypeError, Timestamp, None, 123)
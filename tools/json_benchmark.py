@@ -0,0 +1,76 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark bson.json_util on documents of increasing width.
+
+Doesn't need a server. Run from the root of the repository::
+
+  $ python tools/json_benchmark.py
+"""
+
+import datetime
+import sys
+import timeit
+
+sys.path[0:0] = [""]
+
+from bson import json_util
+from bson.binary import Binary
+from bson.int64 import Int64
+from bson.objectid import ObjectId
+from bson.son import SON
+from bson.timestamp import Timestamp
+
+WIDTHS = (10, 100, 1000)
+NUMBER = 20
+VALUES = [
+    1,
+    1.5,
+    "string",
+    None,
+    True,
+    [1, 2, 3],
+    {"nested": "document"},
+    ObjectId(),
+    datetime.datetime(2015, 5, 20, 12, 30),
+    Int64(2 ** 40),
+    Binary(b"binary data"),
+    Timestamp(1432000000, 1),
+]
+
+
+def build(width):
+    doc = SON()
+    for i in range(width):
+        doc["field%d" % (i,)] = VALUES[i % len(VALUES)]
+    return doc
+
+
+def benchmark(name, function, *args):
+    best = min(timeit.repeat(lambda: function(*args), repeat=3,
+                             number=NUMBER))
+    sys.stdout.write("%s%.3f ms\n" % (name + (40 - len(name)) * ".",
+                                      best * 1000 / NUMBER))
+
+
+def main():
+    for width in WIDTHS:
+        doc = build(width)
+        data = json_util.dumps(doc)
+        benchmark("dumps (%d fields)" % (width,), json_util.dumps, doc)
+        benchmark("loads (%d fields)" % (width,), json_util.loads, data)
+
+
+if __name__ == "__main__":
+    main()
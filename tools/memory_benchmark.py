@@ -0,0 +1,66 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the memory used by decoded BSON values.
+
+Decodes a document holding an array of 1M values of each type and
+reports the memory held per value, including the array's slot. Doesn't
+need a server, but needs tracemalloc (Python 3.4+). Run from the root of
+the repository::
+
+  $ python tools/memory_benchmark.py
+"""
+
+import sys
+
+sys.path[0:0] = [""]
+
+try:
+    import tracemalloc
+except ImportError:
+    sys.exit("tracemalloc is required, use Python 3.4 or later")
+
+from bson import BSON
+from bson.dbref import DBRef
+from bson.int64 import Int64
+from bson.max_key import MaxKey
+from bson.objectid import ObjectId
+from bson.regex import Regex
+from bson.timestamp import Timestamp
+
+COUNT = 1000000
+VALUES = [
+    ("ObjectId", ObjectId()),
+    ("Timestamp", Timestamp(1432000000, 1)),
+    ("Int64", Int64(2 ** 40)),
+    ("Regex", Regex("^a", "i")),
+    ("DBRef", DBRef("coll", 1)),
+    ("MaxKey", MaxKey()),
+]
+
+
+def main():
+    for name, value in VALUES:
+        data = BSON.encode({"values": [value] * COUNT})
+        tracemalloc.start()
+        decoded = BSON(data).decode()
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        sys.stdout.write("%s%.1f bytes\n" % (name + (20 - len(name)) * ".",
+                                             float(used) / COUNT))
+        del decoded
+
+
+if __name__ == "__main__":
+    main()
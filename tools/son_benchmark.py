@@ -0,0 +1,81 @@
+# Copyright 2015 MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark SON operations on documents of increasing width.
+
+Doesn't need a server. Run from the root of the repository::
+
+  $ python tools/son_benchmark.py
+"""
+
+import sys
+import timeit
+
+sys.path[0:0] = [""]
+
+from bson import BSON
+from bson.codec_options import CodecOptions
+from bson.son import SON
+
+WIDTHS = (10, 100, 1000)
+NUMBER = 20
+SON_OPTIONS = CodecOptions(document_class=SON)
+
+
+def build(width):
+    doc = SON()
+    for i in range(width):
+        doc["field%d" % (i,)] = i
+    return doc
+
+
+def delete(width):
+    doc = build(width)
+    for i in range(width):
+        del doc["field%d" % (i,)]
+
+
+def pop(width):
+    doc = build(width)
+    for i in range(width - 1, -1, -1):
+        doc.pop("field%d" % (i,))
+
+
+def iterate(doc):
+    for _ in doc.items():
+        pass
+
+
+def benchmark(name, function, *args):
+    best = min(timeit.repeat(lambda: function(*args), repeat=3,
+                             number=NUMBER))
+    sys.stdout.write("%s%.3f ms\n" % (name + (40 - len(name)) * ".",
+                                      best * 1000 / NUMBER))
+
+
+def main():
+    for width in WIDTHS:
+        doc = build(width)
+        data = BSON.encode(doc)
+        benchmark("build (%d fields)" % (width,), build, width)
+        benchmark("delete (%d fields)" % (width,), delete, width)
+        benchmark("pop (%d fields)" % (width,), pop, width)
+        benchmark("items (%d fields)" % (width,), iterate, doc)
+        benchmark("encode (%d fields)" % (width,), BSON.encode, doc)
+        benchmark("decode (%d fields)" % (width,),
+                  BSON(data).decode, SON_OPTIONS)
+
+
+if __name__ == "__main__":
+    main()